@@ -1,5 +1,11 @@
+"""
+Vercel (@vercel/python) 用のエントリーポイント
+
+ランタイムはこのモジュールの `app` を ASGI アプリとしてそのまま呼び出す。
+モジュールはウォームなインスタンスで使い回されるため、アプリと Supabase / Gemini のクライアントは
+プロセスごとに一度だけ生成される（クライアントは最初に必要になったときに生成, backend/app/clients.py）。
+ASGI のまま渡すので、非同期の並行処理やストリーミングレスポンスもそのまま使える。
+"""
 from backend.app.main import app
 
-# Vercel用のハンドラー
-def handler(request):
-    return app(request.environ, lambda status, headers: None)
\ No newline at end of file
+__all__ = ["app"]
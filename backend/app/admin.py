@@ -0,0 +1,22 @@
+"""
+KazokuLog 管理用エンドポイントの認証
+環境変数 ADMIN_TOKEN を設定した場合のみ有効で、リクエストヘッダー X-Admin-Token で照合する
+（Prometheus の scrape 設定の authorization から送れるよう、Authorization: Bearer <ADMIN_TOKEN> も受け付ける）
+"""
+import hmac
+import os
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None), authorization: Optional[str] = Header(None)) -> None:
+    """管理用エンドポイントの依存関係（Depends(require_admin)）"""
+    # .env は main.py の import 後に読み込まれるため、呼び出し時に参照する
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token and authorization and authorization[:7].lower() == "bearer ":
+        x_admin_token = authorization[7:].strip()
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode("utf-8"), admin_token.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
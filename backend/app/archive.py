@@ -0,0 +1,88 @@
+"""
+KazokuLog ログのアーカイブ
+ARCHIVE_AFTER_MONTHS か月より前の月のエントリを、家族×月ごとに圧縮したアーカイブに移す
+
+- Supabase: database/schema.sql の archive_log_entries() で log_entries_archive に移し、月のパーティションを削除する。
+  あわせて ensure_log_entry_partitions() で先の月のパーティションを作成する。
+  どちらも service_role にしか実行権限がない（anon のキーはブラウザに配られるため）。アプリの anon のキーではなく
+  SUPABASE_SERVICE_ROLE_KEY で接続するので、このキーはバッチを動かす環境にだけ置く
+- ローカルストア: 家族×月ごとに zlib で圧縮したJSONにまとめる（shared_state.py）
+
+一覧（GET /api/logs）は通常アーカイブ境界より新しい月だけを読み、古い日付が指定された場合だけ
+アーカイブも読んで結果に含める（読み出したアーカイブの月はプロセス内にキャッシュする）。
+
+    cd backend
+    SUPABASE_SERVICE_ROLE_KEY=... python -m app.archive   # 月1回程度、cron などから実行
+    python -m app.archive --dry-run  # アーカイブ境界だけを表示
+"""
+import argparse
+import os
+from datetime import date
+from typing import Any, Dict, Optional
+
+ARCHIVE_AFTER_MONTHS = int(os.getenv("ARCHIVE_AFTER_MONTHS", "6"))
+
+
+class ArchiveNotConfigured(Exception):
+    """Supabase を使っているが SUPABASE_SERVICE_ROLE_KEY がない"""
+
+
+def hot_start(today: Optional[date] = None) -> date:
+    """アーカイブしない（ホットな）範囲の最初の日。この日より前の月がアーカイブの対象"""
+    today = today or date.today()
+    months = today.year * 12 + today.month - 1 - ARCHIVE_AFTER_MONTHS
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def month_of(day: date) -> date:
+    return day.replace(day=1)
+
+
+def archive_client():
+    """アーカイブ用の Supabase クライアント（Supabase を使っていなければ None）"""
+    url = os.getenv("SUPABASE_URL")
+    if not url:
+        return None
+    key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+    if not key:
+        raise ArchiveNotConfigured("アーカイブには SUPABASE_SERVICE_ROLE_KEY が必要です（anon のキーでは実行できません）")
+    from supabase import create_client
+    return create_client(url, key)
+
+
+def run_archive(supabase, local_store, today: Optional[date] = None) -> Dict[str, Any]:
+    """アーカイブを実行し、境界と移した家族×月の数を返す"""
+    cutoff = hot_start(today)
+    if supabase:
+        archived = supabase.rpc("archive_log_entries", {"cutoff": cutoff.isoformat()}).execute().data
+        partitions_created = supabase.rpc("ensure_log_entry_partitions", {}).execute().data
+    else:
+        archived = local_store.archive_log_entries(cutoff.isoformat())
+        partitions_created = 0
+    return {"cutoff": cutoff.isoformat(), "archived": archived, "partitions_created": partitions_created}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="古い月のログをアーカイブに移す")
+    parser.add_argument("--dry-run", action="store_true", help="アーカイブ境界を表示するだけ")
+    args = parser.parse_args()
+
+    if args.dry_run:
+        print(f"cutoff: {hot_start().isoformat()} (ARCHIVE_AFTER_MONTHS={ARCHIVE_AFTER_MONTHS})")
+        return
+
+    # ローカルストアとイベントバスはアプリと同じものを使う
+    from .main import bus, local_store
+
+    try:
+        supabase = archive_client()
+    except ArchiveNotConfigured as e:
+        raise SystemExit(f"❌ {e}")
+    result = run_archive(supabase, local_store)
+    # 起動中のワーカーが読み出し済みのアーカイブを捨てるように通知する
+    bus.publish("archive.completed", result)
+    print(f"📦 アーカイブ完了: {result}")
+
+
+if __name__ == "__main__":
+    main()
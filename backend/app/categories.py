@@ -0,0 +1,77 @@
+"""
+KazokuLog カテゴリ一覧のキャッシュ
+categories テーブルは初期データのみで実行中に変わらないため、プロセスごとに一度だけ読み込んで使い回す
+
+- 読み込んだ一覧はJSONにシリアライズ済みの不変なスナップショットとして保持し、リクエストごとに作り直さない
+- 本文のハッシュを強いETagとして返し、If-None-Match が一致すれば 304 を返す
+- カテゴリを変更した場合は管理用の再読み込み（POST /api/admin/categories/reload）で差し替える
+"""
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .cache import etag_matches
+from .metrics import REGISTRY
+
+# ブラウザは5分、CDN（Vercel のエッジ）は1日キャッシュし、期限切れ後も1週間は古い応答を返しながら再検証する
+CATEGORIES_CACHE_CONTROL = os.getenv(
+    "CATEGORIES_CACHE_CONTROL",
+    "public, max-age=300, s-maxage=86400, stale-while-revalidate=604800",
+)
+
+category_loads = REGISTRY.counter(
+    "kazokulog_category_loads_total",
+    "カテゴリ一覧をデータソースから読み込んだ回数",
+    ("reason",),
+)
+
+
+class CategorySnapshot:
+    """読み込んだ時点のカテゴリ一覧（変更しない）"""
+
+    __slots__ = ("items", "body", "etag", "loaded_at")
+
+    def __init__(self, items: List[Dict[str, Any]]):
+        self.body = json.dumps(items, ensure_ascii=False, separators=(",", ":"), sort_keys=True).encode("utf-8")
+        # 呼び出し側が書き換えても共有の状態が壊れないよう、本文から作り直したものだけを持つ
+        self.items: Tuple[Dict[str, Any], ...] = tuple(json.loads(self.body))
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+        self.loaded_at = datetime.now()
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """If-None-Match ヘッダーがこのスナップショットのETagを含むか"""
+        return etag_matches(if_none_match, self.etag)
+
+
+class CategoryCache:
+    """カテゴリ一覧を一度だけ読み込み、スナップショットを返す"""
+
+    def __init__(self, loader: Callable[[], List[Dict[str, Any]]]):
+        self._loader = loader
+        self._snapshot: Optional[CategorySnapshot] = None
+        self._lock = threading.Lock()
+
+    def peek(self) -> Optional[CategorySnapshot]:
+        """読み込み済みのスナップショット（まだ読み込んでいなければ None。データソースには触らない）"""
+        return self._snapshot
+
+    def get(self) -> CategorySnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = CategorySnapshot(self._loader())
+                    category_loads.inc(reason="initial")
+                snapshot = self._snapshot
+        return snapshot
+
+    def reload(self) -> CategorySnapshot:
+        """データソースから読み直して差し替える（読み込みに失敗した場合は元のまま）"""
+        snapshot = CategorySnapshot(self._loader())
+        with self._lock:
+            self._snapshot = snapshot
+        category_loads.inc(reason="reload")
+        return snapshot
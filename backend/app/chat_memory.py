@@ -0,0 +1,94 @@
+"""
+KazokuLog AIチャットの会話の記憶
+会話（chat_sessions）ごとに発言（chat_turns）を保存し、続けての質問でもそれまでの流れを踏まえて答えられるようにする
+
+- プロンプトに入れるのは、会話の要約と、まだ要約していない直近の発言だけ
+- 要約していない発言が CHAT_HISTORY_TOKEN_BUDGET（概算トークン数）を超えたら、直近の CHAT_RECENT_TURNS 件を残して
+  古い発言を要約に畳み込む（プロンプト chat_summary。LLMが使えなければ質問と回答の冒頭を並べた要約）
+- 要約は回答を返したあとに行うので、会話が長くなってもプロンプトの大きさと応答時間はほぼ一定になる
+"""
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+from .metrics import REGISTRY, estimate_tokens
+
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1000"))
+CHAT_RECENT_TURNS = int(os.getenv("CHAT_RECENT_TURNS", "4"))
+CHAT_SUMMARY_MAX_CHARS = int(os.getenv("CHAT_SUMMARY_MAX_CHARS", "300"))
+# 会話を復元するときに返す発言の数
+CHAT_TURNS_PAGE_SIZE = 50
+NO_HISTORY = "（まだ会話はありません）"
+
+ROLE_LABELS = {"user": "家族", "assistant": "AI"}
+
+chat_summaries = REGISTRY.counter(
+    "kazokulog_chat_summaries_total",
+    "会話の古い発言を要約に畳み込んだ回数（method: llm / fallback）",
+    ("method",),
+)
+chat_history_tokens = REGISTRY.histogram(
+    "kazokulog_chat_history_tokens",
+    "チャットのプロンプトに入れた会話（要約と直近の発言）の概算トークン数",
+    buckets=(50, 100, 250, 500, 750, 1000, 1500, 2000, 4000),
+)
+
+
+def format_turns(turns: List[Dict[str, Any]]) -> str:
+    return "\n".join(f"{ROLE_LABELS.get(turn['role'], turn['role'])}: {turn['content']}" for turn in turns)
+
+
+def build_history(session: Dict[str, Any], turns: List[Dict[str, Any]]) -> str:
+    """
+    プロンプトに入れる会話（要約と、まだ要約していない発言）
+
+    Args:
+        turns: 要約していない発言（seq > session["summarized_seq"]）
+    """
+    parts = []
+    if session.get("summary"):
+        parts.append(f"（要約）{session['summary']}")
+    if turns:
+        parts.append(format_turns(turns))
+    history = "\n".join(parts) or NO_HISTORY
+    chat_history_tokens.observe(estimate_tokens(history) if parts else 0)
+    return history
+
+
+def turns_to_summarize(turns: List[Dict[str, Any]], budget: int = CHAT_HISTORY_TOKEN_BUDGET,
+                       keep: int = CHAT_RECENT_TURNS) -> List[Dict[str, Any]]:
+    """要約していない発言のうち、要約に畳み込む古い発言（予算内なら空）"""
+    if len(turns) <= keep:
+        return []
+    if sum(estimate_tokens(turn["content"]) for turn in turns) <= budget:
+        return []
+    return turns[:len(turns) - keep]
+
+
+def fallback_summary(summary: str, turns: List[Dict[str, Any]], max_chars: int = CHAT_SUMMARY_MAX_CHARS) -> str:
+    """LLMを使わない要約（発言の冒頭を並べ、長すぎれば古い方から削る）"""
+    lines = [summary] if summary else []
+    lines += [f"{ROLE_LABELS.get(turn['role'], turn['role'])}: {turn['content'][:40]}" for turn in turns]
+    while len(lines) > 1 and len(" / ".join(lines)) > max_chars:
+        lines.pop(0)
+    return " / ".join(lines)[-max_chars:]
+
+
+def summarize(summary: str, turns: List[Dict[str, Any]], generate: Optional[Callable[[str], str]] = None,
+              max_chars: int = CHAT_SUMMARY_MAX_CHARS) -> str:
+    """
+    これまでの要約に古い発言を畳み込んだ新しい要約を作る
+
+    Args:
+        generate: プロンプト chat_summary で要約を生成する関数（None か、失敗・空の応答ならLLMを使わない要約）
+    """
+    if generate is not None:
+        try:
+            text = (generate(format_turns(turns)) or "").strip()
+        except Exception as e:
+            print(f"Chat summary error: {e}")
+            text = ""
+        if text:
+            chat_summaries.inc(method="llm")
+            return text[:max_chars]
+    chat_summaries.inc(method="fallback")
+    return fallback_summary(summary, turns, max_chars)
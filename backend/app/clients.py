@@ -0,0 +1,71 @@
+"""
+KazokuLog 外部サービスのクライアント
+Supabase / Gemini のSDKは import だけで数百msかかるため、最初に必要になったときに読み込んで生成する
+
+- サーバーレス環境のコールドスタートで `GET /` などのSDKを使わないリクエストを待たせない
+- 生成したクライアントはプロセス内で使い回す（ウォームな呼び出しでは再生成しない）
+- warm_up() で事前に読み込んでおくこともできる（`GET /api/warmup` / WARMUP_ON_STARTUP=1）
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from .metrics import REGISTRY
+
+client_init_seconds = REGISTRY.gauge(
+    "kazokulog_client_init_seconds",
+    "外部サービスのクライアント初期化（SDKの読み込みを含む）にかかった時間",
+    ("client",),
+)
+
+
+class LazyClient:
+    """初回の get() でファクトリを呼び、以降は同じインスタンスを返す"""
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self.name = name
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._instance is not None
+
+    def get(self) -> Any:
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    started = time.perf_counter()
+                    self._instance = self._factory()
+                    client_init_seconds.set(time.perf_counter() - started, client=self.name)
+        return self._instance
+
+
+_clients: Dict[str, LazyClient] = {}
+
+
+def register_client(name: str, factory: Callable[[], Any]) -> LazyClient:
+    client = LazyClient(name, factory)
+    _clients[name] = client
+    return client
+
+
+def get_client(name: str) -> Optional[Any]:
+    """登録済みのクライアントを返す（設定されていなければ None）"""
+    client = _clients.get(name)
+    return client.get() if client is not None else None
+
+
+def warm_up() -> Dict[str, float]:
+    """登録済みのクライアントをすべて初期化し、それぞれの所要時間(ms)を返す"""
+    timings = {}
+    for name, client in _clients.items():
+        started = time.perf_counter()
+        try:
+            client.get()
+        except Exception as e:
+            print(f"⚠️ {name} の初期化に失敗しました: {e}")
+            continue
+        timings[name] = round((time.perf_counter() - started) * 1000, 2)
+    return timings
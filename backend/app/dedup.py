@@ -0,0 +1,158 @@
+"""
+KazokuLog 重複投稿の検出
+ダブルタップや、LLMの応答が遅いときの再送で同じメモが二重に保存されるのを防ぐ
+
+- Idempotency-Key ヘッダー: 同じキーの投稿は最初のエントリを返す（期間の制限なし）
+- ほぼ同じ内容: 本文の文字3-gramから作った64ビットの SimHash を各エントリに保存し、
+  同じ家族の直近のエントリ（DEDUP_WINDOW_SECONDS 以内、最大 DEDUP_WINDOW_SIZE 件）と
+  ハミング距離 DEDUP_MAX_DISTANCE 以内で、日付と本文中の数字が同じなら重複とみなす
+  （「10時」と「11時」のような数字だけの違いは別のエントリとして扱う）
+- /api/logs/extract で複数の項目に分けたメモは、メモ全体の SimHash（note_simhash）を各項目に保存し、
+  メモ単位で同じように比べる（本文中の数字は項目の本文を合わせたもので比べる）
+- 同時に届いた同じ投稿: 先の投稿の分類・保存が終わるのを待って、その結果を返す（プロセス内）
+
+重複と判定した投稿は分類（LLM呼び出し）も保存もせず、既存のエントリを返す。
+"""
+import asyncio
+import hashlib
+import os
+import re
+import unicodedata
+from datetime import datetime, timedelta
+from typing import Any, Dict, Hashable, Iterable, List, Optional
+
+from .metrics import REGISTRY
+
+DEDUP_WINDOW_SECONDS = int(os.getenv("DEDUP_WINDOW_SECONDS", "600"))
+DEDUP_WINDOW_SIZE = int(os.getenv("DEDUP_WINDOW_SIZE", "20"))
+DEDUP_MAX_DISTANCE = int(os.getenv("DEDUP_MAX_DISTANCE", "3"))
+SHINGLE_SIZE = 3
+
+duplicate_entries = REGISTRY.counter(
+    "kazokulog_duplicate_entries_total",
+    "重複と判定して保存しなかった投稿数（reason: idempotency_key / near_duplicate / in_flight）",
+    ("reason",),
+)
+
+_IGNORED = re.compile(r"[\s\W_]+", re.UNICODE)
+_NUMBERS = re.compile(r"\d+")
+_MASK = (1 << 64) - 1
+
+
+def normalize_text(text: str) -> str:
+    """全角・半角や大文字・小文字、空白・記号の違いを無視するための正規化"""
+    return _IGNORED.sub("", unicodedata.normalize("NFKC", text).lower())
+
+
+def simhash(text: str) -> int:
+    """
+    文字 n-gram の SimHash（64ビット）
+    Postgres の BIGINT に入るよう符号付きの整数で返す
+    """
+    normalized = normalize_text(text)
+    if len(normalized) <= SHINGLE_SIZE:
+        shingles = [normalized]
+    else:
+        shingles = [normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)]
+
+    weights = [0] * 64
+    for shingle in shingles:
+        value = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if value >> bit & 1 else -1
+
+    signature = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            signature |= 1 << bit
+    return signature - (1 << 64) if signature >= 1 << 63 else signature
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin((a ^ b) & _MASK).count("1")
+
+
+def _numbers(text: str) -> list:
+    return _NUMBERS.findall(unicodedata.normalize("NFKC", text))
+
+
+def window_start(now: Optional[datetime] = None) -> datetime:
+    """重複を探す期間の開始時刻"""
+    return (now or datetime.now()) - timedelta(seconds=DEDUP_WINDOW_SECONDS)
+
+
+def find_near_duplicate(text: str, signature: int, entry_date: str,
+                        recent_entries: Iterable[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    直近のエントリからほぼ同じ内容のものを探す
+
+    Args:
+        recent_entries: original_text / date / simhash を持つエントリ（期間で絞り込み済み）
+    """
+    numbers = _numbers(text)
+    for entry in recent_entries:
+        if entry.get("simhash") is None or str(entry.get("date")) != entry_date:
+            continue
+        if hamming_distance(signature, entry["simhash"]) > DEDUP_MAX_DISTANCE:
+            continue
+        if _numbers(entry["original_text"]) != numbers:
+            continue
+        return entry
+    return None
+
+
+def find_near_duplicate_note(text: str, signature: int, entry_date: str,
+                             recent_entries: Iterable[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+    """
+    直近のエントリから、ほぼ同じ内容のメモから作ったエントリをまとめて探す（作成順）
+
+    Args:
+        recent_entries: original_text / date / note_simhash / change_seq を持つエントリ（期間で絞り込み済み）
+    """
+    groups: Dict[int, List[Dict[str, Any]]] = {}
+    for entry in recent_entries:
+        if entry.get("note_simhash") is None or str(entry.get("date")) != entry_date:
+            continue
+        if hamming_distance(signature, entry["note_simhash"]) > DEDUP_MAX_DISTANCE:
+            continue
+        groups.setdefault(entry["note_simhash"], []).append(entry)
+    numbers = sorted(_numbers(text))
+    for group in groups.values():
+        # LLMが項目の本文から数字を落とした場合は一致せず、重複とみなさない（保存し直すだけで済む側に倒す）
+        if sorted(number for entry in group for number in _numbers(entry["original_text"])) == numbers:
+            return sorted(group, key=lambda entry: entry.get("change_seq", 0))
+    return None
+
+
+def like_prefix(prefix: str) -> str:
+    """LIKE で prefix から始まる値を探すパターン（prefix 中の % _ \\ はそのまま一致させる）"""
+    return prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+class PendingWrites:
+    """
+    処理中の投稿（家族×Idempotency-Key または SimHash ごと）
+    後から届いた同じ投稿は、先の投稿の結果を待って受け取る（イベントループ上で使う）
+    """
+
+    def __init__(self):
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+
+    def get(self, key: Hashable) -> Optional[asyncio.Future]:
+        return self._pending.get(key)
+
+    def claim(self, key: Hashable) -> asyncio.Future:
+        """key の処理を始める。結果は返した Future に set_result し、最後に release を呼ぶ"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        return future
+
+    def release(self, key: Hashable, future: asyncio.Future) -> None:
+        """処理を終える（結果を入れずに終えた場合、待っている投稿には None が渡る）"""
+        if not future.done():
+            future.set_result(None)
+        if self._pending.get(key) is future:
+            del self._pending[key]
+
+
+pending_writes = PendingWrites()
@@ -0,0 +1,215 @@
+"""
+KazokuLog 依存サービスの遅延に応じた縮退運転
+LLM・Supabase の直近のレイテンシ（p95）を SLO と比べ、超えたらその依存先を使う「なくてもよい処理」を止める
+
+- 依存先ごとに直近 SLO_WINDOW_SECONDS 秒のレイテンシを保持し、p95 が目標（LLM_SLO_P95_SECONDS / SUPABASE_SLO_P95_SECONDS）を
+  超えたら degraded、目標の SLO_RECOVERY_RATIO 倍を下回り、degraded になってから SLO_MIN_DEGRADED_SECONDS 秒経ったら normal に戻す
+- サンプルが SLO_MIN_SAMPLES 件に満たない間は切り替えない。degraded の間も SLO_PROBE_RATE の割合のリクエストは
+  止めずに依存先を呼び、回復したかどうかを測り続ける
+- 管理用エンドポイントから依存先ごとにモードを固定できる（auto に戻すまで自動では切り替えない。戻すと normal から判断し直す）
+- 状態はワーカーごと（それぞれが自分の呼び出しのレイテンシで判断する）
+
+止める処理（SHED_FEATURES）:
+    llm       rules_classification  分類はルールベースだけで行う（/api/logs・/api/logs/extract）
+              cached_suggestions    AI提案は直近の提案（なければルールベース）を返す
+    supabase  defer_classification_details  classification_details のINSERTはレスポンスを送ってから行う（同じリクエストの
+                                            BackgroundTasks の中。失敗したら kazokulog_deferred_write_failures_total に数える）
+              skip_chat_context     AIチャットに会話の履歴を入れず、会話の要約も行わない
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+from .metrics import REGISTRY
+
+LLM_SLO_P95_SECONDS = float(os.getenv("LLM_SLO_P95_SECONDS", "3.0"))
+SUPABASE_SLO_P95_SECONDS = float(os.getenv("SUPABASE_SLO_P95_SECONDS", "0.5"))
+SLO_WINDOW_SECONDS = float(os.getenv("SLO_WINDOW_SECONDS", "60"))
+SLO_MIN_SAMPLES = int(os.getenv("SLO_MIN_SAMPLES", "20"))
+SLO_RECOVERY_RATIO = float(os.getenv("SLO_RECOVERY_RATIO", "0.8"))
+SLO_MIN_DEGRADED_SECONDS = float(os.getenv("SLO_MIN_DEGRADED_SECONDS", "30"))
+SLO_PROBE_RATE = float(os.getenv("SLO_PROBE_RATE", "0.05"))
+# p95 の計算は依存先ごとにこの間隔に1回まで
+SLO_EVALUATE_INTERVAL_SECONDS = 1.0
+# レスポンスを待たせないLLM呼び出し（会話の要約・夜間のまとめ）はレイテンシに含めない
+BACKGROUND_LLM_OPERATIONS = ("chat_summary", "digest")
+
+MODES = ("normal", "degraded")
+OVERRIDES = ("auto",) + MODES
+
+SHED_FEATURES = {
+    "rules_classification": "llm",
+    "cached_suggestions": "llm",
+    "defer_classification_details": "supabase",
+    "skip_chat_context": "supabase",
+}
+
+degradation_mode = REGISTRY.gauge(
+    "kazokulog_degradation_mode",
+    "依存先ごとの運転モード（0: normal / 1: degraded）",
+    ("dependency",),
+)
+degradation_transitions = REGISTRY.counter(
+    "kazokulog_degradation_transitions_total",
+    "運転モードの切り替え回数（mode は切り替え後、reason: slo / recovered / override）",
+    ("dependency", "mode", "reason"),
+)
+dependency_latency_p95 = REGISTRY.gauge(
+    "kazokulog_dependency_latency_p95_seconds",
+    "依存先の直近 SLO_WINDOW_SECONDS 秒のレイテンシの p95",
+    ("dependency",),
+)
+shed_requests = REGISTRY.counter(
+    "kazokulog_degradation_shed_total",
+    "縮退運転で止めた処理の回数",
+    ("feature",),
+)
+deferred_write_failures = REGISTRY.counter(
+    "kazokulog_deferred_write_failures_total",
+    "レスポンスを送ってから行ったDB書き込みの失敗（レスポンスでは保存済みと返している）",
+    ("name",),
+)
+
+
+class DependencySLO:
+    """1つの依存先のレイテンシの窓と運転モード"""
+
+    def __init__(self, name: str, target: float, window: float = SLO_WINDOW_SECONDS,
+                 min_samples: int = SLO_MIN_SAMPLES, recovery_ratio: float = SLO_RECOVERY_RATIO,
+                 min_degraded: float = SLO_MIN_DEGRADED_SECONDS, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.target = target
+        self.window = window
+        self.min_samples = min_samples
+        self.recovery_ratio = recovery_ratio
+        self.min_degraded = min_degraded
+        self.clock = clock
+        self.mode = "normal"
+        self.override = "auto"
+        self.since = clock()
+        self.p95: Optional[float] = None
+        self._samples: Deque[Tuple[float, float]] = deque()
+        self._evaluated_at = 0.0
+        self._lock = threading.Lock()
+        degradation_mode.set(0, dependency=name)
+
+    def observe(self, seconds: float) -> None:
+        now = self.clock()
+        with self._lock:
+            self._samples.append((now, seconds))
+            if now - self._evaluated_at >= SLO_EVALUATE_INTERVAL_SECONDS:
+                self._evaluated_at = now
+                self._evaluate(now)
+
+    def _evaluate(self, now: float) -> None:
+        while self._samples and self._samples[0][0] < now - self.window:
+            self._samples.popleft()
+        if len(self._samples) < self.min_samples:
+            return
+        values = sorted(seconds for _, seconds in self._samples)
+        self.p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+        dependency_latency_p95.set(self.p95, dependency=self.name)
+        if self.override != "auto":
+            return
+        if self.mode == "normal" and self.p95 > self.target:
+            self._switch("degraded", "slo", now)
+        elif (self.mode == "degraded" and self.p95 < self.target * self.recovery_ratio
+              and now - self.since >= self.min_degraded):
+            self._switch("normal", "recovered", now)
+
+    def _switch(self, mode: str, reason: str, now: float) -> None:
+        if mode == self.mode:
+            return
+        self.mode = mode
+        self.since = now
+        degradation_mode.set(MODES.index(mode), dependency=self.name)
+        degradation_transitions.inc(dependency=self.name, mode=mode, reason=reason)
+        print(f"🚦 {self.name}: {mode}（{reason}、p95={self.p95 if self.p95 is not None else '-'}）")
+
+    def set_override(self, override: str) -> None:
+        if override not in OVERRIDES:
+            raise ValueError(f"mode は {OVERRIDES} のいずれかです: {override}")
+        with self._lock:
+            self.override = override
+            # auto に戻したら normal から判断し直す（サンプルがなければそのまま normal）
+            self._switch("normal" if override == "auto" else override, "override", self.clock())
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "override": self.override,
+                "p95_seconds": self.p95,
+                "target_p95_seconds": self.target,
+                "samples": len(self._samples),
+                "since_seconds": round(self.clock() - self.since, 1),
+            }
+
+
+class DegradationController:
+    """依存先ごとの SLO から、止める処理を決める"""
+
+    def __init__(self, dependencies: Dict[str, DependencySLO], probe_rate: float = SLO_PROBE_RATE,
+                 rng: Optional[random.Random] = None):
+        self.dependencies = dependencies
+        self.probe_rate = probe_rate
+        self.random = rng or random.Random()
+
+    def observe(self, dependency: str, seconds: float) -> None:
+        self.dependencies[dependency].observe(seconds)
+
+    def observe_llm(self, operation: str, seconds: float) -> None:
+        if operation not in BACKGROUND_LLM_OPERATIONS:
+            self.observe("llm", seconds)
+
+    def degraded(self, dependency: str) -> bool:
+        return self.dependencies[dependency].mode == "degraded"
+
+    def shed(self, feature: str) -> bool:
+        """feature を止めるなら True（degraded でも SLO_PROBE_RATE の割合は止めずに依存先のレイテンシを測る）"""
+        dependency = self.dependencies[SHED_FEATURES[feature]]
+        if dependency.mode != "degraded":
+            return False
+        if dependency.override == "auto" and self.random.random() < self.probe_rate:
+            return False
+        shed_requests.inc(feature=feature)
+        return True
+
+    def status(self) -> Dict:
+        return {
+            "dependencies": {name: slo.status() for name, slo in self.dependencies.items()},
+            "shed": [feature for feature, name in SHED_FEATURES.items() if self.degraded(name)],
+        }
+
+    def httpx_event_hooks(self, dependency: str) -> Dict:
+        """httpx.Client(event_hooks=...) 用（リクエストの送信からレスポンスのヘッダーまでを測る）"""
+        def on_request(request):
+            request.extensions["slo_started"] = time.perf_counter()
+
+        def on_response(response):
+            started = response.request.extensions.get("slo_started")
+            if started is not None:
+                self.observe(dependency, time.perf_counter() - started)
+
+        return {"request": [on_request], "response": [on_response]}
+
+
+def run_deferred_write(name: str, write: Callable[[], None]) -> None:
+    """
+    BackgroundTasks に渡す書き込み（レスポンスの送信後、ASGI の呼び出しが終わる前に実行される）
+    Vercel でも関数が止められる前に終わる。ワーカーが強制終了された場合だけは失われる
+    """
+    try:
+        write()
+    except Exception as e:
+        print(f"Deferred write error ({name}): {e}")
+        deferred_write_failures.inc(name=name)
+
+
+degradation = DegradationController({
+    "llm": DependencySLO("llm", LLM_SLO_P95_SECONDS),
+    "supabase": DependencySLO("supabase", SUPABASE_SLO_P95_SECONDS),
+})
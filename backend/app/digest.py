@@ -0,0 +1,142 @@
+"""
+KazokuLog 1日のまとめ（夜間バッチ）
+その日にログを書いた家族ごとに、1日のまとめと翌日への提案を作って digests に保存する
+
+- ダッシュボードの AI提案（GET /api/ai/suggestions）は前日のまとめがあればその提案を返すので、昼間の表示でLLMを呼ばない
+- その日のログがない家族は対象にしない。前回と同じログから作ったまとめがあれば作り直さない（何度実行してもよい）
+- 同時に DIGEST_CONCURRENCY 家族まで処理する。1家族のプロンプトは DIGEST_MAX_PROMPT_TOKENS に収まるだけのログにし、
+  1回の実行で DIGEST_MAX_RUN_TOKENS を使い切ったら残りの家族はルールベースのまとめにする
+- 1家族あたりLLMは1回（プロンプト digest でまとめと提案を一緒に作る）
+
+    cd backend
+    python -m app.digest                    # 毎晩 cron などから実行（対象は前日）
+    python -m app.digest --date 2026-10-18  # 日付を指定して作り直す
+    python -m app.digest --dry-run          # 対象の家族とログの件数だけを表示
+"""
+import argparse
+import hashlib
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .events import EVENT_TIMEZONE
+from .metrics import REGISTRY
+
+DIGEST_CONCURRENCY = int(os.getenv("DIGEST_CONCURRENCY", "4"))
+DIGEST_MAX_PROMPT_TOKENS = int(os.getenv("DIGEST_MAX_PROMPT_TOKENS", "2000"))
+DIGEST_MAX_RUN_TOKENS = int(os.getenv("DIGEST_MAX_RUN_TOKENS", "500000"))
+# 応答（まとめ100文字と提案3件）の概算トークン数。実行全体の予算から先に差し引いておく
+DIGEST_OUTPUT_TOKENS = 400
+RULES_DIGEST_VERSION = "rules@1"
+
+CATEGORY_LABELS = {"schedule": "予定", "emotion": "子どもの様子", "shopping": "買い物", "todo": "ToDo", "memo": "メモ"}
+
+digest_families = REGISTRY.counter(
+    "kazokulog_digest_families_total",
+    "1日のまとめのバッチで処理した家族数（outcome: generated / fallback / budget_exceeded / unchanged / error）",
+    ("outcome",),
+)
+digest_suggestions_served = REGISTRY.counter(
+    "kazokulog_digest_suggestions_served_total",
+    "AI提案に前日のまとめの提案を返した回数（LLMを呼ばなかった回数）",
+)
+
+
+def digest_day(today: Optional[date] = None) -> date:
+    """夜間バッチの対象日（EVENT_TIMEZONE での前日。サーバーのタイムゾーンが UTC でも家族の暦日で数える）"""
+    return (today or datetime.now(EVENT_TIMEZONE).date()) - timedelta(days=1)
+
+
+def source_hash(entries: Iterable[Dict[str, Any]]) -> str:
+    """まとめの元にしたログの組み合わせ（同じなら作り直さない）"""
+    ids = sorted(str(entry["id"]) for entry in entries)
+    return hashlib.sha256(",".join(ids).encode("utf-8")).hexdigest()[:16]
+
+
+def fit_entries(entries: List[Dict[str, Any]], max_tokens: int,
+                measure: Callable[[List[Dict[str, Any]]], int]) -> List[Dict[str, Any]]:
+    """measure(ログ) が max_tokens に収まるだけの新しいログ（少なくとも1件）"""
+    count = len(entries)
+    while count > 1 and measure(entries[-count:]) > max_tokens:
+        count = count * 3 // 4
+    return entries[-count:]
+
+
+def fallback_digest_summary(entries: List[Dict[str, Any]]) -> str:
+    """LLMを使わないまとめ（カテゴリごとの件数と、予定・子どもの様子の要約）"""
+    counts = Counter(entry.get("category", "memo") for entry in entries)
+    parts = [f"{CATEGORY_LABELS.get(category, category)}{count}件" for category, count in counts.most_common()]
+    summary = f"記録は{len(entries)}件（{'・'.join(parts)}）。"
+    highlights = [entry.get("summary") for entry in entries
+                  if entry.get("category") in ("schedule", "emotion") and entry.get("summary")]
+    if highlights:
+        summary += " ".join(highlights[:3])
+    return summary
+
+
+class TokenBudget:
+    """1回の実行でLLMに使うトークン数の上限（スレッド間で共有する）"""
+
+    def __init__(self, limit: int = DIGEST_MAX_RUN_TOKENS):
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: int) -> bool:
+        """tokens を使えるなら差し引いて True、上限を超えるなら False"""
+        with self._lock:
+            if self.used + tokens > self.limit:
+                return False
+            self.used += tokens
+            return True
+
+
+def run_digests(families: List[Tuple[Dict[str, Any], List[Dict[str, Any]]]],
+                digest_family: Callable[[Dict[str, Any], List[Dict[str, Any]]], str],
+                concurrency: int = DIGEST_CONCURRENCY) -> Dict[str, int]:
+    """
+    家族ごとのまとめを同時に concurrency 家族まで作り、結果（outcome）ごとの家族数を返す
+
+    Args:
+        families: (家族, その日のログ) のリスト
+        digest_family: 1家族のまとめを作って保存し、outcome を返す関数
+    """
+    def run(family, entries):
+        try:
+            return digest_family(family, entries)
+        except Exception as e:
+            print(f"Digest error ({family.get('id')}): {e}")
+            return "error"
+
+    outcomes: Counter = Counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="digest") as pool:
+        for outcome in pool.map(lambda family: run(*family), families):
+            outcomes[outcome] += 1
+            digest_families.inc(outcome=outcome)
+    return dict(outcomes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="家族ごとの1日のまとめと翌日への提案を作る")
+    parser.add_argument("--date", type=date.fromisoformat, help="対象日（デフォルトは前日）")
+    parser.add_argument("--concurrency", type=int, default=DIGEST_CONCURRENCY)
+    parser.add_argument("--dry-run", action="store_true", help="対象の家族とログの件数を表示するだけ")
+    args = parser.parse_args()
+
+    # Supabase の設定・LLM・ローカルストアはアプリと同じものを使う
+    from .main import day_entries_by_family, run_daily_digests
+
+    day = args.date or digest_day()
+    if args.dry_run:
+        families = day_entries_by_family(day)
+        print(f"date: {day.isoformat()} families: {len(families)} entries: {sum(len(e) for _, e in families)}")
+        return
+    result = run_daily_digests(day, args.concurrency)
+    print(f"📰 まとめ作成完了: {result}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+KazokuLog 予定の日時の抽出とカレンダー
+予定（schedule）に分類したエントリの本文から予定の日時を取り出し、events テーブルに載せる
+
+- log_entries.date はエントリの日付で、予定の日付ではない（「明日運動会」の運動会は date の翌日）
+- 日時はまずルールで読み取り（「明日」「来週の火曜日10時」「3月10日」「15日」「午後2時半」など、基準はエントリの日付）、
+  読み取れなければLLM（プロンプト event）に任せる
+- 予定は (family_id, event_at) のインデックスで引くので、「今後N日の予定」や iCal の出力が範囲の読み出しで済む
+"""
+import os
+import re
+import unicodedata
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+from zoneinfo import ZoneInfo
+
+EVENT_TIMEZONE = ZoneInfo(os.getenv("EVENT_TIMEZONE", "Asia/Tokyo"))
+RULES_EVENT_PARSER_VERSION = "rules@1"
+# iCal に含める範囲（今日から過去・未来の日数）
+ICAL_PAST_DAYS = int(os.getenv("ICAL_PAST_DAYS", "30"))
+ICAL_FUTURE_DAYS = int(os.getenv("ICAL_FUTURE_DAYS", "365"))
+EVENT_TITLE_MAX_LENGTH = 100
+
+WEEKDAYS = "月火水木金土日"
+
+# 日時の表現のあとの助詞（タイトルから一緒に取り除く）
+_PARTICLE = r"(?:の|に|は|から|まで|、)?"
+_FULL_DATE = re.compile(r"(?:(\d{4})年)?(\d{1,2})月(\d{1,2})日" + _PARTICLE)
+_SLASH_DATE = re.compile(r"(?<![\d/])(\d{1,2})/(\d{1,2})(?![\d/])" + _PARTICLE)
+_RELATIVE_DAY = re.compile(r"(明々後日|しあさって|明後日|あさって|明日|あした|あす|今日|本日|きょう)" + _PARTICLE)
+_DAYS_LATER = re.compile(r"(\d{1,3})日後" + _PARTICLE)
+_WEEKDAY = re.compile(r"(再来週|来週|今週)?の?([月火水木金土日])曜(?:日)?" + _PARTICLE)
+_DAY_OF_MONTH = re.compile(r"(?<![\d月])(\d{1,2})日(?![後間分中前])" + _PARTICLE)
+_PERIOD = r"(午前|午後|朝|夕方|夜)?"
+_TIME = re.compile(_PERIOD + r"(\d{1,2})時(?:(\d{1,2})分|(半))?" + _PARTICLE)
+_CLOCK = re.compile(_PERIOD + r"(?<!\d)(\d{1,2}):(\d{2})(?!\d)" + _PARTICLE)
+
+_RELATIVE_DAYS = {
+    "今日": 0, "本日": 0, "きょう": 0,
+    "明日": 1, "あした": 1, "あす": 1,
+    "明後日": 2, "あさって": 2,
+    "明々後日": 3, "しあさって": 3,
+}
+
+
+def _year_for(month: int, day: int, base: date) -> Optional[date]:
+    """年のない月日。1か月以上前なら来年のこととみなす"""
+    try:
+        candidate = date(base.year, month, day)
+        if candidate < base - timedelta(days=31):
+            candidate = date(base.year + 1, month, day)
+    except ValueError:
+        return None
+    return candidate
+
+
+def _parse_date(text: str, base: date):
+    """本文中の日付と、その表現の位置（なければ None）"""
+    match = _FULL_DATE.search(text)
+    if match:
+        year, month, day = match.groups()
+        try:
+            found = date(int(year), int(month), int(day)) if year else _year_for(int(month), int(day), base)
+        except ValueError:
+            found = None
+        if found:
+            return found, match.span()
+
+    match = _SLASH_DATE.search(text)
+    if match:
+        found = _year_for(int(match.group(1)), int(match.group(2)), base)
+        if found:
+            return found, match.span()
+
+    match = _RELATIVE_DAY.search(text)
+    if match:
+        return base + timedelta(days=_RELATIVE_DAYS[match.group(1)]), match.span()
+
+    match = _DAYS_LATER.search(text)
+    if match:
+        return base + timedelta(days=int(match.group(1))), match.span()
+
+    match = _WEEKDAY.search(text)
+    if match:
+        week, weekday = match.group(1), WEEKDAYS.index(match.group(2))
+        if week:
+            monday = base - timedelta(days=base.weekday())
+            weeks = {"今週": 0, "来週": 1, "再来週": 2}[week]
+            return monday + timedelta(weeks=weeks, days=weekday), match.span()
+        # 「金曜に」は次に来るその曜日（今日がその曜日なら今日）
+        return base + timedelta(days=(weekday - base.weekday()) % 7), match.span()
+
+    match = _DAY_OF_MONTH.search(text)
+    if match:
+        day = int(match.group(1))
+        month_start = base.replace(day=1)
+        for months in (0, 1):
+            # 今月のその日が過ぎていれば来月
+            start = (month_start + timedelta(days=32 * months)).replace(day=1)
+            try:
+                found = start.replace(day=day)
+            except ValueError:
+                continue
+            if found >= base:
+                return found, match.span()
+    return None
+
+
+def _parse_time(text: str):
+    """本文中の時刻と、その表現の位置（なければ None）"""
+    for match in (_TIME.search(text), _CLOCK.search(text)):
+        if not match:
+            continue
+        period, hour, minute = match.group(1), int(match.group(2)), match.group(3)
+        minute = 30 if match.re is _TIME and match.group(4) else int(minute or 0)
+        if period in ("午後", "夕方", "夜") and hour < 12:
+            hour += 12
+        if hour < 24 and minute < 60:
+            return time(hour, minute), match.span()
+    return None
+
+
+def _remove_spans(text: str, spans: List[tuple]) -> str:
+    for start, end in sorted(spans, reverse=True):
+        text = text[:start] + text[end:]
+    return text
+
+
+def parse_event(text: str, base: date) -> Optional[Dict[str, Any]]:
+    """
+    本文から予定の日時とタイトルをルールで読み取る（読み取れなければ None）
+    例: "来週の火曜日10時に病院"（基準 2026-10-19）-> 2026-10-27 10:00、タイトル「病院」
+
+    Returns:
+        {"event_at": 予定の日時（EVENT_TIMEZONE）, "all_day": 時刻がない, "title": 日時の表現を除いた本文,
+         "extracted_by": 読み取った方法（rules@1 / プロンプトのID）}
+    """
+    normalized = unicodedata.normalize("NFKC", text)
+    found_date = _parse_date(normalized, base)
+    found_time = _parse_time(normalized)
+    if found_date is None and found_time is None:
+        return None
+
+    # 時刻だけなら、エントリの日付の予定とする（「15時から歯医者」）
+    day = found_date[0] if found_date else base
+    spans = [found[1] for found in (found_date, found_time) if found]
+    title = _remove_spans(normalized, spans).strip(" 、。,.") or normalized
+    return {
+        "event_at": datetime.combine(day, found_time[0] if found_time else time(0, 0), EVENT_TIMEZONE),
+        "all_day": found_time is None,
+        "title": title[:EVENT_TITLE_MAX_LENGTH],
+        "extracted_by": RULES_EVENT_PARSER_VERSION,
+    }
+
+
+def day_start(day: date) -> datetime:
+    """EVENT_TIMEZONE でのその日の0時"""
+    return datetime.combine(day, time(0, 0), EVENT_TIMEZONE)
+
+
+def today() -> date:
+    return datetime.now(EVENT_TIMEZONE).date()
+
+
+def events_from_entries(entries: Iterable[Dict[str, Any]], items: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    保存したエントリと、日時を読み取った項目（item["event"]）から events の行を作る
+    event_at は範囲検索のために UTC の ISO 形式にそろえる
+    """
+    events = []
+    for entry, item in zip(entries, items):
+        event = item.get("event")
+        if not event:
+            continue
+        events.append({
+            "log_entry_id": str(entry["id"]),
+            "log_entry_date": str(entry["date"]),
+            "title": event["title"],
+            "event_at": event["event_at"].astimezone(timezone.utc).isoformat(),
+            "all_day": event["all_day"],
+            "extracted_by": event["extracted_by"],
+            "original_text": entry["original_text"],
+        })
+    return events
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def _fold(line: str) -> List[str]:
+    """iCal の1行は75オクテットまで（続きは空白で始まる行に折り返す）"""
+    lines, current = [], ""
+    for char in line:
+        if len((current + char).encode("utf-8")) > 75:
+            lines.append(current)
+            current = " "
+        current += char
+    lines.append(current)
+    return lines
+
+
+def build_ical(events: Iterable[Dict[str, Any]], calendar_name: str) -> str:
+    """
+    予定（event_at / created_at は aware な datetime）から iCalendar（RFC 5545）のテキストを作る
+    DTSTAMP に予定の作成日時を使うので、予定が変わらなければ同じテキストになる（ETag に使える）
+    """
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//KazokuLog//Events//JA",
+        "CALSCALE:GREGORIAN",
+        f"X-WR-CALNAME:{_escape(calendar_name)}",
+    ]
+    for event in events:
+        event_at = event["event_at"].astimezone(EVENT_TIMEZONE)
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:{event['id']}@kazokulog",
+            f"DTSTAMP:{event['created_at'].astimezone(timezone.utc):%Y%m%dT%H%M%SZ}",
+        ]
+        if event["all_day"]:
+            lines += [
+                f"DTSTART;VALUE=DATE:{event_at:%Y%m%d}",
+                f"DTEND;VALUE=DATE:{event_at + timedelta(days=1):%Y%m%d}",
+            ]
+        else:
+            lines += [f"DTSTART:{event_at.astimezone(timezone.utc):%Y%m%dT%H%M%SZ}", "DURATION:PT1H"]
+        lines.append(f"SUMMARY:{_escape(event['title'])}")
+        if event.get("original_text"):
+            lines.append(f"DESCRIPTION:{_escape(event['original_text'])}")
+        lines.append("END:VEVENT")
+    lines.append("END:VCALENDAR")
+    return "".join(folded + "\r\n" for line in lines for folded in _fold(line))
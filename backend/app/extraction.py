@@ -0,0 +1,93 @@
+"""
+KazokuLog 複数項目の抽出
+「明日運動会、お弁当の材料(卵・ウインナー)を買う、太郎は少し熱っぽい」のように
+予定・買い物・子どもの様子が混在するメモを、カテゴリごとの項目に分ける
+
+- 区切り（、。改行など）がなく1つの文として読めるメモは分けない（通常の分類と同じ経路で、LLMを呼ばないこともある）
+- 複数の文からなるメモは、LLMへの1回の呼び出しで項目のリストを抽出する（プロンプト extract）
+- LLMが使えない場合は、文ごとにルールベースで分類し、同じカテゴリが続く文をまとめる
+- 項目は EXTRACT_MAX_ITEMS 個まで。超えた分は捨てずに最後の項目にまとめる
+"""
+import os
+from typing import Callable, Dict, List
+
+from .metrics import REGISTRY
+
+EXTRACT_MAX_ITEMS = int(os.getenv("EXTRACT_MAX_ITEMS", "10"))
+
+extract_overflow_items = REGISTRY.counter(
+    "kazokulog_extract_overflow_items_total",
+    "EXTRACT_MAX_ITEMS を超えたため最後の項目にまとめた項目数（source: llm / rules）",
+    ("source",),
+)
+
+_SEPARATORS = "、。，．,\n!?！？;；"
+_OPENING = "(（「『[［【"
+_CLOSING = ")）」』]］】"
+
+
+def split_note(text: str) -> List[str]:
+    """
+    メモを文に分ける（括弧の中の区切りでは分けない）
+    例: "お弁当の材料(卵、ウインナー)を買う。太郎は熱っぽい" -> ["お弁当の材料(卵、ウインナー)を買う", "太郎は熱っぽい"]
+    """
+    segments, current, depth = [], [], 0
+    for char in text:
+        if char in _OPENING:
+            depth += 1
+        elif char in _CLOSING:
+            depth = max(0, depth - 1)
+        if char in _SEPARATORS and depth == 0:
+            segments.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    segments.append("".join(current))
+    return [segment.strip() for segment in segments if segment.strip()]
+
+
+def cap_items(items: List[Dict], source: str, max_items: int = EXTRACT_MAX_ITEMS) -> List[Dict]:
+    """
+    LLMが抽出した項目を max_items 個までにする（超えた分は最後の項目にまとめる）
+    まとめた項目のカテゴリは最後に残した項目のまま。本文・要約・キーワードをつなげ、信頼度は最も低いものにする
+    """
+    if len(items) <= max_items:
+        return items
+    overflow = items[max_items - 1:]
+    extract_overflow_items.inc(len(overflow) - 1, source=source)
+    merged = dict(overflow[0])
+    merged["text"] = "、".join(item["text"] for item in overflow)
+    merged["summary"] = "、".join(item["summary"] for item in overflow)
+    merged["keywords"] = list(dict.fromkeys(keyword for item in overflow for keyword in item["keywords"]))
+    merged["confidence_score"] = min(item["confidence_score"] for item in overflow)
+    return items[:max_items - 1] + [merged]
+
+
+def group_segments(segments: List[str], classify: Callable[[str], Dict],
+                   max_items: int = EXTRACT_MAX_ITEMS) -> List[Dict]:
+    """
+    文ごとに分類し、同じカテゴリが続く文を1つの項目にまとめる（ルールベースの抽出）
+    max_items 個を超えた分の文は最後の項目にまとめる
+
+    Args:
+        classify: 1つのテキストを分類する関数（ルールベース分類）
+    """
+    groups: List[List] = []
+    for segment in segments:
+        category = classify(segment)["category"]
+        if groups and groups[-1][0] == category:
+            groups[-1][1].append(segment)
+        else:
+            groups.append([category, [segment]])
+
+    if len(groups) > max_items:
+        overflow = groups[max_items - 1:]
+        extract_overflow_items.inc(len(overflow) - 1, source="rules")
+        groups = groups[:max_items - 1] + [[overflow[0][0], [text for _, texts in overflow for text in texts]]]
+
+    items = []
+    for category, texts in groups:
+        text = "、".join(texts)
+        # まとめた文で要約・キーワードを作り直す（カテゴリは文ごとの分類に揃える）
+        items.append(dict(classify(text), category=category, text=text))
+    return items
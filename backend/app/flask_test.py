@@ -9,7 +9,9 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
 import google.generativeai as genai
-import json
+
+from .llm_parsing import LLMParseError, parse_classification_response
+from .prompts import get_prompt
 
 # 環境変数を読み込み
 load_dotenv()
@@ -38,51 +40,19 @@ test_categories = [
 def classify_text_with_gemini(text):
     """Gemini APIを使用してテキストを分類する"""
     try:
-        prompt = """
-以下のテキストを家族のログとして分析し、適切なカテゴリに分類してください。
-また、要約とキーワードも抽出してください。
-
-テキスト: "{}"
-
-分類カテゴリ:
-- schedule: 予定・イベント（運動会、病院、学校行事など）
-- emotion: 子どもの様子・感情（機嫌、体調、行動など）
-- shopping: 買い物リスト（食材、日用品など）
-- todo: 家族のやること（手続き、申請、タスクなど）
-- memo: 雑談・メモ（その他、日常の出来事など）
-
-以下のJSON形式で回答してください:
-{{
-    "category": "分類したカテゴリ名",
-    "confidence_score": 0.0-1.0の信頼度,
-    "summary": "30文字以内の要約",
-    "keywords": ["キーワード1", "キーワード2", "キーワード3"],
-    "reasoning": "分類の理由"
-}}
-        """.format(text)
+        template = get_prompt("classify")
+        prompt = template.render(text=text)
         
         response = gemini_model.generate_content(prompt)
         result_text = response.text
         
-        # JSONの抽出を試行
+        # JSONの抽出とスキーマ検証
         try:
-            import re
-            json_match = re.search(r'\{.*?\}', result_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group()
-                result = json.loads(json_str)
-                
-                # 必要なフィールドの検証
-                required_fields = ['category', 'confidence_score', 'summary', 'keywords', 'reasoning']
-                for field in required_fields:
-                    if field not in result:
-                        raise ValueError("Missing required field: {}".format(field))
-                
-                return result
-            else:
-                raise ValueError("No JSON found in response")
+            result = parse_classification_response(result_text, "gemini", "gemini-1.5-flash")
+            result["prompt_version"] = template.id
+            return result
                 
-        except (json.JSONDecodeError, ValueError) as e:
+        except LLMParseError as e:
             print("JSON parsing error: {}".format(e))
             return fallback_classify_text(text)
             
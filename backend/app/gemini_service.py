@@ -2,10 +2,24 @@
 KazokuLog Gemini API Service
 """
 import os
-import json
-from typing import Dict, List, Any
+import inspect
+import time
+from typing import Dict, List, Any, Optional, Tuple
 import google.generativeai as genai
-from datetime import datetime
+from datetime import timedelta
+
+from .llm_parsing import LLMParseError, parse_classification_response
+from .metrics import record_fallback, track_llm_call
+from .prompts import PromptTemplate, get_prompt
+from .tracing import SPAN_KIND_CLIENT, span
+
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-pro')
+# 1 にするとプロンプトの固定部分を Gemini の cached content として登録する
+# （モデルごとに最小トークン数があり、満たさない場合は system_instruction にフォールバックする）
+GEMINI_CACHED_CONTENT = os.getenv('GEMINI_CACHED_CONTENT') == '1'
+GEMINI_CACHE_TTL = timedelta(hours=1)
+# cached content は期限切れの後に使うとエラーになるため、期限のこれだけ前に作り直す
+GEMINI_CACHE_REFRESH_MARGIN = timedelta(minutes=5)
 
 class GeminiService:
     def __init__(self):
@@ -15,7 +29,74 @@ class GeminiService:
             raise ValueError("GEMINI_API_KEY environment variable is required")
         
         genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-pro')
+        self.model = genai.GenerativeModel(GEMINI_MODEL)
+        # SDKが対応していればJSONモードで応答させる
+        self.json_generation_config = None
+        if "response_mime_type" in getattr(genai.types.GenerationConfig, "__annotations__", {}):
+            self.json_generation_config = genai.types.GenerationConfig(response_mime_type="application/json")
+        # プロンプトの固定部分を埋め込んだモデル（テンプレートID -> (モデル, 作り直す時刻)）
+        # 作り直す時刻は cached content のときだけ（time.monotonic()）。system_instruction のモデルは期限がない
+        self._prefixed_models: Dict[str, Tuple[Any, Optional[float]]] = {}
+        self._supports_system_instruction = (
+            "system_instruction" in inspect.signature(genai.GenerativeModel.__init__).parameters
+        )
+    
+    def _prefixed_model(self, template: PromptTemplate):
+        """
+        固定部分を cached content / system_instruction として持つモデルを返す
+        どちらにも対応しないSDKでは None（呼び出し側でプロンプト全体を送る）
+        """
+        if not template.prefix:
+            return None
+        memo = self._prefixed_models.get(template.id)
+        if memo is not None and (memo[1] is None or time.monotonic() < memo[1]):
+            return memo[0]
+        
+        model, refresh_at = None, None
+        if GEMINI_CACHED_CONTENT and hasattr(genai, "caching"):
+            try:
+                cached = genai.caching.CachedContent.create(
+                    model=f"models/{GEMINI_MODEL}",
+                    display_name=f"kazokulog-{template.id}-{template.prefix_hash}",
+                    system_instruction=template.prefix,
+                    ttl=GEMINI_CACHE_TTL,
+                )
+                model = genai.GenerativeModel.from_cached_content(cached_content=cached)
+                refresh_at = time.monotonic() + (GEMINI_CACHE_TTL - GEMINI_CACHE_REFRESH_MARGIN).total_seconds()
+            except Exception as e:
+                print(f"Gemini cached content unavailable for {template.id}: {e}")
+        if model is None and self._supports_system_instruction:
+            model = genai.GenerativeModel(GEMINI_MODEL, system_instruction=template.prefix)
+        self._prefixed_models[template.id] = (model, refresh_at)
+        return model
+        
+    def _generate(self, template: PromptTemplate, operation: str, generation_config=None, **values) -> str:
+        """Generate content and record token usage / latency metrics"""
+        model = self._prefixed_model(template)
+        if model is not None:
+            # 固定部分はモデル側に載っているので可変部分だけを送る
+            prompt = template.render_suffix(**values)
+        else:
+            model = self.model
+            prompt = template.render(**values)
+        with span(f"llm.{operation}", SPAN_KIND_CLIENT, provider="gemini", model=GEMINI_MODEL,
+                  prompt_version=template.id), \
+                track_llm_call("gemini", GEMINI_MODEL, operation, prompt) as call:
+            try:
+                if generation_config is not None:
+                    response = model.generate_content(prompt, generation_config=generation_config)
+                else:
+                    response = model.generate_content(prompt)
+            except Exception:
+                # cached content が消えていた場合などに備え、次の呼び出しではモデルを作り直す
+                self._prefixed_models.pop(template.id, None)
+                raise
+            call.output_text = response.text
+            usage = getattr(response, "usage_metadata", None)
+            if usage is not None:
+                call.prompt_tokens = getattr(usage, "prompt_token_count", None)
+                call.output_tokens = getattr(usage, "candidates_token_count", None)
+        return call.output_text
         
     def classify_text(self, text: str) -> Dict[str, Any]:
         """
@@ -28,58 +109,25 @@ class GeminiService:
             Dictionary containing classification results
         """
         try:
-            prompt = f"""
-以下のテキストを家族のログとして分析し、適切なカテゴリに分類してください。
-また、要約とキーワードも抽出してください。
-
-テキスト: "{text}"
-
-分類カテゴリ:
-- schedule: 予定・イベント（運動会、病院、学校行事など）
-- emotion: 子どもの様子・感情（機嫌、体調、行動など）
-- shopping: 買い物リスト（食材、日用品など）
-- todo: 家族のやること（手続き、申請、タスクなど）
-- memo: 雑談・メモ（その他、日常の出来事など）
-
-以下のJSON形式で回答してください:
-{{
-    "category": "分類したカテゴリ名",
-    "confidence_score": 0.0-1.0の信頼度,
-    "summary": "30文字以内の要約",
-    "keywords": ["キーワード1", "キーワード2", "キーワード3"],
-    "reasoning": "分類の理由"
-}}
-            """
+            template = get_prompt("classify")
+            result_text = self._generate(template, "classify", self.json_generation_config, text=text)
             
-            response = self.model.generate_content(prompt)
-            result_text = response.text
-            
-            # JSONの抽出を試行
+            # JSONの抽出とスキーマ検証
             try:
-                # レスポンスからJSONを抽出
-                import re
-                json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group()
-                    result = json.loads(json_str)
-                else:
-                    raise ValueError("No JSON found in response")
-                    
-                # 必要なフィールドの検証
-                required_fields = ['category', 'confidence_score', 'summary', 'keywords', 'reasoning']
-                for field in required_fields:
-                    if field not in result:
-                        raise ValueError(f"Missing required field: {field}")
-                
+                with span("llm.parse_json"):
+                    result = parse_classification_response(result_text, "gemini", GEMINI_MODEL)
+                result["prompt_version"] = template.id
                 return result
                 
-            except (json.JSONDecodeError, ValueError) as e:
+            except LLMParseError as e:
                 print(f"JSON parsing error: {e}")
+                record_fallback("classify", "parse_error")
                 # フォールバック：基本的な分類
                 return self._fallback_classification(text)
                 
         except Exception as e:
             print(f"Gemini API error: {e}")
+            record_fallback("classify", "error")
             return self._fallback_classification(text)
     
     def _fallback_classification(self, text: str) -> Dict[str, Any]:
@@ -129,28 +177,11 @@ class GeminiService:
             # ログの要約を作成
             log_summary = self._create_log_summary(logs)
             
-            prompt = f"""
-あなたは家族のAIコンシェルジュです。過去のログを参考にして、家族の質問に答えてください。
-
-過去のログ:
-{log_summary}
-
-質問: {question}
-
-以下の点を考慮して回答してください:
-1. 過去のログから傾向を読み取る
-2. 家族の状況を理解して適切な提案をする
-3. 温かみのある、親しみやすい口調で回答する
-4. 具体的で実践的なアドバイスを提供する
-
-回答:
-            """
-            
-            response = self.model.generate_content(prompt)
-            return response.text
+            return self._generate(get_prompt("chat"), "chat", log_summary=log_summary, question=question)
             
         except Exception as e:
             print(f"AI response error: {e}")
+            record_fallback("chat", "error")
             return "申し訳ございません。現在AIからの回答を取得できません。しばらく時間をおいて再度お試しください。"
     
     def _create_log_summary(self, logs: List[Dict[str, Any]]) -> str:
@@ -183,25 +214,7 @@ class GeminiService:
         try:
             log_summary = self._create_log_summary(logs)
             
-            prompt = f"""
-以下の家族のログを分析して、3つの有用な提案をしてください。
-
-過去のログ:
-{log_summary}
-
-以下の形式で3つの提案を出してください:
-1. [提案1]
-2. [提案2]
-3. [提案3]
-
-提案の内容:
-- 家族の健康や幸福につながる提案
-- 実践しやすい具体的な内容
-- ログから読み取れる傾向に基づく提案
-            """
-            
-            response = self.model.generate_content(prompt)
-            suggestions_text = response.text
+            suggestions_text = self._generate(get_prompt("suggestions"), "suggestions", log_summary=log_summary)
             
             # 提案を抽出
             suggestions = []
@@ -214,6 +227,7 @@ class GeminiService:
             
         except Exception as e:
             print(f"Suggestions error: {e}")
+            record_fallback("suggestions", "error")
             return [
                 "家族でゆっくりと過ごす時間を作ってみませんか？",
                 "子どもたちとの会話を増やしてみるのはいかがでしょうか？",
@@ -0,0 +1,147 @@
+"""
+KazokuLog 外部サービスへのHTTP接続プール
+Supabase（PostgREST）・スタブLLM・OTLPへのリクエストで、プロセス内の1つの接続プールを共有する
+
+- 接続は使い終わっても OUTBOUND_KEEPALIVE_EXPIRY 秒まで残し、次のリクエストで使い回す（TCP・TLSのハンドシェイクを毎回しない）
+- HTTPS の接続先が対応していれば HTTP/2 で1本の接続に複数のリクエストを多重化する（h2 がインストールされている場合）
+- 接続数の上限はスレッドプール（anyio のデフォルト40）に合わせ、同時に外部を呼ぶスレッドがプールの空きを待たないようにする
+- 名前解決の結果は DNS_CACHE_TTL_SECONDS 秒キャッシュする。接続に失敗したらそのホストのキャッシュを捨てる
+- httpx は import に時間がかかるため、このモジュールは使うクライアントの生成時に読み込む（コールドスタートに含めない）
+
+クライアント（base_url・ヘッダー・タイムアウト）は使う側ごとに pooled_client() で作り、下の接続プールだけを共有する。
+"""
+import importlib.util
+import os
+import socket
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpcore
+import httpx
+
+from .clients import LazyClient
+from .metrics import REGISTRY
+
+OUTBOUND_MAX_CONNECTIONS = int(os.getenv("OUTBOUND_MAX_CONNECTIONS", "40"))
+OUTBOUND_MAX_KEEPALIVE = int(os.getenv("OUTBOUND_MAX_KEEPALIVE", "20"))
+OUTBOUND_KEEPALIVE_EXPIRY = float(os.getenv("OUTBOUND_KEEPALIVE_EXPIRY", "60"))
+OUTBOUND_HTTP2 = os.getenv("OUTBOUND_HTTP2", "1") == "1"
+OUTBOUND_TIMEOUT_SECONDS = float(os.getenv("OUTBOUND_TIMEOUT_SECONDS", "30"))
+OUTBOUND_CONNECT_TIMEOUT_SECONDS = 5.0
+DNS_CACHE_TTL_SECONDS = float(os.getenv("DNS_CACHE_TTL_SECONDS", "300"))
+
+# HTTP/2 は h2 がなければ使わない（HTTP/1.1 の keep-alive だけになる）
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+outbound_connections = REGISTRY.counter(
+    "kazokulog_outbound_connections_total",
+    "外部サービスへ新しく張ったTCP接続の数（リクエスト数より十分少なければ接続を使い回せている）",
+    ("host",),
+)
+dns_lookups = REGISTRY.counter(
+    "kazokulog_dns_cache_total",
+    "外部サービスのホスト名の解決（outcome: hit / miss）",
+    ("outcome",),
+)
+
+
+class DNSCache:
+    """getaddrinfo の結果を TTL の間キャッシュする（スレッド間で共有する）"""
+
+    def __init__(self, ttl: float = DNS_CACHE_TTL_SECONDS,
+                 resolve: Callable[..., list] = socket.getaddrinfo, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.resolve = resolve
+        self.clock = clock
+        self._entries: Dict[Tuple[str, int], Tuple[float, List[str]]] = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, host: str, port: int) -> List[str]:
+        """host のIPアドレス（getaddrinfo の順）"""
+        key = (host, port)
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            dns_lookups.inc(outcome="hit")
+            return entry[1]
+        dns_lookups.inc(outcome="miss")
+        addresses = []
+        for info in self.resolve(host, port, type=socket.SOCK_STREAM):
+            address = info[4][0]
+            if address not in addresses:
+                addresses.append(address)
+        with self._lock:
+            self._entries[key] = (now + self.ttl, addresses)
+        return addresses
+
+    def forget(self, host: str, port: int) -> None:
+        with self._lock:
+            self._entries.pop((host, port), None)
+
+
+class CachingDNSBackend(httpcore.SyncBackend):
+    """名前解決を DNSCache で済ませてからTCP接続する（TLSのSNI・証明書の検証は元のホスト名で行われる）"""
+
+    def __init__(self, dns: DNSCache):
+        self.dns = dns
+
+    def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        last_error: Optional[Exception] = None
+        for address in self.dns.lookup(host, port):
+            try:
+                stream = super().connect_tcp(address, port, timeout=timeout, local_address=local_address,
+                                             socket_options=socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                last_error = e
+                continue
+            outbound_connections.inc(host=host)
+            return stream
+        # アドレスが変わった可能性があるので、次の接続では引き直す
+        self.dns.forget(host, port)
+        raise last_error or httpcore.ConnectError(f"{host} のアドレスが見つかりません")
+
+
+class PooledTransport(httpx.HTTPTransport):
+    """keep-alive・HTTP/2・DNSキャッシュ付きの接続プール"""
+
+    def __init__(self, max_connections: int = OUTBOUND_MAX_CONNECTIONS,
+                 max_keepalive: int = OUTBOUND_MAX_KEEPALIVE, keepalive_expiry: float = OUTBOUND_KEEPALIVE_EXPIRY,
+                 http2: bool = OUTBOUND_HTTP2, verify=True, dns: Optional[DNSCache] = None):
+        http2 = http2 and HTTP2_AVAILABLE
+        ssl_context = httpx.create_ssl_context(verify=verify)
+        super().__init__(verify=ssl_context, http2=http2)
+        # HTTPTransport は接続の張り方を差し替えられないため、同じ設定のプールを作り直す
+        self._pool = httpcore.ConnectionPool(
+            ssl_context=ssl_context,
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+            http1=True,
+            http2=http2,
+            network_backend=CachingDNSBackend(dns or DNSCache()),
+        )
+
+    def close(self) -> None:
+        # プールは複数のクライアントで共有するので、個々のクライアントの close() では閉じない
+        pass
+
+    def shutdown(self) -> None:
+        self._pool.close()
+
+
+def _create_transport() -> PooledTransport:
+    transport = PooledTransport()
+    print(f"🔌 外部接続プール: 最大{OUTBOUND_MAX_CONNECTIONS}接続 / keep-alive {OUTBOUND_MAX_KEEPALIVE}接続・"
+          f"{OUTBOUND_KEEPALIVE_EXPIRY:g}秒 / HTTP/2 {'有効' if OUTBOUND_HTTP2 and HTTP2_AVAILABLE else '無効'}")
+    return transport
+
+
+shared_transport = LazyClient("http", _create_transport)
+
+
+def pooled_client(**kwargs) -> httpx.Client:
+    """共有の接続プールを使う httpx.Client（base_url・headers などは kwargs で指定）"""
+    kwargs.setdefault("timeout", httpx.Timeout(OUTBOUND_TIMEOUT_SECONDS, connect=OUTBOUND_CONNECT_TIMEOUT_SECONDS))
+    return httpx.Client(transport=shared_transport.get(), **kwargs)
@@ -0,0 +1,105 @@
+"""
+KazokuLog 買い物リスト・ToDoリスト
+買い物・ToDoに分類したエントリから品目・やることを取り出し、家族ごとのリスト（shopping_items / todo_items）に載せる
+
+- エントリの保存時（/api/logs, /api/logs/extract）に追加するので、未完了の項目を一覧するときに過去のログを読み直さない
+- 同じ品目（正規化した名前が同じ）が未完了のまま残っていれば新しく作らず、言及回数（mention_count）を増やしてまとめる
+- 完了にした項目は履歴として残り、同じ品目がまた出てきたら新しい項目になる
+"""
+import re
+from typing import Any, Dict, Iterable, List
+
+from .dedup import normalize_text
+from .metrics import REGISTRY
+
+# リストの種類 -> テーブル名（種類はエントリのカテゴリ名と同じ）
+LIST_KINDS = {"shopping": "shopping_items", "todo": "todo_items"}
+ITEM_NAME_MAX_LENGTH = 100
+
+list_items_recorded = REGISTRY.counter(
+    "kazokulog_list_items_total",
+    "エントリから買い物・ToDoリストに載せた項目数（action: added / merged）",
+    ("kind", "action"),
+)
+
+_BRACKETS = re.compile(r"[(（]([^)）]*)[)）]")
+_SHOPPING_PLACE = re.compile(r"^.*?(スーパー|ドラッグストア|コンビニ|薬局|ホームセンター|100均|百均)(で|に行って|に寄って)")
+_SHOPPING_VERB = re.compile(
+    r"(を|も|が)?(買(う|った|っておく|っとく|わなきゃ|わないと|い足す|いに行く|い物)|購入|補充|切れ(た|そう)|なくなりそう).*$"
+)
+_TODO_VERB = re.compile(
+    r"(を)?(やる|やらなきゃ|やらないと|しなければ(ならない|いけない)?|しなきゃ|しないと|する(こと)?|やること)[。!！]*$"
+)
+_ITEM_SEPARATORS = re.compile(r"[、・,，/／&＆]")
+_KANJI = re.compile(r"[\u4e00-\u9fff]")
+# 品目と呼べない語（「買い物に行く」などは品目なしとして扱う）
+_GENERIC_NAMES = {"買い物", "かいもの", "スーパー", "もの", "物", "いろいろ", "色々"}
+
+
+def normalize_item_name(name: str) -> str:
+    """リストの項目をまとめるためのキー（全角・半角、カタカナ・ひらがな、記号の違いを無視する）"""
+    normalized = normalize_text(name)
+    return "".join(chr(ord(char) - 0x60) if "ァ" <= char <= "ヶ" else char for char in normalized)
+
+
+def _split_names(text: str) -> List[str]:
+    names = [name.strip() for name in _ITEM_SEPARATORS.split(text) if name.strip()]
+    # 「卵と牛乳」は分けるが、「ところてん」「ひとくちゼリー」は分けない（どの部分も2文字以上か漢字1文字のときだけ）
+    split = []
+    for name in names:
+        parts = name.split("と")
+        if len(parts) > 1 and all(len(part) >= 2 or _KANJI.fullmatch(part) for part in parts):
+            split.extend(parts)
+        else:
+            split.append(name)
+    return split
+
+
+def shopping_item_names(text: str) -> List[str]:
+    """
+    買い物のエントリから品目を取り出す
+    例: "お弁当の材料(卵、ウインナー)を買う" -> ["卵", "ウインナー"] / "スーパーで牛乳と食パンを買う" -> ["牛乳", "食パン"]
+    """
+    # 括弧の中に複数の品目が並んでいれば、それを品目とする（「牛乳(2本)」のような数量は捨てる）
+    for contents in _BRACKETS.findall(text):
+        names = _split_names(contents)
+        if len(names) > 1:
+            return names
+    text = _BRACKETS.sub("", text)
+    text = _SHOPPING_PLACE.sub("", text)
+    text = _SHOPPING_VERB.sub("", text).strip()
+    return [name for name in _split_names(text) if name not in _GENERIC_NAMES]
+
+
+def todo_item_name(text: str) -> str:
+    """ToDoのエントリからやることを取り出す（例: "保育園の申請をしなければ" -> "保育園の申請"）"""
+    text = text.strip()
+    return _TODO_VERB.sub("", text).strip() or text
+
+
+def list_items_from_entries(entries: Iterable[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    保存したエントリ（id / original_text / category / date）から、リストの種類ごとの項目を作る
+    同じ投稿の中で同じ品目が繰り返された場合は1つにする
+    """
+    items: Dict[str, Dict[str, Dict[str, Any]]] = {kind: {} for kind in LIST_KINDS}
+    for entry in entries:
+        category = entry["category"]
+        if category == "shopping":
+            names = shopping_item_names(entry["original_text"])
+        elif category == "todo":
+            names = [todo_item_name(entry["original_text"])]
+        else:
+            continue
+        for name in names:
+            name = name[:ITEM_NAME_MAX_LENGTH]
+            normalized = normalize_item_name(name)
+            if not normalized:
+                continue
+            items[category].setdefault(normalized, {
+                "name": name,
+                "normalized_name": normalized,
+                "log_entry_id": str(entry["id"]),
+                "log_entry_date": str(entry["date"]),
+            })
+    return {kind: list(by_name.values()) for kind, by_name in items.items() if by_name}
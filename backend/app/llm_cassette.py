@@ -0,0 +1,183 @@
+"""
+KazokuLog LLM応答のカセット（記録と再生）
+実際のLLMの応答を一度だけカセット（JSONL）に記録し、以降はネットワークなしで同じ応答を再生する
+
+- LLM_CASSETTE_MODE=record: 通常どおりLLM（またはスタブ）を呼び、プロンプトのハッシュ・応答・レイテンシ・
+  ストリーミングのチャンクの到着時刻をカセットに追記する
+- LLM_CASSETTE_MODE=replay（デフォルト）: LLMを呼ばず、記録したレイテンシ（LLM_CASSETTE_LATENCY_SCALE 倍）だけ待って応答を返す
+- 再生時はまず操作とプロンプトが同じ記録を探す。LLM_CASSETTE_MATCH=operation（デフォルト）なら、見つからなくても
+  同じ操作の記録をプロンプトのハッシュで選んで返す（負荷試験でプロンプトが毎回少しずつ違っても、応答の大きさと時間は実物どおり）
+- 同じプロンプトを複数回記録した場合は、記録した順に繰り返し返す
+
+    LLM_CASSETTE_PATH=cassettes/load.jsonl LLM_CASSETTE_MODE=record GEMINI_API_KEY=... uvicorn app.main:app
+    LLM_CASSETTE_PATH=cassettes/load.jsonl LLM_CASSETTE_LATENCY_SCALE=0.5 uvicorn app.main:app
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .metrics import REGISTRY
+
+LLM_CASSETTE_PATH = os.getenv("LLM_CASSETTE_PATH")
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "replay")
+LLM_CASSETTE_LATENCY_SCALE = float(os.getenv("LLM_CASSETTE_LATENCY_SCALE", "1.0"))
+LLM_CASSETTE_MATCH = os.getenv("LLM_CASSETTE_MATCH", "operation")
+
+CASSETTE_MODES = ("record", "replay")
+CASSETTE_MATCHES = ("exact", "operation")
+
+cassette_calls = REGISTRY.counter(
+    "kazokulog_llm_cassette_total",
+    "カセットでのLLM呼び出し（outcome: recorded / hit / substituted / miss）",
+    ("operation", "outcome"),
+)
+
+
+class CassetteMiss(Exception):
+    """再生するカセットに該当する記録がない"""
+
+
+def prompt_digest(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+class LLMCassette:
+    """LLM呼び出しを記録・再生するラッパー"""
+
+    def __init__(self, path: str, mode: str = "replay", latency_scale: float = 1.0, match: str = "operation",
+                 sleep: Callable[[float], None] = time.sleep):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"LLM_CASSETTE_MODE は {CASSETTE_MODES} のいずれかです: {mode}")
+        if match not in CASSETTE_MATCHES:
+            raise ValueError(f"LLM_CASSETTE_MATCH は {CASSETTE_MATCHES} のいずれかです: {match}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.match = match
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        # (operation, プロンプトのハッシュ) -> 記録、operation -> 記録（ハッシュ順）
+        self.by_prompt: Dict[Tuple[str, str], List[Dict]] = {}
+        self.by_operation: Dict[str, List[Dict]] = {}
+        self.replayed: Dict[Tuple[str, str], int] = {}
+        if mode == "replay":
+            self._load()
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"カセットがありません: {self.path}（LLM_CASSETTE_MODE=record で記録してください）")
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    self._index(json.loads(line))
+        for records in self.by_operation.values():
+            records.sort(key=lambda record: record["prompt_sha256"])
+
+    def _index(self, record: Dict) -> None:
+        self.by_prompt.setdefault((record["operation"], record["prompt_sha256"]), []).append(record)
+        self.by_operation.setdefault(record["operation"], []).append(record)
+
+    def __len__(self) -> int:
+        return sum(len(records) for records in self.by_operation.values())
+
+    def _append(self, record: Dict) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+            self._index(record)
+
+    def _record(self, prompt: str, operation: str, output_text: str, latency_ms: float,
+                chunks: Optional[List[List]] = None) -> None:
+        record = {
+            "operation": operation,
+            "prompt_sha256": prompt_digest(prompt),
+            "prompt_chars": len(prompt),
+            "output_text": output_text,
+            "latency_ms": round(latency_ms, 1),
+            "recorded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }
+        if chunks is not None:
+            record["chunks"] = chunks
+        self._append(record)
+        cassette_calls.inc(operation=operation, outcome="recorded")
+
+    def lookup(self, prompt: str, operation: str) -> Dict:
+        """再生する記録を選ぶ（見つからなければ CassetteMiss）"""
+        digest = prompt_digest(prompt)
+        key = (operation, digest)
+        records = self.by_prompt.get(key)
+        if records:
+            with self.lock:
+                count = self.replayed.get(key, 0)
+                self.replayed[key] = count + 1
+            cassette_calls.inc(operation=operation, outcome="hit")
+            return records[count % len(records)]
+        candidates = self.by_operation.get(operation)
+        if self.match == "operation" and candidates:
+            cassette_calls.inc(operation=operation, outcome="substituted")
+            return candidates[int(digest[:8], 16) % len(candidates)]
+        cassette_calls.inc(operation=operation, outcome="miss")
+        raise CassetteMiss(f"カセットに {operation} の記録がありません（prompt_sha256={digest[:12]}）")
+
+    def _wait_until(self, start: float, offset_ms: float) -> None:
+        remaining = start + offset_ms * self.latency_scale / 1000.0 - time.perf_counter()
+        if remaining > 0:
+            self.sleep(remaining)
+
+    def generate(self, prompt: str, operation: str, call: Callable[[], str]) -> str:
+        """
+        記録時は call() でLLMを呼んで記録し、再生時は記録した応答を返す
+
+        Args:
+            call: 実際にLLMを呼んで生成テキストを返す関数（再生時は呼ばない）
+        """
+        start = time.perf_counter()
+        if self.recording:
+            output_text = call()
+            self._record(prompt, operation, output_text, (time.perf_counter() - start) * 1000)
+            return output_text
+        record = self.lookup(prompt, operation)
+        self._wait_until(start, record["latency_ms"])
+        return record["output_text"]
+
+    def stream(self, prompt: str, operation: str, call: Callable[[], Iterator[str]]) -> Iterator[str]:
+        """
+        generate のストリーミング版
+        チャンクごとの到着時刻を記録し、再生時も同じ間隔（LLM_CASSETTE_LATENCY_SCALE 倍）で返す
+        """
+        start = time.perf_counter()
+        if self.recording:
+            chunks = []
+            for chunk in call():
+                chunks.append([round((time.perf_counter() - start) * 1000, 1), chunk])
+                yield chunk
+            self._record(prompt, operation, "".join(chunk for _, chunk in chunks),
+                         (time.perf_counter() - start) * 1000, chunks)
+            return
+        record = self.lookup(prompt, operation)
+        # 一括で記録した応答は、記録したレイテンシのあとにまとめて返す
+        for offset_ms, chunk in record.get("chunks") or [[record["latency_ms"], record["output_text"]]]:
+            self._wait_until(start, offset_ms)
+            yield chunk
+
+
+def load_cassette() -> Optional[LLMCassette]:
+    """LLM_CASSETTE_PATH が設定されていればカセットを開く"""
+    if not LLM_CASSETTE_PATH:
+        return None
+    return LLMCassette(LLM_CASSETTE_PATH, LLM_CASSETTE_MODE, LLM_CASSETTE_LATENCY_SCALE, LLM_CASSETTE_MATCH)
+
+
+llm_cassette = load_cassette()
@@ -0,0 +1,217 @@
+"""
+KazokuLog LLMレスポンスの構造化パーサー
+全プロバイダ共通で、応答テキストからJSONオブジェクトを取り出して分類スキーマで検証する
+
+- 応答を先頭から一度だけ走査し、'{' の位置から json.JSONDecoder.raw_decode で直接デコードする
+  （部分文字列を切り出さないので、長い応答でも余計なコピーをしない）
+- ```json コードフェンス・前後の説明文・ネストした配列/オブジェクト・文字列中の括弧に対応
+- 解析の試行回数と失敗回数を /metrics に記録する
+"""
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from .metrics import REGISTRY, record_parse_failure
+
+CATEGORIES = ("schedule", "emotion", "shopping", "todo", "memo")
+
+_decoder = json.JSONDecoder()
+
+llm_parse_attempts = REGISTRY.counter(
+    "kazokulog_llm_parse_attempts_total",
+    "LLMレスポンスの解析試行回数（失敗率 = parse_failures / parse_attempts）",
+    ("provider", "model", "operation"),
+)
+
+
+class LLMParseError(ValueError):
+    """LLMレスポンスから期待する構造を取り出せない"""
+
+
+def extract_json_object(text: str, required_key: Optional[str] = None) -> Dict[str, Any]:
+    """
+    テキスト中の最初のJSONオブジェクトを返す
+
+    Args:
+        text: LLMの応答テキスト
+        required_key: 指定した場合、このキーを持つオブジェクトだけを対象にする
+                      （説明文中の {例} などを読み飛ばすため）
+    """
+    if not text:
+        raise LLMParseError("Empty response")
+
+    index = text.find("{")
+    while index != -1:
+        try:
+            value, end = _decoder.raw_decode(text, index)
+        except json.JSONDecodeError:
+            index = text.find("{", index + 1)
+            continue
+        if isinstance(value, dict):
+            found = value if required_key is None else _find_object_with_key(value, required_key)
+            if found is not None:
+                return found
+        # デコードできたが対象外のオブジェクトは丸ごと読み飛ばす
+        index = text.find("{", end)
+    raise LLMParseError("No JSON object found in response")
+
+
+def _find_object_with_key(value: Any, key: str) -> Optional[Dict[str, Any]]:
+    """{"result": {"category": ...}} のように包まれた場合も対象のオブジェクトを探す"""
+    if isinstance(value, dict):
+        if key in value:
+            return value
+        children = value.values()
+    elif isinstance(value, list):
+        children = value
+    else:
+        return None
+    for child in children:
+        found = _find_object_with_key(child, key)
+        if found is not None:
+            return found
+    return None
+
+
+def _as_keywords(value: Any) -> List[str]:
+    if isinstance(value, str):
+        value = value.replace("、", ",").split(",")
+    if not isinstance(value, list):
+        raise LLMParseError("keywords must be a list")
+    return [str(keyword).strip() for keyword in value if str(keyword).strip()]
+
+
+def validate_classification(data: Dict[str, Any]) -> Dict[str, Any]:
+    """分類スキーマで検証し、型を揃えた辞書を返す"""
+    for field in ("category", "confidence_score", "summary", "keywords"):
+        if field not in data:
+            raise LLMParseError(f"Missing required field: {field}")
+
+    category = str(data["category"]).strip().lower()
+    if category not in CATEGORIES:
+        raise LLMParseError(f"Unknown category: {data['category']}")
+
+    try:
+        confidence = float(data["confidence_score"])
+    except (TypeError, ValueError):
+        raise LLMParseError(f"Invalid confidence_score: {data['confidence_score']!r}")
+
+    return {
+        "category": category,
+        "confidence_score": min(1.0, max(0.0, confidence)),
+        "summary": str(data["summary"]),
+        "keywords": _as_keywords(data["keywords"]),
+        "reasoning": str(data.get("reasoning", "")),
+    }
+
+
+def validate_extraction(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """複数項目の抽出結果（{"items": [...]}）を検証し、各項目に元のテキスト（text）を付けて返す"""
+    items = data.get("items")
+    if not isinstance(items, list) or not items:
+        raise LLMParseError("items must be a non-empty list")
+    result = []
+    for item in items:
+        if not isinstance(item, dict):
+            raise LLMParseError("each item must be an object")
+        validated = validate_classification(item)
+        validated["text"] = str(item.get("text") or validated["summary"]).strip()
+        result.append(validated)
+    return result
+
+
+def validate_event(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    予定の日時の抽出結果を検証する（日時が読み取れなかった場合は None）
+    event_at は naive な datetime、all_day は時刻がない場合に True
+    """
+    value = data.get("event_at")
+    if value in (None, "", "null"):
+        return None
+    value = str(value).strip()
+    try:
+        event_at = datetime.fromisoformat(value.replace(" ", "T"))
+    except ValueError:
+        raise LLMParseError(f"Invalid event_at: {value!r}")
+    return {
+        "event_at": event_at.replace(tzinfo=None),
+        "all_day": len(value) <= 10,
+        "title": str(data.get("title") or "").strip(),
+    }
+
+
+def validate_digest(data: Dict[str, Any]) -> Dict[str, Any]:
+    """1日のまとめ（{"summary": ..., "suggestions": [...]}）を検証する（提案は3件まで）"""
+    summary = str(data.get("summary") or "").strip()
+    if not summary:
+        raise LLMParseError("Missing required field: summary")
+    suggestions = data.get("suggestions")
+    if not isinstance(suggestions, list):
+        raise LLMParseError("suggestions must be a list")
+    suggestions = [str(suggestion).strip() for suggestion in suggestions if str(suggestion).strip()]
+    if not suggestions:
+        raise LLMParseError("suggestions must not be empty")
+    return {"summary": summary, "suggestions": suggestions[:3]}
+
+
+def parse_classification(text: str) -> Dict[str, Any]:
+    """分類用のLLM応答を解析（失敗時は LLMParseError）"""
+    return validate_classification(extract_json_object(text, required_key="category"))
+
+
+def parse_extraction(text: str) -> List[Dict[str, Any]]:
+    """複数項目の抽出用のLLM応答を解析（失敗時は LLMParseError）"""
+    return validate_extraction(extract_json_object(text, required_key="items"))
+
+
+def parse_event(text: str) -> Optional[Dict[str, Any]]:
+    """予定の日時の抽出用のLLM応答を解析（失敗時は LLMParseError）"""
+    return validate_event(extract_json_object(text, required_key="event_at"))
+
+
+def parse_digest(text: str) -> Dict[str, Any]:
+    """1日のまとめ用のLLM応答を解析（失敗時は LLMParseError）"""
+    return validate_digest(extract_json_object(text, required_key="summary"))
+
+
+def parse_classification_response(text: str, provider: str, model: str,
+                                  operation: str = "classify") -> Dict[str, Any]:
+    """parse_classification に解析試行・失敗のメトリクス記録を加えたもの"""
+    llm_parse_attempts.inc(provider=provider, model=model, operation=operation)
+    try:
+        return parse_classification(text)
+    except LLMParseError:
+        record_parse_failure(provider, model, operation)
+        raise
+
+
+def parse_extraction_response(text: str, provider: str, model: str,
+                              operation: str = "extract") -> List[Dict[str, Any]]:
+    """parse_extraction に解析試行・失敗のメトリクス記録を加えたもの"""
+    llm_parse_attempts.inc(provider=provider, model=model, operation=operation)
+    try:
+        return parse_extraction(text)
+    except LLMParseError:
+        record_parse_failure(provider, model, operation)
+        raise
+
+
+def parse_event_response(text: str, provider: str, model: str,
+                         operation: str = "event") -> Optional[Dict[str, Any]]:
+    """parse_event に解析試行・失敗のメトリクス記録を加えたもの"""
+    llm_parse_attempts.inc(provider=provider, model=model, operation=operation)
+    try:
+        return parse_event(text)
+    except LLMParseError:
+        record_parse_failure(provider, model, operation)
+        raise
+
+
+def parse_digest_response(text: str, provider: str, model: str, operation: str = "digest") -> Dict[str, Any]:
+    """parse_digest に解析試行・失敗のメトリクス記録を加えたもの"""
+    llm_parse_attempts.inc(provider=provider, model=model, operation=operation)
+    try:
+        return parse_digest(text)
+    except LLMParseError:
+        record_parse_failure(provider, model, operation)
+        raise
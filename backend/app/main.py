@@ -3,22 +3,121 @@ KazokuLog FastAPI バックエンド - Gemini API版
 テキスト入力 → 分類 → 保存 → 表示の一連の処理
 """
 import os
-import json
-import re
-from datetime import datetime, date
+import hashlib
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from functools import partial
+from datetime import datetime, date, timedelta, timezone
 from typing import List, Optional
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Depends, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from supabase import create_client, Client
 import uuid
 from dotenv import load_dotenv
-import google.generativeai as genai
+
+from .admin import require_admin
+from .archive import ArchiveNotConfigured, archive_client, hot_start, month_of, run_archive
+from .cache import TTLCache, etag_matches
+from .categories import CATEGORIES_CACHE_CONTROL, CategoryCache
+from .chat_memory import (
+    CHAT_SUMMARY_MAX_CHARS,
+    CHAT_TURNS_PAGE_SIZE,
+    NO_HISTORY,
+    build_history,
+    summarize,
+    turns_to_summarize,
+)
+from .clients import get_client, register_client, warm_up
+from .degradation import degradation, run_deferred_write
+from .dedup import (
+    DEDUP_WINDOW_SIZE,
+    duplicate_entries,
+    find_near_duplicate,
+    find_near_duplicate_note,
+    like_prefix,
+    pending_writes,
+    simhash,
+    window_start,
+)
+from .digest import (
+    DIGEST_CONCURRENCY,
+    DIGEST_MAX_PROMPT_TOKENS,
+    DIGEST_OUTPUT_TOKENS,
+    RULES_DIGEST_VERSION,
+    TokenBudget,
+    digest_day,
+    digest_suggestions_served,
+    fallback_digest_summary,
+    fit_entries,
+    run_digests,
+    source_hash,
+)
+from .events import (
+    EVENT_TIMEZONE,
+    ICAL_FUTURE_DAYS,
+    ICAL_PAST_DAYS,
+    build_ical,
+    day_start,
+    events_from_entries,
+    parse_event,
+    today,
+)
+from .extraction import cap_items, group_segments, split_note
+from .items import LIST_KINDS, list_items_from_entries, list_items_recorded
+from .llm_cassette import llm_cassette
+from .llm_parsing import (
+    LLMParseError,
+    parse_classification_response,
+    parse_digest_response,
+    parse_event_response,
+    parse_extraction_response,
+)
+from .metrics import (
+    REGISTRY,
+    PrometheusMiddleware,
+    current_family_id,
+    estimate_tokens,
+    record_fallback,
+    record_parse_failure,
+    track_llm_call,
+)
+from .profiling import (
+    PROFILE_FORMATS,
+    PROFILER_ALWAYS_ON,
+    ProfilerBusy,
+    RouteCPUMiddleware,
+    profile_body,
+    profiler,
+    route_cpu_table,
+    run_in_threadpool,
+)
+from .prompts import get_prompt
+from .rate_limit import LLMBudgetExceeded, llm_budget, rate_limiter
+from .realtime import SubscriberLimitExceeded, broker, publish_log_entry, start_postgres_bridge
+from .routing import classification_router
+from .shared_state import bus, local_store
+from .stub_llm import generate_with_stub, stream_with_stub
+from .tracing import SPAN_KIND_CLIENT, TracingMiddleware, span
 
 # 環境変数を読み込み
 load_dotenv()
 
-app = FastAPI(title="KazokuLog API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 常駐サーバーでは WARMUP_ON_STARTUP=1 で起動時にSDKとカテゴリ一覧を読み込んでおく
+    if os.getenv("WARMUP_ON_STARTUP") == "1":
+        timings = await run_in_threadpool(warm_up_app)
+        print(f"🔥 ウォームアップ完了: {timings}")
+    start_postgres_bridge()
+    bus.start()
+    if PROFILER_ALWAYS_ON:
+        profiler.start_continuous()
+    yield
+
+app = FastAPI(title="KazokuLog API", version="1.0.0", lifespan=lifespan)
 
 # CORS設定 - 本番用に更新
 app.add_middleware(
@@ -27,39 +126,91 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 差分同期でフロントエンドが変更番号を読めるようにする
+    expose_headers=["ETag", "X-Change-Seq", "X-Duplicate"],
 )
+app.add_middleware(RouteCPUMiddleware)
+app.add_middleware(PrometheusMiddleware)
+app.add_middleware(TracingMiddleware)
 
 # 環境変数設定
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_ANON_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_TEXT_MODEL = "models/text-bison-001"
+# ベンチマーク用: 設定するとGemini APIの代わりにスタブLLMサーバーを使う
+LLM_STUB_URL = os.getenv("LLM_STUB_URL")
+# LLM_CASSETTE_PATH を設定すると、記録済みの応答を再生する（LLM_CASSETTE_MODE=record なら記録する）
+LLM_REPLAYING = llm_cassette is not None and not llm_cassette.recording
+LLM_ENABLED = bool(GEMINI_API_KEY or LLM_STUB_URL or LLM_REPLAYING)
+LLM_PROVIDER = "cassette" if LLM_REPLAYING else "stub" if LLM_STUB_URL else "gemini"
+# ルールベース分類の結果に記録するバージョン
+RULES_CLASSIFIER_VERSION = "rules@1"
+
+# Gemini / Supabase のSDKは最初に使うときに読み込む（コールドスタート短縮のため）
+def _create_genai():
+    import google.generativeai as genai
+    genai.configure(api_key=GEMINI_API_KEY)
+    return genai
+
+def _create_supabase():
+    from .http_pool import pooled_client
+    from .supabase_client import PooledSupabaseClient
+    # PostgREST への接続は共有の接続プールで使い回す（keep-alive・HTTP/2）
+    # httpx.Client はサブクライアントごとに作る（base_url とヘッダーを書き換えられるため共有しない）
+    # レスポンスまでの時間は縮退運転の判断に使う
+    return PooledSupabaseClient(
+        SUPABASE_URL, SUPABASE_KEY,
+        lambda: pooled_client(follow_redirects=True, event_hooks=degradation.httpx_event_hooks("supabase")),
+    )
 
 # Gemini APIの設定
 if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+    register_client("gemini", _create_genai)
     print("🤖 Gemini API連携が有効になりました")
 else:
     print("⚠️ Gemini APIキーが設定されていません。フォールバック機能を使用します。")
 
 # Supabaseクライアント（オプション）
-supabase = None
 if SUPABASE_URL and SUPABASE_KEY:
-    supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    register_client("supabase", _create_supabase)
     print("📊 Supabase連携が有効になりました")
 else:
     print("⚠️ Supabase設定が不完全です。メモリベースで動作します。")
 
-# テスト用のメモリデータベース
-test_families = {}
-test_log_entries = {}
+# LLMの分類結果（キーはプロンプトのバージョンと本文のハッシュ）
+classification_cache = TTLCache(maxsize=4096, ttl=24 * 3600)
+
+# LLMの直近の応答（レート制限時の代替応答に使う）
+chat_response_cache = TTLCache(maxsize=2048, ttl=6 * 3600)
+suggestions_cache = TTLCache(maxsize=1024, ttl=24 * 3600)
+
+# アーカイブから読み出した家族×月のエントリ（アーカイブ処理のたびに捨てる）
+archive_cache = TTLCache(maxsize=256, ttl=3600)
+
+# Supabase 未設定時の家族・ログは local_store（shared_state.py）に持つ
+# IDは名前から決めて、プロセスが違っても同じ一覧（同じETag）になるようにする
 test_categories = [
-    {"id": str(uuid.uuid4()), "name": "schedule", "display_name": "予定・イベント", "color": "#3B82F6", "icon": "calendar"},
-    {"id": str(uuid.uuid4()), "name": "emotion", "display_name": "子どもの様子", "color": "#EF4444", "icon": "heart"},
-    {"id": str(uuid.uuid4()), "name": "shopping", "display_name": "買い物リスト", "color": "#10B981", "icon": "shopping-cart"},
-    {"id": str(uuid.uuid4()), "name": "todo", "display_name": "家族のToDo", "color": "#F59E0B", "icon": "check-square"},
-    {"id": str(uuid.uuid4()), "name": "memo", "display_name": "雑談・メモ", "color": "#8B5CF6", "icon": "file-text"},
+    {"id": str(uuid.uuid5(uuid.NAMESPACE_URL, "kazokulog:category:schedule")), "name": "schedule", "display_name": "予定・イベント", "color": "#3B82F6", "icon": "calendar"},
+    {"id": str(uuid.uuid5(uuid.NAMESPACE_URL, "kazokulog:category:emotion")), "name": "emotion", "display_name": "子どもの様子", "color": "#EF4444", "icon": "heart"},
+    {"id": str(uuid.uuid5(uuid.NAMESPACE_URL, "kazokulog:category:shopping")), "name": "shopping", "display_name": "買い物リスト", "color": "#10B981", "icon": "shopping-cart"},
+    {"id": str(uuid.uuid5(uuid.NAMESPACE_URL, "kazokulog:category:todo")), "name": "todo", "display_name": "家族のToDo", "color": "#F59E0B", "icon": "check-square"},
+    {"id": str(uuid.uuid5(uuid.NAMESPACE_URL, "kazokulog:category:memo")), "name": "memo", "display_name": "雑談・メモ", "color": "#8B5CF6", "icon": "file-text"},
 ]
 
+def load_categories():
+    """カテゴリ一覧をデータソースから読み込む（category_cache から呼ばれる）"""
+    supabase = get_client("supabase")
+    if supabase:
+        with span("db.categories.select"):
+            result = supabase.table("categories").select("*").order("name").execute()
+        return result.data
+    # メモリベースのフォールバック
+    return test_categories
+
+# カテゴリ一覧はプロセスごとに一度だけ読み込む
+category_cache = CategoryCache(load_categories)
+
 # データモデル
 class LogEntryCreate(BaseModel):
     """ログエントリ作成用モデル"""
@@ -77,6 +228,7 @@ class LogEntryResponse(BaseModel):
     keywords: List[str]
     confidence_score: float
     created_at: datetime
+    change_seq: int = 0
 
 class FamilyCreate(BaseModel):
     """家族作成用モデル"""
@@ -90,72 +242,179 @@ class FamilyResponse(BaseModel):
     created_at: datetime
 
 class ChatRequest(BaseModel):
-    """AIチャットリクエスト用モデル"""
+    """AIチャットリクエスト用モデル（session_id を指定すると会話の続きとして答える）"""
     question: str
     family_access_key: str
+    session_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     """AIチャットレスポンス用モデル"""
     response: str
     timestamp: datetime
+    session_id: Optional[str] = None
+
+class ChatSessionCreate(BaseModel):
+    """AIチャットの会話作成用モデル"""
+    family_access_key: str
+
+class ChatTurnResponse(BaseModel):
+    """AIチャットの発言レスポンス用モデル"""
+    seq: int
+    role: str
+    content: str
+    created_at: datetime
+
+class ChatSessionResponse(BaseModel):
+    """AIチャットの会話レスポンス用モデル（発言は最後の50件）"""
+    id: str
+    summary: str
+    turns: List[ChatTurnResponse]
+    created_at: datetime
+
+class DigestResponse(BaseModel):
+    """1日のまとめレスポンス用モデル"""
+    date: date
+    summary: str
+    suggestions: List[str]
+    entry_count: int
+    generated_by: str
+    created_at: datetime
 
 class SuggestionsResponse(BaseModel):
     """AI提案レスポンス用モデル"""
     suggestions: List[str]
     timestamp: datetime
 
+class ListItemResponse(BaseModel):
+    """買い物リスト・ToDoリストの項目レスポンス用モデル"""
+    id: str
+    kind: str
+    name: str
+    done: bool
+    mention_count: int
+    log_entry_id: Optional[str] = None
+    log_entry_date: Optional[date] = None
+    done_at: Optional[datetime] = None
+    created_at: datetime
+
+class ListItemUpdate(BaseModel):
+    """リストの項目の更新用モデル"""
+    done: bool
+
+class EventResponse(BaseModel):
+    """予定レスポンス用モデル"""
+    id: str
+    title: str
+    event_at: datetime
+    all_day: bool
+    log_entry_id: Optional[str] = None
+    log_entry_date: Optional[date] = None
+    original_text: Optional[str] = None
+
 # Gemini API関数
+def _generate_text(prompt, operation):
+    if LLM_STUB_URL:
+        return generate_with_stub(LLM_STUB_URL, prompt, operation)
+    response = get_client("gemini").generate_text(prompt=prompt, model=GEMINI_TEXT_MODEL)
+    return response.result if response.result else ""
+
+def _stream_text(prompt, operation):
+    if LLM_STUB_URL:
+        yield from stream_with_stub(LLM_STUB_URL, prompt, operation)
+        return
+    output_text = _generate_text(prompt, operation)
+    if output_text:
+        yield output_text
+
+def generate_text_with_gemini(prompt, operation):
+    """Gemini APIでテキストを生成し、トークン数とレイテンシを記録する"""
+    with llm_budget.acquire(operation), \
+            span(f"llm.{operation}", SPAN_KIND_CLIENT, provider=LLM_PROVIDER, model=GEMINI_TEXT_MODEL), \
+            track_llm_call(LLM_PROVIDER, GEMINI_TEXT_MODEL, operation, prompt) as call:
+        started = time.perf_counter()
+        try:
+            if llm_cassette is not None:
+                call.output_text = llm_cassette.generate(prompt, operation, lambda: _generate_text(prompt, operation))
+            else:
+                call.output_text = _generate_text(prompt, operation)
+        finally:
+            degradation.observe_llm(operation, time.perf_counter() - started)
+    return call.output_text
+
+def stream_text_with_gemini(prompt, operation):
+    """
+    生成されたテキストを届いた分から順に返す（text-bison はストリーミング非対応のため一括で返す）
+    StreamingResponse がチャンクごとに別スレッドで呼び出すため、ここではスパンを作らない
+    縮退運転の判断には最初のチャンクまでの時間を使う
+    """
+    with llm_budget.acquire(operation), \
+            track_llm_call(LLM_PROVIDER, GEMINI_TEXT_MODEL, operation, prompt) as call:
+        started = time.perf_counter()
+        first_chunk = True
+        try:
+            if llm_cassette is not None:
+                chunks = llm_cassette.stream(prompt, operation, lambda: _stream_text(prompt, operation))
+            else:
+                chunks = _stream_text(prompt, operation)
+            for chunk in chunks:
+                if first_chunk:
+                    first_chunk = False
+                    degradation.observe_llm(operation, time.perf_counter() - started)
+                call.output_text += chunk
+                yield chunk
+        finally:
+            if first_chunk:
+                degradation.observe_llm(operation, time.perf_counter() - started)
+
 def classify_text_with_gemini(text):
-    """Gemini APIを使用してテキストを分類する"""
+    """Gemini APIを使用してテキストを分類する（失敗時はフォールバック分類）"""
+    result = try_classify_text_with_gemini(text)
+    return result if result is not None else fallback_classify_text(text)
+
+def llm_allowed(family_id, route, operation):
+    """LLMを呼ぶ直前にレート制限のトークンを使う（超えていればフォールバックを記録して False）"""
+    if rate_limiter.allow(family_id, route):
+        return True
+    record_fallback(operation, "rate_limited")
+    return False
+
+def try_classify_text_with_gemini(text, allow_call=None):
+    """
+    Gemini APIを使用してテキストを分類する（失敗時は None）
+    allow_call はキャッシュになくLLMを呼ぶときだけ呼ばれ、False なら呼ばずに None を返す（レート制限）
+    """
     try:
-        prompt = f"""
-以下のテキストを家族のログとして分析し、適切なカテゴリに分類してください。
-また、要約とキーワードも抽出してください。
-
-テキスト: "{text}"
-
-分類カテゴリ:
-- schedule: 予定・イベント（運動会、病院、学校行事など）
-- emotion: 子どもの様子・感情（機嫌、体調、行動など）
-- shopping: 買い物リスト（食材、日用品など）
-- todo: 家族のやること（手続き、申請、タスクなど）
-- memo: 雑談・メモ（その他、日常の出来事など）
-
-以下のJSON形式で回答してください:
-{{
-    "category": "分類したカテゴリ名",
-    "confidence_score": 0.0-1.0の信頼度,
-    "summary": "30文字以内の要約",
-    "keywords": ["キーワード1", "キーワード2", "キーワード3"],
-    "reasoning": "分類の理由"
-}}
-        """
-        
-        response = genai.generate_text(prompt=prompt, model='models/text-bison-001')
-        result_text = response.result if response.result else ""
-        
-        # JSONの抽出を試行
+        prompt_template = get_prompt("classify")
+        cache_key = (prompt_template.id, hashlib.sha256(text.encode("utf-8")).hexdigest())
+        cached = classification_cache.get(cache_key)
+        if cached is not None:
+            return dict(cached)
+        if allow_call is not None and not allow_call():
+            return None
+        
+        prompt = prompt_template.render(text=text)
+        result_text = generate_text_with_gemini(prompt, "classify")
+        
+        # JSONの抽出とスキーマ検証
         try:
-            json_match = re.search(r'\{.*?\}', result_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group()
-                result = json.loads(json_str)
-                
-                # 必要なフィールドの検証
-                required_fields = ['category', 'confidence_score', 'summary', 'keywords', 'reasoning']
-                for field in required_fields:
-                    if field not in result:
-                        raise ValueError(f"Missing required field: {field}")
+            with span("llm.parse_json"):
+                result = parse_classification_response(result_text, LLM_PROVIDER, GEMINI_TEXT_MODEL)
+            result["prompt_version"] = prompt_template.id
+            classification_cache.set(cache_key, result)
+            return dict(result)
                 
-                return result
-            else:
-                raise ValueError("No JSON found in response")
-                
-        except (json.JSONDecodeError, ValueError) as e:
-            return fallback_classify_text(text)
+        except LLMParseError as e:
+            print(f"JSON parsing error: {e}")
+            record_fallback("classify", "parse_error")
+            return None
             
+    except LLMBudgetExceeded:
+        record_fallback("classify", "concurrency_limit")
+        return None
     except Exception as e:
-        return fallback_classify_text(text)
+        print(f"Gemini API error: {e}")
+        record_fallback("classify", "error")
+        return None
 
 def fallback_classify_text(text):
     """Gemini APIが使用できない場合のフォールバック分類"""
@@ -200,43 +459,162 @@ def fallback_classify_text(text):
             "reasoning": "特定のカテゴリに該当しないため"
         }
 
-def get_ai_response_with_gemini(question, logs):
-    """Gemini APIを使用してAI回答を生成"""
+def try_extract_items_with_gemini(text, allow_call=None):
+    """
+    Gemini APIを使用して、1つのメモを分類済みの項目のリストに分ける（失敗時は None）
+    allow_call は try_classify_text_with_gemini と同じ
+    """
     try:
-        # ログの要約を作成
-        log_summary = create_log_summary(logs)
+        prompt_template = get_prompt("extract")
+        cache_key = (prompt_template.id, hashlib.sha256(text.encode("utf-8")).hexdigest())
+        cached = classification_cache.get(cache_key)
+        if cached is not None:
+            return [dict(item) for item in cached]
+        if allow_call is not None and not allow_call():
+            return None
+        
+        prompt = prompt_template.render(text=text)
+        result_text = generate_text_with_gemini(prompt, "extract")
+        
+        try:
+            with span("llm.parse_json"):
+                items = cap_items(parse_extraction_response(result_text, LLM_PROVIDER, GEMINI_TEXT_MODEL), "llm")
+            for item in items:
+                item["prompt_version"] = prompt_template.id
+            classification_cache.set(cache_key, items)
+            return [dict(item) for item in items]
         
-        prompt = f"""
-あなたは家族のAIコンシェルジュです。過去のログを参考にして、家族の質問に答えてください。
+        except LLMParseError as e:
+            print(f"JSON parsing error: {e}")
+            record_fallback("extract", "parse_error")
+            return None
+    
+    except LLMBudgetExceeded:
+        record_fallback("extract", "concurrency_limit")
+        return None
+    except Exception as e:
+        print(f"Gemini API error: {e}")
+        record_fallback("extract", "error")
+        return None
 
-過去のログ:
-{log_summary}
+def fallback_extract_items(text):
+    """Gemini APIが使用できない場合のフォールバック抽出（文ごとにルールで分類し、同じカテゴリが続く文をまとめる）"""
+    return group_segments(split_note(text), fallback_classify_text)
 
-質問: {question}
+def try_extract_event_with_gemini(text, base_date, allow_call=None):
+    """
+    Gemini APIを使用して予定の日時を読み取る（読み取れない・失敗時は None）
+    allow_call は try_classify_text_with_gemini と同じ
+    """
+    try:
+        prompt_template = get_prompt("event")
+        cache_key = (prompt_template.id, base_date.isoformat(), hashlib.sha256(text.encode("utf-8")).hexdigest())
+        cached = classification_cache.get(cache_key)
+        if cached is not None:
+            return dict(cached) if cached else None
+        if allow_call is not None and not allow_call():
+            return None
+        
+        prompt = prompt_template.render(text=text, base_date=base_date.isoformat(), weekday="月火水木金土日"[base_date.weekday()])
+        result_text = generate_text_with_gemini(prompt, "event")
+        
+        try:
+            with span("llm.parse_json"):
+                event = parse_event_response(result_text, LLM_PROVIDER, GEMINI_TEXT_MODEL)
+        except LLMParseError as e:
+            print(f"JSON parsing error: {e}")
+            record_fallback("event", "parse_error")
+            return None
+        
+        if event is not None:
+            event = {
+                "event_at": event["event_at"].replace(tzinfo=EVENT_TIMEZONE),
+                "all_day": event["all_day"],
+                "title": event["title"] or text[:20],
+                "extracted_by": prompt_template.id,
+            }
+        # 日時が読み取れなかった結果もキャッシュする（同じメモで何度も呼ばない）
+        classification_cache.set(cache_key, event or {})
+        return dict(event) if event else None
+    
+    except LLMBudgetExceeded:
+        record_fallback("event", "concurrency_limit")
+        return None
+    except Exception as e:
+        print(f"Gemini API error: {e}")
+        record_fallback("event", "error")
+        return None
 
-以下の点を考慮して回答してください:
-1. 過去のログから傾向を読み取る
-2. 家族の状況を理解して適切な提案をする
-3. 温かみのある、親しみやすい口調で回答する
-4. 具体的で実践的なアドバイスを提供する
-5. 200文字以内で回答する
+def attach_events(family_id, items, entry_date):
+    """
+    予定の項目に日時（item["event"]）を付ける
+    まずルールで読み取り、読み取れなければLLMに任せる（レート制限の範囲で）
+    """
+    for item in items:
+        if item["category"] != "schedule":
+            continue
+        event = parse_event(item["text"], entry_date)
+        if event is None and LLM_ENABLED:
+            event = try_extract_event_with_gemini(
+                item["text"], entry_date, allow_call=partial(llm_allowed, family_id, "events", "event"),
+            )
+        if event is not None:
+            item["event"] = event
+    return items
 
-回答:
-        """
+def get_ai_response_with_gemini(question, logs, history=NO_HISTORY):
+    """Gemini APIを使用してAI回答を生成（history はこれまでの会話の要約と直近の発言）"""
+    try:
+        # ログの要約を作成
+        log_summary = create_log_summary(logs)
+        
+        prompt = get_prompt("chat").render(log_summary=log_summary, history=history, question=question)
         
-        response = genai.generate_text(prompt=prompt, model='models/text-bison-001')
-        return response.result if response.result else ""
+        result_text = generate_text_with_gemini(prompt, "chat")
+        if not result_text:
+            record_fallback("chat", "empty")
+            return fallback_get_ai_response(question, logs)
+        return result_text
         
+    except LLMBudgetExceeded:
+        record_fallback("chat", "concurrency_limit")
+        return fallback_get_ai_response(question, logs)
     except Exception as e:
+        print(f"AI response error: {e}")
+        record_fallback("chat", "error")
         return fallback_get_ai_response(question, logs)
 
-def create_log_summary(logs):
+def stream_ai_response_with_gemini(question, logs, on_complete=None, history=NO_HISTORY):
+    """AI回答をストリーミングで生成（最初のチャンクより前に失敗した場合はフォールバックの回答を返す）"""
+    chunks = []
+    try:
+        prompt = get_prompt("chat").render(log_summary=create_log_summary(logs), history=history, question=question)
+        for chunk in stream_text_with_gemini(prompt, "chat"):
+            chunks.append(chunk)
+            yield chunk
+        if not chunks:
+            record_fallback("chat", "empty")
+    except LLMBudgetExceeded:
+        record_fallback("chat", "concurrency_limit")
+    except Exception as e:
+        print(f"AI response error: {e}")
+        record_fallback("chat", "error")
+        if chunks:
+            # 途中まで送った回答は取り消せないので、ここで打ち切る
+            return
+    if chunks:
+        if on_complete is not None:
+            on_complete("".join(chunks))
+        return
+    yield fallback_get_ai_response(question, logs)
+
+def create_log_summary(logs, limit=10):
     """ログの要約を作成"""
     if not logs:
         return "過去のログはありません。"
     
     # 最新の10件のログを要約
-    recent_logs = logs[:10]
+    recent_logs = logs[:limit]
     summary_parts = []
     
     for log in recent_logs:
@@ -267,26 +645,9 @@ def get_suggestions_with_gemini(logs):
     try:
         log_summary = create_log_summary(logs)
         
-        prompt = f"""
-以下の家族のログを分析して、3つの有用な提案をしてください。
-
-過去のログ:
-{log_summary}
-
-以下の形式で3つの提案を出してください:
-1. [提案1]
-2. [提案2]
-3. [提案3]
-
-提案の内容:
-- 家族の健康や幸福につながる提案
-- 実践しやすい具体的な内容
-- ログから読み取れる傾向に基づく提案
-- 各提案は50文字以内で簡潔に
-        """
+        prompt = get_prompt("suggestions").render(log_summary=log_summary)
         
-        response = genai.generate_text(prompt=prompt, model='models/text-bison-001')
-        suggestions_text = response.text
+        suggestions_text = generate_text_with_gemini(prompt, "suggestions")
         
         # 提案を抽出
         suggestions = []
@@ -295,9 +656,18 @@ def get_suggestions_with_gemini(logs):
                 suggestion = line.split('.', 1)[1].strip()
                 suggestions.append(suggestion)
         
-        return suggestions[:3] if suggestions else fallback_get_suggestions(logs)
+        if not suggestions:
+            record_parse_failure(LLM_PROVIDER, GEMINI_TEXT_MODEL, "suggestions")
+            record_fallback("suggestions", "parse_error")
+            return fallback_get_suggestions(logs)
+        return suggestions[:3]
         
+    except LLMBudgetExceeded:
+        record_fallback("suggestions", "concurrency_limit")
+        return fallback_get_suggestions(logs)
     except Exception as e:
+        print(f"Suggestions error: {e}")
+        record_fallback("suggestions", "error")
         return fallback_get_suggestions(logs)
 
 def fallback_get_suggestions(logs):
@@ -332,6 +702,664 @@ def fallback_get_suggestions(logs):
     
     return suggestions[:3]
 
+def get_family(family_access_key, columns="id"):
+    """アクセスキーから家族を取得（存在しない場合は404）"""
+    with span("db.families.select"):
+        supabase = get_client("supabase")
+        if supabase:
+            family_result = supabase.table("families").select(columns).eq("access_key", family_access_key).execute()
+            if not family_result.data:
+                raise HTTPException(status_code=404, detail="Family not found")
+            family = family_result.data[0]
+        else:
+            # ローカルストアのフォールバック
+            family = local_store.get_family(family_access_key)
+            if family is None:
+                raise HTTPException(status_code=404, detail="Family not found")
+    current_family_id.set(family["id"])
+    return family
+
+def get_family_id(family_access_key):
+    """アクセスキーから家族IDを取得（存在しない場合は404）"""
+    return get_family(family_access_key)["id"]
+
+async def resolve_family(family_access_key, columns="id"):
+    """get_family をスレッドプールで実行する（非同期のハンドラーからイベントループを止めずに呼ぶ）"""
+    family = await run_in_threadpool(get_family, family_access_key, columns)
+    # スレッドで設定したコンテキスト変数は呼び出し元に戻らないため、設定し直す
+    current_family_id.set(family["id"])
+    return family
+
+async def resolve_family_id(family_access_key):
+    """get_family_id の非同期版"""
+    return (await resolve_family(family_access_key))["id"]
+
+def log_entry_from_row(data):
+    """Supabase の log_entries の行（classification_details を含む）からレスポンスを作成"""
+    classification_detail = data.get("classification_details", [{}])[0] if data.get("classification_details") else {}
+    return LogEntryResponse(
+        id=data["id"],
+        original_text=data["original_text"],
+        category=data["category"],
+        summary=data["summary"],
+        date=datetime.fromisoformat(data["date"]).date(),
+        keywords=classification_detail.get("keywords", []),
+        confidence_score=classification_detail.get("confidence_score", 0.0),
+        created_at=datetime.fromisoformat(data["created_at"].replace("Z", "+00:00")),
+        change_seq=data.get("change_seq", 0)
+    )
+
+def log_entry_from_local(entry):
+    """ローカルストアのエントリからレスポンスを作成"""
+    return LogEntryResponse(
+        id=entry["id"],
+        original_text=entry["original_text"],
+        category=entry["category"],
+        summary=entry["summary"],
+        date=datetime.fromisoformat(entry["date"]).date(),
+        keywords=entry["keywords"],
+        confidence_score=entry["confidence_score"],
+        created_at=datetime.fromisoformat(entry["created_at"]),
+        change_seq=entry.get("change_seq", 0)
+    )
+
+def same_day_entries_query(supabase, family_id, entry_date):
+    """家族の同じ日付のエントリ（その月のパーティションだけを読む。再送は同じ日付で届く）"""
+    return supabase.table("log_entries").select("*, classification_details(*)") \
+        .eq("family_id", family_id).eq("date", entry_date.isoformat())
+
+def recent_entries_for_dedup(family_access_key, family_id, entry_date):
+    """
+    重複を探す直近のエントリ（DEDUP_WINDOW_SECONDS 以内、新しい順に最大 DEDUP_WINDOW_SIZE 件）と、
+    そのエントリからレスポンスを作る関数
+    """
+    supabase = get_client("supabase")
+    if supabase:
+        since = window_start(datetime.now(timezone.utc)).isoformat()
+        result = same_day_entries_query(supabase, family_id, entry_date).gte("created_at", since) \
+            .order("created_at", desc=True).limit(DEDUP_WINDOW_SIZE).execute()
+        return result.data, log_entry_from_row
+    since = window_start().isoformat()
+    recent = [entry for entry in local_store.recent_log_entries(family_access_key, DEDUP_WINDOW_SIZE)
+              if entry["created_at"] >= since]
+    return recent, log_entry_from_local
+
+def find_duplicate_entry(family_access_key, family_id, idempotency_key, text, signature, entry_date):
+    """
+    既に保存されている同じ投稿を探し、(エントリ, 理由) を返す（なければ None）
+    Idempotency-Key が一致するもの、なければ直近のほぼ同じ内容のもの
+    """
+    supabase = get_client("supabase")
+    with span("db.log_entries.dedup"):
+        if idempotency_key:
+            if supabase:
+                result = same_day_entries_query(supabase, family_id, entry_date).eq("idempotency_key", idempotency_key).limit(1).execute()
+                if result.data:
+                    return log_entry_from_row(result.data[0]), "idempotency_key"
+            else:
+                entry = local_store.find_log_entry(family_access_key, idempotency_key)
+                if entry:
+                    return log_entry_from_local(entry), "idempotency_key"
+        recent, to_response = recent_entries_for_dedup(family_access_key, family_id, entry_date)
+        duplicate = find_near_duplicate(text, signature, entry_date.isoformat(), recent)
+        if duplicate:
+            return to_response(duplicate), "near_duplicate"
+    return None
+
+def find_log_entry_group(family_access_key, family_id, idempotency_key, entry_date):
+    """1つのメモから作ったエントリ（Idempotency-Key が "<key>:<番号>"）を作成順に返す"""
+    supabase = get_client("supabase")
+    with span("db.log_entries.dedup"):
+        if supabase:
+            prefix = f"{idempotency_key}:"
+            result = same_day_entries_query(supabase, family_id, entry_date) \
+                .like("idempotency_key", like_prefix(prefix)).order("change_seq").execute()
+            # PostgREST は * も % として扱うので、前方一致はここでも確かめる
+            return [log_entry_from_row(data) for data in result.data
+                    if (data.get("idempotency_key") or "").startswith(prefix)]
+        return [log_entry_from_local(entry)
+                for entry in local_store.find_log_entry_group(family_access_key, idempotency_key)]
+
+def find_duplicate_note(family_access_key, family_id, idempotency_key, text, signature, entry_date):
+    """
+    /api/logs/extract の投稿について、既に保存されている同じメモのエントリを探し、(エントリのリスト, 理由) を返す
+    Idempotency-Key が一致するもの、なければ直近のほぼ同じ内容のメモ（note_simhash）から作ったもの
+    """
+    if idempotency_key:
+        existing = find_log_entry_group(family_access_key, family_id, idempotency_key, entry_date)
+        if existing:
+            return existing, "idempotency_key"
+    with span("db.log_entries.dedup"):
+        recent, to_response = recent_entries_for_dedup(family_access_key, family_id, entry_date)
+        group = find_near_duplicate_note(text, signature, entry_date.isoformat(), recent)
+    if group:
+        return [to_response(entry) for entry in group], "near_duplicate"
+    return None
+
+def load_archived_entries(family_access_key, family_id, month):
+    """アーカイブした1か月分のエントリ（month は月の初日）"""
+    key = (family_id, month.isoformat())
+    entries = archive_cache.get(key)
+    if entries is None:
+        supabase = get_client("supabase")
+        with span("db.log_entries_archive.select"):
+            if supabase:
+                result = supabase.table("log_entries_archive").select("entries") \
+                    .eq("family_id", family_id).eq("month", month.isoformat()).execute()
+                entries = result.data[0]["entries"] if result.data else []
+            else:
+                entries = local_store.archived_log_entries(family_access_key, month.isoformat())
+        archive_cache.set(key, entries)
+    return entries
+
+def with_archived_entries(log_entries, family_access_key, family_id, day, since):
+    """
+    アーカイブ済みの月の日付が指定された場合に、アーカイブのエントリを一覧に加える
+    アーカイブ処理の後に同じ月へ追加されたエントリは log_entries 側にあるので、両方を合わせる
+    """
+    seen = {entry.id for entry in log_entries}
+    for entry in load_archived_entries(family_access_key, family_id, month_of(day)):
+        if entry["date"] != day.isoformat() or entry["id"] in seen:
+            continue
+        if since is not None and entry.get("change_seq", 0) <= since:
+            continue
+        log_entries.append(log_entry_from_local(entry))
+    return sorted(log_entries, key=lambda entry: entry.created_at, reverse=True)
+
+def load_log_entries(family_access_key, family_id, date_filter, day, since, hot_from):
+    """ログ一覧を読む（日付の指定がなければ hot_from 以降。アーカイブ済みの月はアーカイブからも読む）"""
+    supabase = get_client("supabase")
+    if supabase:
+        # ログエントリを取得
+        query = supabase.table("log_entries").select("*, classification_details(*)").eq("family_id", family_id)
+    
+        if date_filter:
+            query = query.eq("date", date_filter)
+        else:
+            query = query.gte("date", hot_from.isoformat())
+        if since is not None:
+            query = query.gt("change_seq", since)
+    
+        with span("db.log_entries.select"):
+            result = query.order("created_at", desc=True).execute()
+    
+        # レスポンスを作成
+        log_entries = [log_entry_from_row(data) for data in result.data]
+    else:
+        # ローカルストアのフォールバック
+        entries = local_store.list_log_entries(family_access_key)
+    
+        if date_filter:
+            entries = [entry for entry in entries if entry["date"] == date_filter]
+        else:
+            entries = [entry for entry in entries if entry["date"] >= hot_from.isoformat()]
+        if since is not None:
+            entries = [entry for entry in entries if entry.get("change_seq", 0) > since]
+    
+        # 作成日時の降順でソート
+        entries = sorted(entries, key=lambda x: x["created_at"], reverse=True)
+    
+        log_entries = [log_entry_from_local(entry) for entry in entries]
+    
+    # アーカイブ済みの月はアーカイブからも読む
+    if day is not None and day < hot_from:
+        log_entries = with_archived_entries(log_entries, family_access_key, family_id, day, since)
+    return log_entries
+
+def log_list_etag(change_seq, date_filter, since, hot_from):
+    """
+    ログ一覧のETag（変更番号とクエリが同じなら同じ内容になる）
+    日付の指定がない一覧は hot_from（アーカイブ境界）以降だけなので、境界が月替わりで動けば別のETagにする
+    """
+    query = hashlib.sha256(f"{date_filter}|{since}|{hot_from}".encode("utf-8")).hexdigest()[:8]
+    return f'"{change_seq}-{query}"'
+
+def store_log_entries(family_access_key, family_id, entry_date, items, idempotency_keys,
+                      background_tasks: Optional[BackgroundTasks] = None, note_simhash: Optional[int] = None):
+    """
+    分類済みの項目（分類結果 + text）をログエントリとして保存する（同期。スレッドプールで呼ぶ）
+    note_simhash は /api/logs/extract で分けたメモ全体の SimHash（メモ単位の重複の検出用）
+    Supabase では log_entries と classification_details を add_log_entries の1回の呼び出しで書き込む
+    Supabase が遅いときは classification_details を background_tasks（レスポンスの送信後、同じリクエストの中）で書き込む
+    """
+    rows = []
+    for item, idempotency_key in zip(items, idempotency_keys):
+        rows.append({
+            "id": str(uuid.uuid4()),
+            "original_text": item["text"],
+            "category": item["category"],
+            "summary": item["summary"],
+            "date": entry_date.isoformat(),
+            "keywords": item["keywords"],
+            "confidence_score": item["confidence_score"],
+            "reasoning": item.get("reasoning", ""),
+            "prompt_version": item.get("prompt_version", RULES_CLASSIFIER_VERSION),
+            "simhash": simhash(item["text"]),
+            "note_simhash": note_simhash,
+            "idempotency_key": idempotency_key,
+            "created_at": datetime.now().isoformat()
+        })
+    
+    supabase = get_client("supabase")
+    if supabase:
+        details = [{
+            "log_entry_id": row["id"],
+            "log_entry_date": row["date"],
+            "confidence_score": row["confidence_score"],
+            "keywords": row["keywords"],
+            "ai_reasoning": row["reasoning"],
+            "prompt_version": row["prompt_version"]
+        } for row in rows]
+        # Supabase が遅いときは分類詳細をレスポンスを送ってから書き込む
+        # （そのときはエントリの変更番号が分類詳細の分だけもう一度進み、ダッシュボードにも2回届く）
+        defer_details = background_tasks is not None and degradation.shed("defer_classification_details")
+        
+        # ログエントリと分類詳細を1回の呼び出し（1つのトランザクション）で書き込む
+        with span("db.log_entries.insert", rows=len(rows)):
+            saved = supabase.rpc("add_log_entries", {
+                "p_family_id": family_id,
+                "p_entries": [{
+                    "id": row["id"],
+                    "original_text": row["original_text"],
+                    "category": row["category"],
+                    "summary": row["summary"],
+                    "date": row["date"],
+                    "simhash": row["simhash"],
+                    "note_simhash": row["note_simhash"],
+                    "idempotency_key": row["idempotency_key"]
+                } for row in rows],
+                "p_details": [] if defer_details else details,
+            }).execute().data or []
+        
+        if len(saved) != len(rows):
+            raise HTTPException(status_code=500, detail="Log entry creation failed")
+        
+        if defer_details:
+            def insert_classification_details():
+                with span("db.classification_details.insert", rows=len(details)):
+                    supabase.table("classification_details").insert(details).execute()
+            background_tasks.add_task(run_deferred_write, "classification_details", insert_classification_details)
+        
+        saved = {data["id"]: data for data in saved}
+        for row in rows:
+            row["created_at"] = saved[row["id"]]["created_at"].replace("Z", "+00:00")
+            row["change_seq"] = saved[row["id"]].get("change_seq", 0)
+    else:
+        # ローカルストアのフォールバック（変更番号はストアが進める）
+        for row, change_seq in zip(rows, local_store.add_log_entries(family_access_key, rows)):
+            row["change_seq"] = change_seq
+    
+    responses = [log_entry_from_local(row) for row in rows]
+    entries = [response.model_dump() for response in responses]
+    try:
+        record_list_items(family_access_key, family_id, entries)
+    except Exception as e:
+        # エントリは保存済みなので失敗させない（リストに載らなかった品目はログには残る）
+        print(f"List items error: {e}")
+    try:
+        record_events(family_access_key, family_id, entries, items)
+    except Exception as e:
+        print(f"Events error: {e}")
+    return responses
+
+async def save_log_entries(family_access_key, family_id, entry_date, items, idempotency_keys,
+                           background_tasks: Optional[BackgroundTasks] = None, note_simhash: Optional[int] = None):
+    """
+    ログエントリを保存し、ダッシュボードに配信する
+    書き込みはスレッドプールで行い、配信はイベントループ上で行う
+    """
+    responses = await run_in_threadpool(
+        store_log_entries, family_access_key, family_id, entry_date, items, idempotency_keys, background_tasks,
+        note_simhash,
+    )
+    # 他のワーカーに接続しているダッシュボードにはバス経由で届ける
+    for response in responses:
+        entry = response.model_dump(mode="json")
+        if publish_log_entry(family_id, entry):
+            bus.publish("realtime.log_entry", {"family_id": family_id, "entry": entry})
+    return responses
+
+def record_list_items(family_access_key, family_id, entries):
+    """保存したエントリから品目・やることを取り出し、買い物リスト・ToDoリストに載せる"""
+    supabase = get_client("supabase")
+    for kind, items in list_items_from_entries(entries).items():
+        with span("db.list_items.upsert", kind=kind, rows=len(items)):
+            if supabase:
+                stored = supabase.rpc("add_list_items", {
+                    "p_table": LIST_KINDS[kind], "p_family_id": family_id, "p_items": items,
+                }).execute().data
+            else:
+                stored = local_store.add_list_items(family_access_key, kind, items)
+        merged = sum(1 for item in stored if item["mention_count"] > 1)
+        list_items_recorded.inc(len(stored) - merged, kind=kind, action="added")
+        list_items_recorded.inc(merged, kind=kind, action="merged")
+
+def record_events(family_access_key, family_id, entries, items):
+    """日時を読み取った予定の項目を events に載せる"""
+    events = events_from_entries(entries, items)
+    if not events:
+        return
+    supabase = get_client("supabase")
+    with span("db.events.insert", rows=len(events)):
+        if supabase:
+            supabase.table("events").insert([dict(event, family_id=family_id) for event in events]).execute()
+        else:
+            local_store.add_events(family_access_key, events)
+
+def list_events(family_access_key, family_id, start, end):
+    """start 以上 end 未満の予定を日時順に返す（(family_id, event_at) のインデックスの範囲検索）"""
+    supabase = get_client("supabase")
+    with span("db.events.select"):
+        if supabase:
+            return supabase.table("events").select("*").eq("family_id", family_id) \
+                .gte("event_at", start.isoformat()).lt("event_at", end.isoformat()).order("event_at").execute().data
+        return local_store.list_events(
+            family_access_key, start.astimezone(timezone.utc).isoformat(), end.astimezone(timezone.utc).isoformat(),
+        )
+
+def event_from_row(event):
+    """events の行（Supabase・ローカルストア）の日時を EVENT_TIMEZONE の datetime にする"""
+    return dict(
+        event,
+        id=str(event["id"]),
+        event_at=datetime.fromisoformat(event["event_at"].replace("Z", "+00:00")).astimezone(EVENT_TIMEZONE),
+        created_at=datetime.fromisoformat(event["created_at"].replace("Z", "+00:00")),
+    )
+
+def create_chat_session(family_access_key, family_id):
+    """AIチャットの会話を作成"""
+    supabase = get_client("supabase")
+    with span("db.chat_sessions.insert"):
+        if supabase:
+            return supabase.table("chat_sessions").insert({"family_id": family_id}).execute().data[0]
+        return local_store.create_chat_session(family_access_key)
+
+def get_chat_session(family_access_key, family_id, session_id):
+    """家族のAIチャットの会話を取得（なければ404）"""
+    try:
+        uuid.UUID(session_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    supabase = get_client("supabase")
+    with span("db.chat_sessions.select"):
+        if supabase:
+            rows = supabase.table("chat_sessions").select("*").eq("id", session_id).eq("family_id", family_id).execute().data
+            session = rows[0] if rows else None
+        else:
+            session = local_store.get_chat_session(family_access_key, session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    return session
+
+def list_chat_turns(family_access_key, session_id, after_seq=0, limit=None):
+    """after_seq より後の発言を番号順に返す（limit を指定すると最後の limit 件）"""
+    supabase = get_client("supabase")
+    with span("db.chat_turns.select"):
+        if supabase:
+            query = supabase.table("chat_turns").select("seq, role, content, created_at") \
+                .eq("session_id", session_id).gt("seq", after_seq)
+            if limit is None:
+                return query.order("seq").execute().data
+            return query.order("seq", desc=True).limit(limit).execute().data[::-1]
+        return local_store.list_chat_turns(family_access_key, session_id, after_seq, limit)
+
+def load_chat_history(family_access_key, family_id, session_id):
+    """プロンプトに入れる会話（要約と、まだ要約していない発言）"""
+    session = get_chat_session(family_access_key, family_id, session_id)
+    return build_history(session, list_chat_turns(family_access_key, session_id, session["summarized_seq"]))
+
+def append_chat_turns(family_access_key, session_id, question, answer):
+    """質問と回答を会話に追加"""
+    turns = [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+    supabase = get_client("supabase")
+    with span("db.chat_turns.insert", rows=len(turns)):
+        if supabase:
+            supabase.rpc("add_chat_turns", {"p_session_id": session_id, "p_turns": turns}).execute()
+        else:
+            local_store.add_chat_turns(family_access_key, session_id, turns)
+
+def summarize_chat_turns_with_gemini(summary, turns_text):
+    """プロンプト chat_summary で会話の要約を作り直す"""
+    prompt = get_prompt("chat_summary").render(
+        summary=summary or "（なし）", turns=turns_text, max_chars=CHAT_SUMMARY_MAX_CHARS,
+    )
+    return generate_text_with_gemini(prompt, "chat_summary")
+
+def compact_chat_session(family_access_key, family_id, session_id):
+    """
+    まだ要約していない発言が予算を超えていれば、直近の発言を残して古い発言を要約に畳み込む
+    回答を返したあとにバックグラウンドで実行する。同じ会話を同時に要約した場合は先に終わった方だけを残す
+    """
+    try:
+        session = get_chat_session(family_access_key, family_id, session_id)
+        old_turns = turns_to_summarize(list_chat_turns(family_access_key, session_id, session["summarized_seq"]))
+        if not old_turns:
+            return
+        generate = None
+        if LLM_ENABLED:
+            generate = lambda turns_text: summarize_chat_turns_with_gemini(session["summary"], turns_text)
+        summary = summarize(session["summary"], old_turns, generate)
+
+        supabase = get_client("supabase")
+        with span("db.chat_sessions.update"):
+            if supabase:
+                supabase.table("chat_sessions").update({"summary": summary, "summarized_seq": old_turns[-1]["seq"]}) \
+                    .eq("id", session_id).eq("summarized_seq", session["summarized_seq"]).execute()
+            else:
+                local_store.update_chat_summary(family_access_key, session_id, summary, old_turns[-1]["seq"],
+                                                session["summarized_seq"])
+    except Exception as e:
+        print(f"Chat summary error: {e}")
+
+def chat_session_response(session, turns):
+    """会話（Supabase の行・ローカルストアの会話）からレスポンスを作成"""
+    return ChatSessionResponse(
+        id=str(session["id"]),
+        summary=session["summary"],
+        turns=[
+            ChatTurnResponse(
+                seq=turn["seq"],
+                role=turn["role"],
+                content=turn["content"],
+                created_at=datetime.fromisoformat(turn["created_at"].replace("Z", "+00:00")),
+            )
+            for turn in turns
+        ],
+        created_at=datetime.fromisoformat(session["created_at"].replace("Z", "+00:00"))
+    )
+
+def day_entries_by_family(day):
+    """日付が day のログを家族ごとに返す（[(家族, ログ)]。ログのない家族は含めない）"""
+    supabase = get_client("supabase")
+    with span("db.log_entries.select_day"):
+        if supabase:
+            # PostgREST は1回に返す行数に上限があるので、ページに分けて読む
+            rows, page_size = [], 1000
+            while True:
+                page = supabase.table("log_entries") \
+                    .select("id, family_id, date, category, summary, original_text, created_at") \
+                    .eq("date", day.isoformat()).order("created_at").order("id") \
+                    .range(len(rows), len(rows) + page_size - 1).execute().data
+                rows += page
+                if len(page) < page_size:
+                    break
+            by_family = {}
+            for row in rows:
+                by_family.setdefault(row["family_id"], []).append(row)
+            return [({"id": family_id, "access_key": None}, entries) for family_id, entries in by_family.items()]
+        families = []
+        for access_key, entries in local_store.log_entries_on(day.isoformat()).items():
+            family = local_store.get_family(access_key)
+            families.append(({"id": family["id"], "access_key": access_key}, entries))
+        return families
+
+def get_digest(family_access_key, family_id, day):
+    """家族の day のまとめ（なければ None）"""
+    supabase = get_client("supabase")
+    with span("db.digests.select"):
+        if supabase:
+            rows = supabase.table("digests").select("*").eq("family_id", family_id) \
+                .eq("digest_date", day.isoformat()).execute().data
+            return rows[0] if rows else None
+        return local_store.get_digest(family_access_key, day.isoformat())
+
+def save_digest(family_access_key, family_id, digest):
+    """まとめを保存（同じ日のまとめは置き換える）"""
+    supabase = get_client("supabase")
+    with span("db.digests.upsert"):
+        if supabase:
+            supabase.table("digests").upsert(dict(digest, family_id=family_id), on_conflict="family_id,digest_date").execute()
+        else:
+            local_store.save_digest(family_access_key, digest)
+
+def digest_prompt(entries, day):
+    """まとめのプロンプト（DIGEST_MAX_PROMPT_TOKENS に収まるだけの新しいログを入れる）"""
+    template = get_prompt("digest")
+    render = lambda logs: template.render(date=day.isoformat(), log_summary=create_log_summary(logs, len(logs)))
+    return render(fit_entries(entries, DIGEST_MAX_PROMPT_TOKENS, lambda logs: estimate_tokens(render(logs))))
+
+def generate_digest_with_gemini(prompt):
+    """Gemini APIで1日のまとめと翌日への提案を作る（失敗時は LLMParseError などの例外）"""
+    result_text = generate_text_with_gemini(prompt, "digest")
+    digest = parse_digest_response(result_text, LLM_PROVIDER, GEMINI_TEXT_MODEL)
+    digest["generated_by"] = get_prompt("digest").id
+    return digest
+
+def fallback_digest(entries):
+    return {
+        "summary": fallback_digest_summary(entries),
+        "suggestions": fallback_get_suggestions(entries),
+        "generated_by": RULES_DIGEST_VERSION,
+    }
+
+def digest_family(family, entries, day, budget):
+    """1家族のまとめを作って保存し、結果（outcome）を返す"""
+    current_family_id.set(family["id"])
+    fingerprint = source_hash(entries)
+    existing = get_digest(family["access_key"], family["id"], day)
+    # ルールベースで作ったまとめは、LLMが使えれば作り直す（実行全体の予算を超えた家族など）
+    if existing is not None and existing.get("source_hash") == fingerprint \
+            and (existing.get("generated_by") != RULES_DIGEST_VERSION or not LLM_ENABLED):
+        return "unchanged"
+
+    outcome = "fallback"
+    digest = None
+    if LLM_ENABLED:
+        prompt = digest_prompt(entries, day)
+        if budget.reserve(estimate_tokens(prompt) + DIGEST_OUTPUT_TOKENS):
+            try:
+                digest = generate_digest_with_gemini(prompt)
+                outcome = "generated"
+            except LLMBudgetExceeded:
+                record_fallback("digest", "concurrency_limit")
+            except LLMParseError:
+                record_fallback("digest", "parse_error")
+            except Exception as e:
+                print(f"Digest error: {e}")
+                record_fallback("digest", "error")
+        else:
+            record_fallback("digest", "run_budget")
+            outcome = "budget_exceeded"
+    else:
+        record_fallback("digest", "no_api_key")
+    digest = dict(digest or fallback_digest(entries), digest_date=day.isoformat(),
+                  entry_count=len(entries), source_hash=fingerprint)
+    save_digest(family["access_key"], family["id"], digest)
+    return outcome
+
+def run_daily_digests(day, concurrency=DIGEST_CONCURRENCY):
+    """day にログを書いた全家族のまとめを作る（夜間のバッチ。`python -m app.digest` と POST /api/admin/digests）"""
+    families = day_entries_by_family(day)
+    budget = TokenBudget()
+    outcomes = run_digests(families, lambda family, entries: digest_family(family, entries, day, budget), concurrency)
+    return {"date": day.isoformat(), "families": len(families), "outcomes": outcomes,
+            "estimated_tokens": budget.used}
+
+def digest_response(digest):
+    return DigestResponse(
+        date=date.fromisoformat(str(digest["digest_date"])),
+        summary=digest["summary"],
+        suggestions=digest["suggestions"],
+        entry_count=digest["entry_count"],
+        generated_by=digest["generated_by"],
+        created_at=datetime.fromisoformat(digest["created_at"].replace("Z", "+00:00"))
+    )
+
+def list_item_response(kind, item):
+    """リストの項目（Supabase の行・ローカルストアの項目）からレスポンスを作成"""
+    return ListItemResponse(
+        id=str(item["id"]),
+        kind=kind,
+        name=item["name"],
+        done=item["done"],
+        mention_count=item["mention_count"],
+        log_entry_id=item.get("log_entry_id"),
+        log_entry_date=item.get("log_entry_date"),
+        done_at=datetime.fromisoformat(item["done_at"].replace("Z", "+00:00")) if item.get("done_at") else None,
+        created_at=datetime.fromisoformat(item["created_at"].replace("Z", "+00:00"))
+    )
+
+def list_table(kind):
+    """リストの種類からテーブル名を返す（未知の種類は404）"""
+    if kind not in LIST_KINDS:
+        raise HTTPException(status_code=404, detail="List not found")
+    return LIST_KINDS[kind]
+
+def load_list_items(family_access_key, family_id, kind, include_done):
+    """リストの項目を追加順に読む"""
+    supabase = get_client("supabase")
+    with span("db.list_items.select", kind=kind):
+        if supabase:
+            query = supabase.table(list_table(kind)).select("*").eq("family_id", family_id)
+            if not include_done:
+                query = query.eq("done", False)
+            return query.order("created_at").execute().data
+        return local_store.list_items(family_access_key, kind, include_done)
+
+def set_list_item_done(family_access_key, family_id, kind, item_id, done):
+    """リストの項目を完了・未完了にする（見つからなければ None）"""
+    table = list_table(kind)
+    supabase = get_client("supabase")
+    with span("db.list_items.update", kind=kind):
+        if supabase:
+            item = None
+            if not done:
+                # 未完了の同じ品目は1行だけ（部分一意インデックス）なので、先に確かめる
+                current = supabase.table(table).select("normalized_name") \
+                    .eq("id", item_id).eq("family_id", family_id).execute().data
+                if current:
+                    duplicate = supabase.table(table).select("*").eq("family_id", family_id) \
+                        .eq("normalized_name", current[0]["normalized_name"]).eq("done", False).execute().data
+                    item = duplicate[0] if duplicate else None
+            if item is None:
+                result = supabase.table(table).update({
+                    "done": done,
+                    "done_at": datetime.now(timezone.utc).isoformat() if done else None
+                }).eq("id", item_id).eq("family_id", family_id).execute()
+                item = result.data[0] if result.data else None
+        else:
+            item = local_store.set_list_item_done(family_access_key, kind, item_id, done)
+    return item
+
+# 他のワーカーからの通知（LOCAL_STORE_PATH を設定した複数ワーカー構成のみ届く）
+def on_remote_categories_reload(payload):
+    category_cache.reload()
+
+def on_remote_log_entry(payload):
+    entry = payload["entry"]
+    change_seq = entry.get("change_seq")
+    broker.publish_threadsafe(
+        payload["family_id"], "log_entry", {"change_seq": change_seq, "entry": entry},
+        event_id=change_seq, source="bus",
+    )
+
+def on_remote_archive_completed(payload):
+    archive_cache.clear()
+
+bus.subscribe("categories.reload", on_remote_categories_reload)
+bus.subscribe("archive.completed", on_remote_archive_completed)
+bus.subscribe("realtime.log_entry", on_remote_log_entry)
+
 # API エンドポイント
 @app.post("/api/families", response_model=FamilyResponse)
 async def create_family(family: FamilyCreate):
@@ -340,11 +1368,13 @@ async def create_family(family: FamilyCreate):
         family_id = str(uuid.uuid4())
         access_key = str(uuid.uuid4())
         
+        supabase = get_client("supabase")
         if supabase:
-            result = supabase.table("families").insert({
-                "name": family.name,
-                "access_key": access_key
-            }).execute()
+            with span("db.families.insert"):
+                result = supabase.table("families").insert({
+                    "name": family.name,
+                    "access_key": access_key
+                }).execute()
             
             if result.data:
                 data = result.data[0]
@@ -357,15 +1387,15 @@ async def create_family(family: FamilyCreate):
             else:
                 raise HTTPException(status_code=500, detail="Family creation failed")
         else:
-            # メモリベースのフォールバック
+            # ローカルストアのフォールバック
             family_data = {
                 "id": family_id,
                 "name": family.name,
                 "access_key": access_key,
-                "created_at": datetime.now()
+                "created_at": datetime.now().isoformat()
             }
             
-            test_families[access_key] = family_data
+            local_store.create_family(family_data)
             
             return FamilyResponse(
                 id=family_id,
@@ -377,217 +1407,436 @@ async def create_family(family: FamilyCreate):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating family: {str(e)}")
 
+def duplicate_response(http_response, entry, reason):
+    """重複した投稿に既存のエントリを返す（ヘッダー X-Duplicate に理由）"""
+    duplicate_entries.inc(reason=reason)
+    http_response.headers["X-Duplicate"] = reason
+    return entry
+
 @app.post("/api/logs", response_model=LogEntryResponse)
-async def create_log_entry(log_entry: LogEntryCreate):
+async def create_log_entry(log_entry: LogEntryCreate, http_response: Response, background_tasks: BackgroundTasks,
+                           idempotency_key: Optional[str] = Header(None)):
     """
     ログエントリを作成
-    1. Gemini APIでテキストを分類
-    2. データベースに保存
-    3. 結果を返す
+    1. 同じ投稿（Idempotency-Key・ほぼ同じ内容）が保存済みなら、それを返す
+    2. Gemini APIでテキストを分類
+    3. データベースに保存
+    4. 結果を返す
     """
+    pending_key = pending = None
     try:
         # 家族の存在確認
-        if supabase:
-            family_result = supabase.table("families").select("id").eq("access_key", log_entry.family_access_key).execute()
-            if not family_result.data:
-                raise HTTPException(status_code=404, detail="Family not found")
-            
-            family_id = family_result.data[0]["id"]
-        else:
-            # メモリベースのフォールバック
-            if log_entry.family_access_key not in test_families:
-                raise HTTPException(status_code=404, detail="Family not found")
-            family_id = test_families[log_entry.family_access_key]["id"]
+        family_id = await resolve_family_id(log_entry.family_access_key)
+        
+        # エントリ日付の設定
+        entry_date = log_entry.entry_date or date.today()
+        signature = simhash(log_entry.text)
+        
+        # 同じ投稿が処理中なら、その結果を待つ（ダブルタップ・応答待ち中の再送）
+        pending_key = (family_id, "key", idempotency_key) if idempotency_key else (family_id, signature, entry_date)
+        in_flight = pending_writes.get(pending_key)
+        if in_flight is not None:
+            existing = await asyncio.shield(in_flight)
+            if existing is not None:
+                return duplicate_response(http_response, existing, "in_flight")
+        
+        duplicate = await run_in_threadpool(
+            find_duplicate_entry,
+            log_entry.family_access_key, family_id, idempotency_key, log_entry.text, signature, entry_date,
+        )
+        if duplicate:
+            return duplicate_response(http_response, *duplicate)
+        pending = pending_writes.claim(pending_key)
         
         # Gemini APIでテキストを分類
-        if GEMINI_API_KEY:
-            classification = classify_text_with_gemini(log_entry.text)
-        else:
-            classification = fallback_classify_text(log_entry.text)
+        with span("classify"):
+            if LLM_ENABLED and degradation.shed("rules_classification"):
+                # LLMが遅いときはルールベースだけで分類する
+                record_fallback("classify", "degraded")
+                classification = fallback_classify_text(log_entry.text)
+            elif LLM_ENABLED:
+                # ルールの信頼度が高ければLLMを呼ばない（レート制限のトークンはLLMを呼ぶときだけ使う）
+                allow_call = partial(llm_allowed, family_id, "classify", "classify")
+                classification = await run_in_threadpool(
+                    classification_router.classify, log_entry.text,
+                    partial(try_classify_text_with_gemini, allow_call=allow_call), fallback_classify_text,
+                )
+            else:
+                record_fallback("classify", "no_api_key")
+                classification = fallback_classify_text(log_entry.text)
         
-        # エントリ日付の設定
+        items = [dict(classification, text=log_entry.text)]
+        if classification["category"] == "schedule":
+            # 予定の日時を読み取る（ルールで読めなければLLM）
+            with span("events.extract"):
+                items = await run_in_threadpool(attach_events, family_id, items, entry_date)
+        
+        # ログエントリをデータベースに保存し、同じ家族のダッシュボードに配信
+        response = (await save_log_entries(
+            log_entry.family_access_key, family_id, entry_date, items, [idempotency_key], background_tasks,
+        ))[0]
+        pending.set_result(response)
+        return response
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        if idempotency_key and pending is not None:
+            # 別のレプリカ・ワーカーが同じ Idempotency-Key で先に保存していた（一意制約違反）
+            try:
+                duplicate = await run_in_threadpool(
+                    find_duplicate_entry,
+                    log_entry.family_access_key, family_id, idempotency_key, log_entry.text, signature, entry_date,
+                )
+            except Exception:
+                duplicate = None
+            if duplicate and duplicate[1] == "idempotency_key":
+                return duplicate_response(http_response, *duplicate)
+        raise HTTPException(status_code=500, detail=f"Error creating log entry: {str(e)}")
+    finally:
+        if pending is not None:
+            pending_writes.release(pending_key, pending)
+
+@app.post("/api/logs/extract", response_model=List[LogEntryResponse])
+async def extract_log_entries(log_entry: LogEntryCreate, http_response: Response, background_tasks: BackgroundTasks,
+                              idempotency_key: Optional[str] = Header(None)):
+    """
+    予定・買い物・子どもの様子などが混在するメモを、カテゴリごとの複数のログエントリとして作成
+    1. 文が1つだけのメモは /api/logs と同じ処理（ルールで十分ならLLMを呼ばない）
+    2. 同じ投稿（Idempotency-Key・ほぼ同じ内容のメモ）が保存済みなら、そのエントリを返す
+    3. LLMへの1回の呼び出しで項目に分ける（使えなければルールで分ける）
+    4. すべての項目をまとめて保存し、作成順に返す
+    """
+    if len(split_note(log_entry.text)) <= 1:
+        return [await create_log_entry(log_entry, http_response, background_tasks, idempotency_key=idempotency_key)]
+    
+    pending_key = pending = None
+    try:
+        # 家族の存在確認
+        family_id = await resolve_family_id(log_entry.family_access_key)
         entry_date = log_entry.entry_date or date.today()
         
-        # ログエントリをデータベースに保存
-        log_id = str(uuid.uuid4())
-        log_data = {
-            "id": log_id,
-            "original_text": log_entry.text,
-            "category": classification["category"],
-            "summary": classification["summary"],
-            "date": entry_date.isoformat(),
-            "keywords": classification["keywords"],
-            "confidence_score": classification["confidence_score"],
-            "created_at": datetime.now().isoformat()
-        }
+        signature = simhash(log_entry.text)
         
-        if supabase:
-            # Supabaseに保存
-            log_result = supabase.table("log_entries").insert({
-                "family_id": family_id,
-                "original_text": log_entry.text,
-                "category": classification["category"],
-                "summary": classification["summary"],
-                "date": entry_date.isoformat()
-            }).execute()
-            
-            if not log_result.data:
-                raise HTTPException(status_code=500, detail="Log entry creation failed")
-            
-            log_id = log_result.data[0]["id"]
-            
-            # 分類詳細を保存
-            classification_data = {
-                "log_entry_id": log_id,
-                "confidence_score": classification["confidence_score"],
-                "keywords": classification["keywords"],
-                "ai_reasoning": classification["reasoning"]
-            }
-            
-            supabase.table("classification_details").insert(classification_data).execute()
-            
-            created_at = datetime.fromisoformat(log_result.data[0]["created_at"].replace("Z", "+00:00"))
-        else:
-            # メモリベースのフォールバック
-            if log_entry.family_access_key not in test_log_entries:
-                test_log_entries[log_entry.family_access_key] = []
-            
-            test_log_entries[log_entry.family_access_key].append(log_data)
-            created_at = datetime.now()
+        # 同じ投稿が処理中なら、その結果を待つ
+        pending_key = (family_id, "extract", idempotency_key or signature, entry_date)
+        in_flight = pending_writes.get(pending_key)
+        if in_flight is not None:
+            existing = await asyncio.shield(in_flight)
+            if existing is not None:
+                return duplicate_response(http_response, existing, "in_flight")
         
-        # レスポンスを作成
-        return LogEntryResponse(
-            id=log_id,
-            original_text=log_entry.text,
-            category=classification["category"],
-            summary=classification["summary"],
-            date=entry_date,
-            keywords=classification["keywords"],
-            confidence_score=classification["confidence_score"],
-            created_at=created_at
+        duplicate = await run_in_threadpool(
+            find_duplicate_note,
+            log_entry.family_access_key, family_id, idempotency_key, log_entry.text, signature, entry_date,
         )
+        if duplicate:
+            return duplicate_response(http_response, *duplicate)
+        pending = pending_writes.claim(pending_key)
         
+        # LLMの呼び出しは項目の数によらず1回（レート制限のトークンも1つ）
+        with span("extract"):
+            items = None
+            if LLM_ENABLED and degradation.shed("rules_classification"):
+                record_fallback("extract", "degraded")
+            elif LLM_ENABLED:
+                items = await run_in_threadpool(
+                    try_extract_items_with_gemini, log_entry.text,
+                    partial(llm_allowed, family_id, "classify", "extract"),
+                )
+            else:
+                record_fallback("extract", "no_api_key")
+            if not items:
+                items = fallback_extract_items(log_entry.text)
+        if any(item["category"] == "schedule" for item in items):
+            with span("events.extract"):
+                items = await run_in_threadpool(attach_events, family_id, items, entry_date)
+        
+        # 項目ごとの Idempotency-Key は "<key>:<番号>"（再送時にまとめて見つけるため）
+        keys = [f"{idempotency_key}:{i}" if idempotency_key else None for i in range(len(items))]
+        responses = await save_log_entries(
+            log_entry.family_access_key, family_id, entry_date, items, keys, background_tasks, signature,
+        )
+        pending.set_result(responses)
+        return responses
+    
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error creating log entry: {str(e)}")
+        if idempotency_key and pending is not None:
+            # 別のレプリカ・ワーカーが同じ Idempotency-Key で先に保存していた（一意制約違反）
+            try:
+                existing = await run_in_threadpool(
+                    find_log_entry_group, log_entry.family_access_key, family_id, idempotency_key, entry_date,
+                )
+            except Exception:
+                existing = None
+            if existing:
+                return duplicate_response(http_response, existing, "idempotency_key")
+        raise HTTPException(status_code=500, detail=f"Error extracting log entries: {str(e)}")
+    finally:
+        if pending is not None:
+            pending_writes.release(pending_key, pending)
 
 @app.get("/api/logs/{family_access_key}", response_model=List[LogEntryResponse])
-async def get_log_entries(family_access_key: str, date_filter: Optional[str] = None):
+async def get_log_entries(family_access_key: str, response: Response, date_filter: Optional[str] = None,
+                          since: Optional[int] = None, if_none_match: Optional[str] = Header(None)):
     """
     指定された家族のログエントリを取得
-    date_filterがある場合は特定の日付のみ返す
+    date_filterがある場合は特定の日付のみ返す（アーカイブ済みの月も読む）
+    date_filterがない場合はアーカイブ境界（hot_start()、ARCHIVE_AFTER_MONTHS か月前の月初）以降の日付だけを返す
+    （境界は月替わりで進む。それより古い月は date_filter で日付を指定して読む）
+    sinceがある場合は変更番号がそれより大きいエントリ（追加・変更分）だけを返す
+    
+    レスポンスの X-Change-Seq を次回の since に使う。ETag が一致すれば 304 を返す
     """
     try:
-        # 家族の存在確認
-        if supabase:
-            family_result = supabase.table("families").select("id").eq("access_key", family_access_key).execute()
-            if not family_result.data:
-                raise HTTPException(status_code=404, detail="Family not found")
-            
-            family_id = family_result.data[0]["id"]
-            
-            # ログエントリを取得
-            query = supabase.table("log_entries").select("*, classification_details(*)").eq("family_id", family_id)
-            
-            if date_filter:
-                query = query.eq("date", date_filter)
-            
-            result = query.order("created_at", desc=True).execute()
-            
-            # レスポンスを作成
-            log_entries = []
-            for data in result.data:
-                classification_detail = data.get("classification_details", [{}])[0] if data.get("classification_details") else {}
-                
-                log_entries.append(LogEntryResponse(
-                    id=data["id"],
-                    original_text=data["original_text"],
-                    category=data["category"],
-                    summary=data["summary"],
-                    date=datetime.fromisoformat(data["date"]).date(),
-                    keywords=classification_detail.get("keywords", []),
-                    confidence_score=classification_detail.get("confidence_score", 0.0),
-                    created_at=datetime.fromisoformat(data["created_at"].replace("Z", "+00:00"))
-                ))
-            
-            return log_entries
-        else:
-            # メモリベースのフォールバック
-            if family_access_key not in test_families:
-                raise HTTPException(status_code=404, detail="Family not found")
-            
-            entries = test_log_entries.get(family_access_key, [])
-            
-            if date_filter:
-                entries = [entry for entry in entries if entry["date"] == date_filter]
-            
-            # 作成日時の降順でソート
-            entries.sort(key=lambda x: x["created_at"], reverse=True)
-            
-            log_entries = []
-            for entry in entries:
-                log_entries.append(LogEntryResponse(
-                    id=entry["id"],
-                    original_text=entry["original_text"],
-                    category=entry["category"],
-                    summary=entry["summary"],
-                    date=datetime.fromisoformat(entry["date"]).date(),
-                    keywords=entry["keywords"],
-                    confidence_score=entry["confidence_score"],
-                    created_at=datetime.fromisoformat(entry["created_at"])
-                ))
-            
-            return log_entries
+        # 家族の存在確認と変更番号の取得（一覧より先に読むので、取りこぼしはなく重複だけがありうる）
+        family = await resolve_family(family_access_key, "id, change_seq")
+        family_id = family["id"]
+        change_seq = family.get("change_seq", 0)
+        # 日付の指定がなければアーカイブ境界より新しい月（パーティション）だけを読む
+        hot_from = hot_start()
+        
+        headers = {
+            "ETag": log_list_etag(change_seq, date_filter, since, hot_from),
+            "X-Change-Seq": str(change_seq),
+            "Cache-Control": "private, no-cache",
+        }
+        if etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+        
+        try:
+            day = date.fromisoformat(date_filter) if date_filter else None
+        except ValueError:
+            raise HTTPException(status_code=400, detail="date_filter must be YYYY-MM-DD")
+        
+        log_entries = await run_in_threadpool(
+            load_log_entries, family_access_key, family_id, date_filter, day, since, hot_from,
+        )
+        return log_entries
         
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving log entries: {str(e)}")
 
+@app.get("/api/logs/{family_access_key}/events", include_in_schema=False)
+async def log_events(family_access_key: str):
+    """
+    家族のログの追加・変更を Server-Sent Events で配信
+    event: log_entry（data: {"change_seq", "entry"}）/ event: resync（取りこぼしたので since で取り直す）
+    """
+    family_id = await resolve_family_id(family_access_key)
+    try:
+        subscription = broker.subscribe(family_id)
+    except SubscriberLimitExceeded as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    return StreamingResponse(
+        broker.stream(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/lists/{family_access_key}/{kind}", response_model=List[ListItemResponse])
+async def get_list_items(family_access_key: str, kind: str, include_done: bool = False):
+    """
+    買い物リスト（kind=shopping）・ToDoリスト（kind=todo）の項目を追加順に取得
+    既定は未完了の項目だけ（部分インデックスから読むので、過去のログや完了済みの件数によらない）
+    """
+    list_table(kind)
+    try:
+        family_id = await resolve_family_id(family_access_key)
+        items = await run_in_threadpool(load_list_items, family_access_key, family_id, kind, include_done)
+        return [list_item_response(kind, item) for item in items]
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving list items: {str(e)}")
+
+@app.patch("/api/lists/{family_access_key}/{kind}/{item_id}", response_model=ListItemResponse)
+async def update_list_item(family_access_key: str, kind: str, item_id: str, update: ListItemUpdate):
+    """
+    リストの項目を完了・未完了にする（主キーでの1回の更新）
+    未完了に戻した品目が別の項目として未完了で残っていれば、そちらを返す
+    """
+    list_table(kind)
+    try:
+        family_id = await resolve_family_id(family_access_key)
+        item = await run_in_threadpool(set_list_item_done, family_access_key, family_id, kind, item_id, update.done)
+        
+        if item is None:
+            raise HTTPException(status_code=404, detail="List item not found")
+        return list_item_response(kind, item)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating list item: {str(e)}")
+
+@app.get("/api/events/{family_access_key}", response_model=List[EventResponse])
+async def get_upcoming_events(family_access_key: str, days: int = 7):
+    """今日から days 日間（最大366日）の予定を日時順に取得"""
+    if not 1 <= days <= 366:
+        raise HTTPException(status_code=400, detail="days must be between 1 and 366")
+    try:
+        family_id = await resolve_family_id(family_access_key)
+        start = day_start(today())
+        events = await run_in_threadpool(list_events, family_access_key, family_id, start, start + timedelta(days=days))
+        return [EventResponse(**event_from_row(event)) for event in events]
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving events: {str(e)}")
+
+@app.get("/api/events/{family_access_key}/calendar.ics", response_class=PlainTextResponse)
+async def get_events_calendar(family_access_key: str, if_none_match: Optional[str] = Header(None)):
+    """
+    予定の iCal フィード（カレンダーアプリで購読する）
+    過去 ICAL_PAST_DAYS 日から ICAL_FUTURE_DAYS 日先までの予定。内容が同じなら同じETagを返す
+    """
+    try:
+        family = await resolve_family(family_access_key, "id, name")
+        start = day_start(today())
+        events = await run_in_threadpool(
+            list_events, family_access_key, family["id"],
+            start - timedelta(days=ICAL_PAST_DAYS), start + timedelta(days=ICAL_FUTURE_DAYS),
+        )
+        body = build_ical([event_from_row(event) for event in events], f"KazokuLog {family.get('name', '')}".strip())
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error building calendar: {str(e)}")
+    
+    headers = {"ETag": f'"{hashlib.sha256(body.encode("utf-8")).hexdigest()[:16]}"', "Cache-Control": "private, max-age=300"}
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="text/calendar; charset=utf-8", headers=headers)
+
 @app.get("/api/categories")
-async def get_categories():
-    """利用可能なカテゴリ一覧を取得"""
+async def get_categories(if_none_match: Optional[str] = Header(None)):
+    """利用可能なカテゴリ一覧を取得（ETag が一致すれば 304）"""
+    # 初回の読み込みはDBへの問い合わせになるので、イベントループを止めないようスレッドプールで行う
+    snapshot = category_cache.peek()
+    if snapshot is None:
+        try:
+            snapshot = await run_in_threadpool(category_cache.get)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error retrieving categories: {str(e)}")
+    
+    headers = {"ETag": snapshot.etag, "Cache-Control": CATEGORIES_CACHE_CONTROL}
+    if snapshot.matches(if_none_match):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
+
+@app.post("/api/admin/categories/reload", include_in_schema=False, dependencies=[Depends(require_admin)])
+async def reload_categories():
+    """
+    カテゴリ一覧を読み直す（他のワーカーにはバス経由で伝える。CDNのキャッシュは Cache-Control の期限まで残る）
+    """
     try:
-        if supabase:
-            result = supabase.table("categories").select("*").execute()
-            return result.data
-        else:
-            # メモリベースのフォールバック
-            return test_categories
+        snapshot = await run_in_threadpool(category_cache.reload)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error retrieving categories: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error reloading categories: {str(e)}")
+    bus.publish("categories.reload", {"etag": snapshot.etag})
+    return {"etag": snapshot.etag, "count": len(snapshot.items), "loaded_at": snapshot.loaded_at}
+
+@app.post("/api/admin/archive", include_in_schema=False, dependencies=[Depends(require_admin)])
+async def archive_log_entries():
+    """
+    古い月のログをアーカイブに移す（cron から月1回程度呼ぶ。`python -m app.archive` と同じ）
+    Supabase では SUPABASE_SERVICE_ROLE_KEY をこのサーバーに設定した場合だけ使える（通常はバッチから実行する）
+    """
+    try:
+        supabase = archive_client()
+        result = await run_in_threadpool(run_archive, supabase, local_store)
+    except ArchiveNotConfigured as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error archiving log entries: {str(e)}")
+    archive_cache.clear()
+    bus.publish("archive.completed", result)
+    return result
+
+@app.post("/api/ai/chat/sessions", response_model=ChatSessionResponse)
+async def create_ai_chat_session(session_request: ChatSessionCreate):
+    """AIチャットの会話を作成（以降の質問に session_id を付けると会話の続きとして答える）"""
+    try:
+        family_id = await resolve_family_id(session_request.family_access_key)
+        session = await run_in_threadpool(create_chat_session, session_request.family_access_key, family_id)
+        return chat_session_response(session, [])
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error creating chat session: {str(e)}")
+
+@app.get("/api/ai/chat/sessions/{family_access_key}/{session_id}", response_model=ChatSessionResponse)
+async def get_ai_chat_session(family_access_key: str, session_id: str):
+    """AIチャットの会話を取得（画面を開き直したときの復元用。発言は最後の50件）"""
+    try:
+        family_id = await resolve_family_id(family_access_key)
+        session = await run_in_threadpool(get_chat_session, family_access_key, family_id, session_id)
+        turns = await run_in_threadpool(list_chat_turns, family_access_key, session_id, 0, CHAT_TURNS_PAGE_SIZE)
+        return chat_session_response(session, turns)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching chat session: {str(e)}")
 
 @app.post("/api/ai/chat", response_model=ChatResponse)
-async def ai_chat(chat_request: ChatRequest):
+async def ai_chat(chat_request: ChatRequest, background_tasks: BackgroundTasks):
     """AIチャット機能"""
     try:
         # 家族の存在確認
-        if supabase:
-            family_result = supabase.table("families").select("id").eq("access_key", chat_request.family_access_key).execute()
-            if not family_result.data:
-                raise HTTPException(status_code=404, detail="Family not found")
-        else:
-            # メモリベースのフォールバック
-            if chat_request.family_access_key not in test_families:
-                raise HTTPException(status_code=404, detail="Family not found")
+        family_id = await resolve_family_id(chat_request.family_access_key)
         
         # ログデータを取得
+        supabase = get_client("supabase")
         if supabase:
             # Supabaseから取得（実装略）
             logs = []
         else:
-            logs = test_log_entries.get(chat_request.family_access_key, [])
+            logs = local_store.list_log_entries(chat_request.family_access_key)
+        
+        # 会話の続きなら、要約と直近の発言をプロンプトに入れる（Supabase が遅いときは入れない）
+        history = NO_HISTORY
+        use_context = bool(chat_request.session_id) and not degradation.shed("skip_chat_context")
+        if use_context:
+            history = await run_in_threadpool(
+                load_chat_history, chat_request.family_access_key, family_id, chat_request.session_id,
+            )
         
         # AIからの回答を生成
-        if GEMINI_API_KEY:
-            response = get_ai_response_with_gemini(chat_request.question, logs)
+        # レート制限を超えた場合は待たせず、同じ質問への直近の回答かフォールバックで応答する
+        cache_key = (family_id, chat_request.session_id, chat_request.question.strip())
+        if LLM_ENABLED and rate_limiter.allow(family_id, "chat"):
+            response = await run_in_threadpool(get_ai_response_with_gemini, chat_request.question, logs, history)
+            chat_response_cache.set(cache_key, response)
+        elif LLM_ENABLED:
+            record_fallback("chat", "rate_limited")
+            response = chat_response_cache.get(cache_key) or fallback_get_ai_response(chat_request.question, logs)
         else:
+            record_fallback("chat", "no_api_key")
             response = fallback_get_ai_response(chat_request.question, logs)
         
+        if chat_request.session_id:
+            await run_in_threadpool(
+                append_chat_turns, chat_request.family_access_key, chat_request.session_id,
+                chat_request.question, response,
+            )
+            if use_context:
+                background_tasks.add_task(
+                    compact_chat_session, chat_request.family_access_key, family_id, chat_request.session_id,
+                )
+        
         return ChatResponse(
             response=response,
-            timestamp=datetime.now()
+            timestamp=datetime.now(),
+            session_id=chat_request.session_id
         )
         
     except HTTPException:
@@ -595,31 +1844,100 @@ async def ai_chat(chat_request: ChatRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error in AI chat: {str(e)}")
 
+def remember_chat_answer(chunks, family_access_key, session_id, question):
+    """送り終えた回答を会話に追加する（途中で打ち切られた回答は残さない）"""
+    answer = []
+    for chunk in chunks:
+        answer.append(chunk)
+        yield chunk
+    if answer:
+        append_chat_turns(family_access_key, session_id, question, "".join(answer))
+
+@app.post("/api/ai/chat/stream")
+async def ai_chat_stream(chat_request: ChatRequest):
+    """AIチャット機能（回答を生成しながらテキストで返す）"""
+    family_id = await resolve_family_id(chat_request.family_access_key)
+    
+    supabase = get_client("supabase")
+    if supabase:
+        # Supabaseから取得（実装略）
+        logs = []
+    else:
+        logs = local_store.list_log_entries(chat_request.family_access_key)
+    
+    history = NO_HISTORY
+    use_context = bool(chat_request.session_id) and not degradation.shed("skip_chat_context")
+    if use_context:
+        history = await run_in_threadpool(
+            load_chat_history, chat_request.family_access_key, family_id, chat_request.session_id,
+        )
+    
+    cache_key = (family_id, chat_request.session_id, chat_request.question.strip())
+    if LLM_ENABLED and rate_limiter.allow(family_id, "chat"):
+        chunks = stream_ai_response_with_gemini(
+            chat_request.question, logs,
+            on_complete=lambda response: chat_response_cache.set(cache_key, response),
+            history=history,
+        )
+    elif LLM_ENABLED:
+        record_fallback("chat", "rate_limited")
+        chunks = iter([chat_response_cache.get(cache_key) or fallback_get_ai_response(chat_request.question, logs)])
+    else:
+        record_fallback("chat", "no_api_key")
+        chunks = iter([fallback_get_ai_response(chat_request.question, logs)])
+    
+    background = None
+    if chat_request.session_id:
+        chunks = remember_chat_answer(
+            chunks, chat_request.family_access_key, chat_request.session_id, chat_request.question,
+        )
+        if use_context:
+            background = BackgroundTask(
+                compact_chat_session, chat_request.family_access_key, family_id, chat_request.session_id,
+            )
+    
+    return StreamingResponse(
+        chunks,
+        media_type="text/plain; charset=utf-8",
+        # プロキシでバッファリングさせない
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=background,
+    )
+
 @app.get("/api/ai/suggestions/{family_access_key}", response_model=SuggestionsResponse)
 async def ai_suggestions(family_access_key: str):
     """AIからの提案を取得"""
     try:
         # 家族の存在確認
-        if supabase:
-            family_result = supabase.table("families").select("id").eq("access_key", family_access_key).execute()
-            if not family_result.data:
-                raise HTTPException(status_code=404, detail="Family not found")
-        else:
-            # メモリベースのフォールバック
-            if family_access_key not in test_families:
-                raise HTTPException(status_code=404, detail="Family not found")
+        family_id = await resolve_family_id(family_access_key)
+        
+        # 夜間のバッチで作った前日のまとめがあれば、その提案を返す（ログを読まず、LLMも呼ばない）
+        digest = await run_in_threadpool(get_digest, family_access_key, family_id, digest_day())
+        if digest is not None:
+            digest_suggestions_served.inc()
+            return SuggestionsResponse(suggestions=digest["suggestions"], timestamp=datetime.now())
         
         # ログデータを取得
+        supabase = get_client("supabase")
         if supabase:
             # Supabaseから取得（実装略）
             logs = []
         else:
-            logs = test_log_entries.get(family_access_key, [])
+            logs = local_store.list_log_entries(family_access_key)
         
         # AIからの提案を生成
-        if GEMINI_API_KEY:
-            suggestions = get_suggestions_with_gemini(logs)
+        # LLMが遅いとき・レート制限を超えた場合は直近の提案かフォールバックで応答する
+        if LLM_ENABLED and degradation.shed("cached_suggestions"):
+            record_fallback("suggestions", "degraded")
+            suggestions = suggestions_cache.get((family_id,)) or fallback_get_suggestions(logs)
+        elif LLM_ENABLED and rate_limiter.allow(family_id, "suggestions"):
+            suggestions = await run_in_threadpool(get_suggestions_with_gemini, logs)
+            suggestions_cache.set((family_id,), suggestions)
+        elif LLM_ENABLED:
+            record_fallback("suggestions", "rate_limited")
+            suggestions = suggestions_cache.get((family_id,)) or fallback_get_suggestions(logs)
         else:
+            record_fallback("suggestions", "no_api_key")
             suggestions = fallback_get_suggestions(logs)
         
         return SuggestionsResponse(
@@ -632,6 +1950,96 @@ async def ai_suggestions(family_access_key: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error in AI suggestions: {str(e)}")
 
+@app.get("/api/digests/{family_access_key}", response_model=DigestResponse)
+async def get_family_digest(family_access_key: str, date_filter: Optional[date] = None):
+    """1日のまとめを取得（date_filter 未指定なら前日。夜間のバッチが作ったものを読むだけ）"""
+    try:
+        family_id = await resolve_family_id(family_access_key)
+        digest = await run_in_threadpool(get_digest, family_access_key, family_id, date_filter or digest_day())
+        if digest is None:
+            raise HTTPException(status_code=404, detail="Digest not found")
+        return digest_response(digest)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching digest: {str(e)}")
+
+@app.post("/api/admin/digests", include_in_schema=False, dependencies=[Depends(require_admin)])
+async def create_daily_digests(date_filter: Optional[date] = None):
+    """前日（date_filter）にログを書いた家族のまとめを作る（cron から毎晩呼ぶ。`python -m app.digest` と同じ）"""
+    try:
+        return await run_in_threadpool(run_daily_digests, date_filter or digest_day())
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error creating digests: {str(e)}")
+
+@app.get("/api/admin/degradation", include_in_schema=False, dependencies=[Depends(require_admin)])
+async def get_degradation_status():
+    """依存先ごとの運転モード・直近の p95・止めている処理"""
+    return degradation.status()
+
+@app.post("/api/admin/degradation/{dependency}", include_in_schema=False, dependencies=[Depends(require_admin)])
+async def set_degradation_mode(dependency: str, mode: str):
+    """依存先の運転モードを固定する（mode=normal / degraded。auto で自動の切り替えに戻す）"""
+    slo = degradation.dependencies.get(dependency)
+    if slo is None:
+        raise HTTPException(status_code=404, detail="Dependency not found")
+    try:
+        slo.set_override(mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return degradation.status()
+
+@app.post("/api/admin/profile", include_in_schema=False, dependencies=[Depends(require_admin)])
+async def capture_profile(seconds: float = 10, hz: float = 100, output: str = Query("speedscope", alias="format")):
+    """
+    seconds 秒だけプロセス全体のCPUプロファイルを取る
+    format: speedscope（https://www.speedscope.app で開く）/ folded（flamegraph.pl）/ top（関数ごとの集計）
+    """
+    if output not in PROFILE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format は {PROFILE_FORMATS} のいずれかです")
+    try:
+        profile = await profiler.capture(seconds, hz)
+        body, media_type = profile_body(profile, output)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(body, media_type=media_type)
+
+@app.get("/api/admin/profile/continuous", include_in_schema=False, dependencies=[Depends(require_admin)])
+async def get_continuous_profile(minutes: int = 5, output: str = Query("speedscope", alias="format")):
+    """常時のプロファイリング（PROFILER_ALWAYS_ON=1）の直近 minutes 分"""
+    if not profiler.continuous:
+        raise HTTPException(status_code=404, detail="Continuous profiling is disabled")
+    try:
+        body, media_type = profile_body(profiler.recent(minutes), output)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(body, media_type=media_type)
+
+@app.get("/api/admin/profile/routes", include_in_schema=False, dependencies=[Depends(require_admin)])
+async def get_route_cpu():
+    """ルート別のCPU時間（プロセスの起動から、合計の多い順）とサンプラーの状態"""
+    return {"profiler": profiler.status(), "routes": route_cpu_table()}
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False, dependencies=[Depends(require_admin)])
+async def metrics():
+    """Prometheus形式のメトリクス（家族IDを含むため管理用トークンが必要）"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def warm_up_app():
+    """クライアントの生成とカテゴリ一覧の読み込みを済ませ、所要時間(ms)を返す"""
+    timings = {"clients": warm_up()}
+    started = time.perf_counter()
+    category_cache.get()
+    timings["categories"] = round((time.perf_counter() - started) * 1000, 2)
+    return timings
+
+@app.get("/api/warmup", include_in_schema=False)
+async def warmup():
+    """SDKの読み込みとクライアント生成を済ませる（サーバーレスのウォームアップ用）"""
+    return await run_in_threadpool(warm_up_app)
+
 @app.get("/")
 async def root():
     """ヘルスチェック"""
@@ -0,0 +1,347 @@
+"""
+KazokuLog メトリクス収集
+LLM呼び出しとHTTPリクエストの計測値を Prometheus テキスト形式で公開する
+"""
+import heapq
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+# レイテンシ用のヒストグラム境界（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# /metrics に出す家族別トークン数の上限（ラベルのカーディナリティを抑える）
+TOP_FAMILIES_LIMIT = 20
+# 家族別トークン数を保持する家族数の上限（超えたら消費量の最も少ない家族から忘れる）
+FAMILY_USAGE_MAX_FAMILIES = 1000
+
+# リクエスト中の家族ID（LLMコストを家族単位で集計するため）
+current_family_id: ContextVar[Optional[str]] = ContextVar("current_family_id", default=None)
+
+_CJK_RE = re.compile(r"[぀-ヿ㐀-鿿＀-￯]")
+
+
+def _escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    """単調増加するカウンタ"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        return self._values.get(key, 0.0)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return "\n".join(lines)
+
+
+class Gauge:
+    """任意に上下する値"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def value(self, **labels) -> float:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        return self._values.get(key, 0.0)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return "\n".join(lines)
+
+
+class Histogram:
+    """累積バケット方式のヒストグラム"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # ラベル値 -> [バケットごとの件数..., 合計値, 件数]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [0] * len(self.buckets) + [0.0, 0]
+                self._series[key] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels) -> int:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        series = self._series.get(key)
+        return series[-1] if series else 0
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in items:
+            for bound, bucket_count in zip(self.buckets, series):
+                labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return "\n".join(lines)
+
+
+class FamilyUsage:
+    """
+    家族ごとのLLMトークン消費量（上位のみ公開する）
+    保持するのは max_families 家族まで。新しい家族が来たら消費量の最も少ない家族を忘れる（上位の家族は残る）
+    """
+
+    def __init__(self, name: str, documentation: str, limit: int = TOP_FAMILIES_LIMIT,
+                 max_families: int = FAMILY_USAGE_MAX_FAMILIES):
+        self.name = name
+        self.documentation = documentation
+        self.limit = limit
+        self.max_families = max_families
+        self._tokens: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, family_id: str, tokens: float) -> None:
+        with self._lock:
+            if family_id not in self._tokens and len(self._tokens) >= self.max_families:
+                del self._tokens[min(self._tokens, key=self._tokens.__getitem__)]
+            self._tokens[family_id] = self._tokens.get(family_id, 0.0) + tokens
+
+    def top(self):
+        with self._lock:
+            return heapq.nlargest(self.limit, self._tokens.items(), key=lambda item: item[1])
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for family_id, tokens in self.top():
+            lines.append(f'{self.name}{{family_id="{_escape_label_value(family_id)}"}} {tokens}')
+        return "\n".join(lines)
+
+
+class MetricsRegistry:
+    """メトリクスの登録と Prometheus 形式での出力"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+http_request_duration = REGISTRY.histogram(
+    "kazokulog_http_request_duration_seconds",
+    "HTTPリクエストの処理時間（ルート別）",
+    ("method", "route", "status"),
+)
+llm_requests = REGISTRY.counter(
+    "kazokulog_llm_requests_total",
+    "LLM呼び出し回数（outcome: success / error）",
+    ("provider", "model", "operation", "outcome"),
+)
+llm_latency = REGISTRY.histogram(
+    "kazokulog_llm_latency_seconds",
+    "LLM呼び出しのレイテンシ",
+    ("provider", "model", "operation"),
+)
+llm_prompt_tokens = REGISTRY.counter(
+    "kazokulog_llm_prompt_tokens_total",
+    "LLMに送信したプロンプトのトークン数",
+    ("provider", "model", "operation"),
+)
+llm_output_tokens = REGISTRY.counter(
+    "kazokulog_llm_output_tokens_total",
+    "LLMが生成した出力のトークン数",
+    ("provider", "model", "operation"),
+)
+llm_parse_failures = REGISTRY.counter(
+    "kazokulog_llm_parse_failures_total",
+    "LLMレスポンスの解析失敗回数",
+    ("provider", "model", "operation"),
+)
+# record_fallback の reason（ダッシュボードとアラートの値と揃える）
+FALLBACK_REASONS = (
+    "no_api_key",         # LLMが設定されていない
+    "error",              # 呼び出しの失敗
+    "parse_error",        # 応答を解析できない
+    "empty",              # 応答が空
+    "rate_limited",       # 家族ごとのレート制限
+    "concurrency_limit",  # 同時呼び出し数の上限
+    "degraded",           # 縮退運転中
+    "run_budget",         # 夜間のまとめ1回の実行全体のトークン予算
+)
+llm_fallbacks = REGISTRY.counter(
+    "kazokulog_llm_fallbacks_total",
+    "ルールベースのフォールバックに切り替えた回数（reason: " + " / ".join(FALLBACK_REASONS) + "）",
+    ("operation", "reason"),
+)
+family_llm_tokens = REGISTRY.register(FamilyUsage(
+    "kazokulog_family_llm_tokens_total",
+    f"家族別のLLMトークン消費量（上位{TOP_FAMILIES_LIMIT}家族）",
+))
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    トークン数の概算
+    SDKが使用量を返さない場合に使う。日本語は1文字≒1トークン、それ以外は4文字≒1トークン。
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class LLMCall:
+    """1回のLLM呼び出しの計測情報"""
+
+    def __init__(self, provider: str, model: str, operation: str, prompt: str):
+        self.provider = provider
+        self.model = model
+        self.operation = operation
+        self.prompt = prompt
+        self.output_text = ""
+        # SDKが使用量を返す場合はこちらを設定する
+        self.prompt_tokens: Optional[int] = None
+        self.output_tokens: Optional[int] = None
+
+    @property
+    def labels(self):
+        return {"provider": self.provider, "model": self.model, "operation": self.operation}
+
+
+@contextmanager
+def track_llm_call(provider: str, model: str, operation: str, prompt: str):
+    """
+    LLM呼び出しを計測するコンテキストマネージャ
+
+    with track_llm_call("gemini", model, "classify", prompt) as call:
+        call.output_text = ...
+    """
+    call = LLMCall(provider, model, operation, prompt)
+    start = time.perf_counter()
+    try:
+        yield call
+    except Exception:
+        llm_requests.inc(outcome="error", **call.labels)
+        raise
+    else:
+        llm_requests.inc(outcome="success", **call.labels)
+    finally:
+        llm_latency.observe(time.perf_counter() - start, **call.labels)
+        prompt_tokens = call.prompt_tokens if call.prompt_tokens is not None else estimate_tokens(prompt)
+        output_tokens = call.output_tokens if call.output_tokens is not None else estimate_tokens(call.output_text)
+        llm_prompt_tokens.inc(prompt_tokens, **call.labels)
+        llm_output_tokens.inc(output_tokens, **call.labels)
+        family_id = current_family_id.get()
+        if family_id:
+            family_llm_tokens.add(family_id, prompt_tokens + output_tokens)
+
+
+def record_parse_failure(provider: str, model: str, operation: str) -> None:
+    """LLMレスポンスの解析失敗を記録"""
+    llm_parse_failures.inc(provider=provider, model=model, operation=operation)
+
+
+def record_fallback(operation: str, reason: str) -> None:
+    """フォールバックへの切り替えを記録"""
+    llm_fallbacks.inc(operation=operation, reason=reason)
+
+
+class PrometheusMiddleware:
+    """ルート別のリクエスト処理時間を計測するASGIミドルウェア"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # ルートのテンプレート（/api/logs/{family_access_key}）で集計し、アクセスキーをラベルに含めない
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            http_request_duration.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=route_path,
+                status=str(status_code),
+            )
@@ -0,0 +1,545 @@
+"""
+KazokuLog プロファイリング
+本番でCPUが跳ねたときに、どのハンドラー・関数が使っているかを調べる（管理用エンドポイントからだけ使う）
+
+- サンプリング: 別スレッドから sys._current_frames() で全スレッドのスタックを定期的に読み、
+  前回からそのスレッドが使ったCPU時間を重みとして積み上げる（待っているだけのスレッドは数えない）
+  - オンデマンド: POST /api/admin/profile?seconds=N で N 秒だけ PROFILER_CAPTURE_HZ で取り、speedscope / folded で返す
+  - 常時: PROFILER_ALWAYS_ON=1 で PROFILER_HZ（デフォルト10Hz）で取り続け、1分ごとに PROFILER_RETENTION_MINUTES 分まで残す
+- イベントループ（メインスレッド）だけは SIGPROF（プロセスのCPU時間のタイマー）のハンドラーでスタックを読む。
+  別スレッドからは GIL を取れたときにしか読めず、ループがログやソケットへの書き込みで GIL を手放した位置に偏るため
+  （ハンドラーの Pydantic・JSON の処理がほとんど出てこない）。メインスレッドから開始できない環境では別スレッドから読む
+- 常時のサンプリングは、サンプラー自身のCPU時間が経過時間の PROFILER_OVERHEAD_BUDGET（デフォルト1%）を超えたら間隔を倍にする
+  （ローカルで10Hz 約0.3%、100Hz の取得中は約2%、ルート別のCPU時間は1リクエストあたり約7µs。benchmarks/bench_profiler.py で計測できる）
+- ルート別のCPU時間: RouteCPUMiddleware がリクエストのコルーチンが1回動くごとのCPU時間と、
+  run_in_threadpool で動かした関数のCPU時間を足し合わせる（ストリーミングの本文の生成は含まない）
+
+CPU時間はスレッドごとのCPUクロック（Linux）で測る。取れない環境ではサンプル間隔をそのまま重みにする（待ち時間も含まれる）。
+読んだときに待っている（threading の wait など）スレッドのCPU時間は、その手前で使ったものなので、
+待っている関数を除いた呼び出し元（どのハンドラーの中か）に付ける。
+"""
+import asyncio
+import json
+import os
+import re
+import signal
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool as _run_in_threadpool
+
+from .metrics import REGISTRY
+
+PROFILER_ALWAYS_ON = os.getenv("PROFILER_ALWAYS_ON") == "1"
+PROFILER_HZ = float(os.getenv("PROFILER_HZ", "10"))
+PROFILER_CAPTURE_HZ = float(os.getenv("PROFILER_CAPTURE_HZ", "100"))
+PROFILER_MAX_CAPTURE_SECONDS = 60.0
+PROFILER_RETENTION_MINUTES = int(os.getenv("PROFILER_RETENTION_MINUTES", "15"))
+PROFILER_OVERHEAD_BUDGET = float(os.getenv("PROFILER_OVERHEAD_BUDGET", "0.01"))
+ROUTE_CPU_ACCOUNTING = os.getenv("ROUTE_CPU_ACCOUNTING", "1") == "1"
+PROFILER_SIGNAL = os.getenv("PROFILER_SIGNAL", "1") == "1" and hasattr(signal, "setitimer")
+# 常時のサンプリングの間隔はこれ以上広げない
+PROFILER_MAX_INTERVAL_SECONDS = 1.0
+PROFILER_MAX_DEPTH = 96
+# オーバーヘッドを見直す間隔
+OVERHEAD_CHECK_SECONDS = 10.0
+# 待っているだけの関数（ファイル名の末尾, 関数名）。スタックの葉から取り除く
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("threading.py", "join"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("concurrent/futures/_base.py", "result"),
+    ("concurrent/futures/thread.py", "_worker"),
+}
+
+Stack = Tuple[str, ...]
+PROFILE_FORMATS = ("speedscope", "folded", "top")
+
+route_cpu_seconds = REGISTRY.histogram(
+    "kazokulog_http_request_cpu_seconds",
+    "ルート別のリクエスト1回あたりのCPU時間（イベントループとスレッドプールの合計）",
+    ("method", "route"),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+profiler_samples = REGISTRY.counter(
+    "kazokulog_profiler_samples_total",
+    "サンプラーがスタックを読んだ回数",
+)
+profiler_overhead = REGISTRY.gauge(
+    "kazokulog_profiler_overhead_ratio",
+    "常時のサンプリングでサンプラー自身が使ったCPU時間の割合（直近の OVERHEAD_CHECK_SECONDS 秒）",
+)
+profiler_hz = REGISTRY.gauge(
+    "kazokulog_profiler_hz",
+    "サンプラーの現在のサンプリング頻度（0 は停止中）",
+)
+
+
+class ProfilerBusy(Exception):
+    """オンデマンドのプロファイルを取得中"""
+
+
+class Profile:
+    """スタック（根 → 葉）ごとのCPU時間（秒）"""
+
+    def __init__(self, name: str = "kazokulog"):
+        self.name = name
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started = time.time()
+        self.ended: Optional[float] = None
+
+    def add(self, samples: Iterable[Tuple[Stack, float]]) -> None:
+        for stack, weight in samples:
+            self.stacks[stack] += weight
+        self.samples += 1
+
+    def merge(self, other: "Profile") -> None:
+        self.stacks.update(other.stacks)
+        self.samples += other.samples
+        self.started = min(self.started, other.started)
+
+    @property
+    def cpu_seconds(self) -> float:
+        return sum(self.stacks.values())
+
+    def folded(self) -> str:
+        """flamegraph.pl・speedscope が読める折りたたみ形式（1行に "根;…;葉 マイクロ秒"）"""
+        lines = [f"{';'.join(stack)} {round(weight * 1e6)}"
+                 for stack, weight in self.stacks.most_common() if weight >= 1e-6]
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self) -> Dict:
+        """speedscope（https://www.speedscope.app）のファイル形式"""
+        frames: List[Dict] = []
+        index: Dict[str, int] = {}
+        samples, weights = [], []
+        for stack, weight in self.stacks.most_common():
+            path = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({"name": frame})
+                path.append(index[frame])
+            samples.append(path)
+            weights.append(weight)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "exporter": "kazokulog",
+            "name": self.name,
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": self.name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+    def top_functions(self, limit: int = 20) -> List[Dict]:
+        """自分自身で使ったCPU時間（葉になった時間）の多い関数"""
+        self_time: Counter = Counter()
+        for stack, weight in self.stacks.items():
+            self_time[stack[-1]] += weight
+        total = self.cpu_seconds or 1.0
+        return [{"function": name, "cpu_seconds": round(seconds, 6), "share": round(seconds / total, 4)}
+                for name, seconds in self_time.most_common(limit)]
+
+
+class ThreadCPUClock:
+    """スレッドごとのCPU時間（前回読んだときからの差分）"""
+
+    supported = hasattr(time, "pthread_getcpuclockid")
+
+    def __init__(self):
+        # キーは (ident, native_id)。終了したスレッドの ident は使い回されることがある
+        self._clocks: Dict[Tuple[int, Optional[int]], int] = {}
+        self._last: Dict[Tuple[int, Optional[int]], float] = {}
+
+    def delta(self, key: Tuple[int, Optional[int]], fallback: float) -> Optional[float]:
+        """前回からのCPU時間（初めて見るスレッドは None）"""
+        if not self.supported:
+            return fallback
+        try:
+            clock = self._clocks.get(key)
+            if clock is None:
+                clock = self._clocks[key] = time.pthread_getcpuclockid(key[0])
+            now = time.clock_gettime(clock)
+        except (OSError, OverflowError):
+            # 読む間にスレッドが終了した
+            self._clocks.pop(key, None)
+            return None
+        last = self._last.get(key)
+        self._last[key] = now
+        return None if last is None or now < last else now - last
+
+    def retain(self, keys: Iterable[Tuple[int, Optional[int]]]) -> None:
+        alive = set(keys)
+        for key in [key for key in self._last if key not in alive]:
+            self._last.pop(key, None)
+            self._clocks.pop(key, None)
+
+
+# コードオブジェクト -> (表示名, 待っているだけの関数か)
+_labels: Dict[object, Tuple[str, bool]] = {}
+
+
+def _frame_label(code) -> Tuple[str, bool]:
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename.replace(os.sep, "/")
+        idle = any(filename.endswith(suffix) and code.co_name == name for suffix, name in IDLE_FRAMES)
+        for marker in ("/site-packages/", "/backend/", "/lib/python"):
+            if marker in filename:
+                filename = filename.rsplit(marker, 1)[1]
+                break
+        name = getattr(code, "co_qualname", code.co_name)
+        label = _labels[code] = (f"{name} ({filename}:{code.co_firstlineno})".replace(";", ":"), idle)
+    return label
+
+
+def _thread_label(name: Optional[str]) -> str:
+    # ThreadPoolExecutor-0_3 / Thread-12 のような番号はまとめる
+    return "thread:" + re.sub(r"[-_ ]?\d+(_\d+)?$", "", name or "unknown")
+
+
+def stack_of(frame, thread_name: Optional[str] = None, max_depth: int = PROFILER_MAX_DEPTH) -> Stack:
+    labels = []
+    leaf = True
+    while frame is not None and len(labels) < max_depth:
+        label, idle = _frame_label(frame.f_code)
+        # 待っている関数は葉からだけ取り除く
+        if not (leaf and idle):
+            leaf = False
+            labels.append(label)
+        frame = frame.f_back
+    labels.append(_thread_label(thread_name))
+    return tuple(reversed(labels))
+
+
+class SamplingProfiler:
+    """
+    全スレッドのスタックを定期的に読むサンプラー（プロセスに1つ）
+    オンデマンドの取得中は PROFILER_CAPTURE_HZ、それ以外は常時のサンプリングの間隔で動く
+    """
+
+    def __init__(self, hz: float = PROFILER_HZ, retention_minutes: int = PROFILER_RETENTION_MINUTES,
+                 overhead_budget: float = PROFILER_OVERHEAD_BUDGET):
+        self.base_interval = 1.0 / hz
+        self.interval = self.base_interval
+        self.overhead_budget = overhead_budget
+        self.continuous = False
+        self.windows: Deque[Tuple[int, Profile]] = deque(maxlen=retention_minutes)
+        self.capture_profile: Optional[Profile] = None
+        self.capture_interval = 1.0 / PROFILER_CAPTURE_HZ
+        self.overhead = 0.0
+        self._clock = ThreadCPUClock()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # SIGPROF で読んだメインスレッドのサンプル（ハンドラーからはロックを取らずに積み、サンプラーのスレッドが取り出す）
+        self.signal_installed = False
+        self._signal_interval = 0.0
+        self._signal_samples: Deque[Tuple[Stack, float]] = deque()
+        self._signal_cpu: Optional[float] = None
+        self._signal_overhead = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self.continuous or self.capture_profile is not None
+
+    def _install_signal_handler(self) -> None:
+        # signal.signal はメインスレッドからしか呼べない（uvicorn ではイベントループのスレッド）
+        if self.signal_installed or not PROFILER_SIGNAL or threading.current_thread() is not threading.main_thread():
+            return
+        if signal.getsignal(signal.SIGPROF) not in (signal.SIG_DFL, signal.SIG_IGN, None):
+            # ほかのプロファイラーが使っている
+            return
+        signal.signal(signal.SIGPROF, self._on_sigprof)
+        # 割り込まれたシステムコールはやり直させる
+        signal.siginterrupt(signal.SIGPROF, False)
+        self.signal_installed = True
+
+    def _on_sigprof(self, signum, frame) -> None:
+        now = time.thread_time()
+        last, self._signal_cpu = self._signal_cpu, now
+        if last is not None and now > last and frame is not None:
+            self._signal_samples.append((stack_of(frame, threading.main_thread().name), now - last))
+        self._signal_overhead += time.thread_time() - now
+
+    def _arm_signal(self, interval: float) -> None:
+        # ITIMER_PROF はプロセスのCPU時間で進む（アイドルの間は鳴らない）
+        if interval == self._signal_interval:
+            return
+        if interval and not self._signal_interval:
+            self._signal_cpu = None
+        signal.setitimer(signal.ITIMER_PROF, interval, interval)
+        self._signal_interval = interval
+
+    def _ensure_thread(self) -> None:
+        # self._lock を持って呼ぶ（終了しかけのスレッドとの入れ違いを防ぐ）
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+        self._wake.set()
+
+    def start_continuous(self) -> None:
+        self._install_signal_handler()
+        with self._lock:
+            self.continuous = True
+            self._ensure_thread()
+        print(f"🔬 常時のプロファイリングを開始しました（{1 / self.base_interval:g}Hz、"
+              f"オーバーヘッドの上限 {self.overhead_budget:.1%}）")
+
+    def stop_continuous(self) -> None:
+        with self._lock:
+            self.continuous = False
+
+    def sample(self, elapsed: float) -> List[Tuple[Stack, float]]:
+        """全スレッド（自分を除く）のスタックと、前回からのCPU時間"""
+        me = threading.get_ident()
+        # SIGPROF で読んでいるメインスレッドは除く
+        main = threading.main_thread().ident if self._signal_interval else None
+        threads = {thread.ident: thread for thread in threading.enumerate()}
+        frames = sys._current_frames()
+        samples, keys = [], []
+        while self._signal_samples:
+            samples.append(self._signal_samples.popleft())
+        for ident, frame in frames.items():
+            if ident == me or ident == main:
+                continue
+            thread = threads.get(ident)
+            key = (ident, getattr(thread, "native_id", None))
+            keys.append(key)
+            weight = self._clock.delta(key, elapsed)
+            if weight:
+                samples.append((stack_of(frame, thread.name if thread else None), weight))
+        self._clock.retain(keys)
+        profiler_samples.inc()
+        return samples
+
+    def _run(self) -> None:
+        last = check_wall = time.perf_counter()
+        check_cpu = time.thread_time()
+        check_signal = self._signal_overhead
+        while True:
+            with self._lock:
+                if not self.running:
+                    # 次に始めるスレッドとタイマーを取り合わないよう、ロックの中で止める
+                    if self.signal_installed:
+                        self._arm_signal(0.0)
+                    self._signal_samples.clear()
+                    self._thread = None
+                    break
+            capturing = self.capture_profile is not None
+            interval = self.capture_interval if capturing else self.interval
+            if self.signal_installed:
+                self._arm_signal(interval)
+            self._wake.wait(interval)
+            self._wake.clear()
+            profiler_hz.set(1 / interval)
+            now = time.perf_counter()
+            samples = self.sample(now - last)
+            last = now
+            with self._lock:
+                if self.capture_profile is not None:
+                    self.capture_profile.add(samples)
+                if self.continuous:
+                    self._window().add(samples)
+            if now - check_wall >= OVERHEAD_CHECK_SECONDS:
+                cpu, signal_cpu = time.thread_time(), self._signal_overhead
+                self.overhead = (cpu - check_cpu + signal_cpu - check_signal) / (now - check_wall)
+                profiler_overhead.set(self.overhead)
+                if not capturing:
+                    self._adjust_interval()
+                check_wall, check_cpu, check_signal = now, cpu, signal_cpu
+        profiler_hz.set(0)
+
+    def _adjust_interval(self) -> None:
+        # 上限を超えたら間隔を倍に、十分下回ったら元の間隔に向けて戻す
+        if self.overhead > self.overhead_budget and self.interval < PROFILER_MAX_INTERVAL_SECONDS:
+            self.interval = min(PROFILER_MAX_INTERVAL_SECONDS, self.interval * 2)
+            print(f"🔬 プロファイラーのオーバーヘッド {self.overhead:.2%} が上限を超えたため {1 / self.interval:g}Hz に下げます")
+        elif self.overhead < self.overhead_budget / 4 and self.interval > self.base_interval:
+            self.interval = max(self.base_interval, self.interval / 2)
+
+    def _window(self) -> Profile:
+        minute = int(time.time() // 60)
+        if not self.windows or self.windows[-1][0] != minute:
+            self.windows.append((minute, Profile(f"kazokulog continuous {minute * 60}")))
+        return self.windows[-1][1]
+
+    async def capture(self, seconds: float, hz: float = PROFILER_CAPTURE_HZ) -> Profile:
+        """seconds 秒だけ hz で取得したプロファイル（同時に1つまで）"""
+        if not 0 < seconds <= PROFILER_MAX_CAPTURE_SECONDS:
+            raise ValueError(f"seconds は 0 より大きく {PROFILER_MAX_CAPTURE_SECONDS:g} 以下です")
+        if not 1 <= hz <= 1000:
+            raise ValueError("hz は 1〜1000 です")
+        profile = Profile(f"kazokulog {seconds:g}s")
+        self._install_signal_handler()
+        with self._lock:
+            if self.capture_profile is not None:
+                raise ProfilerBusy("プロファイルを取得中です")
+            self.capture_interval = 1.0 / hz
+            self.capture_profile = profile
+            self._ensure_thread()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            with self._lock:
+                self.capture_profile = None
+            profile.ended = time.time()
+        return profile
+
+    def recent(self, minutes: int) -> Profile:
+        """常時のサンプリングの直近 minutes 分"""
+        profile = Profile(f"kazokulog continuous {minutes}m")
+        since = int(time.time() // 60) - minutes + 1
+        with self._lock:
+            for minute, window in self.windows:
+                if minute >= since:
+                    profile.merge(window)
+        return profile
+
+    def status(self) -> Dict:
+        return {
+            "continuous": self.continuous,
+            "capturing": self.capture_profile is not None,
+            "hz": round(1 / self.interval, 2),
+            "overhead_ratio": round(self.overhead, 5),
+            "overhead_budget": self.overhead_budget,
+            "thread_cpu_clock": ThreadCPUClock.supported,
+            "main_thread_sampling": "signal" if self.signal_installed else "thread",
+            "windows": len(self.windows),
+        }
+
+
+class RequestCPU:
+    """1リクエストのCPU時間（スレッドプールの関数からも足す）"""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self.seconds += seconds
+
+
+_request_cpu: ContextVar[Optional[RequestCPU]] = ContextVar("kazokulog_request_cpu", default=None)
+_route_totals: Dict[Tuple[str, str], List[float]] = {}
+_route_totals_lock = threading.Lock()
+
+
+class _CPUTimed:
+    """コルーチンを1回動かすごとのCPU時間（time.thread_time の差）を数えながら待つ"""
+
+    def __init__(self, coroutine, usage: RequestCPU):
+        self.coroutine = coroutine
+        self.usage = usage
+
+    def __await__(self):
+        coroutine, usage = self.coroutine, self.usage
+        value, error = None, None
+        while True:
+            started = time.thread_time()
+            try:
+                if error is not None:
+                    yielded = coroutine.throw(error)
+                else:
+                    yielded = coroutine.send(value)
+            except StopIteration as e:
+                usage.add(time.thread_time() - started)
+                return e.value
+            except BaseException:
+                usage.add(time.thread_time() - started)
+                raise
+            usage.add(time.thread_time() - started)
+            value, error = None, None
+            try:
+                value = yield yielded
+            except GeneratorExit:
+                coroutine.close()
+                raise
+            except BaseException as e:
+                error = e
+
+
+async def run_in_threadpool(func: Callable, *args, **kwargs):
+    """starlette の run_in_threadpool と同じ（スレッドで使ったCPU時間をリクエストに足す）"""
+    usage = _request_cpu.get()
+    if usage is None:
+        return await _run_in_threadpool(func, *args, **kwargs)
+
+    def timed():
+        started = time.thread_time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            usage.add(time.thread_time() - started)
+
+    return await _run_in_threadpool(timed)
+
+
+class RouteCPUMiddleware:
+    """ルート別のCPU時間を計測するASGIミドルウェア"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ROUTE_CPU_ACCOUNTING:
+            await self.app(scope, receive, send)
+            return
+        usage = RequestCPU()
+        token = _request_cpu.set(usage)
+        try:
+            await _CPUTimed(self.app(scope, receive, send), usage)
+        finally:
+            _request_cpu.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            route_cpu_seconds.observe(usage.seconds, method=scope["method"], route=route)
+            with _route_totals_lock:
+                totals = _route_totals.setdefault((scope["method"], route), [0, 0.0])
+                totals[0] += 1
+                totals[1] += usage.seconds
+
+
+def route_cpu_table() -> List[Dict]:
+    """ルート別のCPU時間（合計の多い順）"""
+    with _route_totals_lock:
+        rows = [(method, route, count, seconds) for (method, route), (count, seconds) in _route_totals.items()]
+    total = sum(seconds for *_, seconds in rows) or 1.0
+    return [{
+        "method": method,
+        "route": route,
+        "requests": count,
+        "cpu_seconds": round(seconds, 6),
+        "cpu_ms_per_request": round(seconds / count * 1000, 3),
+        "share": round(seconds / total, 4),
+    } for method, route, count, seconds in sorted(rows, key=lambda row: -row[3])]
+
+
+def profile_body(profile: Profile, output: str) -> Tuple[str, str]:
+    """(本文, Content-Type)"""
+    if output == "speedscope":
+        return json.dumps(profile.speedscope(), ensure_ascii=False), "application/json"
+    if output == "folded":
+        return profile.folded(), "text/plain; charset=utf-8"
+    if output == "top":
+        return json.dumps({"cpu_seconds": round(profile.cpu_seconds, 6), "samples": profile.samples,
+                           "functions": profile.top_functions()}, ensure_ascii=False), "application/json"
+    raise ValueError(f"format は {PROFILE_FORMATS} のいずれかです")
+
+
+profiler = SamplingProfiler()
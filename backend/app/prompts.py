@@ -0,0 +1,281 @@
+"""
+KazokuLog プロンプトテンプレート
+バージョン付きのプロンプトを一か所で管理する
+
+各テンプレートは固定の指示部分（prefix）と、呼び出しごとに変わる部分（suffix）に分かれる。
+prefix は起動時に一度だけ組み立て、プロバイダが対応していればキャッシュ済みコンテキストとして送る
+（Anthropic の prompt caching / Gemini の cached content）。毎回の呼び出しでは suffix だけが変わる。
+
+テンプレートの内容を変えたら version を上げること。バージョンは分類キャッシュのキーと
+classification_details.prompt_version に記録される。
+環境変数 PROMPT_VERSION_<NAME>（例: PROMPT_VERSION_CLASSIFY=1）で使うバージョンを固定できる。
+"""
+import hashlib
+import os
+from typing import Dict, Tuple
+
+
+class PromptTemplate:
+    """固定部分（prefix）と可変部分（suffix）からなるプロンプト"""
+
+    def __init__(self, name: str, version: int, prefix: str, suffix: str):
+        self.name = name
+        self.version = version
+        self.prefix = prefix.strip() + "\n\n" if prefix.strip() else ""
+        self.suffix = suffix.strip() + "\n"
+        self.id = f"{name}@{version}"
+        self.prefix_hash = hashlib.sha256(self.prefix.encode("utf-8")).hexdigest()[:16]
+
+    def render_suffix(self, **values) -> str:
+        return self.suffix.format(**values)
+
+    def render(self, **values) -> str:
+        """prefix と suffix を連結したプロンプト全体（キャッシュ非対応のプロバイダ用）"""
+        return self.prefix + self.suffix.format(**values)
+
+
+_CATEGORY_GUIDE = """
+分類カテゴリ:
+- schedule: 予定・イベント（運動会、病院、学校行事など）
+- emotion: 子どもの様子・感情（機嫌、体調、行動など）
+- shopping: 買い物リスト（食材、日用品など）
+- todo: 家族のやること（手続き、申請、タスクなど）
+- memo: 雑談・メモ（その他、日常の出来事など）
+"""
+
+_TEMPLATES = [
+    # v1: 本文が指示の途中に入る旧形式（prefix キャッシュ不可、比較評価用に残す）
+    PromptTemplate(
+        "classify", 1,
+        prefix="",
+        suffix="""
+以下のテキストを家族のログとして分析し、適切なカテゴリに分類してください。
+また、要約とキーワードも抽出してください。
+
+テキスト: "{text}"
+""" + _CATEGORY_GUIDE.replace("{", "{{").replace("}", "}}") + """
+以下のJSON形式で回答してください:
+{{
+    "category": "分類したカテゴリ名",
+    "confidence_score": 0.0-1.0の信頼度,
+    "summary": "30文字以内の要約",
+    "keywords": ["キーワード1", "キーワード2", "キーワード3"],
+    "reasoning": "分類の理由"
+}}
+""",
+    ),
+    PromptTemplate(
+        "classify", 2,
+        prefix="""
+あなたは家族のログを整理する専門家です。
+最後に示すテキストを家族のログとして分析し、適切なカテゴリに分類してください。
+また、要約とキーワードも抽出してください。
+""" + _CATEGORY_GUIDE + """
+以下のJSON形式だけで回答してください:
+{
+    "category": "分類したカテゴリ名",
+    "confidence_score": 0.0-1.0の信頼度,
+    "summary": "30文字以内の要約",
+    "keywords": ["キーワード1", "キーワード2", "キーワード3"],
+    "reasoning": "分類の理由"
+}
+
+注意事項:
+- confidence_scoreは0.0-1.0の範囲で信頼度を示す
+- keywordsは重要な単語を3つまで抽出
+- reasoningは分類の根拠を簡潔に説明
+""",
+        suffix="""
+テキスト: "{text}"
+""",
+    ),
+    # 予定・買い物・子どもの様子などが混在するメモを、1回の呼び出しで複数の項目に分ける
+    PromptTemplate(
+        "extract", 1,
+        prefix="""
+あなたは家族のログを整理する専門家です。
+最後に示すテキストには、予定・買い物・子どもの様子などが混在していることがあります。
+内容ごとに項目に分け、それぞれをカテゴリに分類して、要約とキーワードを抽出してください。
+""" + _CATEGORY_GUIDE + """
+以下のJSON形式だけで回答してください:
+{
+    "items": [
+        {
+            "text": "元のテキストのうち、この項目にあたる部分",
+            "category": "分類したカテゴリ名",
+            "confidence_score": 0.0-1.0の信頼度,
+            "summary": "30文字以内の要約",
+            "keywords": ["キーワード1", "キーワード2", "キーワード3"]
+        }
+    ]
+}
+
+注意事項:
+- 1つの話題は1つの項目にまとめる（話題が1つだけなら items は1件）
+- 項目は元のテキストに現れる順に、最大10件
+- textは元のテキストからそのまま抜き出す
+- keywordsは重要な単語を3つまで抽出
+""",
+        suffix="""
+テキスト: "{text}"
+""",
+    ),
+    # 予定のエントリの日時をルールで読み取れなかったときに使う
+    PromptTemplate(
+        "event", 1,
+        prefix="""
+あなたは家族の予定を整理する専門家です。
+最後に示すテキストは家族の予定のメモです。基準日をメモを書いた日として、予定の日時とタイトルを読み取ってください。
+
+以下のJSON形式だけで回答してください:
+{
+    "event_at": "YYYY-MM-DD HH:MM（時刻がなければ YYYY-MM-DD、日付が読み取れなければ null）",
+    "title": "予定の内容（日時の表現を除いた20文字以内）"
+}
+
+注意事項:
+- 「明日」「来週の金曜日」などは基準日から数える
+- 年がなければ基準日以降で最も近い日付にする
+""",
+        suffix="""
+基準日: {base_date}（{weekday}曜日）
+テキスト: "{text}"
+""",
+    ),
+    PromptTemplate(
+        "chat", 2,
+        prefix="""
+あなたは家族のAIコンシェルジュです。過去のログを参考にして、家族の質問に答えてください。
+
+以下の点を考慮して回答してください:
+1. 過去のログから傾向を読み取る
+2. 家族の状況を理解して適切な提案をする
+3. 温かみのある、親しみやすい口調で回答する
+4. 具体的で実践的なアドバイスを提供する
+5. 200文字以内で回答する
+""",
+        suffix="""
+過去のログ:
+{log_summary}
+
+質問: {question}
+
+回答:
+""",
+    ),
+    # v3: 会話の要約と直近のやりとりを入れる（backend/app/chat_memory.py）
+    PromptTemplate(
+        "chat", 3,
+        prefix="""
+あなたは家族のAIコンシェルジュです。過去のログとこれまでの会話を参考にして、家族の質問に答えてください。
+
+以下の点を考慮して回答してください:
+1. 過去のログから傾向を読み取る
+2. これまでの会話の流れを踏まえる（「それ」「さっきの」などは会話の内容を指す）
+3. 家族の状況を理解して適切な提案をする
+4. 温かみのある、親しみやすい口調で回答する
+5. 具体的で実践的なアドバイスを提供する
+6. 200文字以内で回答する
+""",
+        suffix="""
+過去のログ:
+{log_summary}
+
+これまでの会話:
+{history}
+
+質問: {question}
+
+回答:
+""",
+    ),
+    # 長くなった会話の古いやりとりを要約に畳み込む
+    PromptTemplate(
+        "chat_summary", 1,
+        prefix="""
+あなたは家族とAIコンシェルジュの会話を記録する係です。
+これまでの要約に新しいやりとりを加えて、会話の要約を作り直してください。
+
+注意事項:
+- 家族が話題にした人・予定・悩み・AIが提案したことと、その後の返事を残す
+- あいさつや繰り返しは省く
+- 指定した文字数以内の文章だけで回答する
+""",
+        suffix="""
+これまでの要約:
+{summary}
+
+新しいやりとり:
+{turns}
+
+要約（{max_chars}文字以内）:
+""",
+    ),
+    # 夜間のバッチ（backend/app/digest.py）で、家族ごとに1日のまとめと翌日への提案を1回の呼び出しで作る
+    PromptTemplate(
+        "digest", 1,
+        prefix="""
+あなたは家族のAIコンシェルジュです。
+最後に示す家族の1日のログから、その日のまとめと、翌日に向けた3つの提案を作ってください。
+
+以下のJSON形式だけで回答してください:
+{
+    "summary": "その日の家族の出来事のまとめ（100文字以内）",
+    "suggestions": ["提案1", "提案2", "提案3"]
+}
+
+提案の内容:
+- 家族の健康や幸福につながる提案
+- 翌日の予定・やること・買い物を踏まえた具体的な内容
+- 各提案は50文字以内で簡潔に
+""",
+        suffix="""
+日付: {date}
+その日のログ:
+{log_summary}
+""",
+    ),
+    PromptTemplate(
+        "suggestions", 2,
+        prefix="""
+家族のログを分析して、3つの有用な提案をしてください。
+
+以下の形式で3つの提案を出してください:
+1. [提案1]
+2. [提案2]
+3. [提案3]
+
+提案の内容:
+- 家族の健康や幸福につながる提案
+- 実践しやすい具体的な内容
+- ログから読み取れる傾向に基づく提案
+- 各提案は50文字以内で簡潔に
+""",
+        suffix="""
+過去のログ:
+{log_summary}
+""",
+    ),
+]
+
+PROMPT_REGISTRY: Dict[Tuple[str, int], PromptTemplate] = {(t.name, t.version): t for t in _TEMPLATES}
+
+
+def _resolve_active_versions() -> Dict[str, PromptTemplate]:
+    active = {}
+    for name in {t.name for t in _TEMPLATES}:
+        pinned = os.getenv(f"PROMPT_VERSION_{name.upper()}")
+        version = int(pinned) if pinned else max(v for n, v in PROMPT_REGISTRY if n == name)
+        active[name] = PROMPT_REGISTRY[(name, version)]
+    return active
+
+
+# 起動時に使用するバージョンを確定しておく
+ACTIVE_PROMPTS = _resolve_active_versions()
+
+
+def get_prompt(name: str, version: int = None) -> PromptTemplate:
+    """テンプレートを取得（バージョン未指定なら環境変数の指定か最新）"""
+    if version is None:
+        return ACTIVE_PROMPTS[name]
+    return PROMPT_REGISTRY[(name, version)]
@@ -0,0 +1,208 @@
+"""
+KazokuLog レート制限
+家族×ルートごとのトークンバケットと、LLMへの同時呼び出し数の上限
+
+上限を超えたリクエストは待たせず、呼び出し側でキャッシュまたはルールベースの応答に切り替える。
+状態は通常プロセス内に持つが、RATE_LIMIT_REDIS_URL を設定すると Redis に置き、
+複数レプリカ間で同じ制限を共有する（redis パッケージが必要）。
+Redis がなく LOCAL_STORE_PATH を設定した場合は、同じマシンのワーカー間で SQLite に置いて共有する。
+
+環境変数:
+    RATE_LIMIT_<ROUTE>_PER_MINUTE  1分あたりの補充トークン数（ROUTE: CHAT / SUGGESTIONS / CLASSIFY / EVENTS）
+    RATE_LIMIT_<ROUTE>_BURST       バケットの容量
+    LLM_MAX_CONCURRENCY            LLMへの同時呼び出し数の上限（プロセス単位）
+    RATE_LIMIT_REDIS_URL           共有ストアの Redis URL
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+from .metrics import REGISTRY
+from .shared_state import SQLiteStore, local_store
+
+# ルート名 -> (1分あたりのトークン数, バースト容量)
+DEFAULT_LIMITS = {
+    "chat": (10.0, 5),
+    "suggestions": (6.0, 3),
+    "classify": (30.0, 10),
+    # 予定の日時をルールで読み取れなかったときのLLM呼び出し
+    "events": (10.0, 5),
+}
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+
+rate_limited_requests = REGISTRY.counter(
+    "kazokulog_rate_limited_total",
+    "レート制限によりLLMを呼ばずに応答した回数",
+    ("route",),
+)
+llm_concurrency_rejections = REGISTRY.counter(
+    "kazokulog_llm_concurrency_rejected_total",
+    "同時呼び出し数の上限によりLLMを呼ばなかった回数",
+    ("operation",),
+)
+llm_in_flight = REGISTRY.gauge(
+    "kazokulog_llm_in_flight",
+    "実行中のLLM呼び出し数",
+)
+
+
+def load_limits() -> Dict[str, Tuple[float, int]]:
+    """環境変数で上書きしたレート制限の設定を読み込む"""
+    limits = {}
+    for route, (per_minute, burst) in DEFAULT_LIMITS.items():
+        prefix = f"RATE_LIMIT_{route.upper()}"
+        limits[route] = (
+            float(os.getenv(f"{prefix}_PER_MINUTE", per_minute)),
+            int(os.getenv(f"{prefix}_BURST", burst)),
+        )
+    return limits
+
+
+class InMemoryBucketStore:
+    """プロセス内のトークンバケット"""
+
+    def __init__(self):
+        self._buckets: Dict[Tuple[str, str], Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: Tuple[str, str], rate_per_second: float, burst: int) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (float(burst), now))
+            tokens = min(float(burst), tokens + (now - updated_at) * rate_per_second)
+            allowed = tokens >= 1.0
+            if allowed:
+                tokens -= 1.0
+            self._buckets[key] = (tokens, now)
+            return allowed
+
+
+class RedisBucketStore:
+    """Redis 上のトークンバケット（レプリカ間で共有）"""
+
+    # 残量の計算と消費を1回の往復でアトミックに行う
+    SCRIPT = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+return allowed
+"""
+
+    def __init__(self, url: str):
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    def take(self, key: Tuple[str, str], rate_per_second: float, burst: int) -> bool:
+        redis_key = "kazokulog:ratelimit:" + ":".join(key)
+        return bool(self._script(keys=[redis_key], args=[rate_per_second, burst, time.time()]))
+
+
+class SQLiteBucketStore:
+    """ローカルストア（SQLite）上のトークンバケット（同じマシンのワーカー間で共有）"""
+
+    def __init__(self, store: SQLiteStore):
+        self._store = store
+
+    def take(self, key: Tuple[str, str], rate_per_second: float, burst: int) -> bool:
+        # 壁時計を使う（monotonic はプロセスごとに基準が違う）
+        now = time.time()
+        bucket_key = ":".join(key)
+        with self._store.transaction() as conn:
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?", (bucket_key,)
+            ).fetchone()
+            tokens, updated_at = (row[0], row[1]) if row else (float(burst), now)
+            tokens = min(float(burst), tokens + max(0.0, now - updated_at) * rate_per_second)
+            allowed = tokens >= 1.0
+            if allowed:
+                tokens -= 1.0
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                (bucket_key, tokens, now),
+            )
+        return allowed
+
+
+class RateLimiter:
+    """家族×ルートのレート制限"""
+
+    def __init__(self, store=None, limits=None):
+        self.store = store or InMemoryBucketStore()
+        self.limits = limits or load_limits()
+
+    def allow(self, family_id: str, route: str) -> bool:
+        per_minute, burst = self.limits[route]
+        try:
+            allowed = self.store.take((family_id, route), per_minute / 60.0, burst)
+        except Exception as e:
+            # 共有ストアの障害でサービスを止めない
+            print(f"Rate limit store error: {e}")
+            allowed = True
+        if not allowed:
+            rate_limited_requests.inc(route=route)
+        return allowed
+
+
+class LLMBudgetExceeded(Exception):
+    """LLMへの同時呼び出し数が上限に達している"""
+
+
+class LLMConcurrencyBudget:
+    """LLMへの同時呼び出し数の上限（空きがなければ待たずに失敗させる）"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self, operation: str):
+        if not self._semaphore.acquire(blocking=False):
+            llm_concurrency_rejections.inc(operation=operation)
+            raise LLMBudgetExceeded(f"LLM concurrency limit ({self.limit}) reached")
+        with self._lock:
+            self._in_flight += 1
+            llm_in_flight.set(self._in_flight)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                llm_in_flight.set(self._in_flight)
+            self._semaphore.release()
+
+
+def create_rate_limiter() -> RateLimiter:
+    """設定に応じたストアでレート制限を作成"""
+    if RATE_LIMIT_REDIS_URL:
+        try:
+            store = RedisBucketStore(RATE_LIMIT_REDIS_URL)
+            print("🚦 レート制限の状態を Redis で共有します")
+            return RateLimiter(store)
+        except ImportError:
+            print("⚠️ redis パッケージがないため、レート制限はプロセス内で管理します")
+    if isinstance(local_store, SQLiteStore):
+        return RateLimiter(SQLiteBucketStore(local_store))
+    return RateLimiter()
+
+
+rate_limiter = create_rate_limiter()
+llm_budget = LLMConcurrencyBudget(LLM_MAX_CONCURRENCY)
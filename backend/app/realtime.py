@@ -0,0 +1,271 @@
+"""
+KazokuLog リアルタイム配信
+家族ごとのチャンネルに新しいログを流し、接続中のダッシュボードへ Server-Sent Events で届ける
+
+- ブローカーはプロセス内（asyncio）。イベントは publish 時に一度だけSSEのフレームにシリアライズし、
+  同じバイト列を購読者ごとのキューに入れる（接続数が多くてもJSON化は1回）
+- 購読者ごとのキューは上限付き（REALTIME_QUEUE_SIZE）。読み出しが追いつかずに溢れた購読者には
+  "resync" イベントを送って切断する。クライアントは再接続後に GET /api/logs?since=<seq> で差分を取り直す
+- REALTIME_PG_DSN を設定すると Postgres の LISTEN/NOTIFY を購読し、他のレプリカでの書き込みも配信する
+  （database/schema.sql の notify_log_entry_change トリガーが必要、`pip install psycopg2-binary`）
+"""
+import asyncio
+import json
+import os
+import select
+import threading
+from typing import Any, Dict, Optional, Set
+
+from .metrics import REGISTRY
+
+REALTIME_QUEUE_SIZE = int(os.getenv("REALTIME_QUEUE_SIZE", "64"))
+REALTIME_MAX_PER_FAMILY = int(os.getenv("REALTIME_MAX_PER_FAMILY", "50"))
+REALTIME_HEARTBEAT_SECONDS = float(os.getenv("REALTIME_HEARTBEAT_SECONDS", "15"))
+REALTIME_PG_DSN = os.getenv("REALTIME_PG_DSN")
+NOTIFY_CHANNEL = "kazokulog_log_entries"
+
+realtime_subscribers = REGISTRY.gauge(
+    "kazokulog_realtime_subscribers",
+    "リアルタイム配信の接続数",
+)
+realtime_events = REGISTRY.counter(
+    "kazokulog_realtime_events_total",
+    "配信したイベント数（source=local: このプロセスでの書き込み, bus: 他のワーカーでの書き込み, postgres: NOTIFY経由）",
+    ("source",),
+)
+realtime_deliveries = REGISTRY.counter(
+    "kazokulog_realtime_deliveries_total",
+    "購読者のキューに入れたイベント数",
+)
+realtime_overflows = REGISTRY.counter(
+    "kazokulog_realtime_overflows_total",
+    "キューが溢れて切断した購読者の数",
+)
+realtime_rejections = REGISTRY.counter(
+    "kazokulog_realtime_rejected_total",
+    "家族あたりの接続数の上限で拒否した接続の数",
+)
+
+HEARTBEAT_FRAME = b": ping\n\n"
+RETRY_FRAME = b"retry: 3000\n\n"
+
+
+def encode_event(event_type: str, data: Dict[str, Any], event_id: Optional[int] = None) -> bytes:
+    """SSEのフレームを作る"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append("data: " + json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str))
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+
+RESYNC_FRAME = encode_event("resync", {"reason": "overflow"})
+
+
+class Subscription:
+    """1接続分の購読"""
+
+    __slots__ = ("family_id", "queue", "closed")
+
+    def __init__(self, family_id: str, queue_size: int):
+        self.family_id = family_id
+        self.queue: "asyncio.Queue[bytes]" = asyncio.Queue(maxsize=queue_size)
+        self.closed = False
+
+    def offer(self, frame: bytes) -> bool:
+        """フレームを入れる（溢れた場合は resync を送って閉じ、False を返す）"""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            # 古いイベントは捨て、差分の取り直しを促す
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC_FRAME)
+            self.closed = True
+            realtime_overflows.inc()
+            return False
+
+
+class SubscriberLimitExceeded(Exception):
+    """家族あたりの接続数の上限を超えた"""
+
+
+class Broker:
+    """家族ごとのチャンネルを持つプロセス内のブローカー（イベントループ上で使う）"""
+
+    def __init__(self, queue_size: int = REALTIME_QUEUE_SIZE, max_per_family: int = REALTIME_MAX_PER_FAMILY,
+                 heartbeat: float = REALTIME_HEARTBEAT_SECONDS):
+        self.queue_size = queue_size
+        self.max_per_family = max_per_family
+        self.heartbeat = heartbeat
+        self._channels: Dict[str, Set[Subscription]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._count = 0
+
+    def subscribe(self, family_id: str) -> Subscription:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._heartbeat_task = loop.create_task(self._send_heartbeats())
+        channel = self._channels.setdefault(family_id, set())
+        if len(channel) >= self.max_per_family:
+            realtime_rejections.inc()
+            raise SubscriberLimitExceeded(f"Too many connections for family ({self.max_per_family})")
+        subscription = Subscription(family_id, self.queue_size)
+        channel.add(subscription)
+        self._count += 1
+        realtime_subscribers.set(self._count)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        channel = self._channels.get(subscription.family_id)
+        if channel is None or subscription not in channel:
+            return
+        channel.discard(subscription)
+        if not channel:
+            del self._channels[subscription.family_id]
+        subscription.closed = True
+        self._count -= 1
+        realtime_subscribers.set(self._count)
+
+    def subscriber_count(self, family_id: Optional[str] = None) -> int:
+        if family_id is None:
+            return self._count
+        return len(self._channels.get(family_id, ()))
+
+    def publish(self, family_id: str, event_type: str, data: Dict[str, Any],
+                event_id: Optional[int] = None, source: str = "local") -> int:
+        """イベントを家族のチャンネルに配信し、キューに入れた購読者数を返す（イベントループ上で呼ぶ）"""
+        realtime_events.inc(source=source)
+        channel = self._channels.get(family_id)
+        if not channel:
+            return 0
+        frame = encode_event(event_type, data, event_id)
+        delivered = 0
+        for subscription in list(channel):
+            if subscription.offer(frame):
+                delivered += 1
+        realtime_deliveries.inc(delivered)
+        return delivered
+
+    def publish_threadsafe(self, family_id: str, event_type: str, data: Dict[str, Any],
+                           event_id: Optional[int] = None, source: str = "local") -> None:
+        """別スレッド（バックグラウンド処理・NOTIFYの受信）から配信する"""
+        if self._loop is None or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self.publish, family_id, event_type, data, event_id, source)
+
+    async def _send_heartbeats(self) -> None:
+        """
+        接続を保つため、全購読者に定期的にコメント行を送る
+        購読ごとにタイムアウト付きで待つより、ブローカー全体で1つのタスクにした方が軽い
+        """
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            for channel in list(self._channels.values()):
+                for subscription in list(channel):
+                    if not subscription.closed and not subscription.queue.full():
+                        subscription.queue.put_nowait(HEARTBEAT_FRAME)
+
+    async def stream(self, subscription: Subscription):
+        """購読のフレームを順に返す（StreamingResponse 用）"""
+        try:
+            yield RETRY_FRAME
+            while True:
+                yield await subscription.queue.get()
+                if subscription.closed and subscription.queue.empty():
+                    break
+        finally:
+            self.unsubscribe(subscription)
+
+
+class PostgresBridge:
+    """
+    Postgres の LISTEN/NOTIFY を受けてブローカーに流す（バックグラウンドスレッド）
+    NOTIFY のペイロードは notify_log_entry_change トリガーが作る {"family_id", "change_seq", "entry"}
+    """
+
+    def __init__(self, dsn: str, broker: Broker, channel: str = NOTIFY_CHANNEL):
+        import psycopg2  # noqa: F401  （未インストールなら ImportError）
+
+        self.dsn = dsn
+        self.broker = broker
+        self.channel = channel
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="realtime-pg-bridge", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        import psycopg2
+
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.channel};")
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 5.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._dispatch(conn.notifies.pop(0).payload)
+            except Exception as e:
+                print(f"⚠️ Postgres LISTEN の接続が切れました（再接続します）: {e}")
+                self._stop.wait(5.0)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def _dispatch(self, payload: str) -> None:
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        # 再接続中に取りこぼした可能性があるため、entry がなくても変更番号だけは届ける
+        data = {"change_seq": message.get("change_seq"), "entry": message.get("entry")}
+        self.broker.publish_threadsafe(
+            message["family_id"], "log_entry", data, event_id=message.get("change_seq"), source="postgres",
+        )
+
+
+broker = Broker()
+pg_bridge: Optional[PostgresBridge] = None
+
+
+def start_postgres_bridge() -> Optional[PostgresBridge]:
+    """REALTIME_PG_DSN が設定されていれば LISTEN/NOTIFY の受信を始める"""
+    global pg_bridge
+    if not REALTIME_PG_DSN or pg_bridge is not None:
+        return pg_bridge
+    try:
+        pg_bridge = PostgresBridge(REALTIME_PG_DSN, broker)
+    except ImportError:
+        print("⚠️ psycopg2 がないため、リアルタイム配信はこのプロセス内の書き込みだけを対象にします")
+        return None
+    pg_bridge.start()
+    print("📡 Postgres LISTEN/NOTIFY でリアルタイム配信を共有します")
+    return pg_bridge
+
+
+def publish_log_entry(family_id: str, entry: Dict[str, Any]) -> bool:
+    """
+    ログの追加・変更を家族のチャンネルに配信する（イベントループ上で呼ぶ）
+    Postgres のブリッジが動いている場合は NOTIFY 経由で全レプリカに届くため、ここでは配信せず False を返す
+    """
+    if pg_bridge is not None:
+        return False
+    change_seq = entry.get("change_seq")
+    broker.publish(family_id, "log_entry", {"change_seq": change_seq, "entry": entry}, event_id=change_seq)
+    return True
@@ -0,0 +1,86 @@
+"""
+KazokuLog 分類ルーティング
+ルールベース分類の信頼度が高いテキストはLLMを呼ばずに分類する
+
+- ルールの信頼度 >= CLASSIFY_RULE_CONFIDENCE_THRESHOLD: ルールの結果を採用（LLM呼び出しを節約）
+  ただし CLASSIFY_AGREEMENT_SAMPLE_RATE の割合でLLMも呼び、両者の一致を記録する
+- それ未満（境界ケース）: LLMで分類し、ルールとの一致を記録する
+
+一致率はルールの信頼度ごとに /metrics に出るので、しきい値はそこから調整する。
+"""
+import json
+import os
+import random
+from typing import Callable, Dict, Optional
+
+from .metrics import REGISTRY
+
+CLASSIFY_RULE_CONFIDENCE_THRESHOLD = float(os.getenv("CLASSIFY_RULE_CONFIDENCE_THRESHOLD", "0.85"))
+CLASSIFY_AGREEMENT_SAMPLE_RATE = float(os.getenv("CLASSIFY_AGREEMENT_SAMPLE_RATE", "0.05"))
+
+routing_decisions = REGISTRY.counter(
+    "kazokulog_classify_routing_total",
+    "分類の振り分け結果（route: rules / llm / sampled）",
+    ("route",),
+)
+llm_calls_saved = REGISTRY.counter(
+    "kazokulog_classify_llm_calls_saved_total",
+    "ルールの信頼度が高くLLM呼び出しを省略した回数",
+)
+routing_agreement = REGISTRY.counter(
+    "kazokulog_classify_agreement_total",
+    "ルールとLLMの分類結果の一致（rule_confidence ごと）",
+    ("rule_confidence", "agree"),
+)
+
+
+class ClassificationRouter:
+    """信頼度に応じてルールベース分類とLLM分類を振り分ける"""
+
+    def __init__(self, threshold: float = CLASSIFY_RULE_CONFIDENCE_THRESHOLD,
+                 sample_rate: float = CLASSIFY_AGREEMENT_SAMPLE_RATE, rng: Optional[random.Random] = None):
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.random = rng or random.Random()
+
+    def classify(self, text: str, llm_classify: Callable[[str], Optional[Dict]],
+                 rule_classify: Callable[[str], Dict]) -> Dict:
+        """
+        テキストを分類する
+
+        Args:
+            llm_classify: LLMで分類する関数（失敗時は None を返す）
+            rule_classify: ルールベースで分類する関数
+        """
+        rule_result = rule_classify(text)
+        if rule_result["confidence_score"] >= self.threshold:
+            if self.random.random() >= self.sample_rate:
+                routing_decisions.inc(route="rules")
+                llm_calls_saved.inc()
+                return rule_result
+            routing_decisions.inc(route="sampled")
+        else:
+            routing_decisions.inc(route="llm")
+
+        llm_result = llm_classify(text)
+        if llm_result is None:
+            return rule_result
+        self.record_agreement(text, rule_result, llm_result)
+        return llm_result
+
+    def record_agreement(self, text: str, rule_result: Dict, llm_result: Dict) -> None:
+        """ルールとLLMの一致を記録（本文は残さず、長さとカテゴリのみ）"""
+        rule_confidence = f'{rule_result["confidence_score"]:.1f}'
+        agree = rule_result["category"] == llm_result.get("category")
+        routing_agreement.inc(rule_confidence=rule_confidence, agree=str(agree).lower())
+        print("classify_agreement " + json.dumps({
+            "rule_category": rule_result["category"],
+            "rule_confidence": rule_result["confidence_score"],
+            "llm_category": llm_result.get("category"),
+            "llm_confidence": llm_result.get("confidence_score"),
+            "agree": agree,
+            "text_length": len(text),
+        }, ensure_ascii=False))
+
+
+classification_router = ClassificationRouter()
@@ -3,12 +3,15 @@ Claude APIとの連携処理
 テキスト分類・要約のためのサービス
 """
 import os
-import json
 from typing import Dict, List, Any, Optional
-from datetime import datetime
 import anthropic
 from pydantic import BaseModel
 
+from ..llm_parsing import LLMParseError, parse_classification_response
+from ..metrics import record_fallback, track_llm_call
+from ..prompts import get_prompt
+from ..tracing import SPAN_KIND_CLIENT, span
+
 class ClassificationResult(BaseModel):
     """分類結果のデータモデル"""
     category: str
@@ -16,6 +19,7 @@ class ClassificationResult(BaseModel):
     summary: str
     keywords: List[str]
     reasoning: str
+    prompt_version: Optional[str] = None
 
 class ClaudeService:
     """Claude APIサービス"""
@@ -35,22 +39,48 @@ class ClaudeService:
             ClassificationResult: 分類結果
         """
         try:
-            prompt = self._create_classification_prompt(text)
+            template = get_prompt("classify")
+            # prefix が空のテンプレート（classify@1 など）は system を付けず、全文をユーザーメッセージで送る
+            # （空のテキストブロックは API に拒否される）
+            if template.prefix:
+                prompt = template.render_suffix(text=text)
+                extra = {"system": self._system_blocks(template)}
+            else:
+                prompt = template.render(text=text)
+                extra = {}
             
-            message = self.client.messages.create(
-                model=self.model,
-                max_tokens=1000,
-                temperature=0.1,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
+            with span("llm.classify", SPAN_KIND_CLIENT, provider="anthropic", model=self.model,
+                      prompt_version=template.id), \
+                    track_llm_call("anthropic", self.model, "classify", template.render(text=text)) as call:
+                message = self.client.messages.create(
+                    model=self.model,
+                    max_tokens=1000,
+                    temperature=0.1,
+                    # 固定の指示部分はプロンプトキャッシュに載せ、毎回の入力は本文だけにする
+                    # （キャッシュはモデルごとの最小トークン数を超えた場合のみ有効）
+                    **extra,
+                    messages=[
+                        {"role": "user", "content": prompt},
+                        # 応答の書き出しを "{" に固定してJSONだけを返させる
+                        {"role": "assistant", "content": "{"}
+                    ]
+                )
+                call.output_text = "{" + message.content[0].text
+                call.prompt_tokens = (
+                    message.usage.input_tokens
+                    + (getattr(message.usage, "cache_creation_input_tokens", None) or 0)
+                    + (getattr(message.usage, "cache_read_input_tokens", None) or 0)
+                )
+                call.output_tokens = message.usage.output_tokens
             
-            response_text = message.content[0].text
-            return self._parse_classification_response(response_text)
+            with span("llm.parse_json"):
+                result = self._parse_classification_response(call.output_text)
+            result.prompt_version = template.id
+            return result
             
         except Exception as e:
             # エラー時のフォールバック
+            record_fallback("classify", "error")
             return ClassificationResult(
                 category="memo",
                 confidence_score=0.0,
@@ -59,56 +89,23 @@ class ClaudeService:
                 reasoning=f"分類エラー: {str(e)}"
             )
     
-    def _create_classification_prompt(self, text: str) -> str:
-        """分類用のプロンプトを作成"""
-        return f"""
-あなたは家族のログを整理する専門家です。以下のテキストを分析し、適切なカテゴリに分類してください。
-
-テキスト: {text}
-
-利用可能なカテゴリ:
-- schedule: 予定・イベント（病院の予約、学校行事、家族の予定など）
-- emotion: 子どもの様子（感情、体調、発達、行動など）
-- shopping: 買い物リスト（食材、日用品、子供用品など）
-- todo: 家族のToDo（やるべきこと、タスク、手続きなど）
-- memo: 雑談・メモ（日常の気づき、思いついたことなど）
-
-以下のJSON形式で回答してください:
-{{
-    "category": "カテゴリ名",
-    "confidence_score": 0.8,
-    "summary": "簡潔な要約（50文字以内）",
-    "keywords": ["キーワード1", "キーワード2"],
-    "reasoning": "分類理由"
-}}
-
-注意事項:
-- confidence_scoreは0.0-1.0の範囲で信頼度を示す
-- summaryは要点を簡潔にまとめる
-- keywordsは重要な単語を3つまで抽出
-- reasoningは分類の根拠を説明
-"""
+    def _system_blocks(self, template) -> List[Dict[str, Any]]:
+        """プロンプトの固定部分をキャッシュ対象の system ブロックにする"""
+        return [{
+            "type": "text",
+            "text": template.prefix,
+            "cache_control": {"type": "ephemeral"},
+        }]
     
     def _parse_classification_response(self, response: str) -> ClassificationResult:
         """Claude APIのレスポンスを解析"""
         try:
-            # JSON部分を抽出
-            start_idx = response.find('{')
-            end_idx = response.rfind('}') + 1
-            json_str = response[start_idx:end_idx]
-            
-            data = json.loads(json_str)
-            
-            return ClassificationResult(
-                category=data.get('category', 'memo'),
-                confidence_score=float(data.get('confidence_score', 0.5)),
-                summary=data.get('summary', ''),
-                keywords=data.get('keywords', []),
-                reasoning=data.get('reasoning', '')
-            )
+            data = parse_classification_response(response, "anthropic", self.model)
+            return ClassificationResult(**data)
             
-        except (json.JSONDecodeError, KeyError, ValueError) as e:
+        except LLMParseError as e:
             # パース失敗時のフォールバック
+            record_fallback("classify", "parse_error")
             return ClassificationResult(
                 category="memo",
                 confidence_score=0.0,
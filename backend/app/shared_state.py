@@ -0,0 +1,761 @@
+"""
+KazokuLog プロセス間で共有する状態
+Supabase 未設定時のローカルストアと、プロセスごとのキャッシュを揃えるための無効化バス
+
+uvicorn / gunicorn を複数ワーカーで動かすと、モジュールのグローバル変数はワーカーごとに別々になる。
+LOCAL_STORE_PATH（例: /tmp/kazokulog.db）を設定すると、同じマシン上の全ワーカーが SQLite（WALモード）の
+ファイルを共有し、家族・ログ・買い物/ToDoリスト・予定・AIチャットの会話・1日のまとめ・レート制限の状態が揃う。未設定なら従来どおりプロセス内の辞書に持つ（1ワーカー用）。
+
+無効化バス:
+    各プロセスの TTLCache / カテゴリ一覧 / リアルタイム配信はプロセス内にあるため、
+    変更を bus_events テーブルに書き、他のプロセスがポーリングで受け取って自分のキャッシュに反映する。
+    送信元のプロセスは自分で反映済みなので、自分が書いたイベントは受け取らない。
+"""
+import bisect
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .metrics import REGISTRY
+
+LOCAL_STORE_PATH = os.getenv("LOCAL_STORE_PATH")
+BUS_POLL_INTERVAL_SECONDS = float(os.getenv("BUS_POLL_INTERVAL_SECONDS", "0.2"))
+# 受信の遅れたプロセスが取りこぼさないだけの時間を残して古いイベントを消す
+BUS_RETENTION_SECONDS = 60.0
+
+bus_messages = REGISTRY.counter(
+    "kazokulog_bus_messages_total",
+    "プロセス間バスのメッセージ数（direction=sent / received）",
+    ("topic", "direction"),
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS families (
+    access_key TEXT PRIMARY KEY,
+    id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    change_seq INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS log_entries (
+    id TEXT PRIMARY KEY,
+    access_key TEXT NOT NULL,
+    change_seq INTEGER NOT NULL,
+    idempotency_key TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_log_entries_access_key ON log_entries(access_key, change_seq);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_log_entries_idempotency_key ON log_entries(access_key, idempotency_key);
+CREATE TABLE IF NOT EXISTS log_archive (
+    access_key TEXT NOT NULL,
+    month TEXT NOT NULL,
+    entry_count INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (access_key, month)
+);
+CREATE TABLE IF NOT EXISTS list_items (
+    id TEXT PRIMARY KEY,
+    access_key TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    normalized_name TEXT NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+-- 未完了の項目の一覧と、同じ品目をまとめるときの検索に使う
+CREATE UNIQUE INDEX IF NOT EXISTS idx_list_items_open ON list_items(access_key, kind, normalized_name) WHERE done = 0;
+CREATE TABLE IF NOT EXISTS events (
+    id TEXT PRIMARY KEY,
+    access_key TEXT NOT NULL,
+    event_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_access_key_event_at ON events(access_key, event_at);
+CREATE TABLE IF NOT EXISTS chat_sessions (
+    id TEXT PRIMARY KEY,
+    access_key TEXT NOT NULL,
+    summary TEXT NOT NULL DEFAULT '',
+    summarized_seq INTEGER NOT NULL DEFAULT 0,
+    turn_count INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chat_turns (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (session_id, seq)
+);
+CREATE TABLE IF NOT EXISTS digests (
+    access_key TEXT NOT NULL,
+    digest_date TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (access_key, digest_date)
+);
+CREATE TABLE IF NOT EXISTS bus_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    topic TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    origin TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+def pack_entries(entries: List[Dict[str, Any]]) -> bytes:
+    """アーカイブする1家族×1か月のエントリを圧縮"""
+    return zlib.compress(json.dumps(entries, ensure_ascii=False, default=str).encode("utf-8"), 6)
+
+
+def unpack_entries(data: bytes) -> List[Dict[str, Any]]:
+    return json.loads(zlib.decompress(data))
+
+
+def group_by_month(entries: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """エントリを日付の月（YYYY-MM-01）ごとに分ける"""
+    months: Dict[str, List[Dict[str, Any]]] = {}
+    for entry in entries:
+        months.setdefault(entry["date"][:7] + "-01", []).append(entry)
+    return months
+
+
+def new_list_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """リストに新しく載せる項目（item は name / normalized_name / log_entry_id / log_entry_date）"""
+    now = datetime.now().isoformat()
+    return dict(item, id=str(uuid.uuid4()), done=False, mention_count=1, done_at=None, created_at=now, updated_at=now)
+
+
+def merge_list_item(existing: Dict[str, Any], item: Dict[str, Any]) -> Dict[str, Any]:
+    """未完了の同じ品目に、新しいエントリでの言及をまとめる"""
+    return dict(existing, mention_count=existing["mention_count"] + 1, log_entry_id=item["log_entry_id"],
+                log_entry_date=item["log_entry_date"], updated_at=datetime.now().isoformat())
+
+
+def mark_list_item(item: Dict[str, Any], done: bool) -> Dict[str, Any]:
+    now = datetime.now().isoformat()
+    return dict(item, done=done, done_at=now if done else None, updated_at=now)
+
+
+def new_event(event: Dict[str, Any]) -> Dict[str, Any]:
+    return dict(event, id=str(uuid.uuid4()), created_at=datetime.now(timezone.utc).isoformat())
+
+
+def new_chat_session() -> Dict[str, Any]:
+    now = datetime.now(timezone.utc).isoformat()
+    return {"id": str(uuid.uuid4()), "summary": "", "summarized_seq": 0, "turn_count": 0,
+            "created_at": now, "updated_at": now}
+
+
+def new_chat_turns(first_seq: int, turns: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """発言（role / content）に first_seq からの番号を振る"""
+    now = datetime.now(timezone.utc).isoformat()
+    return [{"seq": first_seq + i, "role": turn["role"], "content": turn["content"], "created_at": now}
+            for i, turn in enumerate(turns)]
+
+
+def new_digest(digest: Dict[str, Any]) -> Dict[str, Any]:
+    return dict(digest, id=str(uuid.uuid4()), created_at=datetime.now(timezone.utc).isoformat())
+
+
+class MemoryStore:
+    """プロセス内の辞書に持つストア（1ワーカー用）"""
+
+    def __init__(self):
+        self._families: Dict[str, Dict[str, Any]] = {}
+        self._log_entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._archive: Dict[Tuple[str, str], bytes] = {}
+        # (家族, リストの種類) ごとの項目（ID -> 項目）と、未完了の項目の索引（正規化した名前 -> ID）
+        self._list_items: Dict[Tuple[str, str], Dict[str, Dict[str, Any]]] = {}
+        self._open_list_items: Dict[Tuple[str, str], Dict[str, str]] = {}
+        # 家族ごとの予定（(event_at, ID) の昇順に並べた索引と、ID -> 予定）
+        self._event_index: Dict[str, List[Tuple[str, str]]] = {}
+        self._events: Dict[str, Dict[str, Any]] = {}
+        # AIチャットの会話（ID -> 会話、ID -> 発言の番号順のリスト）
+        self._chat_sessions: Dict[str, Dict[str, Any]] = {}
+        self._chat_turns: Dict[str, List[Dict[str, Any]]] = {}
+        # (家族, 日付) -> 1日のまとめ
+        self._digests: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def create_family(self, family: Dict[str, Any]) -> None:
+        with self._lock:
+            self._families[family["access_key"]] = dict(family, change_seq=0)
+
+    def get_family(self, access_key: str) -> Optional[Dict[str, Any]]:
+        family = self._families.get(access_key)
+        return dict(family) if family is not None else None
+
+    def add_log_entry(self, access_key: str, entry: Dict[str, Any]) -> int:
+        """家族の変更番号を進めてエントリを追加し、新しい変更番号を返す"""
+        return self.add_log_entries(access_key, [entry])[0]
+
+    def add_log_entries(self, access_key: str, entries: List[Dict[str, Any]]) -> List[int]:
+        """複数のエントリをまとめて追加し、それぞれの変更番号を返す"""
+        with self._lock:
+            family = self._families[access_key]
+            stored = self._log_entries.setdefault(access_key, [])
+            change_seqs = []
+            for entry in entries:
+                family["change_seq"] += 1
+                stored.append(dict(entry, change_seq=family["change_seq"]))
+                change_seqs.append(family["change_seq"])
+            return change_seqs
+
+    def list_log_entries(self, access_key: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._log_entries.get(access_key, []))
+
+    def log_entries_on(self, day: str) -> Dict[str, List[Dict[str, Any]]]:
+        """日付が day のエントリを家族ごとに返す（ログのない家族は含めない）"""
+        with self._lock:
+            found = {}
+            for access_key, entries in self._log_entries.items():
+                on_day = [dict(entry) for entry in entries if entry["date"] == day]
+                if on_day:
+                    found[access_key] = on_day
+            return found
+
+    def recent_log_entries(self, access_key: str, limit: int) -> List[Dict[str, Any]]:
+        """新しい順に最大 limit 件"""
+        with self._lock:
+            return self._log_entries.get(access_key, [])[::-1][:limit]
+
+    def find_log_entry(self, access_key: str, idempotency_key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            for entry in self._log_entries.get(access_key, []):
+                if entry.get("idempotency_key") == idempotency_key:
+                    return entry
+        return None
+
+    def find_log_entry_group(self, access_key: str, idempotency_key: str) -> List[Dict[str, Any]]:
+        """1つのメモから作った複数のエントリ（Idempotency-Key が "<key>:<番号>"）"""
+        prefix = idempotency_key + ":"
+        with self._lock:
+            return [entry for entry in self._log_entries.get(access_key, [])
+                    if (entry.get("idempotency_key") or "").startswith(prefix)]
+
+    def archive_log_entries(self, cutoff: str) -> int:
+        """日付が cutoff より前のエントリをアーカイブに移し、移した家族×月の数を返す"""
+        archived = 0
+        with self._lock:
+            for access_key, entries in self._log_entries.items():
+                old = [entry for entry in entries if entry["date"] < cutoff]
+                if not old:
+                    continue
+                for month, month_entries in group_by_month(old).items():
+                    packed = self._archive.get((access_key, month))
+                    existing = unpack_entries(packed) if packed else []
+                    self._archive[(access_key, month)] = pack_entries(existing + month_entries)
+                    archived += 1
+                self._log_entries[access_key] = [entry for entry in entries if entry["date"] >= cutoff]
+        return archived
+
+    def archived_log_entries(self, access_key: str, month: str) -> List[Dict[str, Any]]:
+        """アーカイブした1か月分のエントリ（month は YYYY-MM-01）"""
+        packed = self._archive.get((access_key, month))
+        return unpack_entries(packed) if packed else []
+
+    def add_list_items(self, access_key: str, kind: str, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """項目をリストに載せる（未完了の同じ品目があればまとめる）。載せた・まとめた項目を返す"""
+        with self._lock:
+            stored = self._list_items.setdefault((access_key, kind), {})
+            open_items = self._open_list_items.setdefault((access_key, kind), {})
+            result = []
+            for item in items:
+                item_id = open_items.get(item["normalized_name"])
+                if item_id is not None:
+                    stored[item_id] = merge_list_item(stored[item_id], item)
+                else:
+                    new_item = new_list_item(item)
+                    item_id = open_items[item["normalized_name"]] = new_item["id"]
+                    stored[item_id] = new_item
+                result.append(dict(stored[item_id]))
+            return result
+
+    def list_items(self, access_key: str, kind: str, include_done: bool = False) -> List[Dict[str, Any]]:
+        """リストの項目を追加順に返す（未完了だけなら索引から読むので、完了済みの件数によらない）"""
+        with self._lock:
+            stored = self._list_items.get((access_key, kind), {})
+            if include_done:
+                items = list(stored.values())
+            else:
+                items = [stored[item_id] for item_id in self._open_list_items.get((access_key, kind), {}).values()]
+            return sorted((dict(item) for item in items), key=lambda item: item["created_at"])
+
+    def set_list_item_done(self, access_key: str, kind: str, item_id: str, done: bool) -> Optional[Dict[str, Any]]:
+        """
+        項目を完了・未完了にする（項目がなければ None）
+        未完了に戻す品目が別の項目として未完了で残っていれば、そちらを返す
+        """
+        with self._lock:
+            stored = self._list_items.get((access_key, kind), {})
+            item = stored.get(item_id)
+            if item is None or item["done"] == done:
+                return dict(item) if item is not None else None
+            open_items = self._open_list_items.setdefault((access_key, kind), {})
+            if done:
+                open_items.pop(item["normalized_name"], None)
+            elif item["normalized_name"] in open_items:
+                return dict(stored[open_items[item["normalized_name"]]])
+            else:
+                open_items[item["normalized_name"]] = item_id
+            stored[item_id] = mark_list_item(item, done)
+            return dict(stored[item_id])
+
+    def add_events(self, access_key: str, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """予定を追加する（event_at は UTC の ISO 形式）"""
+        stored = [new_event(event) for event in events]
+        with self._lock:
+            index = self._event_index.setdefault(access_key, [])
+            for event in stored:
+                bisect.insort(index, (event["event_at"], event["id"]))
+                self._events[event["id"]] = event
+        return stored
+
+    def list_events(self, access_key: str, start: str, end: str) -> List[Dict[str, Any]]:
+        """event_at が start 以上 end 未満の予定を日時順に返す（索引の二分探索）"""
+        with self._lock:
+            index = self._event_index.get(access_key, [])
+            lo, hi = bisect.bisect_left(index, (start,)), bisect.bisect_left(index, (end,))
+            return [dict(self._events[event_id]) for _, event_id in index[lo:hi]]
+
+    def create_chat_session(self, access_key: str) -> Dict[str, Any]:
+        session = new_chat_session()
+        with self._lock:
+            self._chat_sessions[session["id"]] = dict(session, access_key=access_key)
+            self._chat_turns[session["id"]] = []
+        return session
+
+    def get_chat_session(self, access_key: str, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            session = self._chat_sessions.get(session_id)
+            if session is None or session["access_key"] != access_key:
+                return None
+            return {key: value for key, value in session.items() if key != "access_key"}
+
+    def add_chat_turns(self, access_key: str, session_id: str, turns: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """会話に発言を追加する（番号は会話の中で1から順に振る）"""
+        with self._lock:
+            session = self._chat_sessions[session_id]
+            stored = new_chat_turns(session["turn_count"] + 1, turns)
+            self._chat_turns[session_id].extend(stored)
+            session["turn_count"] += len(stored)
+            session["updated_at"] = stored[-1]["created_at"] if stored else session["updated_at"]
+        return [dict(turn) for turn in stored]
+
+    def list_chat_turns(self, access_key: str, session_id: str, after_seq: int = 0,
+                        limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """after_seq より後の発言を番号順に返す（limit を指定すると最後の limit 件）"""
+        with self._lock:
+            # 番号は1から連続しているので、after_seq 番目から先を切り出せばよい
+            turns = self._chat_turns.get(session_id, [])[after_seq:]
+            if limit is not None:
+                turns = turns[-limit:] if limit else []
+            return [dict(turn) for turn in turns]
+
+    def update_chat_summary(self, access_key: str, session_id: str, summary: str,
+                            summarized_seq: int, expected_seq: int) -> bool:
+        """要約を更新する（他の処理が先に要約を進めていれば更新せず False）"""
+        with self._lock:
+            session = self._chat_sessions.get(session_id)
+            if session is None or session["summarized_seq"] != expected_seq:
+                return False
+            session.update(summary=summary, summarized_seq=summarized_seq,
+                           updated_at=datetime.now(timezone.utc).isoformat())
+            return True
+
+    def save_digest(self, access_key: str, digest: Dict[str, Any]) -> Dict[str, Any]:
+        """1日のまとめを保存する（同じ日のまとめがあれば置き換える）"""
+        stored = new_digest(digest)
+        with self._lock:
+            self._digests[(access_key, digest["digest_date"])] = stored
+        return dict(stored)
+
+    def get_digest(self, access_key: str, digest_date: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            digest = self._digests.get((access_key, digest_date))
+            return dict(digest) if digest is not None else None
+
+
+class SQLiteStore:
+    """同じマシン上のワーカー間で共有する SQLite のストア"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 の接続はスレッド間で共有しない（スレッドプールのスレッドごとに1本）
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def execute(self, sql: str, params=()) -> sqlite3.Cursor:
+        return self._connection().execute(sql, params)
+
+    def transaction(self):
+        """書き込みを直列化するトランザクション（BEGIN IMMEDIATE）"""
+        return _Transaction(self._connection())
+
+    def create_family(self, family: Dict[str, Any]) -> None:
+        self.execute(
+            "INSERT INTO families (access_key, id, name, change_seq, created_at) VALUES (?, ?, ?, 0, ?)",
+            (family["access_key"], family["id"], family["name"], str(family["created_at"])),
+        )
+
+    def get_family(self, access_key: str) -> Optional[Dict[str, Any]]:
+        row = self.execute("SELECT * FROM families WHERE access_key = ?", (access_key,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def add_log_entry(self, access_key: str, entry: Dict[str, Any]) -> int:
+        """家族の変更番号を進めてエントリを追加し、新しい変更番号を返す"""
+        return self.add_log_entries(access_key, [entry])[0]
+
+    def add_log_entries(self, access_key: str, entries: List[Dict[str, Any]]) -> List[int]:
+        """複数のエントリを1つのトランザクションで追加し、それぞれの変更番号を返す"""
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE families SET change_seq = change_seq + ? WHERE access_key = ?", (len(entries), access_key)
+            )
+            last_seq = conn.execute(
+                "SELECT change_seq FROM families WHERE access_key = ?", (access_key,)
+            ).fetchone()[0]
+            change_seqs = list(range(last_seq - len(entries) + 1, last_seq + 1))
+            conn.executemany(
+                "INSERT INTO log_entries (id, access_key, change_seq, idempotency_key, data) VALUES (?, ?, ?, ?, ?)",
+                [(entry["id"], access_key, change_seq, entry.get("idempotency_key"),
+                  json.dumps(dict(entry, change_seq=change_seq), ensure_ascii=False, default=str))
+                 for entry, change_seq in zip(entries, change_seqs)],
+            )
+        return change_seqs
+
+    def list_log_entries(self, access_key: str) -> List[Dict[str, Any]]:
+        rows = self.execute(
+            "SELECT data FROM log_entries WHERE access_key = ? ORDER BY change_seq", (access_key,)
+        ).fetchall()
+        return [json.loads(row["data"]) for row in rows]
+
+    def log_entries_on(self, day: str) -> Dict[str, List[Dict[str, Any]]]:
+        """日付が day のエントリを家族ごとに返す（夜間のバッチ用。日付の索引はないので全件を読む）"""
+        rows = self.execute(
+            "SELECT access_key, data FROM log_entries WHERE json_extract(data, '$.date') = ?"
+            " ORDER BY access_key, change_seq",
+            (day,),
+        ).fetchall()
+        found: Dict[str, List[Dict[str, Any]]] = {}
+        for row in rows:
+            found.setdefault(row["access_key"], []).append(json.loads(row["data"]))
+        return found
+
+    def recent_log_entries(self, access_key: str, limit: int) -> List[Dict[str, Any]]:
+        """新しい順に最大 limit 件"""
+        rows = self.execute(
+            "SELECT data FROM log_entries WHERE access_key = ? ORDER BY change_seq DESC LIMIT ?", (access_key, limit)
+        ).fetchall()
+        return [json.loads(row["data"]) for row in rows]
+
+    def find_log_entry(self, access_key: str, idempotency_key: str) -> Optional[Dict[str, Any]]:
+        row = self.execute(
+            "SELECT data FROM log_entries WHERE access_key = ? AND idempotency_key = ?", (access_key, idempotency_key)
+        ).fetchone()
+        return json.loads(row["data"]) if row is not None else None
+
+    def find_log_entry_group(self, access_key: str, idempotency_key: str) -> List[Dict[str, Any]]:
+        """1つのメモから作った複数のエントリ（Idempotency-Key が "<key>:<番号>"）"""
+        rows = self.execute(
+            "SELECT data FROM log_entries WHERE access_key = ? AND substr(idempotency_key, 1, ?) = ? ORDER BY change_seq",
+            (access_key, len(idempotency_key) + 1, idempotency_key + ":"),
+        ).fetchall()
+        return [json.loads(row["data"]) for row in rows]
+
+    def archive_log_entries(self, cutoff: str) -> int:
+        """日付が cutoff より前のエントリをアーカイブに移し、移した家族×月の数を返す"""
+        archived = 0
+        with self.transaction() as conn:
+            rows = conn.execute(
+                "SELECT access_key, data FROM log_entries WHERE json_extract(data, '$.date') < ? ORDER BY change_seq",
+                (cutoff,),
+            ).fetchall()
+            by_family: Dict[str, List[Dict[str, Any]]] = {}
+            for row in rows:
+                by_family.setdefault(row["access_key"], []).append(json.loads(row["data"]))
+            for access_key, entries in by_family.items():
+                for month, month_entries in group_by_month(entries).items():
+                    existing = conn.execute(
+                        "SELECT data FROM log_archive WHERE access_key = ? AND month = ?", (access_key, month)
+                    ).fetchone()
+                    merged = (unpack_entries(existing["data"]) if existing else []) + month_entries
+                    conn.execute(
+                        "INSERT OR REPLACE INTO log_archive (access_key, month, entry_count, data) VALUES (?, ?, ?, ?)",
+                        (access_key, month, len(merged), pack_entries(merged)),
+                    )
+                    archived += 1
+            conn.execute("DELETE FROM log_entries WHERE json_extract(data, '$.date') < ?", (cutoff,))
+        return archived
+
+    def archived_log_entries(self, access_key: str, month: str) -> List[Dict[str, Any]]:
+        """アーカイブした1か月分のエントリ（month は YYYY-MM-01）"""
+        row = self.execute(
+            "SELECT data FROM log_archive WHERE access_key = ? AND month = ?", (access_key, month)
+        ).fetchone()
+        return unpack_entries(row["data"]) if row is not None else []
+
+    def add_list_items(self, access_key: str, kind: str, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """項目をリストに載せる（未完了の同じ品目があればまとめる）。載せた・まとめた項目を返す"""
+        result = []
+        with self.transaction() as conn:
+            for item in items:
+                row = conn.execute(
+                    "SELECT data FROM list_items WHERE access_key = ? AND kind = ? AND normalized_name = ? AND done = 0",
+                    (access_key, kind, item["normalized_name"]),
+                ).fetchone()
+                if row is not None:
+                    stored = merge_list_item(json.loads(row["data"]), item)
+                    conn.execute("UPDATE list_items SET data = ? WHERE id = ?",
+                                 (json.dumps(stored, ensure_ascii=False), stored["id"]))
+                else:
+                    stored = new_list_item(item)
+                    conn.execute(
+                        "INSERT INTO list_items (id, access_key, kind, normalized_name, done, data) VALUES (?, ?, ?, ?, 0, ?)",
+                        (stored["id"], access_key, kind, stored["normalized_name"], json.dumps(stored, ensure_ascii=False)),
+                    )
+                result.append(stored)
+        return result
+
+    def list_items(self, access_key: str, kind: str, include_done: bool = False) -> List[Dict[str, Any]]:
+        """リストの項目を追加順に返す（未完了だけなら部分インデックスから読む）"""
+        sql = "SELECT data FROM list_items WHERE access_key = ? AND kind = ?"
+        if not include_done:
+            sql += " AND done = 0"
+        rows = self.execute(sql + " ORDER BY rowid", (access_key, kind)).fetchall()
+        return [json.loads(row["data"]) for row in rows]
+
+    def set_list_item_done(self, access_key: str, kind: str, item_id: str, done: bool) -> Optional[Dict[str, Any]]:
+        """
+        項目を完了・未完了にする（項目がなければ None）
+        未完了に戻す品目が別の項目として未完了で残っていれば、そちらを返す
+        """
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT data FROM list_items WHERE id = ? AND access_key = ? AND kind = ?", (item_id, access_key, kind)
+            ).fetchone()
+            if row is None:
+                return None
+            item = json.loads(row["data"])
+            if item["done"] == done:
+                return item
+            if not done:
+                duplicate = conn.execute(
+                    "SELECT data FROM list_items WHERE access_key = ? AND kind = ? AND normalized_name = ? AND done = 0",
+                    (access_key, kind, item["normalized_name"]),
+                ).fetchone()
+                if duplicate is not None:
+                    return json.loads(duplicate["data"])
+            item = mark_list_item(item, done)
+            conn.execute("UPDATE list_items SET done = ?, data = ? WHERE id = ?",
+                         (int(done), json.dumps(item, ensure_ascii=False), item_id))
+        return item
+
+    def add_events(self, access_key: str, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """予定を追加する（event_at は UTC の ISO 形式）"""
+        stored = [new_event(event) for event in events]
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO events (id, access_key, event_at, data) VALUES (?, ?, ?, ?)",
+                [(event["id"], access_key, event["event_at"], json.dumps(event, ensure_ascii=False)) for event in stored],
+            )
+        return stored
+
+    def list_events(self, access_key: str, start: str, end: str) -> List[Dict[str, Any]]:
+        """event_at が start 以上 end 未満の予定を日時順に返す（インデックスの範囲検索）"""
+        rows = self.execute(
+            "SELECT data FROM events WHERE access_key = ? AND event_at >= ? AND event_at < ? ORDER BY event_at, id",
+            (access_key, start, end),
+        ).fetchall()
+        return [json.loads(row["data"]) for row in rows]
+
+    def create_chat_session(self, access_key: str) -> Dict[str, Any]:
+        session = new_chat_session()
+        self.execute(
+            "INSERT INTO chat_sessions (id, access_key, summary, summarized_seq, turn_count, created_at, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (session["id"], access_key, session["summary"], session["summarized_seq"], session["turn_count"],
+             session["created_at"], session["updated_at"]),
+        )
+        return session
+
+    def get_chat_session(self, access_key: str, session_id: str) -> Optional[Dict[str, Any]]:
+        row = self.execute(
+            "SELECT id, summary, summarized_seq, turn_count, created_at, updated_at FROM chat_sessions"
+            " WHERE id = ? AND access_key = ?",
+            (session_id, access_key),
+        ).fetchone()
+        return dict(row) if row is not None else None
+
+    def add_chat_turns(self, access_key: str, session_id: str, turns: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """会話に発言を追加する（番号は会話の中で1から順に振る）"""
+        with self.transaction() as conn:
+            row = conn.execute("SELECT turn_count FROM chat_sessions WHERE id = ?", (session_id,)).fetchone()
+            stored = new_chat_turns(row["turn_count"] + 1, turns)
+            conn.executemany(
+                "INSERT INTO chat_turns (session_id, seq, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(session_id, turn["seq"], turn["role"], turn["content"], turn["created_at"]) for turn in stored],
+            )
+            if stored:
+                conn.execute("UPDATE chat_sessions SET turn_count = ?, updated_at = ? WHERE id = ?",
+                             (stored[-1]["seq"], stored[-1]["created_at"], session_id))
+        return stored
+
+    def list_chat_turns(self, access_key: str, session_id: str, after_seq: int = 0,
+                        limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """after_seq より後の発言を番号順に返す（limit を指定すると最後の limit 件）"""
+        if limit is None:
+            rows = self.execute(
+                "SELECT seq, role, content, created_at FROM chat_turns WHERE session_id = ? AND seq > ? ORDER BY seq",
+                (session_id, after_seq),
+            ).fetchall()
+        else:
+            rows = self.execute(
+                "SELECT seq, role, content, created_at FROM chat_turns WHERE session_id = ? AND seq > ?"
+                " ORDER BY seq DESC LIMIT ?",
+                (session_id, after_seq, limit),
+            ).fetchall()[::-1]
+        return [dict(row) for row in rows]
+
+    def update_chat_summary(self, access_key: str, session_id: str, summary: str,
+                            summarized_seq: int, expected_seq: int) -> bool:
+        """要約を更新する（他の処理が先に要約を進めていれば更新せず False）"""
+        cursor = self.execute(
+            "UPDATE chat_sessions SET summary = ?, summarized_seq = ?, updated_at = ?"
+            " WHERE id = ? AND access_key = ? AND summarized_seq = ?",
+            (summary, summarized_seq, datetime.now(timezone.utc).isoformat(), session_id, access_key, expected_seq),
+        )
+        return cursor.rowcount == 1
+
+    def save_digest(self, access_key: str, digest: Dict[str, Any]) -> Dict[str, Any]:
+        """1日のまとめを保存する（同じ日のまとめがあれば置き換える）"""
+        stored = new_digest(digest)
+        self.execute(
+            "INSERT OR REPLACE INTO digests (access_key, digest_date, data) VALUES (?, ?, ?)",
+            (access_key, digest["digest_date"], json.dumps(stored, ensure_ascii=False)),
+        )
+        return stored
+
+    def get_digest(self, access_key: str, digest_date: str) -> Optional[Dict[str, Any]]:
+        row = self.execute(
+            "SELECT data FROM digests WHERE access_key = ? AND digest_date = ?", (access_key, digest_date)
+        ).fetchone()
+        return json.loads(row["data"]) if row is not None else None
+
+
+class _Transaction:
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+class InvalidationBus:
+    """
+    プロセス間のメッセージバス（SQLite のテーブルをポーリング）
+    store が None（1ワーカー）のときは何もしない
+    """
+
+    def __init__(self, store: Optional[SQLiteStore], poll_interval: float = BUS_POLL_INTERVAL_SECONDS):
+        self.store = store
+        self.poll_interval = poll_interval
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._handlers: Dict[str, List[Callable[[Dict[str, Any]], None]]] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._last_id = 0
+        self._last_prune = 0.0
+
+    def subscribe(self, topic: str, handler: Callable[[Dict[str, Any]], None]) -> None:
+        self._handlers.setdefault(topic, []).append(handler)
+
+    def publish(self, topic: str, payload: Dict[str, Any]) -> None:
+        """他のプロセスに通知する（自分のプロセスへの反映は呼び出し側で済ませる）"""
+        if self.store is None:
+            return
+        try:
+            self.store.execute(
+                "INSERT INTO bus_events (topic, payload, origin, created_at) VALUES (?, ?, ?, ?)",
+                (topic, json.dumps(payload, ensure_ascii=False, default=str), self.origin, time.time()),
+            )
+            bus_messages.inc(topic=topic, direction="sent")
+        except sqlite3.Error as e:
+            print(f"⚠️ バスへの送信に失敗しました: {e}")
+
+    def start(self) -> None:
+        if self.store is None or self._thread is not None:
+            return
+        # 起動前のイベントは再生しない
+        row = self.store.execute("SELECT COALESCE(MAX(id), 0) FROM bus_events").fetchone()
+        self._last_id = row[0]
+        self._thread = threading.Thread(target=self._run, name="invalidation-bus", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"⚠️ バスの受信に失敗しました: {e}")
+            time.sleep(self.poll_interval)
+
+    def poll(self) -> int:
+        """新しいイベントを受け取ってハンドラを呼び、処理した数を返す"""
+        rows = self.store.execute(
+            "SELECT id, topic, payload, origin FROM bus_events WHERE id > ? ORDER BY id", (self._last_id,)
+        ).fetchall()
+        handled = 0
+        for row in rows:
+            self._last_id = row["id"]
+            if row["origin"] == self.origin:
+                continue
+            for handler in self._handlers.get(row["topic"], ()):
+                handler(json.loads(row["payload"]))
+            bus_messages.inc(topic=row["topic"], direction="received")
+            handled += 1
+
+        now = time.time()
+        if now - self._last_prune > BUS_RETENTION_SECONDS:
+            self._last_prune = now
+            self.store.execute("DELETE FROM bus_events WHERE created_at < ?", (now - BUS_RETENTION_SECONDS,))
+        return handled
+
+
+def create_local_store():
+    """設定に応じたローカルストアを作成"""
+    if LOCAL_STORE_PATH:
+        print(f"🗄️ ローカルストアを {LOCAL_STORE_PATH} で共有します（複数ワーカー対応）")
+        return SQLiteStore(LOCAL_STORE_PATH)
+    return MemoryStore()
+
+
+local_store = create_local_store()
+bus = InvalidationBus(local_store if isinstance(local_store, SQLiteStore) else None)
@@ -0,0 +1,54 @@
+"""
+スタブLLMサーバーのクライアント
+ベンチマーク時に LLM_STUB_URL を設定すると、Gemini API の代わりにローカルのスタブサーバーへ問い合わせる
+（サーバー本体は benchmarks/stub_llm_server.py）
+
+接続は共有の接続プール（app/http_pool.py）で使い回す。
+"""
+import codecs
+from typing import Iterator
+
+from .clients import LazyClient
+
+STUB_TIMEOUT_SECONDS = 30
+
+
+def _create_stub_client():
+    from .http_pool import pooled_client
+    return pooled_client(timeout=STUB_TIMEOUT_SECONDS)
+
+
+stub_client = LazyClient("stub_llm", _create_stub_client)
+
+
+def _generate_request(base_url: str, prompt: str, operation: str, stream: bool = False):
+    return stub_client.get().build_request(
+        "POST",
+        base_url.rstrip("/") + "/v1/generate",
+        json={"prompt": prompt, "operation": operation, "stream": stream},
+    )
+
+
+def generate_with_stub(base_url: str, prompt: str, operation: str) -> str:
+    """スタブサーバーの /v1/generate を呼び出して生成テキストを返す"""
+    response = stub_client.get().send(_generate_request(base_url, prompt, operation))
+    response.raise_for_status()
+    return response.json()["text"]
+
+
+def stream_with_stub(base_url: str, prompt: str, operation: str) -> Iterator[str]:
+    """スタブサーバーにストリーミングで問い合わせ、届いた分から順に返す"""
+    request = _generate_request(base_url, prompt, operation, stream=True)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    response = stub_client.get().send(request, stream=True)
+    try:
+        response.raise_for_status()
+        for chunk in response.iter_raw():
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+    finally:
+        response.close()
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
@@ -0,0 +1,50 @@
+"""
+KazokuLog Supabaseクライアント
+PostgREST・Storage・Functions・Auth のそれぞれに別の httpx.Client を渡し、下の接続プールだけを共有する
+
+supabase-py は ClientOptions(httpx_client=...) の1つのクライアントを全サブクライアントに渡すが、
+postgrest・storage・functions はそのクライアントの base_url とヘッダーを自分用に書き換えるため、
+後から作られたサブクライアントの URL でリクエストが飛んでしまう。
+"""
+import copy
+from typing import Callable, Optional
+
+import httpx
+from supabase import Client, ClientOptions
+from supafunc import SyncFunctionsClient
+
+
+class PooledSupabaseClient(Client):
+    """サブクライアントを作るたびに http_client_factory() で新しい httpx.Client を作る"""
+
+    def __init__(self, supabase_url: str, supabase_key: str, http_client_factory: Callable[[], httpx.Client],
+                 options: Optional[ClientOptions] = None):
+        # 親の __init__ が Auth クライアントを作るので、先に設定しておく
+        self._http_client_factory = http_client_factory
+        super().__init__(supabase_url, supabase_key, options)
+
+    def _init_supabase_auth_client(self, auth_url, client_options, verify=True, proxy=None):
+        client_options = copy.copy(client_options)
+        client_options.httpx_client = self._http_client_factory()
+        return super()._init_supabase_auth_client(auth_url, client_options)
+
+    def _init_postgrest_client(self, rest_url, headers, schema, timeout=None, verify=True, proxy=None,
+                               http_client=None):
+        return super()._init_postgrest_client(rest_url, headers, schema,
+                                              http_client=self._http_client_factory())
+
+    def _init_storage_client(self, storage_url, headers, storage_client_timeout=None, verify=True, proxy=None,
+                             http_client=None):
+        return super()._init_storage_client(storage_url, headers, http_client=self._http_client_factory())
+
+    @property
+    def functions(self):
+        # 親の functions は ClientOptions.httpx_client を直接渡すので、ここで作り直す
+        if self._functions is None:
+            self._functions = SyncFunctionsClient(
+                url=self.functions_url,
+                headers=self.options.headers,
+                http_client=self._http_client_factory(),
+            )
+        return self._functions
+
@@ -0,0 +1,73 @@
+"""重複投稿の検出（dedup.py）のテスト"""
+from app.dedup import (
+    DEDUP_MAX_DISTANCE, find_near_duplicate, find_near_duplicate_note, hamming_distance, like_prefix, simhash,
+)
+
+TEXT = "明日の15時に歯医者の予約、帰りにスーパーで牛乳を買う"
+
+
+def entry(text, date="2026-10-19", signature=None):
+    return {"original_text": text, "date": date, "simhash": simhash(text) if signature is None else signature}
+
+
+def test_simhash_fits_bigint():
+    for text in (TEXT, "", "a", "太郎は少し熱っぽい"):
+        assert -(1 << 63) <= simhash(text) < 1 << 63
+
+
+def test_simhash_ignores_width_punctuation_and_spaces():
+    assert simhash(TEXT) == simhash("明日の１５時に歯医者の予約 帰りにスーパーで牛乳を買う！")
+
+
+def test_hamming_distance_of_signed_values():
+    assert hamming_distance(-1, 0) == 64
+    assert hamming_distance(simhash(TEXT), simhash(TEXT)) == 0
+
+
+def test_finds_near_duplicate_on_same_day():
+    text = "明日の15時に歯医者の予約。帰りにスーパーで牛乳を買う"
+    found = find_near_duplicate(text, simhash(text), "2026-10-19", [entry("太郎は少し熱っぽい"), entry(TEXT)])
+    assert found["original_text"] == TEXT
+
+
+def test_different_numbers_are_not_duplicates():
+    # SimHash が近くても、本文中の数字が違えば別の予定として扱う
+    text = TEXT.replace("15時", "16時")
+    assert find_near_duplicate(text, simhash(text), "2026-10-19", [entry(TEXT, signature=simhash(text))]) is None
+
+
+def test_other_day_or_distant_text_is_not_duplicate():
+    assert find_near_duplicate(TEXT, simhash(TEXT), "2026-10-19", [entry(TEXT, date="2026-10-18")]) is None
+    other = "太郎は少し熱っぽいので保育園を休ませる"
+    assert hamming_distance(simhash(TEXT), simhash(other)) > DEDUP_MAX_DISTANCE
+    assert find_near_duplicate(TEXT, simhash(TEXT), "2026-10-19", [entry(other)]) is None
+
+
+def test_entries_without_simhash_are_skipped():
+    assert find_near_duplicate(TEXT, simhash(TEXT), "2026-10-19", [dict(entry(TEXT), simhash=None)]) is None
+
+
+NOTE = "明日10時に運動会、お弁当の材料(卵・ウインナー)を買う、太郎は少し熱っぽい"
+
+
+def note_entries(note, texts, date="2026-10-19", first_seq=1):
+    return [{"original_text": text, "date": date, "note_simhash": simhash(note), "change_seq": first_seq + i}
+            for i, text in enumerate(texts)]
+
+
+def test_finds_near_duplicate_note_group_in_order():
+    group = note_entries(NOTE, ["明日10時に運動会", "お弁当の材料(卵・ウインナー)を買う", "太郎は少し熱っぽい"])
+    recent = [{"original_text": "別のメモ", "date": "2026-10-19", "simhash": 1}] + group[::-1]
+    resend = NOTE + "。"
+    assert find_near_duplicate_note(resend, simhash(resend), "2026-10-19", recent) == group
+
+
+def test_note_with_other_numbers_or_day_is_not_duplicate():
+    group = note_entries(NOTE, ["明日10時に運動会", "お弁当の材料(卵・ウインナー)を買う", "太郎は少し熱っぽい"])
+    other = NOTE.replace("10時", "11時")
+    assert find_near_duplicate_note(other, simhash(other), "2026-10-19", group) is None
+    assert find_near_duplicate_note(NOTE, simhash(NOTE), "2026-10-20", group) is None
+
+
+def test_like_prefix_escapes_wildcards():
+    assert like_prefix("a_b%c\\d:") == "a\\_b\\%c\\\\d:%"
@@ -0,0 +1,92 @@
+"""予定の日時の抽出とカレンダー（events.py）のテスト"""
+from datetime import date, datetime, timezone
+
+import pytest
+
+from app.events import EVENT_TIMEZONE, build_ical, parse_event
+
+MONDAY = date(2026, 10, 19)
+
+
+@pytest.mark.parametrize("text, event_at, all_day, title", [
+    ("明日運動会", datetime(2026, 10, 20), True, "運動会"),
+    ("3日後に発表会", datetime(2026, 10, 22), True, "発表会"),
+    ("金曜に面談", datetime(2026, 10, 23), True, "面談"),
+    ("来週の火曜日10時に病院", datetime(2026, 10, 27, 10), False, "病院"),
+    ("12/25 クリスマス会", datetime(2026, 12, 25), True, "クリスマス会"),
+    ("10/31の午前9時に遠足", datetime(2026, 10, 31, 9), False, "遠足"),
+    # 1か月以上前の月日は来年
+    ("3月10日に入学説明会", datetime(2027, 3, 10), True, "入学説明会"),
+    # 時刻だけならエントリの日付
+    ("午後2時半から歯医者", datetime(2026, 10, 19, 14, 30), False, "歯医者"),
+    ("夜7時に夕食会", datetime(2026, 10, 19, 19), False, "夕食会"),
+    ("１５時に歯医者", datetime(2026, 10, 19, 15), False, "歯医者"),
+])
+def test_parse_event(text, event_at, all_day, title):
+    event = parse_event(text, MONDAY)
+    assert event["event_at"] == event_at.replace(tzinfo=EVENT_TIMEZONE)
+    assert event["all_day"] is all_day
+    assert event["title"] == title
+    assert event["extracted_by"] == "rules@1"
+
+
+@pytest.mark.parametrize("text, base, day", [
+    # 今月のその日が過ぎていれば来月（来月にその日がなければさらに次の月）
+    ("15日に集金", date(2026, 10, 20), date(2026, 11, 15)),
+    ("15日に集金", date(2026, 10, 15), date(2026, 10, 15)),
+    ("31日に締め切り", date(2026, 11, 5), date(2026, 12, 31)),
+    ("明日", date(2026, 12, 31), date(2027, 1, 1)),
+])
+def test_parse_event_month_rollover(text, base, day):
+    assert parse_event(text, base)["event_at"].date() == day
+
+
+def test_parse_event_without_datetime():
+    assert parse_event("太郎は少し熱っぽい", MONDAY) is None
+
+
+def ical_event(**fields):
+    return dict({
+        "id": "e1",
+        "title": "運動会",
+        "event_at": datetime(2026, 10, 20, tzinfo=EVENT_TIMEZONE),
+        "all_day": True,
+        "created_at": datetime(2026, 10, 19, 9, 0, tzinfo=timezone.utc),
+        "original_text": "明日運動会",
+    }, **fields)
+
+
+def test_build_ical_all_day_and_timed():
+    events = [
+        ical_event(),
+        ical_event(id="e2", all_day=False, event_at=datetime(2026, 10, 27, 10, tzinfo=EVENT_TIMEZONE)),
+    ]
+    body = build_ical(events, "KazokuLog 山田家")
+    lines = body.split("\r\n")
+    assert lines[0] == "BEGIN:VCALENDAR" and lines[-2:] == ["END:VCALENDAR", ""]
+    assert "DTSTART;VALUE=DATE:20261020" in lines and "DTEND;VALUE=DATE:20261021" in lines
+    assert "DTSTART:20261027T010000Z" in lines
+    assert "DTSTAMP:20261019T090000Z" in lines
+    # 予定が変わらなければ同じテキスト（ETag に使う）
+    assert build_ical(events, "KazokuLog 山田家") == body
+
+
+def test_build_ical_escapes_text():
+    body = build_ical([ical_event(title="卵, 牛乳; パン\\", original_text="1行目\n2行目")], "家族")
+    assert "SUMMARY:卵\\, 牛乳\\; パン\\\\\r\n" in body
+    assert "DESCRIPTION:1行目\\n2行目\r\n" in body
+
+
+def test_build_ical_folds_long_lines_without_splitting_characters():
+    title = "とても長い予定のタイトル" * 10
+    body = build_ical([ical_event(title=title)], "家族")
+    lines = body.split("\r\n")
+    assert all(len(line.encode("utf-8")) <= 75 for line in lines)
+    start = next(i for i, line in enumerate(lines) if line.startswith("SUMMARY:"))
+    folded = [lines[start]]
+    for line in lines[start + 1:]:
+        if not line.startswith(" "):
+            break
+        folded.append(line[1:])
+    assert len(folded) > 1
+    assert "".join(folded) == f"SUMMARY:{title}"
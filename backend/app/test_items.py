@@ -0,0 +1,42 @@
+"""買い物リスト・ToDoリスト（items.py）のテスト"""
+import pytest
+
+from app.items import list_items_from_entries, normalize_item_name, shopping_item_names, todo_item_name
+
+
+@pytest.mark.parametrize("text, names", [
+    ("お弁当の材料(卵、ウインナー)を買う", ["卵", "ウインナー"]),
+    ("スーパーで牛乳と食パンを買う", ["牛乳", "食パン"]),
+    ("ドラッグストアに寄ってシャンプー・リンスを買わなきゃ", ["シャンプー", "リンス"]),
+    ("牛乳(2本)を買う", ["牛乳"]),
+    ("ところてんを買う", ["ところてん"]),
+    ("トイレットペーパーが切れそう", ["トイレットペーパー"]),
+    ("買い物に行く", []),
+])
+def test_shopping_item_names(text, names):
+    assert shopping_item_names(text) == names
+
+
+@pytest.mark.parametrize("text, name", [
+    ("保育園の申請をしなければ", "保育園の申請"),
+    ("ゴミ出しをやる", "ゴミ出し"),
+    # やることが残らなければ本文のまま
+    ("しなきゃ", "しなきゃ"),
+])
+def test_todo_item_name(text, name):
+    assert todo_item_name(text) == name
+
+
+def test_normalize_item_name_merges_kana_and_width():
+    assert normalize_item_name("タマゴ") == normalize_item_name("たまご")
+    assert normalize_item_name("ＭＩＬＫ") == "milk"
+
+
+def test_list_items_from_entries():
+    items = list_items_from_entries([
+        {"id": 1, "original_text": "卵と卵を買う", "category": "shopping", "date": "2026-10-19"},
+        {"id": 2, "original_text": "申請をしなきゃ", "category": "todo", "date": "2026-10-19"},
+        {"id": 3, "original_text": "卵を買う日", "category": "memo", "date": "2026-10-19"},
+    ])
+    assert [item["name"] for item in items["shopping"]] == ["卵"]
+    assert items["todo"] == [{"name": "申請", "normalized_name": "申請", "log_entry_id": "2", "log_entry_date": "2026-10-19"}]
@@ -0,0 +1,69 @@
+"""LLMレスポンスのパーサー（llm_parsing.py）のテスト"""
+import pytest
+
+from app.llm_parsing import (
+    LLMParseError, extract_json_object, validate_classification, validate_event, validate_extraction,
+)
+
+
+def test_extract_from_code_fence_with_prose():
+    text = '分類しました。\n```json\n{"category": "todo", "note": "括弧 } を含む"}\n```\n以上です'
+    assert extract_json_object(text) == {"category": "todo", "note": "括弧 } を含む"}
+
+
+def test_extract_skips_objects_without_required_key():
+    text = '例: {"example": 1} 結果: {"result": {"category": "memo", "keywords": ["a"]}}'
+    assert extract_json_object(text, required_key="category") == {"category": "memo", "keywords": ["a"]}
+
+
+def test_extract_skips_broken_json():
+    assert extract_json_object('{"category": } {"category": "memo"}') == {"category": "memo"}
+
+
+@pytest.mark.parametrize("text", ["", "JSONはありません", '{"other": 1}'])
+def test_extract_without_object(text):
+    with pytest.raises(LLMParseError):
+        extract_json_object(text, required_key="category")
+
+
+def test_validate_classification_normalizes_types():
+    result = validate_classification({
+        "category": " Shopping ", "confidence_score": "1.5", "summary": "卵", "keywords": "卵、牛乳, ",
+    })
+    assert result == {
+        "category": "shopping", "confidence_score": 1.0, "summary": "卵", "keywords": ["卵", "牛乳"], "reasoning": "",
+    }
+
+
+@pytest.mark.parametrize("data", [
+    {"category": "memo", "confidence_score": 0.5, "summary": "s"},
+    {"category": "unknown", "confidence_score": 0.5, "summary": "s", "keywords": []},
+    {"category": "memo", "confidence_score": "high", "summary": "s", "keywords": []},
+    {"category": "memo", "confidence_score": 0.5, "summary": "s", "keywords": 3},
+])
+def test_validate_classification_rejects(data):
+    with pytest.raises(LLMParseError):
+        validate_classification(data)
+
+
+def test_validate_extraction_uses_summary_as_text():
+    items = validate_extraction({"items": [
+        {"category": "schedule", "confidence_score": 0.9, "summary": "運動会", "keywords": [], "text": "明日運動会"},
+        {"category": "shopping", "confidence_score": 0.8, "summary": "卵を買う", "keywords": ["卵"]},
+    ]})
+    assert [(item["category"], item["text"]) for item in items] == [("schedule", "明日運動会"), ("shopping", "卵を買う")]
+
+
+@pytest.mark.parametrize("data", [{"items": []}, {"items": "x"}, {"items": ["x"]}])
+def test_validate_extraction_rejects(data):
+    with pytest.raises(LLMParseError):
+        validate_extraction(data)
+
+
+def test_validate_event():
+    assert validate_event({"event_at": None}) is None
+    event = validate_event({"event_at": "2026-10-20 15:00", "title": "歯医者"})
+    assert event["event_at"].isoformat() == "2026-10-20T15:00:00" and not event["all_day"]
+    assert validate_event({"event_at": "2026-10-20"})["all_day"]
+    with pytest.raises(LLMParseError):
+        validate_event({"event_at": "明日"})
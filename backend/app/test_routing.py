@@ -0,0 +1,44 @@
+"""分類ルーティング（routing.py）のテスト"""
+import random
+
+from app.routing import ClassificationRouter
+
+
+def rule(confidence, category="shopping"):
+    return lambda text: {"category": category, "confidence_score": confidence, "summary": text, "keywords": []}
+
+
+class LLM:
+    def __init__(self, result=None):
+        self.result = result
+        self.calls = []
+
+    def __call__(self, text):
+        self.calls.append(text)
+        return self.result
+
+
+def test_confident_rules_skip_llm():
+    llm = LLM({"category": "todo", "confidence_score": 0.9})
+    router = ClassificationRouter(threshold=0.85, sample_rate=0.0)
+    assert router.classify("牛乳を買う", llm, rule(0.85))["category"] == "shopping"
+    assert llm.calls == []
+
+
+def test_below_threshold_uses_llm():
+    llm = LLM({"category": "todo", "confidence_score": 0.9})
+    router = ClassificationRouter(threshold=0.85, sample_rate=0.0)
+    assert router.classify("ふむ", llm, rule(0.84))["category"] == "todo"
+    assert llm.calls == ["ふむ"]
+
+
+def test_llm_failure_falls_back_to_rules():
+    router = ClassificationRouter(threshold=0.85, sample_rate=0.0)
+    assert router.classify("ふむ", LLM(None), rule(0.5, "memo"))["category"] == "memo"
+
+
+def test_confident_rules_are_sampled():
+    llm = LLM({"category": "shopping", "confidence_score": 0.9})
+    router = ClassificationRouter(threshold=0.85, sample_rate=1.0, rng=random.Random(0))
+    router.classify("牛乳を買う", llm, rule(0.95))
+    assert llm.calls == ["牛乳を買う"]
@@ -0,0 +1,302 @@
+"""
+KazokuLog トレーシング
+リクエスト内の各処理（DB・キャッシュ・LLM）をスパンとして記録する軽量トレーサー
+
+- W3C Trace Context (traceparent) を受け取り・返す
+- OTLP/JSON 形式でファイルまたは OTLP コレクタ（/v1/traces）へ出力する
+- TRACE_SAMPLE_RATE でサンプリング率を制御する
+- TRACE_SERVER_TIMING=1 で Server-Timing ヘッダーに処理時間の内訳を返す
+
+環境変数:
+    TRACE_SAMPLE_RATE            0.0-1.0（デフォルト 0.0 = 記録しない）
+    TRACE_EXPORT_FILE            OTLP/JSON を1行ずつ追記するファイル
+    OTEL_EXPORTER_OTLP_ENDPOINT  OTLPコレクタのURL（例: http://localhost:4318）
+    OTEL_SERVICE_NAME            service.name（デフォルト kazokulog-api）
+    TRACE_SERVER_TIMING          1 で Server-Timing を常に返す。"header" で
+                                 X-Debug-Timing: 1 を付けたリクエストのみ返す
+"""
+import json
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0") or 0)
+TRACE_EXPORT_FILE = os.getenv("TRACE_EXPORT_FILE")
+OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "kazokulog-api")
+SERVER_TIMING_MODE = os.getenv("TRACE_SERVER_TIMING", "")
+
+# OTLP の SpanKind
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+
+class Span:
+    """1つの処理区間"""
+
+    __slots__ = ("trace", "name", "span_id", "parent_span_id", "kind", "attributes",
+                 "start_ns", "end_ns", "error")
+
+    def __init__(self, trace, name, parent_span_id=None, kind=SPAN_KIND_INTERNAL, attributes=None):
+        self.trace = trace
+        self.name = name
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_span_id = parent_span_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+    def set_attribute(self, key, value) -> None:
+        self.attributes[key] = value
+
+    def to_otlp(self) -> Dict:
+        data = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_span_id:
+            data["parentSpanId"] = self.parent_span_id
+        return data
+
+
+class Trace:
+    """1リクエスト分のスパンの集まり"""
+
+    def __init__(self, trace_id=None, sampled=False, record_timing=False):
+        self.trace_id = trace_id or "%032x" % random.getrandbits(128)
+        self.sampled = sampled
+        self.record_timing = record_timing
+        self.spans: List[Span] = []
+
+    @property
+    def recording(self) -> bool:
+        return self.sampled or self.record_timing
+
+    def server_timing(self) -> str:
+        """
+        Server-Timing ヘッダーの値を作成
+        同名スパンは合算する（例: db.insert が2回なら1項目にまとめる）
+        ルートスパンはレスポンス開始時点ではまだ spans に入っていない
+        """
+        totals: Dict[str, float] = {}
+        for span in self.spans:
+            if span.end_ns is None:
+                continue
+            totals[span.name] = totals.get(span.name, 0.0) + span.duration_ms
+        return ", ".join(
+            f'{name.replace(".", "-")};dur={duration:.1f}' for name, duration in totals.items()
+        )
+
+
+def _otlp_attribute(key, value) -> Dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes):
+    """
+    処理区間をスパンとして記録する
+
+    with span("db.log_entries.insert", table="log_entries"):
+        ...
+    トレース対象外のリクエストでは何もしない
+    """
+    trace = _current_trace.get()
+    if trace is None or not trace.recording:
+        yield None
+        return
+
+    parent = _current_span.get()
+    current = Span(trace, name, parent.span_id if parent else None, kind, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+        trace.spans.append(current)
+
+
+def current_trace_id() -> Optional[str]:
+    """現在のトレースID（ログ出力との突き合わせ用）"""
+    trace = _current_trace.get()
+    return trace.trace_id if trace else None
+
+
+class SpanExporter:
+    """
+    スパンをバックグラウンドスレッドでまとめて出力する
+    リクエスト処理をI/Oで待たせないため、キューが溢れた場合は破棄する
+    """
+
+    def __init__(self, export_file=None, otlp_endpoint=None, max_queue=2048, flush_interval=2.0):
+        self.export_file = export_file
+        self.otlp_endpoint = otlp_endpoint.rstrip("/") + "/v1/traces" if otlp_endpoint else None
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue: "queue.Queue[Trace]" = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._client = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.export_file or self.otlp_endpoint)
+
+    def submit(self, trace: Trace) -> None:
+        if not self.enabled:
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+            self._thread.start()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < 256:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self.export(batch)
+            except Exception as e:
+                print(f"Trace export error: {e}")
+
+    def export(self, traces: List[Trace]) -> None:
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [{
+                    "scope": {"name": "kazokulog.tracing"},
+                    "spans": [s.to_otlp() for t in traces for s in t.spans],
+                }],
+            }]
+        }
+        body = json.dumps(payload, ensure_ascii=False)
+        if self.export_file:
+            with open(self.export_file, "a", encoding="utf-8") as f:
+                f.write(body + "\n")
+        if self.otlp_endpoint:
+            if self._client is None:
+                # 送信先への接続は共有の接続プールで使い回す
+                from .http_pool import pooled_client
+                self._client = pooled_client(timeout=5)
+            self._client.post(self.otlp_endpoint, content=body.encode("utf-8"),
+                              headers={"Content-Type": "application/json"}).raise_for_status()
+
+
+exporter = SpanExporter(TRACE_EXPORT_FILE, OTLP_ENDPOINT)
+
+
+def _parse_traceparent(value: str):
+    """traceparent ヘッダー（00-<trace_id>-<span_id>-<flags>）を解析"""
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None, False
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None, None, False
+    return parts[1], parts[2], sampled
+
+
+class TracingMiddleware:
+    """リクエストごとにルートスパンを作成するASGIミドルウェア"""
+
+    def __init__(self, app, sample_rate: float = None, server_timing_mode: str = None):
+        self.app = app
+        self.sample_rate = TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.server_timing_mode = SERVER_TIMING_MODE if server_timing_mode is None else server_timing_mode
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        trace_id, parent_span_id, parent_sampled = None, None, False
+        if "traceparent" in headers:
+            trace_id, parent_span_id, parent_sampled = _parse_traceparent(headers["traceparent"])
+
+        sampled = parent_sampled or (self.sample_rate > 0 and random.random() < self.sample_rate)
+        record_timing = self.server_timing_mode == "1" or (
+            self.server_timing_mode == "header" and headers.get("x-debug-timing") == "1"
+        )
+        trace = Trace(trace_id, sampled=sampled, record_timing=record_timing)
+        if not trace.recording:
+            await self.app(scope, receive, send)
+            return
+
+        # パスには家族のアクセスキーが入るため記録しない（名前と http.route はルートが決まってからテンプレートで付ける）
+        root = Span(trace, scope["method"], parent_span_id, SPAN_KIND_SERVER, {"http.method": scope["method"]})
+        trace_token = _current_trace.set(trace)
+        span_token = _current_span.set(root)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                root.set_attribute("http.status_code", message["status"])
+                extra = [(b"traceparent", f"00-{trace.trace_id}-{root.span_id}-{'01' if sampled else '00'}".encode())]
+                if record_timing:
+                    timing = trace.server_timing()
+                    total = f"total;dur={root.duration_ms:.1f}"
+                    extra.append((b"server-timing", (f"{timing}, {total}" if timing else total).encode()))
+                    extra.append((b"timing-allow-origin", b"*"))
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + extra
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            root.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            route_path = getattr(scope.get("route"), "path", None) or "unmatched"
+            root.name = f'{scope["method"]} {route_path}'
+            root.set_attribute("http.route", route_path)
+            root.end_ns = time.time_ns()
+            trace.spans.append(root)
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+            if sampled:
+                exporter.submit(trace)
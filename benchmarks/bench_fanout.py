@@ -0,0 +1,206 @@
+"""
+リアルタイム配信（app/realtime.py）のファンアウト計測
+
+    cd backend
+    python ../benchmarks/bench_fanout.py                          # ブローカー単体で 10,000 購読
+    python ../benchmarks/bench_fanout.py --subscribers 10000 --slow 0.01
+    python ../benchmarks/bench_fanout.py --http 1000              # uvicorn 経由のSSE接続
+
+ブローカー単体（デフォルト）:
+    1家族に --subscribers 件の購読を張り、--events 件のイベントを配信する。
+    購読者は SSE エンドポイントと同じ Broker.stream() で読み出し、
+    publish() の所要時間と、全購読者に届くまでの時間（p50/p99/最大）を計測する。
+    --slow の割合の購読者は読み出さず、キューが溢れて切断されること（他の購読者が遅れないこと）を確認する。
+
+HTTP（--http N）:
+    アプリを uvicorn で起動して N 本の SSE 接続を張り、POST /api/logs から各接続に届くまでの時間を計測する。
+    ファイルディスクリプタの上限（ulimit -n）を接続数より大きくしておくこと。
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from argparse import Namespace
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / "backend"))
+sys.path.insert(0, str(BENCH_DIR))
+
+from app.realtime import Broker  # noqa: E402
+from run_load import percentile  # noqa: E402
+
+
+def print_latencies(label, samples_ms):
+    values = sorted(samples_ms)
+    print(f"{label:28} p50 {percentile(values, 50):8.2f} ms  p99 {percentile(values, 99):8.2f} ms  "
+          f"max {values[-1] if values else 0.0:8.2f} ms")
+
+
+async def run_broker(args):
+    broker = Broker(queue_size=args.queue_size, max_per_family=args.subscribers, heartbeat=3600)
+    family_id = "family-bench"
+    slow_count = int(args.subscribers * args.slow)
+    received = {}  # イベント番号 -> 受信時刻のリスト
+
+    async def consumer(subscription, slow):
+        async for frame in broker.stream(subscription):
+            if slow:
+                # 読み出さない購読者（キューが溢れて切断される）
+                await asyncio.sleep(3600)
+            if frame.startswith(b"id: "):
+                received.setdefault(int(frame[4:frame.index(b"\n")]), []).append(time.perf_counter())
+
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    subscriptions = [broker.subscribe(family_id) for _ in range(args.subscribers)]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    tasks = [asyncio.create_task(consumer(sub, i < slow_count)) for i, sub in enumerate(subscriptions)]
+    await asyncio.sleep(0)
+
+    publish_ms, delivery_ms, published_at = [], [], {}
+    entry = {"id": "x", "original_text": "牛乳を買う" * 10, "category": "shopping", "summary": "牛乳"}
+    for seq in range(1, args.events + 1):
+        started = time.perf_counter()
+        broker.publish(family_id, "log_entry", {"change_seq": seq, "entry": entry}, event_id=seq)
+        publish_ms.append((time.perf_counter() - started) * 1000)
+        published_at[seq] = started
+        await asyncio.sleep(args.interval_ms / 1000.0)
+
+    # 最後のイベントが読み出し中の購読者全員に届くまで待ってから切断する
+    deadline = time.perf_counter() + 60
+    while len(received.get(args.events, ())) < args.subscribers - slow_count and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    for seq, times in received.items():
+        delivery_ms.append((max(times) - published_at[seq]) * 1000)
+    per_event = [len(received.get(seq, [])) for seq in range(1, args.events + 1)]
+
+    print(f"subscribers: {args.subscribers} (slow {slow_count}), events: {args.events}, queue size: {args.queue_size}")
+    print(f"memory per subscription: {(after - before) / args.subscribers:.0f} bytes")
+    print_latencies("publish() duration", publish_ms)
+    print_latencies("delivered to all", delivery_ms)
+    print(f"deliveries per event: min {min(per_event)}, max {max(per_event)} "
+          f"(expected {args.subscribers - slow_count} after slow subscribers overflow)")
+    return {
+        "mode": "broker",
+        "subscribers": args.subscribers,
+        "slow": slow_count,
+        "events": args.events,
+        "publish_ms": publish_ms,
+        "delivery_ms": delivery_ms,
+        "bytes_per_subscription": (after - before) / args.subscribers,
+    }
+
+
+async def open_sse(host, port, access_key, ready, received):
+    """生のソケットでSSE接続を張り、イベントの受信時刻を記録する"""
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"GET /api/logs/{access_key}/events HTTP/1.1\r\nHost: {host}\r\n"
+                 "Accept: text/event-stream\r\n\r\n".encode())
+    await writer.drain()
+    await reader.readuntil(b"retry: 3000")
+    ready()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.startswith(b"id: "):
+                received.append(time.perf_counter())
+    except (asyncio.CancelledError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def run_http(args):
+    import httpx
+    from run_load import start_app_server
+    from stub_llm_server import StubConfig, start_stub_server
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < args.http + 256:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, args.http + 256), hard))
+
+    stub, stub_url = start_stub_server(StubConfig(latency_ms=50, jitter_ms=0, seed=0))
+    os.environ["REALTIME_MAX_PER_FAMILY"] = str(args.http)
+    os.environ["CLASSIFY_AGREEMENT_SAMPLE_RATE"] = "0"
+    process, base_url = start_app_server(stub_url, Namespace(workers=1))
+    host, port = base_url.rsplit("//", 1)[1].split(":")
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+            access_key = (await client.post("/api/families", json={"name": "fanout"})).json()["access_key"]
+            connected = 0
+            all_ready = asyncio.Event()
+
+            def ready():
+                nonlocal connected
+                connected += 1
+                if connected == args.http:
+                    all_ready.set()
+
+            receipts = [[] for _ in range(args.http)]
+            started = time.perf_counter()
+            tasks = []
+            for i in range(args.http):
+                tasks.append(asyncio.create_task(open_sse(host, int(port), access_key, ready, receipts[i])))
+                if i % 200 == 199:
+                    await asyncio.sleep(0.05)
+            await asyncio.wait_for(all_ready.wait(), timeout=120)
+            print(f"connected {args.http} SSE clients in {time.perf_counter() - started:.1f}s")
+
+            delivery_ms = []
+            for seq in range(args.events):
+                before = [len(r) for r in receipts]
+                sent = time.perf_counter()
+                response = await client.post("/api/logs", json={"text": "牛乳を買う", "family_access_key": access_key})
+                response.raise_for_status()
+                deadline = time.perf_counter() + 30
+                while any(len(r) == b for r, b in zip(receipts, before)) and time.perf_counter() < deadline:
+                    await asyncio.sleep(0.005)
+                arrivals = [r[b] for r, b in zip(receipts, before) if len(r) > b]
+                delivery_ms.append((max(arrivals) - sent) * 1000)
+                print(f"event {seq + 1}: {len(arrivals)}/{args.http} clients, last after {delivery_ms[-1]:.1f} ms")
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        process.terminate()
+        stub.shutdown()
+
+    print_latencies("POST -> delivered to all", delivery_ms)
+    return {"mode": "http", "connections": args.http, "events": args.events, "delivery_ms": delivery_ms}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="リアルタイム配信のファンアウト計測")
+    parser.add_argument("--subscribers", type=int, default=10000)
+    parser.add_argument("--events", type=int, default=20)
+    parser.add_argument("--interval-ms", type=float, default=50.0, help="イベントの配信間隔")
+    parser.add_argument("--queue-size", type=int, default=64)
+    parser.add_argument("--slow", type=float, default=0.0, help="読み出さない購読者の割合")
+    parser.add_argument("--http", type=int, default=0, help="uvicorn 経由で張るSSE接続数（0ならブローカー単体）")
+    parser.add_argument("--output", help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    result = asyncio.run(run_http(args) if args.http else run_broker(args))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+外部サービスへのHTTP接続プール（app/http_pool.py）のレイテンシ計測
+
+    cd backend
+    python ../benchmarks/bench_http_pool.py                        # RTT 20ms・名前解決 5ms
+    python ../benchmarks/bench_http_pool.py --rtt-ms 60 --requests 100 --concurrency 16
+
+ローカルにTLSのスタブサーバー（自己署名証明書、ALPN で HTTP/2 と HTTP/1.1 の両方に応答）を起動し、
+PostgREST の1行取得程度の小さなリクエストを次の3通りで送って、1リクエストあたりのレイテンシを比べる。
+
+    per-request   接続を使い回さない（毎回 名前解決・TCP・TLSのハンドシェイク）。変更前の urllib と同じ
+    keepalive     HTTP/1.1 の keep-alive で接続を使い回し、名前解決はキャッシュする
+    http2         HTTP/2 で1本の接続にリクエストを多重化する（本番の Supabase と同じ）
+
+localhost ではネットワークの往復が一瞬で終わってしまうため、サーバーの手前に遅延プロキシを挟み、
+片道 --rtt-ms/2 の遅延と、接続ごとに TCP のハンドシェイク分の --rtt-ms を加える。
+名前解決には --dns-ms の遅延を加える（キャッシュしない per-request では毎回かかる）。
+"""
+import argparse
+import datetime
+import ipaddress
+import json
+import os
+import queue
+import socket
+import ssl
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import h2.config
+import h2.connection
+import h2.events
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / "backend"))
+sys.path.insert(0, str(BENCH_DIR))
+
+from app.http_pool import DNSCache, PooledTransport  # noqa: E402
+from run_load import percentile  # noqa: E402
+
+import httpx  # noqa: E402
+
+RESPONSE_BODY = json.dumps([{"id": "7d3f0c1e-2a4b-4c5d-8e9f-0a1b2c3d4e5f", "category": "schedule",
+                             "summary": "明日の15時に歯医者の予約", "created_at": "2026-10-19T09:00:00+09:00"}],
+                           ensure_ascii=False).encode("utf-8")
+
+
+def write_certificate(directory):
+    """localhost / 127.0.0.1 の自己署名証明書と鍵を書き出す"""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name).public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=1)).not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([
+            x509.DNSName("localhost"), x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path, key_path = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+    return cert_path, key_path
+
+
+class StubTLSServer:
+    """HTTP/2 と HTTP/1.1（keep-alive）の両方に同じJSONを返すTLSサーバー"""
+
+    def __init__(self, cert_path, key_path):
+        self.context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        self.context.load_cert_chain(cert_path, key_path)
+        self.context.set_alpn_protocols(["h2", "http/1.1"])
+        self.sock = socket.create_server(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+        self.connections = 0
+        self._lock = threading.Lock()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            conn, _ = self.sock.accept()
+            # 小さな書き込み（TLSのチケットなど）を Nagle で待たせない
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._lock:
+                self.connections += 1
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        try:
+            tls = self.context.wrap_socket(conn, server_side=True)
+            if tls.selected_alpn_protocol() == "h2":
+                self._serve_h2(tls)
+            else:
+                self._serve_http1(tls)
+        except (OSError, ssl.SSLError):
+            pass
+        finally:
+            conn.close()
+
+    def _serve_http1(self, tls):
+        reader = tls.makefile("rb")
+        while True:
+            request_line = reader.readline()
+            if not request_line:
+                return
+            headers = {}
+            while True:
+                line = reader.readline().strip()
+                if not line:
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            reader.read(int(headers.get("content-length", 0)))
+            tls.sendall(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                        b"Content-Length: %d\r\n\r\n%s" % (len(RESPONSE_BODY), RESPONSE_BODY))
+            if headers.get("connection", "").lower() == "close":
+                return
+
+    def _serve_h2(self, tls):
+        h2_conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False))
+        h2_conn.initiate_connection()
+        tls.sendall(h2_conn.data_to_send())
+        while True:
+            data = tls.recv(65535)
+            if not data:
+                return
+            for event in h2_conn.receive_data(data):
+                if isinstance(event, h2.events.DataReceived):
+                    h2_conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                elif isinstance(event, h2.events.StreamEnded):
+                    h2_conn.send_headers(event.stream_id, [
+                        (":status", "200"), ("content-type", "application/json"),
+                        ("content-length", str(len(RESPONSE_BODY)))])
+                    h2_conn.send_data(event.stream_id, RESPONSE_BODY, end_stream=True)
+            tls.sendall(h2_conn.data_to_send())
+
+
+class DelayProxy:
+    """TCPの中継に片道 rtt/2 の遅延を加える（接続ごとの最初の送信には TCP のハンドシェイク分の rtt を足す）"""
+
+    def __init__(self, upstream_port, rtt_ms):
+        self.upstream_port = upstream_port
+        self.delay = rtt_ms / 2000.0
+        self.sock = socket.create_server(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            client, _ = self.sock.accept()
+            upstream = socket.create_connection(("127.0.0.1", self.upstream_port))
+            for sock in (client, upstream):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._pipe(client, upstream, handshake=self.delay * 2)
+            self._pipe(upstream, client)
+
+    def _pipe(self, source, destination, handshake=0.0):
+        # 読んだ時刻から遅延させて送る（複数の送信が重なっても遅延は積み上がらない）
+        pending = queue.Queue()
+
+        def read():
+            extra = handshake
+            while True:
+                try:
+                    data = source.recv(65535)
+                except OSError:
+                    data = b""
+                pending.put((time.perf_counter() + self.delay + extra, data))
+                extra = 0.0
+                if not data:
+                    return
+
+        def write():
+            while True:
+                deliver_at, data = pending.get()
+                remaining = deliver_at - time.perf_counter()
+                if remaining > 0:
+                    time.sleep(remaining)
+                try:
+                    if not data:
+                        destination.shutdown(socket.SHUT_WR)
+                        return
+                    destination.sendall(data)
+                except OSError:
+                    return
+
+        threading.Thread(target=read, daemon=True).start()
+        threading.Thread(target=write, daemon=True).start()
+
+
+def slow_resolver(dns_ms):
+    def resolve(host, port, *args, **kwargs):
+        time.sleep(dns_ms / 1000.0)
+        return socket.getaddrinfo(host, port, *args, **kwargs)
+    return resolve
+
+
+def make_transport(mode, verify, dns_ms):
+    if mode == "per-request":
+        # keep-alive なし・名前解決のキャッシュなし
+        return PooledTransport(max_keepalive=0, http2=False, verify=verify,
+                               dns=DNSCache(ttl=0, resolve=slow_resolver(dns_ms)))
+    return PooledTransport(http2=mode == "http2", verify=verify, dns=DNSCache(resolve=slow_resolver(dns_ms)))
+
+
+def run_mode(mode, url, verify, args, server, concurrency):
+    transport = make_transport(mode, verify, args.dns_ms)
+    client = httpx.Client(transport=transport, timeout=30)
+    connections_before = server.connections
+    latencies = []
+
+    def fetch(_):
+        started = time.perf_counter()
+        response = client.get(url, params={"family_key": "eq.demo", "limit": "1"})
+        response.read()
+        latencies.append((time.perf_counter() - started) * 1000)
+        return response.http_version
+
+    # 計測前に1回（keep-alive の接続を張っておく。per-request では毎回張り直すので影響しない）
+    versions = {fetch(None)}
+    latencies.clear()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        versions.update(pool.map(fetch, range(args.requests)))
+    elapsed = time.perf_counter() - started
+    transport.shutdown()
+    values = sorted(latencies)
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "http_version": ",".join(sorted(versions)),
+        "requests": len(values),
+        "p50_ms": percentile(values, 50),
+        "p95_ms": percentile(values, 95),
+        "mean_ms": statistics.fmean(values),
+        "rps": len(values) / elapsed,
+        "connections": server.connections - connections_before,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="外部サービスへのHTTP接続プールのレイテンシ計測")
+    parser.add_argument("--requests", type=int, default=200, help="1通りあたりのリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=16, help="並行時のスレッド数（逐次の計測も行う）")
+    parser.add_argument("--rtt-ms", type=float, default=20.0, help="往復の遅延（0なら遅延プロキシを挟まない）")
+    parser.add_argument("--dns-ms", type=float, default=5.0, help="名前解決1回あたりの遅延")
+    parser.add_argument("--output", help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        cert_path, key_path = write_certificate(directory)
+        verify = ssl.create_default_context(cafile=cert_path)
+        server = StubTLSServer(cert_path, key_path)
+        port = DelayProxy(server.port, args.rtt_ms).port if args.rtt_ms > 0 else server.port
+        url = f"https://localhost:{port}/rest/v1/log_entries"
+
+        print(f"RTT {args.rtt_ms:g}ms / 名前解決 {args.dns_ms:g}ms / {args.requests} リクエスト")
+        print(f"{'mode':<12} {'conc':>4} {'http':>9} {'p50':>8} {'p95':>8} {'mean':>8} {'req/s':>8} {'conns':>6}")
+        results = []
+        for concurrency in (1, args.concurrency):
+            for mode in ("per-request", "keepalive", "http2"):
+                result = run_mode(mode, url, verify, args, server, concurrency)
+                results.append(result)
+                print(f"{mode:<12} {concurrency:>4} {result['http_version']:>9} {result['p50_ms']:>7.1f}ms "
+                      f"{result['p95_ms']:>7.1f}ms {result['mean_ms']:>7.1f}ms {result['rps']:>8.1f} "
+                      f"{result['connections']:>6}")
+
+    print()
+    for concurrency in (1, args.concurrency):
+        rows = {r["mode"]: r for r in results if r["concurrency"] == concurrency}
+        baseline = rows["per-request"]["mean_ms"]
+        savings = ", ".join(f"{mode} -{baseline - rows[mode]['mean_ms']:.1f}ms"
+                            for mode in ("keepalive", "http2"))
+        print(f"同時{concurrency}: 1リクエストあたりの短縮（per-request 比、平均）: {savings}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"rtt_ms": args.rtt_ms, "dns_ms": args.dns_ms, "results": results},
+                      f, ensure_ascii=False, indent=2)
+        print(f"\n💾 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+バックエンドのコールドスタート（import時間と最初のリクエスト）の計測
+
+    cd backend
+    python ../benchmarks/bench_import.py
+    python ../benchmarks/bench_import.py --runs 20 --top 15 --output /tmp/import.json
+
+- 新しいPythonプロセスで `python -X importtime` を使って app.main を読み込み、累積import時間を計測
+- 続けて同じプロセスで `GET /` を1回処理し、最初のレスポンスまでの時間と
+  その時点で Supabase / Gemini のSDKが読み込まれていないことを確認する
+- Supabase / Gemini の設定はダミー値を入れて本番と同じ分岐を通す（ネットワークには接続しない）
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = BENCH_DIR.parent / "backend"
+
+HEAVY_MODULES = ("supabase", "google.generativeai", "anthropic")
+
+# 子プロセスで実行するスクリプト: import → GET / を1回 → 結果をJSONで出力
+CHILD_SCRIPT = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+
+async def call_root():
+    messages = [{"type": "http.request", "body": b"", "more_body": False}]
+    status = []
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "scheme": "http", "path": "/", "raw_path": b"/", "query_string": b"", "root_path": "",
+             "headers": [(b"host", b"localhost")], "client": ("127.0.0.1", 0), "server": ("localhost", 80)}
+    await app(scope, receive, send)
+    return status[0]
+
+status = asyncio.run(call_root())
+finished = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "first_request_ms": (finished - imported) * 1000,
+    "status": status,
+    "loaded": [name for name in HEAVY_MODULES if name in sys.modules],
+}))
+"""
+
+
+def parse_importtime(stderr):
+    """-X importtime の出力から (モジュール名, 自身のµs, 累積µs, 深さ) を取り出す"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        self_us, cumulative_us, module = int(parts[0]), int(parts[1]), parts[2]
+        # 形式は "| " + 深さ×2の空白 + モジュール名
+        depth = (len(module) - len(module.lstrip(" ")) - 1) // 2
+        rows.append((module.strip(), self_us, cumulative_us, depth))
+    return rows
+
+
+def app_main_children(rows):
+    """importtime は子モジュールを親より先に出力するので、app.main の直前に並ぶ深さ1の行を集める"""
+    children = []
+    for row in rows:
+        if row[3] == 0:
+            if row[0] == "app.main":
+                return children
+            children = []
+        elif row[3] == 1:
+            children.append(row)
+    return []
+
+
+def run_once(env):
+    script = f"HEAVY_MODULES = {HEAVY_MODULES!r}\n" + CHILD_SCRIPT
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr[-2000:])
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["modules"] = parse_importtime(proc.stderr)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="バックエンドのコールドスタート計測")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=10, help="表示する重いimportの数")
+    parser.add_argument("--output", help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.update({
+        "SUPABASE_URL": "https://example.supabase.co",
+        "SUPABASE_ANON_KEY": "dummy",
+        "GEMINI_API_KEY": "dummy",
+        "PYTHONDONTWRITEBYTECODE": "1",
+    })
+    env.pop("LLM_STUB_URL", None)
+    env.pop("WARMUP_ON_STARTUP", None)
+
+    runs = [run_once(env) for _ in range(args.runs)]
+    import_ms = [run["import_ms"] for run in runs]
+    first_ms = [run["first_request_ms"] for run in runs]
+    app_main_ms = [
+        next(cumulative for module, _, cumulative, _ in run["modules"] if module == "app.main") / 1000
+        for run in runs
+    ]
+
+    print(f"runs: {args.runs}")
+    print(f"import app.main (-X importtime) median {statistics.median(app_main_ms):8.1f} ms  min {min(app_main_ms):8.1f} ms")
+    print(f"import app.main (wall clock)    median {statistics.median(import_ms):8.1f} ms  min {min(import_ms):8.1f} ms")
+    print(f"first GET /                     median {statistics.median(first_ms):8.1f} ms  min {min(first_ms):8.1f} ms")
+
+    # 最後の実行で、app.main 直下から読み込まれた重いモジュール
+    top_level = app_main_children(runs[-1]["modules"])
+    top_level.sort(key=lambda row: row[2], reverse=True)
+    print(f"\nheaviest imports (top {args.top}):")
+    for module, _, cumulative, _ in top_level[: args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {module}")
+
+    loaded = sorted({name for run in runs for name in run["loaded"]})
+    statuses = sorted({run["status"] for run in runs})
+    print(f"\nstatus of GET /: {statuses}")
+    if loaded:
+        print(f"❌ SDKs loaded before any request needed them: {', '.join(loaded)}")
+    else:
+        print("✅ no SDK was loaded by import or GET /")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "runs": args.runs,
+                "app_main_import_ms": app_main_ms,
+                "import_ms": import_ms,
+                "first_request_ms": first_ms,
+                "sdk_loaded": loaded,
+                "heaviest_imports": [
+                    {"module": module, "cumulative_ms": cumulative / 1000}
+                    for module, _, cumulative, _ in top_level[: args.top]
+                ],
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 {args.output}")
+    sys.exit(1 if loaded or statuses != [200] else 0)
+
+
+if __name__ == "__main__":
+    main()
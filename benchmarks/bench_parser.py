@@ -0,0 +1,145 @@
+"""
+LLMレスポンスパーサーの正確性・ファジング・速度の計測
+
+    cd backend
+    python ../benchmarks/bench_parser.py
+    python ../benchmarks/bench_parser.py --fuzz 5000 --seed 1
+
+- コーパス（benchmarks/data/llm_output_corpus.jsonl）で期待どおり成功/失敗するかを確認
+- 旧実装（非貪欲な正規表現 / find・rfind による切り出し）との成功数を比較
+- 有効な応答を壊した入力（切り詰め・括弧の挿入・フェンス）で例外が LLMParseError だけであることを確認
+- 1件あたりの解析時間を計測
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import timeit
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / "backend"))
+
+from app.llm_parsing import LLMParseError, parse_classification  # noqa: E402
+
+CORPUS_PATH = BENCH_DIR / "data" / "llm_output_corpus.jsonl"
+REQUIRED_FIELDS = ["category", "confidence_score", "summary", "keywords", "reasoning"]
+
+
+def legacy_regex_parse(text):
+    """旧 classify_text_with_gemini の抽出方法"""
+    match = re.search(r"\{.*?\}", text, re.DOTALL)
+    if not match:
+        raise ValueError("No JSON found in response")
+    result = json.loads(match.group())
+    for field in REQUIRED_FIELDS:
+        if field not in result:
+            raise ValueError(f"Missing required field: {field}")
+    return result
+
+
+def legacy_slice_parse(text):
+    """旧 ClaudeService._parse_classification_response の抽出方法"""
+    return json.loads(text[text.find("{"):text.rfind("}") + 1])
+
+
+def load_corpus():
+    with open(CORPUS_PATH, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def check_corpus(corpus):
+    failures = 0
+    counts = {"new": 0, "legacy_regex": 0, "legacy_slice": 0}
+    for case in corpus:
+        expected = case["expected_category"]
+        try:
+            category = parse_classification(case["text"])["category"]
+        except LLMParseError:
+            category = None
+        if category != expected:
+            failures += 1
+            print(f"❌ {case['name']}: expected {expected}, got {category}")
+        if category is not None:
+            counts["new"] += 1
+        for name, parser in (("legacy_regex", legacy_regex_parse), ("legacy_slice", legacy_slice_parse)):
+            try:
+                parser(case["text"])
+                counts[name] += 1
+            except (ValueError, json.JSONDecodeError):
+                pass
+    valid = sum(1 for case in corpus if case["expected_category"])
+    print(f"corpus: {len(corpus)} cases ({valid} valid), mismatches: {failures}")
+    print("parsed successfully: " + ", ".join(f"{name}={count}" for name, count in counts.items()))
+    return failures
+
+
+def mutate(text, rng):
+    """有効な応答を壊す"""
+    choice = rng.randrange(5)
+    if choice == 0:
+        return text[: rng.randrange(len(text) + 1)]
+    if choice == 1:
+        i = rng.randrange(len(text) + 1)
+        return text[:i] + rng.choice(["{", "}", "[", "]", '"', "\\", "```"]) + text[i:]
+    if choice == 2:
+        return "```json\n" + text + "\n```"
+    if choice == 3:
+        return "説明 {例} と [注記]\n" + text + "\n{以上}"
+    i = rng.randrange(len(text) + 1)
+    return text[:i] + text[i:][::-1]
+
+
+def fuzz(corpus, iterations, seed):
+    rng = random.Random(seed)
+    seeds = [case["text"] for case in corpus if case["expected_category"]]
+    parsed = rejected = 0
+    for _ in range(iterations):
+        text = mutate(rng.choice(seeds), rng)
+        try:
+            parse_classification(text)
+            parsed += 1
+        except LLMParseError:
+            rejected += 1
+        except Exception as e:
+            print(f"❌ unexpected {type(e).__name__}: {e!r} for input {text!r}")
+            return 1
+    print(f"fuzz: {iterations} inputs, parsed={parsed}, rejected={rejected}, unexpected=0")
+    return 0
+
+
+def benchmark(corpus, number):
+    texts = [case["text"] for case in corpus if case["expected_category"]]
+    long_text = "前置きの説明です。" * 500 + texts[1]
+
+    def run(parser, inputs):
+        for text in inputs:
+            try:
+                parser(text)
+            except (ValueError, json.JSONDecodeError):
+                pass
+
+    for label, inputs in (("corpus", texts), ("long_prose", [long_text])):
+        for name, parser in (("new", parse_classification), ("legacy_regex", legacy_regex_parse)):
+            seconds = timeit.timeit(lambda: run(parser, inputs), number=number)
+            per_call = seconds / (number * len(inputs)) * 1e6
+            print(f"{label:11} {name:13} {per_call:8.2f} µs/parse")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLMレスポンスパーサーの検証と計測")
+    parser.add_argument("--fuzz", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--number", type=int, default=2000, help="速度計測の繰り返し回数")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    status = check_corpus(corpus)
+    status += fuzz(corpus, args.fuzz, args.seed)
+    benchmark(corpus, args.number)
+    sys.exit(1 if status else 0)
+
+
+if __name__ == "__main__":
+    main()
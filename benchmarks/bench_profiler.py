@@ -0,0 +1,172 @@
+"""
+プロファイラー（app/profiling.py）のオーバーヘッド計測
+
+    cd backend
+    python ../benchmarks/bench_profiler.py
+    python ../benchmarks/bench_profiler.py --seconds 10 --rounds 5 --threads 40
+
+GET /api/logs/{family_access_key} と同じ処理（ローカルストアの30件から LogEntryResponse を作ってJSONにする）を
+イベントループで回し続け、次の条件でプロファイラー自身が使ったCPU時間を測る。スレッドプールの待機中のスレッド（--threads）も立てておく。
+
+    continuous      常時のサンプリング（PROFILER_HZ）。サンプラーのスレッドと SIGPROF のハンドラーのCPU時間 / 経過時間
+    capture         オンデマンドの取得（PROFILER_CAPTURE_HZ）。同上
+    route-cpu       RouteCPUMiddleware と同じく、コルーチンが1回動くごとのCPU時間を数えたときの1リクエストあたりの増分 /
+                    1リクエストのCPU時間
+
+スループットの差で比べないのは、1%前後の差が共有のCPUのクロックの揺れ（回ごとに±20%程度）に埋もれるため。
+最後に capture で取れたプロファイルの上位の関数を表示する（ハンドラーの処理が上に出ていれば、偏りなく読めている）。
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / "backend"))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from app.main import log_entry_from_local  # noqa: E402
+from app.profiling import (  # noqa: E402
+    PROFILER_CAPTURE_HZ, PROFILER_HZ, RequestCPU, ThreadCPUClock, _CPUTimed, profiler,
+)
+
+
+def make_entries(count=30):
+    now = datetime(2026, 10, 19, 9, 0)
+    return [{
+        "id": str(uuid.uuid4()),
+        "original_text": f"明日の15時に歯医者の予約、帰りに買い物もする（{i}）",
+        "category": "schedule",
+        "summary": "明日の15時に歯医者の予約",
+        "date": (now + timedelta(days=i % 7)).date().isoformat(),
+        "keywords": ["歯医者", "予約", "買い物"],
+        "confidence_score": 0.92,
+        "created_at": (now + timedelta(minutes=i)).isoformat(),
+        "change_seq": i,
+    } for i in range(count)]
+
+
+async def handle(entries):
+    """GET /api/logs/{family_access_key} のハンドラーとレスポンスの生成に近い処理"""
+    await asyncio.sleep(0)
+    body = [log_entry_from_local(entry) for entry in entries]
+    await asyncio.sleep(0)
+    return json.dumps(jsonable_encoder(body), ensure_ascii=False)
+
+
+async def run_workload(seconds, entries):
+    done = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        await handle(entries)
+        done += 1
+    return done
+
+
+def profiler_cpu():
+    """サンプラーのスレッドと SIGPROF のハンドラーがこれまでに使ったCPU時間"""
+    thread = profiler._thread
+    cpu = profiler._signal_overhead
+    if thread is not None and thread.ident is not None:
+        cpu += time.clock_gettime(time.pthread_getcpuclockid(thread.ident))
+    return cpu
+
+
+async def measure_sampling(mode, seconds, entries):
+    """(プロファイラーのCPU時間 / 経過時間, 処理数, capture のプロファイル)"""
+    capture = None
+    if mode == "continuous":
+        profiler.start_continuous()
+    else:
+        capture = asyncio.ensure_future(profiler.capture(seconds, PROFILER_CAPTURE_HZ))
+        await asyncio.sleep(0)
+    started_cpu, started = profiler_cpu(), time.perf_counter()
+    done = await run_workload(seconds, entries)
+    ratio = (profiler_cpu() - started_cpu) / (time.perf_counter() - started)
+    if capture is None:
+        profiler.stop_continuous()
+        return ratio, done, None
+    return ratio, done, await capture
+
+
+async def empty_handle():
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+
+async def measure_route_cpu(entries, requests):
+    """(1リクエストあたりの増分, 1リクエストのCPU時間)"""
+    # 増分は handle と同じ回数だけ止まる空のコルーチンで測る（handle 自体の揺れに埋もれないように）
+    plain = timed = 0.0
+    for _ in range(requests // 100):
+        started = time.thread_time()
+        for _ in range(100):
+            await empty_handle()
+        plain += time.thread_time() - started
+        started = time.thread_time()
+        for _ in range(100):
+            await _CPUTimed(empty_handle(), RequestCPU())
+        timed += time.thread_time() - started
+    started = time.thread_time()
+    for _ in range(200):
+        await handle(entries)
+    return (timed - plain) / requests, (time.thread_time() - started) / 200
+
+
+async def main_async(args):
+    if not ThreadCPUClock.supported:
+        sys.exit("スレッドごとのCPUクロックが取れない環境では計測できません")
+    entries = make_entries()
+    stop = threading.Event()
+    idle = [threading.Thread(target=stop.wait, name=f"AnyIO worker thread-{i}", daemon=True)
+            for i in range(args.threads)]
+    for thread in idle:
+        thread.start()
+    await run_workload(2.0, entries)  # ウォームアップ
+
+    results = {"continuous": [], "capture": []}
+    last_profile = None
+    for _ in range(args.rounds):
+        for mode in results:
+            ratio, done, profile = await measure_sampling(mode, args.seconds, entries)
+            results[mode].append((ratio, done / args.seconds))
+            last_profile = profile or last_profile
+            # 止めたサンプラーのスレッドが終わるのを待つ
+            await asyncio.sleep(0.3)
+    route = [await measure_route_cpu(entries, 20000) for _ in range(args.rounds)]
+    stop.set()
+
+    print(f"イベントループのスタックの読み方: {profiler.status()['main_thread_sampling']} / "
+          f"待機スレッド {args.threads} / 各 {args.seconds:g}秒 × {args.rounds}回の中央値")
+    for mode, hz in (("continuous", PROFILER_HZ), ("capture", PROFILER_CAPTURE_HZ)):
+        ratio = statistics.median(r for r, _ in results[mode])
+        rate = statistics.median(r for _, r in results[mode])
+        print(f"{mode:<11} {hz:5g}Hz  プロファイラーのCPU {ratio:7.3%}  （{rate:.0f} req/s）")
+    extra = statistics.median(e for e, _ in route)
+    per_request = statistics.median(p for _, p in route)
+    print(f"route-cpu           1リクエストあたり +{extra * 1e6:.1f}µs / {per_request * 1e3:.2f}ms  "
+          f"（{extra / per_request:.2%}）")
+
+    if last_profile is not None:
+        print("\ncapture の上位の関数（自分自身のCPU時間）")
+        for row in last_profile.top_functions(8):
+            print(f"  {row['share']:6.1%}  {row['function']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5.0, help="1条件あたりの計測時間")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=40, help="待機中のスレッド数（anyio のスレッドプールの上限と同じ）")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
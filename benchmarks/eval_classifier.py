@@ -0,0 +1,327 @@
+"""
+分類の品質とコスト・レイテンシのオフライン評価
+
+    cd backend
+    python ../benchmarks/eval_classifier.py                             # 記録済みの応答で全段を評価
+    GEMINI_API_KEY=... python ../benchmarks/eval_classifier.py --record gemini-1.5-flash   # 実APIの応答を1回だけ記録
+    python ../benchmarks/eval_classifier.py --output /tmp/eval.json --prices prices.json
+
+評価データ: data/classification_eval.jsonl（家族のログ60件、カテゴリごとに12件。正解カテゴリ付き）
+
+段（tier）:
+- rules: ルールベース分類（app.main.fallback_classify_text）
+- local-nb: 文字 n-gram のナイーブベイズ（評価データで5分割の交差検証。LLMなしで手元で動くモデルの目安）
+- LLMごと（gemini-text-bison / gemini-1.5-flash / claude-3-haiku / stub）:
+  --record で data/eval_recordings/<tier>.jsonl に記録した応答・レイテンシ・トークン数を再生する（ネットワーク不要）。
+  解析できない応答は本番と同じくルールベースの結果で数える
+- router@<しきい値>+<LLM>: ルールの信頼度がしきい値以上ならルール、未満ならLLM（app/routing.py と同じ振り分け）
+
+正解率・LLMの呼び出し率・レイテンシ（p50/p95）・1件あたりのトークン数・1000件あたりの費用を表示し、
+正解率・費用・p50 のどれでも他の段に劣らない段（パレート最適）に * を付ける。
+CLASSIFY_RULE_CONFIDENCE_THRESHOLD は router 行のうちパレート最適なものから選ぶ。
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / "backend"))
+sys.path.insert(0, str(BENCH_DIR))
+
+from app.llm_parsing import LLMParseError, parse_classification  # noqa: E402
+from app.metrics import estimate_tokens  # noqa: E402
+from app.prompts import get_prompt  # noqa: E402
+from run_load import percentile  # noqa: E402
+
+DATASET_PATH = BENCH_DIR / "data" / "classification_eval.jsonl"
+RECORDINGS_DIR = BENCH_DIR / "data" / "eval_recordings"
+
+# 段の名前 -> (プロバイダ, モデル)。モデル名はアプリで使っているもの
+LLM_TIERS = {
+    "gemini-text-bison": ("gemini", "models/text-bison-001"),  # app/main.py
+    "gemini-1.5-flash": ("gemini", "gemini-1.5-flash"),  # app/flask_test.py
+    "claude-3-haiku": ("anthropic", "claude-3-haiku-20240307"),  # app/services/claude_service.py
+    "stub": ("stub", "stub"),  # benchmarks/stub_llm_server.py（記録・再生の動作確認用）
+}
+# 100万トークンあたりの価格（USD、入力・出力）。公開価格の目安なので、最新の価格は --prices で渡す
+# text-bison は文字数課金のため、日本語1文字≒1トークンとして換算
+DEFAULT_PRICES = {
+    "models/text-bison-001": (0.50, 0.50),
+    "gemini-1.5-flash": (0.075, 0.30),
+    "claude-3-haiku-20240307": (0.25, 1.25),
+    "stub": (0.0, 0.0),
+}
+NB_FOLDS = 5
+
+
+def load_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# --- 記録 ---------------------------------------------------------------
+
+def call_llm(tier, template, text):
+    """実際のAPIを呼び出し、(応答, 入力トークン数, 出力トークン数) を返す（トークン数が不明なら None）"""
+    provider, model = LLM_TIERS[tier]
+    if provider == "stub":
+        from app.stub_llm import generate_with_stub
+        return generate_with_stub(os.environ["LLM_STUB_URL"], template.render(text=text), "classify"), None, None
+    if provider == "anthropic":
+        import anthropic
+        message = anthropic.Anthropic(api_key=os.environ["ANTHROPIC_API_KEY"]).messages.create(
+            model=model, max_tokens=1000, temperature=0.1,
+            system=[{"type": "text", "text": template.prefix}],
+            messages=[{"role": "user", "content": template.render_suffix(text=text)},
+                      {"role": "assistant", "content": "{"}],
+        )
+        return "{" + message.content[0].text, message.usage.input_tokens, message.usage.output_tokens
+
+    import google.generativeai as genai
+    genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+    if model.startswith("models/text-"):
+        response = genai.generate_text(prompt=template.render(text=text), model=model)
+        return response.result or "", None, None
+    response = genai.GenerativeModel(model).generate_content(template.render(text=text))
+    usage = getattr(response, "usage_metadata", None)
+    return (response.text,
+            getattr(usage, "prompt_token_count", None),
+            getattr(usage, "candidates_token_count", None))
+
+
+def record(tier, dataset):
+    """評価データの全件をAPIで分類し、応答とレイテンシを記録する"""
+    template = get_prompt("classify")
+    RECORDINGS_DIR.mkdir(parents=True, exist_ok=True)
+    path = RECORDINGS_DIR / f"{tier}.jsonl"
+    with open(path, "w", encoding="utf-8") as f:
+        for case in dataset:
+            started = time.perf_counter()
+            output_text, prompt_tokens, output_tokens = call_llm(tier, template, case["text"])
+            latency_ms = (time.perf_counter() - started) * 1000
+            f.write(json.dumps({
+                "id": case["id"],
+                "prompt_version": template.id,
+                "output_text": output_text,
+                "latency_ms": round(latency_ms, 1),
+                "prompt_tokens": prompt_tokens if prompt_tokens is not None else estimate_tokens(template.render(text=case["text"])),
+                "output_tokens": output_tokens if output_tokens is not None else estimate_tokens(output_text),
+            }, ensure_ascii=False) + "\n")
+            print(f"  {case['id']}: {latency_ms:.0f}ms")
+    print(f"記録しました: {path}")
+
+
+# --- 各段の予測 ---------------------------------------------------------
+
+def predict_rules(dataset):
+    from app.main import fallback_classify_text
+
+    predictions = []
+    for case in dataset:
+        started = time.perf_counter()
+        result = fallback_classify_text(case["text"])
+        predictions.append({
+            "category": result["category"],
+            "confidence": result["confidence_score"],
+            "latency_ms": (time.perf_counter() - started) * 1000,
+            "prompt_tokens": 0, "output_tokens": 0, "llm": False,
+        })
+    return predictions
+
+
+def _ngrams(text):
+    text = unicodedata.normalize("NFKC", text).lower()
+    return [text[i:i + n] for n in (1, 2, 3) for i in range(len(text) - n + 1)]
+
+
+class NaiveBayes:
+    """文字 1〜3-gram の多項ナイーブベイズ（ラプラス平滑化）"""
+
+    def fit(self, texts, labels):
+        self.class_counts = Counter(labels)
+        self.feature_counts = defaultdict(Counter)
+        for text, label in zip(texts, labels):
+            self.feature_counts[label].update(_ngrams(text))
+        self.vocabulary = {gram for counts in self.feature_counts.values() for gram in counts}
+        self.totals = {label: sum(counts.values()) for label, counts in self.feature_counts.items()}
+        return self
+
+    def predict(self, text):
+        total = sum(self.class_counts.values())
+        scores = {}
+        for label, count in self.class_counts.items():
+            denominator = self.totals[label] + len(self.vocabulary)
+            scores[label] = math.log(count / total) + sum(
+                math.log((self.feature_counts[label][gram] + 1) / denominator) for gram in _ngrams(text)
+            )
+        return max(scores, key=scores.get)
+
+
+def predict_local_nb(dataset):
+    """NB_FOLDS 分割の交差検証（各件は自分を含まない分割で学習したモデルで予測する）"""
+    predictions = [None] * len(dataset)
+    for fold in range(NB_FOLDS):
+        train = [case for i, case in enumerate(dataset) if i % NB_FOLDS != fold]
+        model = NaiveBayes().fit([case["text"] for case in train], [case["category"] for case in train])
+        for i, case in enumerate(dataset):
+            if i % NB_FOLDS != fold:
+                continue
+            started = time.perf_counter()
+            category = model.predict(case["text"])
+            predictions[i] = {
+                "category": category,
+                "latency_ms": (time.perf_counter() - started) * 1000,
+                "prompt_tokens": 0, "output_tokens": 0, "llm": False,
+            }
+    return predictions
+
+
+def predict_recorded(tier, dataset, rules):
+    """記録した応答を再生する（記録がない件があれば None）"""
+    path = RECORDINGS_DIR / f"{tier}.jsonl"
+    if not path.exists():
+        return None
+    recorded = {row["id"]: row for row in load_jsonl(path)}
+    if any(case["id"] not in recorded for case in dataset):
+        print(f"⚠️ {tier}: 評価データの一部が記録されていません。--record {tier} で記録し直してください")
+        return None
+    versions = {row["prompt_version"] for row in recorded.values()}
+    if versions != {get_prompt("classify").id}:
+        print(f"⚠️ {tier}: 記録時のプロンプト {sorted(versions)} は現在の {get_prompt('classify').id} と異なります")
+
+    predictions = []
+    for case, rule in zip(dataset, rules):
+        row = recorded[case["id"]]
+        try:
+            category = parse_classification(row["output_text"])["category"]
+            parse_failed = False
+        except LLMParseError:
+            category, parse_failed = rule["category"], True
+        predictions.append({
+            "category": category,
+            "latency_ms": row["latency_ms"],
+            "prompt_tokens": row["prompt_tokens"],
+            "output_tokens": row["output_tokens"],
+            "llm": True,
+            "parse_failed": parse_failed,
+        })
+    return predictions
+
+
+def predict_router(threshold, rules, llm):
+    """ルールの信頼度がしきい値以上ならルール、未満ならLLM（ルールの計算時間も含める）"""
+    predictions = []
+    for rule, answer in zip(rules, llm):
+        if rule["confidence"] >= threshold:
+            predictions.append(rule)
+        else:
+            predictions.append(dict(answer, latency_ms=rule["latency_ms"] + answer["latency_ms"]))
+    return predictions
+
+
+# --- 集計 ---------------------------------------------------------------
+
+def summarize(name, model, dataset, predictions, prices):
+    latencies = sorted(p["latency_ms"] for p in predictions)
+    input_price, output_price = prices.get(model, (0.0, 0.0)) if model else (0.0, 0.0)
+    cost = sum(p["prompt_tokens"] * input_price + p["output_tokens"] * output_price for p in predictions) / 1e6
+    correct = [p["category"] == case["category"] for case, p in zip(dataset, predictions)]
+    return {
+        "tier": name,
+        "model": model,
+        "accuracy": sum(correct) / len(dataset),
+        "llm_call_rate": sum(p["llm"] for p in predictions) / len(dataset),
+        "latency_p50_ms": percentile(latencies, 50),
+        "latency_p95_ms": percentile(latencies, 95),
+        "tokens_per_entry": sum(p["prompt_tokens"] + p["output_tokens"] for p in predictions) / len(dataset),
+        "cost_per_1k_usd": cost / len(dataset) * 1000,
+        "parse_failures": sum(p.get("parse_failed", False) for p in predictions),
+        "errors": [
+            {"id": case["id"], "expected": case["category"], "predicted": p["category"]}
+            for case, p, ok in zip(dataset, predictions, correct) if not ok
+        ],
+    }
+
+
+def mark_pareto(results):
+    """正解率（高いほど良い）・費用・p50（低いほど良い）で他の段に支配されない段に pareto=True を付ける"""
+    def at_least_as_good(a, b):
+        return (a["accuracy"] >= b["accuracy"] and a["cost_per_1k_usd"] <= b["cost_per_1k_usd"]
+                and a["latency_p50_ms"] <= b["latency_p50_ms"])
+
+    def better_somewhere(a, b):
+        return (a["accuracy"] > b["accuracy"] or a["cost_per_1k_usd"] < b["cost_per_1k_usd"]
+                or a["latency_p50_ms"] < b["latency_p50_ms"])
+
+    for result in results:
+        result["pareto"] = not any(
+            other is not result and at_least_as_good(other, result) and better_somewhere(other, result)
+            for other in results
+        )
+    return results
+
+
+def print_table(results):
+    print(f"\n{'tier':<36} {'acc':>6} {'llm%':>6} {'p50ms':>8} {'p95ms':>8} {'tok/件':>7} {'$/1k':>8} {'parse✗':>6}")
+    for r in results:
+        mark = "*" if r["pareto"] else " "
+        print(f"{mark}{r['tier']:<35} {r['accuracy']:>6.1%} {r['llm_call_rate']:>6.0%} {r['latency_p50_ms']:>8.2f} "
+              f"{r['latency_p95_ms']:>8.2f} {r['tokens_per_entry']:>7.0f} {r['cost_per_1k_usd']:>8.4f} {r['parse_failures']:>6}")
+    print("\n* = パレート最適（正解率・費用・p50 のどれでも他の段に劣らない）")
+
+
+def evaluate(dataset, prices):
+    rules = predict_rules(dataset)
+    results = [
+        summarize("rules", None, dataset, rules, prices),
+        summarize(f"local-nb ({NB_FOLDS}-fold)", None, dataset, predict_local_nb(dataset), prices),
+    ]
+    thresholds = sorted({rule["confidence"] for rule in rules})
+    for tier, (_, model) in LLM_TIERS.items():
+        llm = predict_recorded(tier, dataset, rules)
+        if llm is None:
+            continue
+        results.append(summarize(tier, model, dataset, llm, prices))
+        # 最も低い信頼度をしきい値にすると全件ルールになるので除く
+        for threshold in thresholds[1:]:
+            results.append(summarize(f"router@{threshold:.2f}+{tier}", model, dataset,
+                                     predict_router(threshold, rules, llm), prices))
+    return mark_pareto(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分類の品質とコスト・レイテンシのオフライン評価")
+    parser.add_argument("--record", choices=sorted(LLM_TIERS), help="実際のAPIを呼んで応答を記録する段")
+    parser.add_argument("--prices", help='価格の上書き（JSON: {"モデル名": [入力USD/100万トークン, 出力USD/100万トークン]}）')
+    parser.add_argument("--output", help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    dataset = load_jsonl(DATASET_PATH)
+    if args.record:
+        record(args.record, dataset)
+        return
+
+    prices = dict(DEFAULT_PRICES)
+    if args.prices:
+        with open(args.prices, encoding="utf-8") as f:
+            prices.update({model: tuple(price) for model, price in json.load(f).items()})
+
+    results = evaluate(dataset, prices)
+    print(f"評価データ: {len(dataset)}件 {dict(Counter(case['category'] for case in dataset))}")
+    print_table(results)
+    missing = [tier for tier in LLM_TIERS if not (RECORDINGS_DIR / f"{tier}.jsonl").exists()]
+    if missing:
+        print(f"記録がないため評価していない段: {', '.join(missing)}（--record で記録）")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"dataset_size": len(dataset), "prices": prices, "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
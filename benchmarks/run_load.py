@@ -0,0 +1,343 @@
+"""
+KazokuLog 負荷試験・ベンチマーク
+
+スタブLLMサーバーとメモリベースのバックエンド（Supabase未設定）で FastAPI アプリを起動し、
+家族の利用パターンに沿った負荷をかけてエンドポイントごとのスループットと p50/p95/p99 を計測する。
+結果は JSON で保存され、--compare で過去の結果（別コミット）と比較できる。
+
+    cd backend
+    python ../benchmarks/run_load.py --workload mixed --duration 30 --concurrency 32
+    python ../benchmarks/run_load.py --workload write_burst --compare ../benchmarks/results/write_burst-abc1234.json
+    python ../benchmarks/run_load.py --workload mixed --workers 4   # LOCAL_STORE_PATH（SQLite）でワーカー間共有
+    GEMINI_API_KEY=... python ../benchmarks/run_load.py --workload chat --cassette-mode record --real-llm   # 実LLMの応答を記録
+    python ../benchmarks/run_load.py --workload chat --cassette-mode replay   # 記録した応答を再生（ネットワーク不要）
+
+ワークロード:
+    write_burst  家族ごとに短時間で連続してログを投稿（ダブルタップ・まとめ入力）
+    dashboard    カテゴリ・当日のログ一覧・AI提案の取得（ダッシュボード表示）
+    chat         AIチャットの会話を作って続けて質問
+    mixed        上記を 2:6:2 の割合で混在
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+from pathlib import Path
+
+import httpx
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_ROOT = BENCH_DIR.parent
+BACKEND_DIR = REPO_ROOT / "backend"
+RESULTS_DIR = BENCH_DIR / "results"
+DEFAULT_CASSETTE = BENCH_DIR / "data" / "cassettes" / "load.jsonl"
+
+sys.path.insert(0, str(BENCH_DIR))
+from stub_llm_server import StubConfig, start_stub_server  # noqa: E402
+
+SAMPLE_TEXTS = [
+    "牛乳、パン、卵、トマトを買う",
+    "明日は太郎の小学校の運動会です。お弁当を作らないと。",
+    "太郎が今日は機嫌が悪くて泣いてばかりいた。熱はないけど心配。",
+    "来週までに子供の医療費助成の申請書を出す",
+    "今日は良い天気だった。散歩が気持ちよかった。",
+    "花子の歯医者の予約を金曜日の午後4時に入れた",
+    "トイレットペーパーと洗剤がなくなりそう",
+    "保育園の連絡帳に今日はよく笑っていたと書いてあった",
+    "週末に実家へ行く予定。お土産を買っておく",
+    "町内会の回覧板を回す",
+]
+
+CHAT_QUESTIONS = [
+    "最近の子どもの様子はどうですか？",
+    "週末はどう過ごすのがいいですか？",
+    "買い忘れているものはありますか？",
+    "今週の予定をまとめてください",
+    "疲れがたまっている気がします",
+]
+
+WORKLOAD_MIX = {
+    "write_burst": {"write_burst": 1.0},
+    "dashboard": {"dashboard": 1.0},
+    "chat": {"chat": 1.0},
+    "mixed": {"write_burst": 0.2, "dashboard": 0.6, "chat": 0.2},
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+def percentile(sorted_values, p):
+    """最近傍順位法によるパーセンタイル"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+class Recorder:
+    """エンドポイントごとのレイテンシを記録"""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+
+    def add(self, endpoint, seconds, ok):
+        self.samples.setdefault(endpoint, []).append(seconds)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self, elapsed):
+        endpoints = {}
+        total = 0
+        for endpoint, values in sorted(self.samples.items()):
+            values = sorted(values)
+            total += len(values)
+            endpoints[endpoint] = {
+                "requests": len(values),
+                "errors": self.errors.get(endpoint, 0),
+                "throughput_rps": round(len(values) / elapsed, 2),
+                "mean_ms": round(sum(values) / len(values) * 1000, 2),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+                "max_ms": round(values[-1] * 1000, 2),
+            }
+        return {
+            "elapsed_seconds": round(elapsed, 2),
+            "total_requests": total,
+            "total_throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+            "endpoints": endpoints,
+        }
+
+
+async def _timed(client, recorder, endpoint, method, url, **kwargs):
+    start = time.perf_counter()
+    ok = False
+    response = None
+    try:
+        response = await client.request(method, url, **kwargs)
+        ok = response.status_code < 400
+    except httpx.HTTPError:
+        pass
+    recorder.add(endpoint, time.perf_counter() - start, ok)
+    return response
+
+
+async def write_burst(client, recorder, rng, access_key):
+    for _ in range(rng.randint(2, 5)):
+        await _timed(client, recorder, "POST /api/logs", "POST", "/api/logs",
+                     json={"text": rng.choice(SAMPLE_TEXTS), "family_access_key": access_key})
+
+
+async def dashboard(client, recorder, rng, access_key):
+    await _timed(client, recorder, "GET /api/categories", "GET", "/api/categories")
+    await _timed(client, recorder, "GET /api/logs/{family_access_key}", "GET", f"/api/logs/{access_key}",
+                 params={"date_filter": date.today().isoformat()})
+    if rng.random() < 0.3:
+        await _timed(client, recorder, "GET /api/ai/suggestions/{family_access_key}", "GET",
+                     f"/api/ai/suggestions/{access_key}")
+
+
+async def chat(client, recorder, rng, access_key):
+    # 会話を作って続けて質問する（2問目以降はそれまでの会話がプロンプトに入る）
+    response = await _timed(client, recorder, "POST /api/ai/chat/sessions", "POST", "/api/ai/chat/sessions",
+                            json={"family_access_key": access_key})
+    session_id = response.json()["id"] if response.status_code == 200 else None
+    for _ in range(rng.randint(1, 3)):
+        await _timed(client, recorder, "POST /api/ai/chat", "POST", "/api/ai/chat",
+                     json={"question": rng.choice(CHAT_QUESTIONS), "family_access_key": access_key,
+                           "session_id": session_id})
+
+
+SCENARIOS = {"write_burst": write_burst, "dashboard": dashboard, "chat": chat}
+
+
+async def virtual_user(client, recorder, seed, access_keys, mix, deadline, think_ms):
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    while time.monotonic() < deadline:
+        scenario = SCENARIOS[rng.choices(names, weights)[0]]
+        await scenario(client, recorder, rng, rng.choice(access_keys))
+        if think_ms:
+            await asyncio.sleep(rng.uniform(0, think_ms) / 1000.0)
+
+
+async def run_workload(base_url, args):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60.0, limits=limits) as client:
+        # 家族を作成し、既存ログを少し入れておく
+        access_keys = []
+        for i in range(args.families):
+            response = await client.post("/api/families", json={"name": f"bench-family-{i}"})
+            response.raise_for_status()
+            access_keys.append(response.json()["access_key"])
+        seed_rng = random.Random(args.seed)
+        for access_key in access_keys:
+            for _ in range(args.seed_entries):
+                await client.post("/api/logs", json={"text": seed_rng.choice(SAMPLE_TEXTS),
+                                                     "family_access_key": access_key})
+
+        recorder = Recorder()
+        start = time.monotonic()
+        deadline = start + args.duration
+        await asyncio.gather(*[
+            virtual_user(client, recorder, args.seed * 1000 + i, access_keys,
+                         WORKLOAD_MIX[args.workload], deadline, args.think_ms)
+            for i in range(args.concurrency)
+        ])
+        return recorder.summary(time.monotonic() - start)
+
+
+def start_app_server(stub_url, args):
+    """uvicorn でアプリを別プロセスとして起動する（メモリベースのバックエンド）"""
+    port = _free_port()
+    env = dict(os.environ)
+    env.pop("SUPABASE_URL", None)
+    env.pop("SUPABASE_ANON_KEY", None)
+    env.pop("LLM_STUB_URL", None)
+    if stub_url:
+        env["LLM_STUB_URL"] = stub_url
+    if args.cassette_mode:
+        env["LLM_CASSETTE_PATH"] = str(Path(args.cassette).resolve())
+        env["LLM_CASSETTE_MODE"] = args.cassette_mode
+        env["LLM_CASSETTE_LATENCY_SCALE"] = str(args.cassette_latency_scale)
+    if args.workers > 1 and not env.get("LOCAL_STORE_PATH"):
+        # ワーカー間で家族・ログを共有しないと、別のワーカーに届いたリクエストが404になる
+        env["LOCAL_STORE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="kazokulog-load-"), "store.db")
+    command = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+               "--port", str(port), "--log-level", "warning", "--workers", str(args.workers)]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            if httpx.get(base_url + "/", timeout=1.0).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("アプリサーバーが起動しませんでした")
+
+
+def compare(current, baseline_path):
+    """過去の結果と比較して差分を表示"""
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    print(f"\n📊 比較対象: {baseline_path} (commit {baseline['meta'].get('git_commit')})")
+    print(f"{'endpoint':48} {'p50':>16} {'p95':>16} {'p99':>16} {'rps':>16}")
+    for endpoint, stats in current["results"]["endpoints"].items():
+        old = baseline["results"]["endpoints"].get(endpoint)
+        if not old:
+            continue
+        cells = []
+        for key in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+            delta = (stats[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            cells.append(f"{stats[key]:>8.1f} ({delta:+5.1f}%)")
+        print(f"{endpoint:48} " + " ".join(cells))
+
+
+def print_report(results):
+    print(f"\n⏱  {results['total_requests']} requests in {results['elapsed_seconds']}s "
+          f"({results['total_throughput_rps']} req/s)")
+    print(f"{'endpoint':48} {'n':>6} {'err':>5} {'rps':>8} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for endpoint, stats in results["endpoints"].items():
+        print(f"{endpoint:48} {stats['requests']:>6} {stats['errors']:>5} {stats['throughput_rps']:>8} "
+              f"{stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="KazokuLog 負荷試験")
+    parser.add_argument("--workload", choices=sorted(WORKLOAD_MIX), default="mixed")
+    parser.add_argument("--duration", type=float, default=20.0, help="計測時間（秒）")
+    parser.add_argument("--concurrency", type=int, default=16, help="同時仮想ユーザー数")
+    parser.add_argument("--families", type=int, default=20)
+    parser.add_argument("--seed-entries", type=int, default=20, help="計測前に家族ごとに投入するログ件数")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="シナリオ間の待ち時間の上限")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn のワーカープロセス数")
+    parser.add_argument("--target", help="起動済みサーバーのURL（指定時はアプリとスタブを起動しない）")
+    parser.add_argument("--stub-latency-ms", type=float, default=300.0)
+    parser.add_argument("--stub-jitter-ms", type=float, default=50.0)
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--stub-malformed-rate", type=float, default=0.0)
+    parser.add_argument("--cassette-mode", choices=["record", "replay"],
+                        help="LLMの応答をカセットに記録する / カセットから再生する（再生時はスタブを起動しない）")
+    parser.add_argument("--cassette", default=str(DEFAULT_CASSETTE), help="カセットのパス")
+    parser.add_argument("--cassette-latency-scale", type=float, default=1.0,
+                        help="再生時のレイテンシの倍率（0 で待たない）")
+    parser.add_argument("--real-llm", action="store_true",
+                        help="スタブの代わりに実際のLLM（GEMINI_API_KEY）を使う（カセットの記録用）")
+    parser.add_argument("--output", help="結果JSONの保存先（デフォルト benchmarks/results/<workload>-<commit>.json）")
+    parser.add_argument("--compare", help="比較対象の結果JSON")
+    args = parser.parse_args()
+    if args.real_llm and not os.getenv("GEMINI_API_KEY"):
+        parser.error("--real-llm には GEMINI_API_KEY が必要です")
+    if args.cassette_mode == "replay" and not Path(args.cassette).exists():
+        parser.error(f"カセットがありません: {args.cassette}（--cassette-mode record で記録してください）")
+
+    stub_server = process = None
+    config = None
+    try:
+        if args.target:
+            base_url = args.target
+        else:
+            stub_url = None
+            if not args.real_llm and args.cassette_mode != "replay":
+                config = StubConfig(args.stub_latency_ms, args.stub_jitter_ms, args.stub_error_rate,
+                                    args.stub_malformed_rate, seed=args.seed)
+                stub_server, stub_url = start_stub_server(config)
+            process, base_url = start_app_server(stub_url, args)
+        results = asyncio.run(run_workload(base_url, args))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        if stub_server is not None:
+            stub_server.shutdown()
+
+    commit = _git_commit()
+    report = {
+        "meta": {
+            "git_commit": commit,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+            "stub_llm_requests": config.requests if config else None,
+        },
+        "results": results,
+    }
+    print_report(results)
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{args.workload}-{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\n💾 {output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+サーバーレス（Vercel）の呼び出しをローカルで再現し、コールド/ウォームのレイテンシを計測する
+
+    cd backend
+    python ../benchmarks/serverless_harness.py
+    python ../benchmarks/serverless_harness.py --instances 5 --invocations 20 --output /tmp/serverless.json
+
+- インスタンス = 新しいPythonプロセス。`api/index.py` を import し、その `app` を ASGI で直接呼び出す
+  （@vercel/python と同じく、プロセス内のアプリとクライアントはウォームな呼び出しで使い回される）
+- 各インスタンスの最初の呼び出しが「コールド」（import 時間を含む）、以降が「ウォーム」
+- レスポンスは http.response.body のチャンク単位で受け取り、最初のバイトまで（TTFB）と完了までを分けて記録する
+  ストリーミング（/api/ai/chat/stream）では TTFB が完了時間より十分短くなる
+- LLM はスタブサーバー（stub_llm_server.py）、DB はメモリベースのバックエンドを使う
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_ROOT = BENCH_DIR.parent
+
+# 子プロセスのコールドスタートを汚さないよう、ベンチマーク用のモジュールは親プロセスでだけ読み込む
+sys.path.insert(0, str(BENCH_DIR))
+
+# 1インスタンスで順に処理する呼び出し（最初の1件がコールド）
+INVOCATIONS = [
+    ("GET", "/api/categories", None),
+    ("POST", "/api/logs", {"text": "明日は太郎の小学校の運動会です。お弁当を作らないと。"}),
+    ("GET", "/api/logs/{access_key}", None),
+    ("POST", "/api/ai/chat/stream", {"question": "週末はどう過ごすのがいいですか？"}),
+    ("POST", "/api/ai/chat", {"question": "最近の子どもの様子はどうですか？"}),
+    ("GET", "/", None),
+]
+
+
+async def invoke(app, method, path, body=None):
+    """ASGI アプリを1回呼び出し、(status, 本文, TTFB秒, 完了秒, チャンク数) を返す"""
+    payload = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else b""
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "https",
+        "path": path,
+        "raw_path": path.encode("utf-8"),
+        "query_string": query.encode("utf-8"),
+        "root_path": "",
+        "headers": [(b"host", b"kazokulog.vercel.app"), (b"content-type", b"application/json"),
+                    (b"content-length", str(len(payload)).encode())],
+        "client": ("127.0.0.1", 0),
+        "server": ("kazokulog.vercel.app", 443),
+    }
+    received = asyncio.Event()
+    messages = [{"type": "http.request", "body": payload, "more_body": False}]
+    result = {"status": 0, "body": b"", "first_byte": None, "chunks": 0}
+    started = time.perf_counter()
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await received.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            if message.get("body"):
+                if result["first_byte"] is None:
+                    result["first_byte"] = time.perf_counter() - started
+                result["body"] += message["body"]
+                result["chunks"] += 1
+            if not message.get("more_body"):
+                received.set()
+
+    await app(scope, receive, send)
+    total = time.perf_counter() - started
+    return result["status"], result["body"], result["first_byte"] or total, total, result["chunks"]
+
+
+def run_instance(invocations):
+    """子プロセス側: api/index.py を読み込み、呼び出しを順に処理して結果をJSONで出力"""
+    started = time.perf_counter()
+    sys.path.insert(0, str(REPO_ROOT))
+    from api.index import app
+    import_seconds = time.perf_counter() - started
+
+    async def main():
+        status, body, _, _, _ = await invoke(app, "POST", "/api/families", {"name": "ベンチマーク家族"})
+        access_key = json.loads(body)["access_key"]
+        records = []
+        for i in range(invocations):
+            method, path, body = INVOCATIONS[i % len(INVOCATIONS)]
+            if body is not None:
+                body = dict(body, family_access_key=access_key)
+            status, response, ttfb, total, chunks = await invoke(app, method, path.format(access_key=access_key), body)
+            records.append({
+                "endpoint": f"{method} {path}",
+                "status": status,
+                "ttfb": ttfb,
+                "total": total,
+                "chunks": chunks,
+            })
+        return records
+
+    records = asyncio.run(main())
+    print(json.dumps({"import_seconds": import_seconds, "records": records}))
+
+
+def spawn_instance(env, invocations):
+    proc = subprocess.run(
+        [sys.executable, str(Path(__file__).resolve()), "--child", "--invocations", str(invocations)],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr[-2000:])
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def summarize(instances):
+    """コールド（インスタンスの最初の呼び出し）とウォームをエンドポイント別に集計"""
+    from run_load import percentile
+    groups = {}
+    for instance in instances:
+        for i, record in enumerate(instance["records"]):
+            kind = "cold" if i == 0 else "warm"
+            ttfb, total = record["ttfb"], record["total"]
+            if kind == "cold":
+                # コールドは import 時間も含めて数える
+                ttfb += instance["import_seconds"]
+                total += instance["import_seconds"]
+            group = groups.setdefault((kind, record["endpoint"]), {"ttfb": [], "total": [], "chunks": [], "errors": 0})
+            group["ttfb"].append(ttfb * 1000)
+            group["total"].append(total * 1000)
+            group["chunks"].append(record["chunks"])
+            if record["status"] >= 400:
+                group["errors"] += 1
+
+    summary = []
+    for (kind, endpoint), group in sorted(groups.items()):
+        ttfb, total = sorted(group["ttfb"]), sorted(group["total"])
+        summary.append({
+            "kind": kind,
+            "endpoint": endpoint,
+            "count": len(total),
+            "errors": group["errors"],
+            "ttfb_p50_ms": percentile(ttfb, 50),
+            "total_p50_ms": percentile(total, 50),
+            "total_p95_ms": percentile(total, 95),
+            "max_chunks": max(group["chunks"]),
+        })
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="サーバーレス呼び出しのコールド/ウォーム計測")
+    parser.add_argument("--instances", type=int, default=3, help="起動するインスタンス（プロセス）数")
+    parser.add_argument("--invocations", type=int, default=12, help="1インスタンスあたりの呼び出し数")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--chunk-delay-ms", type=float, default=20.0)
+    parser.add_argument("--output", help="結果をJSONで保存するパス")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_instance(args.invocations)
+        return
+
+    from run_load import percentile
+    from stub_llm_server import StubConfig, start_stub_server
+
+    stub, stub_url = start_stub_server(StubConfig(
+        latency_ms=args.llm_latency_ms, jitter_ms=0, chunk_delay_ms=args.chunk_delay_ms, seed=0,
+    ))
+    env = dict(os.environ)
+    for name in ("SUPABASE_URL", "SUPABASE_ANON_KEY", "GEMINI_API_KEY", "WARMUP_ON_STARTUP"):
+        env.pop(name, None)
+    env.update({
+        "LLM_STUB_URL": stub_url,
+        # 一致率のサンプリングでLLM呼び出しの有無が揺れないようにする
+        "CLASSIFY_AGREEMENT_SAMPLE_RATE": "0",
+        "PYTHONDONTWRITEBYTECODE": "1",
+    })
+    try:
+        instances = [spawn_instance(env, args.invocations) for _ in range(args.instances)]
+    finally:
+        stub.shutdown()
+
+    summary = summarize(instances)
+    imports = sorted(instance["import_seconds"] * 1000 for instance in instances)
+    print(f"instances: {args.instances}, invocations/instance: {args.invocations}")
+    print(f"import api.index: p50 {percentile(imports, 50):.1f} ms, max {imports[-1]:.1f} ms\n")
+    print(f"{'kind':5} {'endpoint':32} {'n':>4} {'err':>4} {'ttfb p50':>10} {'p50':>10} {'p95':>10} {'chunks':>7}")
+    for row in summary:
+        print(f"{row['kind']:5} {row['endpoint']:32} {row['count']:4d} {row['errors']:4d} "
+              f"{row['ttfb_p50_ms']:10.1f} {row['total_p50_ms']:10.1f} {row['total_p95_ms']:10.1f} {row['max_chunks']:7d}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"instances": instances, "summary": summary}, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 {args.output}")
+    sys.exit(1 if any(row["errors"] for row in summary) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+KazokuLog ベンチマーク用スタブLLMサーバー
+
+実際のLLM APIの代わりに、設定したレイテンシ・エラー率でそれらしい応答を返す。
+バックエンドは LLM_STUB_URL=http://127.0.0.1:<port> を設定するとこのサーバーを使う。
+
+    python benchmarks/stub_llm_server.py --port 8090 --latency-ms 800 --jitter-ms 200 --error-rate 0.02
+
+エンドポイント:
+    POST /v1/generate  {"prompt": "...", "operation": "classify|extract|event|chat|chat_summary|digest|suggestions", "stream": false}
+        stream=true の場合はチャンク転送で数文字ずつ返す（--chunk-delay-ms 間隔）
+    GET  /health
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CATEGORY_KEYWORDS = {
+    "shopping": ["買", "スーパー", "購入", "牛乳", "卵"],
+    "schedule": ["運動会", "学校", "病院", "予定", "明日", "来週"],
+    "emotion": ["機嫌", "泣", "笑", "熱", "元気"],
+    "todo": ["申請", "手続き", "やる", "提出", "予約"],
+}
+
+
+class StubConfig:
+    """スタブの振る舞い（レイテンシ・エラー率など）"""
+
+    def __init__(self, latency_ms=500.0, jitter_ms=100.0, error_rate=0.0, malformed_rate=0.0,
+                 chunk_delay_ms=20.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.chunk_delay_ms = chunk_delay_ms
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def sample_latency(self) -> float:
+        with self.lock:
+            self.requests += 1
+            jitter = self.random.uniform(-self.jitter_ms, self.jitter_ms)
+        return max(0.0, self.latency_ms + jitter) / 1000.0
+
+    def roll(self, rate: float) -> bool:
+        with self.lock:
+            return self.random.random() < rate
+
+
+def _extract_log_text(prompt: str) -> str:
+    match = re.search(r'テキスト: "?(.+?)"?\n', prompt)
+    return match.group(1) if match else prompt[-200:]
+
+
+def _classify(text: str) -> dict:
+    category = "memo"
+    for name, words in CATEGORY_KEYWORDS.items():
+        if any(word in text for word in words):
+            category = name
+            break
+    return {
+        "category": category,
+        "confidence_score": 0.85,
+        "summary": text[:30],
+        "keywords": [word for word in CATEGORY_KEYWORDS.get(category, ["メモ"]) if word in text][:3] or ["メモ"],
+        "reasoning": "スタブサーバーによる分類",
+    }
+
+
+def build_response(prompt: str, operation: str, malformed: bool = False) -> str:
+    """operation に応じて本物のLLMに近い形式の応答を作る"""
+    if operation in ("classify", "extract"):
+        text = _extract_log_text(prompt)
+        if operation == "classify":
+            payload = _classify(text)
+        else:
+            # 句読点で区切った文ごとに1項目（括弧の中では区切らない）
+            segments = [segment for segment in re.split(r"[、。\n](?![^(（]*[)）])", text) if segment.strip()]
+            payload = {"items": [dict(_classify(segment), text=segment) for segment in segments]}
+        body = json.dumps(payload, ensure_ascii=False, indent=4)
+        if malformed:
+            body = body[: len(body) // 2]
+        return f"以下が分類結果です。\n```json\n{body}\n```"
+    if operation == "event":
+        # 日時の表現は読まず、基準日の終日の予定として返す
+        match = re.search(r"基準日: (\d{4}-\d{2}-\d{2})", prompt)
+        payload = {"event_at": match.group(1) if match else None, "title": _extract_log_text(prompt)[:20]}
+        return f"```json\n{json.dumps(payload, ensure_ascii=False, indent=4)}\n```"
+    if operation == "digest":
+        payload = {
+            "summary": "家族それぞれの予定と体調を記録した一日でした。",
+            "suggestions": ["明日の持ち物を夜のうちに確認しましょう", "早めに寝て体調を整えましょう", "買い物は朝のうちに済ませましょう"],
+        }
+        return f"```json\n{json.dumps(payload, ensure_ascii=False, indent=4)}\n```"
+    if operation == "chat_summary":
+        return "家族は子どもの体調と週末の予定について相談し、AIは早めの休息と買い物の準備を提案した。"
+    if operation == "suggestions":
+        return "\n".join([
+            "1. 週末に家族で近くの公園へ散歩に出かけてみましょう",
+            "2. 買い物リストを前日に家族で共有しておきましょう",
+            "3. 子どもの体調の変化を毎日一言ずつ記録しましょう",
+        ])
+    return "最近のログを拝見すると、ご家族で忙しい日々を過ごされているようですね。" * 3
+
+
+def make_handler(config: StubConfig):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, {"status": "ok", "requests": config.requests})
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/v1/generate":
+                self._send_json(404, {"error": "not found"})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            time.sleep(config.sample_latency())
+
+            if config.roll(config.error_rate):
+                self._send_json(503, {"error": "stub overloaded"})
+                return
+
+            text = build_response(
+                request.get("prompt", ""),
+                request.get("operation", "chat"),
+                malformed=config.roll(config.malformed_rate),
+            )
+            if not request.get("stream"):
+                self._send_json(200, {"text": text})
+                return
+
+            # チャンク転送で数文字ずつ返す
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i in range(0, len(text), 8):
+                chunk = text[i:i + 8].encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                self.wfile.flush()
+                time.sleep(config.chunk_delay_ms / 1000.0)
+            self.wfile.write(b"0\r\n\r\n")
+
+    return StubHandler
+
+
+def start_stub_server(config: StubConfig, host="127.0.0.1", port=0):
+    """スタブサーバーをバックグラウンドスレッドで起動し、(server, url) を返す"""
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="stub-llm", daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="KazokuLog スタブLLMサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=500.0)
+    parser.add_argument("--jitter-ms", type=float, default=100.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="途中で切れたJSONを返す割合")
+    parser.add_argument("--chunk-delay-ms", type=float, default=20.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = StubConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.malformed_rate,
+                        args.chunk_delay_ms, args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(config))
+    print(f"🧪 Stub LLM server: http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2 @@
+-- 既存のデータベースに分類プロンプトのバージョン列を追加
+ALTER TABLE classification_details ADD COLUMN IF NOT EXISTS prompt_version VARCHAR(50);
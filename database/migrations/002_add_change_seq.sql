@@ -0,0 +1,35 @@
+-- 差分同期用の変更番号（families.change_seq / log_entries.change_seq）とトリガーを追加
+ALTER TABLE families ADD COLUMN IF NOT EXISTS change_seq BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE log_entries ADD COLUMN IF NOT EXISTS change_seq BIGINT NOT NULL DEFAULT 0;
+CREATE INDEX IF NOT EXISTS idx_log_entries_family_change_seq ON log_entries(family_id, change_seq);
+
+CREATE OR REPLACE FUNCTION bump_family_change_seq()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        UPDATE families SET change_seq = change_seq + 1 WHERE id = OLD.family_id;
+        RETURN OLD;
+    END IF;
+    UPDATE families SET change_seq = change_seq + 1 WHERE id = NEW.family_id
+        RETURNING change_seq INTO NEW.change_seq;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS bump_log_entries_change_seq ON log_entries;
+CREATE TRIGGER bump_log_entries_change_seq
+    BEFORE INSERT OR UPDATE OR DELETE ON log_entries
+    FOR EACH ROW EXECUTE FUNCTION bump_family_change_seq();
+
+CREATE OR REPLACE FUNCTION touch_log_entry_from_classification()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE log_entries SET updated_at = NOW() WHERE id = NEW.log_entry_id;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS touch_log_entry_on_classification ON classification_details;
+CREATE TRIGGER touch_log_entry_on_classification
+    AFTER INSERT OR UPDATE ON classification_details
+    FOR EACH ROW EXECUTE FUNCTION touch_log_entry_from_classification();
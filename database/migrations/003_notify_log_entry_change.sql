@@ -0,0 +1,38 @@
+-- リアルタイム配信用: ログの追加・変更を NOTIFY で通知（REALTIME_PG_DSN を設定したバックエンドが LISTEN して配信する）
+CREATE OR REPLACE FUNCTION notify_log_entry_change()
+RETURNS TRIGGER AS $$
+DECLARE
+    detail RECORD;
+    payload TEXT;
+BEGIN
+    SELECT keywords, confidence_score INTO detail
+        FROM classification_details WHERE log_entry_id = NEW.id
+        ORDER BY processed_at DESC LIMIT 1;
+    payload := json_build_object(
+        'family_id', NEW.family_id,
+        'change_seq', NEW.change_seq,
+        'entry', json_build_object(
+            'id', NEW.id,
+            'original_text', NEW.original_text,
+            'category', NEW.category,
+            'summary', NEW.summary,
+            'date', NEW.date,
+            'keywords', COALESCE(detail.keywords, '{}'),
+            'confidence_score', COALESCE(detail.confidence_score, 0),
+            'created_at', NEW.created_at,
+            'change_seq', NEW.change_seq
+        )
+    )::text;
+    -- NOTIFY のペイロードは8000バイトまで。超える場合は変更番号だけを送り、クライアントに差分を取らせる
+    IF octet_length(payload) > 7900 THEN
+        payload := json_build_object('family_id', NEW.family_id, 'change_seq', NEW.change_seq)::text;
+    END IF;
+    PERFORM pg_notify('kazokulog_log_entries', payload);
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS notify_log_entries_change ON log_entries;
+CREATE TRIGGER notify_log_entries_change
+    AFTER INSERT OR UPDATE ON log_entries
+    FOR EACH ROW EXECUTE FUNCTION notify_log_entry_change();
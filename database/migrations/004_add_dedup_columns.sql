@@ -0,0 +1,8 @@
+-- 重複投稿の検出用に SimHash と Idempotency-Key を追加
+ALTER TABLE log_entries ADD COLUMN IF NOT EXISTS simhash BIGINT;
+ALTER TABLE log_entries ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(255);
+-- 家族の直近のエントリを新しい順に読む（重複の検出範囲）
+CREATE INDEX IF NOT EXISTS idx_log_entries_family_created_at ON log_entries(family_id, created_at DESC);
+-- 同じキーの同時投稿はデータベースで1件に絞る
+CREATE UNIQUE INDEX IF NOT EXISTS idx_log_entries_family_idempotency_key ON log_entries(family_id, idempotency_key)
+    WHERE idempotency_key IS NOT NULL;
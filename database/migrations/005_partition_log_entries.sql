@@ -0,0 +1,245 @@
+-- log_entries / classification_details をエントリ日付の月ごとのパーティションに移行し、アーカイブ用のテーブルと関数を追加
+-- 一度だけ実行する（移行済みなら最初のチェックで中断する）。行をコピーするため、書き込みを止めてから実行すること
+BEGIN;
+
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'log_entries'::regclass) = 'p' THEN
+        RAISE EXCEPTION 'log_entries is already partitioned';
+    END IF;
+END $$;
+
+-- 既存のテーブルは名前を変えて残し、コピー後に削除する
+ALTER TABLE classification_details RENAME TO classification_details_unpartitioned;
+ALTER INDEX classification_details_pkey RENAME TO classification_details_unpartitioned_pkey;
+ALTER TABLE log_entries RENAME TO log_entries_unpartitioned;
+ALTER INDEX log_entries_pkey RENAME TO log_entries_unpartitioned_pkey;
+
+CREATE TABLE log_entries (
+    id UUID NOT NULL DEFAULT gen_random_uuid(),
+    family_id UUID REFERENCES families(id),
+    original_text TEXT NOT NULL,
+    category VARCHAR(50) NOT NULL, -- 'schedule', 'emotion', 'shopping', 'todo', 'memo'
+    summary TEXT,
+    date DATE NOT NULL,
+    change_seq BIGINT NOT NULL DEFAULT 0, -- 最後に変更されたときの families.change_seq（差分同期用）
+    simhash BIGINT, -- 本文の SimHash（ほぼ同じ内容の重複投稿の検出用）
+    idempotency_key VARCHAR(255), -- 投稿時の Idempotency-Key ヘッダー
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (id, date) -- パーティションキーを含める必要がある
+) PARTITION BY RANGE (date);
+
+CREATE TABLE classification_details (
+    id UUID NOT NULL DEFAULT gen_random_uuid(),
+    log_entry_id UUID NOT NULL,
+    log_entry_date DATE NOT NULL, -- log_entries.date（パーティションキー）
+    confidence_score FLOAT,
+    keywords TEXT[], -- 抽出されたキーワード
+    ai_reasoning TEXT, -- AI分類の理由
+    prompt_version VARCHAR(50), -- 分類に使ったプロンプト（例: classify@2, rules@1）
+    processed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (id, log_entry_date),
+    FOREIGN KEY (log_entry_id, log_entry_date) REFERENCES log_entries(id, date) ON DELETE CASCADE
+) PARTITION BY RANGE (log_entry_date);
+
+-- アーカイブ済みのログ（1家族×1か月を1行のJSONにまとめて圧縮）
+CREATE TABLE log_entries_archive (
+    family_id UUID NOT NULL REFERENCES families(id) ON DELETE CASCADE,
+    month DATE NOT NULL, -- 月の初日
+    entry_count INTEGER NOT NULL,
+    entries JSONB COMPRESSION lz4 NOT NULL, -- 分類詳細を含むエントリの配列（作成日時順）
+    archived_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (family_id, month)
+);
+
+-- 月ごとのパーティションを作成（start_month から months_ahead か月先まで、既にあれば何もしない）
+-- 範囲外の日付のエントリは既定のパーティション（*_default）に入る
+CREATE OR REPLACE FUNCTION ensure_log_entry_partitions(start_month DATE DEFAULT NULL, months_ahead INTEGER DEFAULT 12)
+RETURNS INTEGER AS $$
+DECLARE
+    month_start DATE := date_trunc('month', COALESCE(start_month, CURRENT_DATE - INTERVAL '1 month'))::date;
+    last_month DATE := (date_trunc('month', CURRENT_DATE) + make_interval(months => months_ahead))::date;
+    month_end DATE;
+    suffix TEXT;
+    created INTEGER := 0;
+BEGIN
+    WHILE month_start <= last_month LOOP
+        month_end := (month_start + INTERVAL '1 month')::date;
+        suffix := to_char(month_start, 'YYYY_MM');
+        IF to_regclass('log_entries_' || suffix) IS NULL THEN
+            -- 既定のパーティションに同じ月の行があると作成できないため、その月は飛ばす
+            IF EXISTS (SELECT 1 FROM log_entries_default WHERE date >= month_start AND date < month_end) THEN
+                RAISE NOTICE 'log_entries_default has rows for %, skipping partition', suffix;
+            ELSE
+                EXECUTE format('CREATE TABLE %I PARTITION OF log_entries FOR VALUES FROM (%L) TO (%L)',
+                               'log_entries_' || suffix, month_start, month_end);
+                EXECUTE format('CREATE TABLE %I PARTITION OF classification_details FOR VALUES FROM (%L) TO (%L)',
+                               'classification_details_' || suffix, month_start, month_end);
+                created := created + 1;
+            END IF;
+        END IF;
+        month_start := month_end;
+    END LOOP;
+    RETURN created;
+END;
+$$ language 'plpgsql';
+
+-- cutoff より前の月のエントリを log_entries_archive に移し、その月のパーティションを削除する
+-- 移した家族×月の数を返す（同じ月に後から追加されたエントリは既存の行に追記する）
+CREATE OR REPLACE FUNCTION archive_log_entries(cutoff DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    part RECORD;
+    archived INTEGER;
+BEGIN
+    cutoff := date_trunc('month', cutoff)::date;
+
+    INSERT INTO log_entries_archive (family_id, month, entry_count, entries)
+    SELECT e.family_id, date_trunc('month', e.date)::date, count(*),
+           jsonb_agg(jsonb_build_object(
+               'id', e.id,
+               'original_text', e.original_text,
+               'category', e.category,
+               'summary', e.summary,
+               'date', e.date,
+               'keywords', COALESCE(d.keywords, '{}'),
+               'confidence_score', COALESCE(d.confidence_score, 0),
+               'prompt_version', d.prompt_version,
+               'created_at', e.created_at,
+               'change_seq', e.change_seq
+           ) ORDER BY e.created_at)
+    FROM log_entries e
+    LEFT JOIN LATERAL (
+        SELECT keywords, confidence_score, prompt_version FROM classification_details
+        WHERE log_entry_id = e.id AND log_entry_date = e.date
+        ORDER BY processed_at DESC LIMIT 1
+    ) d ON true
+    -- 家族のないエントリはどこからも参照できないため、アーカイブせずに削除する
+    WHERE e.date < cutoff AND e.family_id IS NOT NULL
+    GROUP BY e.family_id, date_trunc('month', e.date)
+    ON CONFLICT (family_id, month) DO UPDATE
+        SET entries = log_entries_archive.entries || EXCLUDED.entries,
+            entry_count = log_entries_archive.entry_count + EXCLUDED.entry_count,
+            archived_at = NOW();
+    GET DIAGNOSTICS archived = ROW_COUNT;
+
+    -- 移した月のパーティションは DELETE せずに外して削除する（テーブルが膨らまず、VACUUM も不要）
+    FOR part IN
+        SELECT c.relname, p.relname AS parent FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname IN ('classification_details', 'log_entries')
+          AND c.relname ~ '_\d{4}_\d{2}$'
+          AND to_date(right(c.relname, 7), 'YYYY_MM') < cutoff
+        -- 参照する側（分類詳細）を先に削除する
+        ORDER BY p.relname = 'log_entries', c.relname
+    LOOP
+        EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', part.parent, part.relname);
+        EXECUTE format('DROP TABLE %I', part.relname);
+    END LOOP;
+
+    -- 既定のパーティションに入っていた古い日付のエントリ
+    DELETE FROM classification_details_default WHERE log_entry_date < cutoff;
+    DELETE FROM log_entries_default WHERE date < cutoff;
+    RETURN archived;
+END;
+$$ language 'plpgsql';
+
+CREATE TABLE log_entries_default PARTITION OF log_entries DEFAULT;
+CREATE TABLE classification_details_default PARTITION OF classification_details DEFAULT;
+SELECT ensure_log_entry_partitions((SELECT min(date) FROM log_entries_unpartitioned));
+
+-- トリガーを付ける前にコピーするので、変更番号・更新時刻はそのまま移る
+INSERT INTO log_entries (id, family_id, original_text, category, summary, date, change_seq, simhash,
+                         idempotency_key, created_at, updated_at)
+SELECT id, family_id, original_text, category, summary, date, change_seq, simhash,
+       idempotency_key, created_at, updated_at
+FROM log_entries_unpartitioned;
+
+INSERT INTO classification_details (id, log_entry_id, log_entry_date, confidence_score, keywords, ai_reasoning,
+                                    prompt_version, processed_at)
+SELECT d.id, d.log_entry_id, e.date, d.confidence_score, d.keywords, d.ai_reasoning, d.prompt_version, d.processed_at
+FROM classification_details_unpartitioned d
+JOIN log_entries_unpartitioned e ON e.id = d.log_entry_id;
+
+-- 旧テーブルのインデックス・トリガー・ポリシーも一緒に削除される
+DROP TABLE classification_details_unpartitioned;
+DROP TABLE log_entries_unpartitioned;
+
+CREATE INDEX idx_log_entries_family_id ON log_entries(family_id);
+CREATE INDEX idx_log_entries_date ON log_entries(date);
+CREATE INDEX idx_log_entries_category ON log_entries(category);
+CREATE INDEX idx_log_entries_family_change_seq ON log_entries(family_id, change_seq);
+CREATE INDEX idx_log_entries_created_at ON log_entries(created_at);
+CREATE INDEX idx_log_entries_family_created_at ON log_entries(family_id, created_at DESC);
+-- パーティションキー（date）を含める必要がある。再送は同じ日付で届くため重複の防止には十分
+CREATE UNIQUE INDEX idx_log_entries_family_idempotency_key ON log_entries(family_id, idempotency_key, date)
+    WHERE idempotency_key IS NOT NULL;
+CREATE INDEX idx_classification_details_log_entry ON classification_details(log_entry_id, log_entry_date);
+
+CREATE OR REPLACE FUNCTION touch_log_entry_from_classification()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE log_entries SET updated_at = NOW() WHERE id = NEW.log_entry_id AND date = NEW.log_entry_date;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE FUNCTION notify_log_entry_change()
+RETURNS TRIGGER AS $$
+DECLARE
+    detail RECORD;
+    payload TEXT;
+BEGIN
+    SELECT keywords, confidence_score INTO detail
+        FROM classification_details WHERE log_entry_id = NEW.id AND log_entry_date = NEW.date
+        ORDER BY processed_at DESC LIMIT 1;
+    payload := json_build_object(
+        'family_id', NEW.family_id,
+        'change_seq', NEW.change_seq,
+        'entry', json_build_object(
+            'id', NEW.id,
+            'original_text', NEW.original_text,
+            'category', NEW.category,
+            'summary', NEW.summary,
+            'date', NEW.date,
+            'keywords', COALESCE(detail.keywords, '{}'),
+            'confidence_score', COALESCE(detail.confidence_score, 0),
+            'created_at', NEW.created_at,
+            'change_seq', NEW.change_seq
+        )
+    )::text;
+    -- NOTIFY のペイロードは8000バイトまで。超える場合は変更番号だけを送り、クライアントに差分を取らせる
+    IF octet_length(payload) > 7900 THEN
+        payload := json_build_object('family_id', NEW.family_id, 'change_seq', NEW.change_seq)::text;
+    END IF;
+    PERFORM pg_notify('kazokulog_log_entries', payload);
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER update_log_entries_updated_at
+    BEFORE UPDATE ON log_entries
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+CREATE TRIGGER bump_log_entries_change_seq
+    BEFORE INSERT OR UPDATE OR DELETE ON log_entries
+    FOR EACH ROW EXECUTE FUNCTION bump_family_change_seq();
+
+CREATE TRIGGER touch_log_entry_on_classification
+    AFTER INSERT OR UPDATE ON classification_details
+    FOR EACH ROW EXECUTE FUNCTION touch_log_entry_from_classification();
+
+CREATE TRIGGER notify_log_entries_change
+    AFTER INSERT OR UPDATE ON log_entries
+    FOR EACH ROW EXECUTE FUNCTION notify_log_entry_change();
+
+ALTER TABLE log_entries ENABLE ROW LEVEL SECURITY;
+ALTER TABLE classification_details ENABLE ROW LEVEL SECURITY;
+ALTER TABLE log_entries_archive ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "Allow all access" ON log_entries FOR ALL USING (true);
+CREATE POLICY "Allow all access" ON classification_details FOR ALL USING (true);
+CREATE POLICY "Allow all access" ON log_entries_archive FOR ALL USING (true);
+
+COMMIT;
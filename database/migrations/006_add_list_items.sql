@@ -0,0 +1,75 @@
+-- 買い物リスト・ToDoリスト（shopping_items / todo_items）を追加
+-- 既存のログからは作らない（過去の買い物は済んでいることが多いため）。適用後に保存したエントリから載る
+-- 未完了の同じ品目（normalized_name）は1行にまとめ、mention_count を増やす
+-- log_entry_id / log_entry_date は最後に言及したエントリ（アーカイブでパーティションごと消えるため外部キーにしない）
+CREATE TABLE IF NOT EXISTS shopping_items (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    family_id UUID NOT NULL REFERENCES families(id) ON DELETE CASCADE,
+    name TEXT NOT NULL, -- 品目（例: 卵）
+    normalized_name TEXT NOT NULL, -- 同じ品目をまとめるためのキー（全角・半角、カタカナ・ひらがなの違いを無視）
+    done BOOLEAN NOT NULL DEFAULT FALSE,
+    mention_count INTEGER NOT NULL DEFAULT 1,
+    log_entry_id UUID,
+    log_entry_date DATE,
+    done_at TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS todo_items (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    family_id UUID NOT NULL REFERENCES families(id) ON DELETE CASCADE,
+    name TEXT NOT NULL, -- やること（例: 保育園の申請）
+    normalized_name TEXT NOT NULL,
+    done BOOLEAN NOT NULL DEFAULT FALSE,
+    mention_count INTEGER NOT NULL DEFAULT 1,
+    log_entry_id UUID,
+    log_entry_date DATE,
+    done_at TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- 項目をリストに載せる（p_table: shopping_items / todo_items、p_items: [{name, normalized_name, log_entry_id, log_entry_date}]）
+-- 未完了の同じ品目があれば言及回数を増やしてまとめる。載せた・まとめた行の id と mention_count を返す
+CREATE OR REPLACE FUNCTION add_list_items(p_table TEXT, p_family_id UUID, p_items JSONB)
+RETURNS TABLE (id UUID, mention_count INTEGER) AS $$
+BEGIN
+    IF p_table NOT IN ('shopping_items', 'todo_items') THEN
+        RAISE EXCEPTION 'unknown list table: %', p_table;
+    END IF;
+    RETURN QUERY EXECUTE format(
+        'INSERT INTO %1$I AS t (family_id, name, normalized_name, log_entry_id, log_entry_date)
+         SELECT $1, i->>''name'', i->>''normalized_name'', (i->>''log_entry_id'')::uuid, (i->>''log_entry_date'')::date
+         FROM jsonb_array_elements($2) AS i
+         ON CONFLICT (family_id, normalized_name) WHERE NOT done DO UPDATE
+             SET mention_count = t.mention_count + 1,
+                 log_entry_id = EXCLUDED.log_entry_id,
+                 log_entry_date = EXCLUDED.log_entry_date,
+                 updated_at = NOW()
+         RETURNING t.id, t.mention_count', p_table)
+    USING p_family_id, p_items;
+END;
+$$ language 'plpgsql';
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_shopping_items_open ON shopping_items(family_id, normalized_name) WHERE NOT done;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_todo_items_open ON todo_items(family_id, normalized_name) WHERE NOT done;
+CREATE INDEX IF NOT EXISTS idx_shopping_items_family_created_at ON shopping_items(family_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_todo_items_family_created_at ON todo_items(family_id, created_at);
+
+DROP TRIGGER IF EXISTS update_shopping_items_updated_at ON shopping_items;
+CREATE TRIGGER update_shopping_items_updated_at
+    BEFORE UPDATE ON shopping_items
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+DROP TRIGGER IF EXISTS update_todo_items_updated_at ON todo_items;
+CREATE TRIGGER update_todo_items_updated_at
+    BEFORE UPDATE ON todo_items
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+ALTER TABLE shopping_items ENABLE ROW LEVEL SECURITY;
+ALTER TABLE todo_items ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Allow all access" ON shopping_items;
+CREATE POLICY "Allow all access" ON shopping_items FOR ALL USING (true);
+DROP POLICY IF EXISTS "Allow all access" ON todo_items;
+CREATE POLICY "Allow all access" ON todo_items FOR ALL USING (true);
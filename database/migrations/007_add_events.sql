@@ -0,0 +1,20 @@
+-- 予定の日時（events）を追加
+-- 既存のログからは作らない。適用後に保存した予定のエントリから載る
+CREATE TABLE IF NOT EXISTS events (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    family_id UUID NOT NULL REFERENCES families(id) ON DELETE CASCADE,
+    log_entry_id UUID, -- 元のエントリ（アーカイブでパーティションごと消えるため外部キーにしない）
+    log_entry_date DATE,
+    title TEXT NOT NULL,
+    event_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    all_day BOOLEAN NOT NULL DEFAULT FALSE, -- 時刻のない予定（event_at はその日の0時）
+    extracted_by VARCHAR(50), -- 日時を読み取った方法（例: rules@1, event@1）
+    original_text TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_events_family_event_at ON events(family_id, event_at);
+
+ALTER TABLE events ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Allow all access" ON events;
+CREATE POLICY "Allow all access" ON events FOR ALL USING (true);
@@ -0,0 +1,57 @@
+-- AIチャットの会話（chat_sessions）と発言（chat_turns）を追加
+-- 既存の会話はない（これまでの会話はブラウザにだけあった）
+CREATE TABLE IF NOT EXISTS chat_sessions (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    family_id UUID NOT NULL REFERENCES families(id) ON DELETE CASCADE,
+    summary TEXT NOT NULL DEFAULT '',
+    summarized_seq INTEGER NOT NULL DEFAULT 0, -- 要約に畳み込んだ最後の発言の番号
+    turn_count INTEGER NOT NULL DEFAULT 0, -- 発言の数（次の発言の番号を振るのに使う）
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS chat_turns (
+    session_id UUID NOT NULL REFERENCES chat_sessions(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    family_id UUID NOT NULL REFERENCES families(id) ON DELETE CASCADE,
+    role VARCHAR(20) NOT NULL CHECK (role IN ('user', 'assistant')),
+    content TEXT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (session_id, seq)
+);
+
+-- 会話に発言を追加する（p_turns: [{role, content}]）。turn_count を進めて番号を振り、追加した発言の番号を返す
+-- 同じ会話への同時の追加は chat_sessions の行ロックで直列になる
+CREATE OR REPLACE FUNCTION add_chat_turns(p_session_id UUID, p_turns JSONB)
+RETURNS TABLE (turn_seq INTEGER) AS $$
+DECLARE
+    v_family_id UUID;
+    v_last_seq INTEGER;
+BEGIN
+    UPDATE chat_sessions SET turn_count = turn_count + jsonb_array_length(p_turns)
+    WHERE id = p_session_id
+    RETURNING family_id, turn_count - jsonb_array_length(p_turns) INTO v_family_id, v_last_seq;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'unknown chat session: %', p_session_id;
+    END IF;
+    RETURN QUERY
+    INSERT INTO chat_turns (session_id, seq, family_id, role, content)
+    SELECT p_session_id, v_last_seq + t.ordinality::INTEGER, v_family_id, t.value->>'role', t.value->>'content'
+    FROM jsonb_array_elements(p_turns) WITH ORDINALITY AS t(value, ordinality)
+    RETURNING chat_turns.seq;
+END;
+$$ language 'plpgsql';
+
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_family_id ON chat_sessions(family_id);
+
+DROP TRIGGER IF EXISTS update_chat_sessions_updated_at ON chat_sessions;
+CREATE TRIGGER update_chat_sessions_updated_at
+    BEFORE UPDATE ON chat_sessions
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+ALTER TABLE chat_sessions ENABLE ROW LEVEL SECURITY;
+ALTER TABLE chat_turns ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Allow all access" ON chat_sessions;
+CREATE POLICY "Allow all access" ON chat_sessions FOR ALL USING (true);
+DROP POLICY IF EXISTS "Allow all access" ON chat_turns;
+CREATE POLICY "Allow all access" ON chat_turns FOR ALL USING (true);
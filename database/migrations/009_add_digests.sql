@@ -0,0 +1,18 @@
+-- 1日のまとめ（digests）を追加
+-- 夜間のバッチ（python -m app.digest / POST /api/admin/digests）を実行すると前日の分から作られる
+CREATE TABLE IF NOT EXISTS digests (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    family_id UUID NOT NULL REFERENCES families(id) ON DELETE CASCADE,
+    digest_date DATE NOT NULL, -- まとめた日（提案はその翌日向け）
+    summary TEXT NOT NULL,
+    suggestions JSONB NOT NULL DEFAULT '[]',
+    entry_count INTEGER NOT NULL,
+    source_hash VARCHAR(16) NOT NULL, -- まとめの元にしたログのIDのハッシュ（同じなら作り直さない）
+    generated_by VARCHAR(50) NOT NULL, -- 作った方法（例: digest@1, rules@1）
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    UNIQUE (family_id, digest_date)
+);
+
+ALTER TABLE digests ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Allow all access" ON digests;
+CREATE POLICY "Allow all access" ON digests FOR ALL USING (true);
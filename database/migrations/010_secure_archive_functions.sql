@@ -0,0 +1,15 @@
+-- アーカイブ用の関数（005）をテーブルの所有者の権限で動かし、service_role 以外から呼べないようにする
+-- 呼び出し元の権限のままでは DETACH PARTITION / DROP TABLE / CREATE TABLE … PARTITION OF が
+-- "must be owner" で失敗し、anon に権限を与えると公開されている anon のキーでパーティションを消せてしまうため
+-- アーカイブは SUPABASE_SERVICE_ROLE_KEY を設定した python -m app.archive から実行する
+BEGIN;
+
+ALTER FUNCTION ensure_log_entry_partitions(DATE, INTEGER) SECURITY DEFINER SET search_path = public, pg_temp;
+ALTER FUNCTION archive_log_entries(DATE) SECURITY DEFINER SET search_path = public, pg_temp;
+
+REVOKE EXECUTE ON FUNCTION ensure_log_entry_partitions(DATE, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION archive_log_entries(DATE) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION ensure_log_entry_partitions(DATE, INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION archive_log_entries(DATE) TO service_role;
+
+COMMIT;
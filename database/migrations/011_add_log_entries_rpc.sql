@@ -0,0 +1,48 @@
+-- ログエントリと分類詳細を1回の呼び出し（1つのトランザクション）で追加する add_log_entries を追加
+-- 別々に INSERT すると、分類詳細のトリガーがエントリを更新して change_seq をもう一度進め、NOTIFY も2回飛ぶ
+-- （POST の応答の change_seq が古くなり、ダッシュボードが同じエントリを2回取り直す）
+BEGIN;
+
+-- 分類詳細の追加・更新もログの変更として扱う（一覧にキーワードと信頼度が含まれるため）
+-- add_log_entries が追加したばかりのエントリに付けるときは、エントリ自体の変更番号と通知に含まれるので触らない
+CREATE OR REPLACE FUNCTION touch_log_entry_from_classification()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF current_setting('kazokulog.skip_log_entry_touch', true) = 'on' THEN
+        RETURN NEW;
+    END IF;
+    UPDATE log_entries SET updated_at = NOW() WHERE id = NEW.log_entry_id AND date = NEW.log_entry_date;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+-- 追加したエントリの id・created_at・change_seq を返す
+-- p_entries: [{id, original_text, category, summary, date, simhash, idempotency_key}]
+-- p_details: [{log_entry_id, log_entry_date, confidence_score, keywords, ai_reasoning, prompt_version}]
+CREATE OR REPLACE FUNCTION add_log_entries(p_family_id UUID, p_entries JSONB, p_details JSONB DEFAULT '[]')
+RETURNS TABLE (id UUID, created_at TIMESTAMP WITH TIME ZONE, change_seq BIGINT) AS $$
+BEGIN
+    RETURN QUERY
+    INSERT INTO log_entries AS l (id, family_id, original_text, category, summary, date, simhash, idempotency_key)
+    SELECT (e->>'id')::uuid, p_family_id, e->>'original_text', e->>'category', e->>'summary',
+           (e->>'date')::date, (e->>'simhash')::bigint, e->>'idempotency_key'
+    FROM jsonb_array_elements(p_entries) AS e
+    RETURNING l.id, l.created_at, l.change_seq;
+
+    PERFORM set_config('kazokulog.skip_log_entry_touch', 'on', true);
+    INSERT INTO classification_details (log_entry_id, log_entry_date, confidence_score, keywords, ai_reasoning, prompt_version)
+    SELECT (d->>'log_entry_id')::uuid, (d->>'log_entry_date')::date, (d->>'confidence_score')::float,
+           ARRAY(SELECT jsonb_array_elements_text(d->'keywords')), d->>'ai_reasoning', d->>'prompt_version'
+    FROM jsonb_array_elements(p_details) AS d;
+    PERFORM set_config('kazokulog.skip_log_entry_touch', 'off', true);
+END;
+$$ language 'plpgsql';
+
+-- 通知はコミット時に送る（同じトランザクションで追加した分類詳細のキーワードと信頼度をペイロードに含めるため）
+DROP TRIGGER IF EXISTS notify_log_entries_change ON log_entries;
+CREATE CONSTRAINT TRIGGER notify_log_entries_change
+    AFTER INSERT OR UPDATE ON log_entries
+    DEFERRABLE INITIALLY DEFERRED
+    FOR EACH ROW EXECUTE FUNCTION notify_log_entry_change();
+
+COMMIT;
@@ -0,0 +1,28 @@
+-- /api/logs/extract のメモ単位の重複の検出用に、メモ全体の SimHash（note_simhash）を追加
+-- 1つのメモから作った項目には同じ値が入る（/api/logs で保存したエントリは NULL）
+BEGIN;
+
+ALTER TABLE log_entries ADD COLUMN IF NOT EXISTS note_simhash BIGINT;
+
+-- p_entries の各項目に note_simhash を受け取る
+CREATE OR REPLACE FUNCTION add_log_entries(p_family_id UUID, p_entries JSONB, p_details JSONB DEFAULT '[]')
+RETURNS TABLE (id UUID, created_at TIMESTAMP WITH TIME ZONE, change_seq BIGINT) AS $$
+BEGIN
+    RETURN QUERY
+    INSERT INTO log_entries AS l (id, family_id, original_text, category, summary, date, simhash, note_simhash,
+                                  idempotency_key)
+    SELECT (e->>'id')::uuid, p_family_id, e->>'original_text', e->>'category', e->>'summary',
+           (e->>'date')::date, (e->>'simhash')::bigint, (e->>'note_simhash')::bigint, e->>'idempotency_key'
+    FROM jsonb_array_elements(p_entries) AS e
+    RETURNING l.id, l.created_at, l.change_seq;
+
+    PERFORM set_config('kazokulog.skip_log_entry_touch', 'on', true);
+    INSERT INTO classification_details (log_entry_id, log_entry_date, confidence_score, keywords, ai_reasoning, prompt_version)
+    SELECT (d->>'log_entry_id')::uuid, (d->>'log_entry_date')::date, (d->>'confidence_score')::float,
+           ARRAY(SELECT jsonb_array_elements_text(d->'keywords')), d->>'ai_reasoning', d->>'prompt_version'
+    FROM jsonb_array_elements(p_details) AS d;
+    PERFORM set_config('kazokulog.skip_log_entry_touch', 'off', true);
+END;
+$$ language 'plpgsql';
+
+COMMIT;
@@ -5,21 +5,28 @@ CREATE TABLE families (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     name VARCHAR(255) NOT NULL,
     access_key VARCHAR(255) UNIQUE NOT NULL, -- URLアクセス用キー
+    change_seq BIGINT NOT NULL DEFAULT 0, -- 家族のデータの変更番号（書き込みのたびに増える）
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
--- ログエントリテーブル
+-- ログエントリテーブル（エントリ日付の月ごとにパーティション分割）
+-- 古い月はアーカイブ処理（archive_log_entries）で log_entries_archive に移し、パーティションごと削除する
 CREATE TABLE log_entries (
-    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    id UUID NOT NULL DEFAULT gen_random_uuid(),
     family_id UUID REFERENCES families(id),
     original_text TEXT NOT NULL,
     category VARCHAR(50) NOT NULL, -- 'schedule', 'emotion', 'shopping', 'todo', 'memo'
     summary TEXT,
     date DATE NOT NULL,
+    change_seq BIGINT NOT NULL DEFAULT 0, -- 最後に変更されたときの families.change_seq（差分同期用）
+    simhash BIGINT, -- 本文の SimHash（ほぼ同じ内容の重複投稿の検出用）
+    note_simhash BIGINT, -- /api/logs/extract で複数の項目に分けたメモ全体の SimHash（メモ単位の重複の検出用）
+    idempotency_key VARCHAR(255), -- 投稿時の Idempotency-Key ヘッダー
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
-);
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (id, date) -- パーティションキーを含める必要がある
+) PARTITION BY RANGE (date);
 
 -- カテゴリマスタテーブル
 CREATE TABLE categories (
@@ -31,21 +38,304 @@ CREATE TABLE categories (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
--- 分類結果詳細テーブル（Claude APIのレスポンス詳細保存用）
+-- 分類結果詳細テーブル（Claude APIのレスポンス詳細保存用、log_entries と同じ月でパーティション分割）
 CREATE TABLE classification_details (
-    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
-    log_entry_id UUID REFERENCES log_entries(id) ON DELETE CASCADE,
+    id UUID NOT NULL DEFAULT gen_random_uuid(),
+    log_entry_id UUID NOT NULL,
+    log_entry_date DATE NOT NULL, -- log_entries.date（パーティションキー）
     confidence_score FLOAT,
     keywords TEXT[], -- 抽出されたキーワード
     ai_reasoning TEXT, -- AI分類の理由
-    processed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    prompt_version VARCHAR(50), -- 分類に使ったプロンプト（例: classify@2, rules@1）
+    processed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (id, log_entry_date),
+    FOREIGN KEY (log_entry_id, log_entry_date) REFERENCES log_entries(id, date) ON DELETE CASCADE
+) PARTITION BY RANGE (log_entry_date);
+
+-- アーカイブ済みのログ（1家族×1か月を1行のJSONにまとめて圧縮）
+CREATE TABLE log_entries_archive (
+    family_id UUID NOT NULL REFERENCES families(id) ON DELETE CASCADE,
+    month DATE NOT NULL, -- 月の初日
+    entry_count INTEGER NOT NULL,
+    entries JSONB COMPRESSION lz4 NOT NULL, -- 分類詳細を含むエントリの配列（作成日時順）
+    archived_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (family_id, month)
 );
 
+-- 買い物リスト・ToDoリスト（エントリの保存時に品目・やることを取り出して追加する。backend/app/items.py）
+-- 未完了の同じ品目（normalized_name）は1行にまとめ、mention_count を増やす
+-- log_entry_id / log_entry_date は最後に言及したエントリ（アーカイブでパーティションごと消えるため外部キーにしない）
+CREATE TABLE shopping_items (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    family_id UUID NOT NULL REFERENCES families(id) ON DELETE CASCADE,
+    name TEXT NOT NULL, -- 品目（例: 卵）
+    normalized_name TEXT NOT NULL, -- 同じ品目をまとめるためのキー（全角・半角、カタカナ・ひらがなの違いを無視）
+    done BOOLEAN NOT NULL DEFAULT FALSE,
+    mention_count INTEGER NOT NULL DEFAULT 1,
+    log_entry_id UUID,
+    log_entry_date DATE,
+    done_at TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE TABLE todo_items (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    family_id UUID NOT NULL REFERENCES families(id) ON DELETE CASCADE,
+    name TEXT NOT NULL, -- やること（例: 保育園の申請）
+    normalized_name TEXT NOT NULL,
+    done BOOLEAN NOT NULL DEFAULT FALSE,
+    mention_count INTEGER NOT NULL DEFAULT 1,
+    log_entry_id UUID,
+    log_entry_date DATE,
+    done_at TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- 予定（予定に分類したエントリから日時を読み取って追加する。backend/app/events.py）
+-- log_entries.date はエントリの日付なので、予定の日時はここに持つ
+CREATE TABLE events (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    family_id UUID NOT NULL REFERENCES families(id) ON DELETE CASCADE,
+    log_entry_id UUID, -- 元のエントリ（アーカイブでパーティションごと消えるため外部キーにしない）
+    log_entry_date DATE,
+    title TEXT NOT NULL,
+    event_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    all_day BOOLEAN NOT NULL DEFAULT FALSE, -- 時刻のない予定（event_at はその日の0時）
+    extracted_by VARCHAR(50), -- 日時を読み取った方法（例: rules@1, event@1）
+    original_text TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- AIチャットの会話（backend/app/chat_memory.py）
+-- 古い発言は summary に要約し、summarized_seq までの発言はプロンプトに入れない
+CREATE TABLE chat_sessions (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    family_id UUID NOT NULL REFERENCES families(id) ON DELETE CASCADE,
+    summary TEXT NOT NULL DEFAULT '',
+    summarized_seq INTEGER NOT NULL DEFAULT 0, -- 要約に畳み込んだ最後の発言の番号
+    turn_count INTEGER NOT NULL DEFAULT 0, -- 発言の数（次の発言の番号を振るのに使う）
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- AIチャットの発言（番号は会話の中で1から順に振る）
+CREATE TABLE chat_turns (
+    session_id UUID NOT NULL REFERENCES chat_sessions(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    family_id UUID NOT NULL REFERENCES families(id) ON DELETE CASCADE,
+    role VARCHAR(20) NOT NULL CHECK (role IN ('user', 'assistant')),
+    content TEXT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (session_id, seq)
+);
+
+-- 1日のまとめと翌日への提案（夜間のバッチ backend/app/digest.py が作り、AI提案の表示ではこれを読む）
+CREATE TABLE digests (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    family_id UUID NOT NULL REFERENCES families(id) ON DELETE CASCADE,
+    digest_date DATE NOT NULL, -- まとめた日（提案はその翌日向け）
+    summary TEXT NOT NULL,
+    suggestions JSONB NOT NULL DEFAULT '[]',
+    entry_count INTEGER NOT NULL,
+    source_hash VARCHAR(16) NOT NULL, -- まとめの元にしたログのIDのハッシュ（同じなら作り直さない）
+    generated_by VARCHAR(50) NOT NULL, -- 作った方法（例: digest@1, rules@1）
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    UNIQUE (family_id, digest_date)
+);
+
+-- ログエントリと分類詳細を1つのトランザクションで追加する。追加したエントリの id・created_at・change_seq を返す
+-- p_entries: [{id, original_text, category, summary, date, simhash, note_simhash, idempotency_key}]
+-- p_details: [{log_entry_id, log_entry_date, confidence_score, keywords, ai_reasoning, prompt_version}]
+-- 分類詳細のトリガーにエントリを触らせない（change_seq と NOTIFY をエントリごとに1回にする）
+CREATE OR REPLACE FUNCTION add_log_entries(p_family_id UUID, p_entries JSONB, p_details JSONB DEFAULT '[]')
+RETURNS TABLE (id UUID, created_at TIMESTAMP WITH TIME ZONE, change_seq BIGINT) AS $$
+BEGIN
+    RETURN QUERY
+    INSERT INTO log_entries AS l (id, family_id, original_text, category, summary, date, simhash, note_simhash,
+                                  idempotency_key)
+    SELECT (e->>'id')::uuid, p_family_id, e->>'original_text', e->>'category', e->>'summary',
+           (e->>'date')::date, (e->>'simhash')::bigint, (e->>'note_simhash')::bigint, e->>'idempotency_key'
+    FROM jsonb_array_elements(p_entries) AS e
+    RETURNING l.id, l.created_at, l.change_seq;
+
+    PERFORM set_config('kazokulog.skip_log_entry_touch', 'on', true);
+    INSERT INTO classification_details (log_entry_id, log_entry_date, confidence_score, keywords, ai_reasoning, prompt_version)
+    SELECT (d->>'log_entry_id')::uuid, (d->>'log_entry_date')::date, (d->>'confidence_score')::float,
+           ARRAY(SELECT jsonb_array_elements_text(d->'keywords')), d->>'ai_reasoning', d->>'prompt_version'
+    FROM jsonb_array_elements(p_details) AS d;
+    PERFORM set_config('kazokulog.skip_log_entry_touch', 'off', true);
+END;
+$$ language 'plpgsql';
+
+-- 項目をリストに載せる（p_table: shopping_items / todo_items、p_items: [{name, normalized_name, log_entry_id, log_entry_date}]）
+-- 未完了の同じ品目があれば言及回数を増やしてまとめる。載せた・まとめた行の id と mention_count を返す
+CREATE OR REPLACE FUNCTION add_list_items(p_table TEXT, p_family_id UUID, p_items JSONB)
+RETURNS TABLE (id UUID, mention_count INTEGER) AS $$
+BEGIN
+    IF p_table NOT IN ('shopping_items', 'todo_items') THEN
+        RAISE EXCEPTION 'unknown list table: %', p_table;
+    END IF;
+    RETURN QUERY EXECUTE format(
+        'INSERT INTO %1$I AS t (family_id, name, normalized_name, log_entry_id, log_entry_date)
+         SELECT $1, i->>''name'', i->>''normalized_name'', (i->>''log_entry_id'')::uuid, (i->>''log_entry_date'')::date
+         FROM jsonb_array_elements($2) AS i
+         ON CONFLICT (family_id, normalized_name) WHERE NOT done DO UPDATE
+             SET mention_count = t.mention_count + 1,
+                 log_entry_id = EXCLUDED.log_entry_id,
+                 log_entry_date = EXCLUDED.log_entry_date,
+                 updated_at = NOW()
+         RETURNING t.id, t.mention_count', p_table)
+    USING p_family_id, p_items;
+END;
+$$ language 'plpgsql';
+
+-- 会話に発言を追加する（p_turns: [{role, content}]）。turn_count を進めて番号を振り、追加した発言の番号を返す
+-- 同じ会話への同時の追加は chat_sessions の行ロックで直列になる
+CREATE OR REPLACE FUNCTION add_chat_turns(p_session_id UUID, p_turns JSONB)
+RETURNS TABLE (turn_seq INTEGER) AS $$
+DECLARE
+    v_family_id UUID;
+    v_last_seq INTEGER;
+BEGIN
+    UPDATE chat_sessions SET turn_count = turn_count + jsonb_array_length(p_turns)
+    WHERE id = p_session_id
+    RETURNING family_id, turn_count - jsonb_array_length(p_turns) INTO v_family_id, v_last_seq;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'unknown chat session: %', p_session_id;
+    END IF;
+    RETURN QUERY
+    INSERT INTO chat_turns (session_id, seq, family_id, role, content)
+    SELECT p_session_id, v_last_seq + t.ordinality::INTEGER, v_family_id, t.value->>'role', t.value->>'content'
+    FROM jsonb_array_elements(p_turns) WITH ORDINALITY AS t(value, ordinality)
+    RETURNING chat_turns.seq;
+END;
+$$ language 'plpgsql';
+
+-- 月ごとのパーティションを作成（start_month から months_ahead か月先まで、既にあれば何もしない）
+-- 範囲外の日付のエントリは既定のパーティション（*_default）に入る
+CREATE OR REPLACE FUNCTION ensure_log_entry_partitions(start_month DATE DEFAULT NULL, months_ahead INTEGER DEFAULT 12)
+RETURNS INTEGER AS $$
+DECLARE
+    month_start DATE := date_trunc('month', COALESCE(start_month, CURRENT_DATE - INTERVAL '1 month'))::date;
+    last_month DATE := (date_trunc('month', CURRENT_DATE) + make_interval(months => months_ahead))::date;
+    month_end DATE;
+    suffix TEXT;
+    created INTEGER := 0;
+BEGIN
+    WHILE month_start <= last_month LOOP
+        month_end := (month_start + INTERVAL '1 month')::date;
+        suffix := to_char(month_start, 'YYYY_MM');
+        IF to_regclass('log_entries_' || suffix) IS NULL THEN
+            -- 既定のパーティションに同じ月の行があると作成できないため、その月は飛ばす
+            IF EXISTS (SELECT 1 FROM log_entries_default WHERE date >= month_start AND date < month_end) THEN
+                RAISE NOTICE 'log_entries_default has rows for %, skipping partition', suffix;
+            ELSE
+                EXECUTE format('CREATE TABLE %I PARTITION OF log_entries FOR VALUES FROM (%L) TO (%L)',
+                               'log_entries_' || suffix, month_start, month_end);
+                EXECUTE format('CREATE TABLE %I PARTITION OF classification_details FOR VALUES FROM (%L) TO (%L)',
+                               'classification_details_' || suffix, month_start, month_end);
+                created := created + 1;
+            END IF;
+        END IF;
+        month_start := month_end;
+    END LOOP;
+    RETURN created;
+END;
+$$ language 'plpgsql' SECURITY DEFINER SET search_path = public, pg_temp;
+
+-- cutoff より前の月のエントリを log_entries_archive に移し、その月のパーティションを削除する
+-- 移した家族×月の数を返す（同じ月に後から追加されたエントリは既存の行に追記する）
+CREATE OR REPLACE FUNCTION archive_log_entries(cutoff DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    part RECORD;
+    archived INTEGER;
+BEGIN
+    cutoff := date_trunc('month', cutoff)::date;
+
+    INSERT INTO log_entries_archive (family_id, month, entry_count, entries)
+    SELECT e.family_id, date_trunc('month', e.date)::date, count(*),
+           jsonb_agg(jsonb_build_object(
+               'id', e.id,
+               'original_text', e.original_text,
+               'category', e.category,
+               'summary', e.summary,
+               'date', e.date,
+               'keywords', COALESCE(d.keywords, '{}'),
+               'confidence_score', COALESCE(d.confidence_score, 0),
+               'prompt_version', d.prompt_version,
+               'created_at', e.created_at,
+               'change_seq', e.change_seq
+           ) ORDER BY e.created_at)
+    FROM log_entries e
+    LEFT JOIN LATERAL (
+        SELECT keywords, confidence_score, prompt_version FROM classification_details
+        WHERE log_entry_id = e.id AND log_entry_date = e.date
+        ORDER BY processed_at DESC LIMIT 1
+    ) d ON true
+    -- 家族のないエントリはどこからも参照できないため、アーカイブせずに削除する
+    WHERE e.date < cutoff AND e.family_id IS NOT NULL
+    GROUP BY e.family_id, date_trunc('month', e.date)
+    ON CONFLICT (family_id, month) DO UPDATE
+        SET entries = log_entries_archive.entries || EXCLUDED.entries,
+            entry_count = log_entries_archive.entry_count + EXCLUDED.entry_count,
+            archived_at = NOW();
+    GET DIAGNOSTICS archived = ROW_COUNT;
+
+    -- 移した月のパーティションは DELETE せずに外して削除する（テーブルが膨らまず、VACUUM も不要）
+    FOR part IN
+        SELECT c.relname, p.relname AS parent FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname IN ('classification_details', 'log_entries')
+          AND c.relname ~ '_\d{4}_\d{2}$'
+          AND to_date(right(c.relname, 7), 'YYYY_MM') < cutoff
+        -- 参照する側（分類詳細）を先に削除する
+        ORDER BY p.relname = 'log_entries', c.relname
+    LOOP
+        EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', part.parent, part.relname);
+        EXECUTE format('DROP TABLE %I', part.relname);
+    END LOOP;
+
+    -- 既定のパーティションに入っていた古い日付のエントリ
+    DELETE FROM classification_details_default WHERE log_entry_date < cutoff;
+    DELETE FROM log_entries_default WHERE date < cutoff;
+    RETURN archived;
+END;
+$$ language 'plpgsql' SECURITY DEFINER SET search_path = public, pg_temp;
+
+-- パーティションの作成・削除はテーブルの所有者にしかできないため、2つの関数は所有者の権限で動かす（SECURITY DEFINER）
+-- 呼べるのはアーカイブのバッチ（service_role のキー）だけにする。anon のキーはブラウザに配られるので呼べてはいけない
+REVOKE EXECUTE ON FUNCTION ensure_log_entry_partitions(DATE, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION archive_log_entries(DATE) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION ensure_log_entry_partitions(DATE, INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION archive_log_entries(DATE) TO service_role;
+
+CREATE TABLE log_entries_default PARTITION OF log_entries DEFAULT;
+CREATE TABLE classification_details_default PARTITION OF classification_details DEFAULT;
+SELECT ensure_log_entry_partitions();
+
 -- インデックス作成
 CREATE INDEX idx_log_entries_family_id ON log_entries(family_id);
 CREATE INDEX idx_log_entries_date ON log_entries(date);
 CREATE INDEX idx_log_entries_category ON log_entries(category);
+CREATE INDEX idx_log_entries_family_change_seq ON log_entries(family_id, change_seq);
 CREATE INDEX idx_log_entries_created_at ON log_entries(created_at);
+CREATE INDEX idx_log_entries_family_created_at ON log_entries(family_id, created_at DESC);
+-- パーティションキー（date）を含める必要がある。再送は同じ日付で届くため重複の防止には十分
+CREATE UNIQUE INDEX idx_log_entries_family_idempotency_key ON log_entries(family_id, idempotency_key, date)
+    WHERE idempotency_key IS NOT NULL;
+CREATE INDEX idx_classification_details_log_entry ON classification_details(log_entry_id, log_entry_date);
+-- 未完了の項目だけの部分インデックス（一覧が完了済みの履歴の件数によらない。同じ品目をまとめるキーも兼ねる）
+CREATE UNIQUE INDEX idx_shopping_items_open ON shopping_items(family_id, normalized_name) WHERE NOT done;
+CREATE UNIQUE INDEX idx_todo_items_open ON todo_items(family_id, normalized_name) WHERE NOT done;
+CREATE INDEX idx_shopping_items_family_created_at ON shopping_items(family_id, created_at);
+CREATE INDEX idx_todo_items_family_created_at ON todo_items(family_id, created_at);
+-- 「今後N日の予定」と iCal の出力は家族ごとの日時の範囲で読む
+CREATE INDEX idx_events_family_event_at ON events(family_id, event_at);
+CREATE INDEX idx_chat_sessions_family_id ON chat_sessions(family_id);
 
 -- 初期データ挿入
 INSERT INTO categories (name, display_name, color, icon) VALUES
@@ -72,13 +362,114 @@ CREATE TRIGGER update_log_entries_updated_at
     BEFORE UPDATE ON log_entries 
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
+CREATE TRIGGER update_shopping_items_updated_at
+    BEFORE UPDATE ON shopping_items
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+CREATE TRIGGER update_todo_items_updated_at
+    BEFORE UPDATE ON todo_items
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+CREATE TRIGGER update_chat_sessions_updated_at
+    BEFORE UPDATE ON chat_sessions
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+-- 変更番号の更新トリガー（ログの追加・更新・削除のたびに家族の change_seq を進め、行に記録する）
+CREATE OR REPLACE FUNCTION bump_family_change_seq()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        UPDATE families SET change_seq = change_seq + 1 WHERE id = OLD.family_id;
+        RETURN OLD;
+    END IF;
+    UPDATE families SET change_seq = change_seq + 1 WHERE id = NEW.family_id
+        RETURNING change_seq INTO NEW.change_seq;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER bump_log_entries_change_seq
+    BEFORE INSERT OR UPDATE OR DELETE ON log_entries
+    FOR EACH ROW EXECUTE FUNCTION bump_family_change_seq();
+
+-- 分類詳細の追加・更新もログの変更として扱う（一覧にキーワードと信頼度が含まれるため）
+-- add_log_entries が追加したばかりのエントリに付けるときは、エントリ自体の変更番号と通知に含まれるので触らない
+CREATE OR REPLACE FUNCTION touch_log_entry_from_classification()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF current_setting('kazokulog.skip_log_entry_touch', true) = 'on' THEN
+        RETURN NEW;
+    END IF;
+    UPDATE log_entries SET updated_at = NOW() WHERE id = NEW.log_entry_id AND date = NEW.log_entry_date;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER touch_log_entry_on_classification
+    AFTER INSERT OR UPDATE ON classification_details
+    FOR EACH ROW EXECUTE FUNCTION touch_log_entry_from_classification();
+
+-- ログの追加・変更を NOTIFY で通知（REALTIME_PG_DSN を設定したバックエンドが LISTEN して配信する）
+CREATE OR REPLACE FUNCTION notify_log_entry_change()
+RETURNS TRIGGER AS $$
+DECLARE
+    detail RECORD;
+    payload TEXT;
+BEGIN
+    SELECT keywords, confidence_score INTO detail
+        FROM classification_details WHERE log_entry_id = NEW.id AND log_entry_date = NEW.date
+        ORDER BY processed_at DESC LIMIT 1;
+    payload := json_build_object(
+        'family_id', NEW.family_id,
+        'change_seq', NEW.change_seq,
+        'entry', json_build_object(
+            'id', NEW.id,
+            'original_text', NEW.original_text,
+            'category', NEW.category,
+            'summary', NEW.summary,
+            'date', NEW.date,
+            'keywords', COALESCE(detail.keywords, '{}'),
+            'confidence_score', COALESCE(detail.confidence_score, 0),
+            'created_at', NEW.created_at,
+            'change_seq', NEW.change_seq
+        )
+    )::text;
+    -- NOTIFY のペイロードは8000バイトまで。超える場合は変更番号だけを送り、クライアントに差分を取らせる
+    IF octet_length(payload) > 7900 THEN
+        payload := json_build_object('family_id', NEW.family_id, 'change_seq', NEW.change_seq)::text;
+    END IF;
+    PERFORM pg_notify('kazokulog_log_entries', payload);
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+-- コミット時に送る（同じトランザクションで追加した分類詳細のキーワードと信頼度をペイロードに含めるため）
+CREATE CONSTRAINT TRIGGER notify_log_entries_change
+    AFTER INSERT OR UPDATE ON log_entries
+    DEFERRABLE INITIALLY DEFERRED
+    FOR EACH ROW EXECUTE FUNCTION notify_log_entry_change();
+
 -- RLS (Row Level Security) 設定（将来的な認証対応）
 ALTER TABLE families ENABLE ROW LEVEL SECURITY;
 ALTER TABLE log_entries ENABLE ROW LEVEL SECURITY;
 ALTER TABLE classification_details ENABLE ROW LEVEL SECURITY;
+ALTER TABLE log_entries_archive ENABLE ROW LEVEL SECURITY;
+ALTER TABLE shopping_items ENABLE ROW LEVEL SECURITY;
+ALTER TABLE todo_items ENABLE ROW LEVEL SECURITY;
+ALTER TABLE events ENABLE ROW LEVEL SECURITY;
+ALTER TABLE chat_sessions ENABLE ROW LEVEL SECURITY;
+ALTER TABLE chat_turns ENABLE ROW LEVEL SECURITY;
+ALTER TABLE digests ENABLE ROW LEVEL SECURITY;
 
 -- 一時的なアクセス許可ポリシー（認証なし）
 CREATE POLICY "Allow all access" ON families FOR ALL USING (true);
 CREATE POLICY "Allow all access" ON log_entries FOR ALL USING (true);
 CREATE POLICY "Allow all access" ON classification_details FOR ALL USING (true);
+CREATE POLICY "Allow all access" ON log_entries_archive FOR ALL USING (true);
+CREATE POLICY "Allow all access" ON shopping_items FOR ALL USING (true);
+CREATE POLICY "Allow all access" ON todo_items FOR ALL USING (true);
+CREATE POLICY "Allow all access" ON events FOR ALL USING (true);
+CREATE POLICY "Allow all access" ON chat_sessions FOR ALL USING (true);
+CREATE POLICY "Allow all access" ON chat_turns FOR ALL USING (true);
+CREATE POLICY "Allow all access" ON digests FOR ALL USING (true);
 CREATE POLICY "Allow all access" ON categories FOR ALL USING (true);
\ No newline at end of file
@@ -1,6 +1,6 @@
 "use client";
 
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { format } from 'date-fns';
 import { ja } from 'date-fns/locale';
 import FamilySettings from '@/components/FamilySettings';
@@ -44,6 +44,8 @@ const KazokuLogApp: React.FC = () => {
   const [selectedDate, setSelectedDate] = useState<string>(format(new Date(), 'yyyy-MM-dd'));
   const [selectedCategory, setSelectedCategory] = useState<string>('all');
   const [isLoading, setIsLoading] = useState(false);
+  // 保存に失敗した同じ本文を再送するときは同じキーを使い、サーバー側で二重保存を防ぐ
+  const idempotencyKeyRef = useRef<{ text: string; key: string } | null>(null);
   const [error, setError] = useState<string | null>(null);
   const [isRecording, setIsRecording] = useState(false);
   const [familyMembers, setFamilyMembers] = useState<FamilyMember[]>([]);
@@ -76,6 +78,27 @@ const KazokuLogApp: React.FC = () => {
     };
   }, [recognition]);
 
+  // 他の家族メンバーが記録したログをリアルタイムで反映
+  useEffect(() => {
+    if (!familyAccessKey) return;
+
+    const source = new EventSource(`${API_BASE_URL}/api/logs/${familyAccessKey}/events`);
+    source.addEventListener('log_entry', (event) => {
+      const { entry } = JSON.parse((event as MessageEvent).data);
+      if (!entry) {
+        // 本文が大きすぎて変更番号だけが届いた場合は取り直す
+        loadLogEntries(familyAccessKey);
+        return;
+      }
+      if (entry.date !== selectedDate) return;
+      setLogEntries(prev => [entry, ...prev.filter(e => e.id !== entry.id)]);
+    });
+    // 配信が追いつかずに切断された場合は一覧を取り直す（EventSource は自動で再接続する）
+    source.addEventListener('resync', () => loadLogEntries(familyAccessKey));
+
+    return () => source.close();
+  }, [familyAccessKey, selectedDate]);
+
   const loadCategories = async () => {
     try {
       const response = await fetch(`${API_BASE_URL}/api/categories`);
@@ -124,10 +147,16 @@ const KazokuLogApp: React.FC = () => {
       setIsLoading(true);
       setError(null);
       
-      const response = await fetch(`${API_BASE_URL}/api/logs`, {
+      if (idempotencyKeyRef.current?.text !== inputText) {
+        idempotencyKeyRef.current = { text: inputText, key: crypto.randomUUID() };
+      }
+      
+      // 予定・買い物などが混在するメモは複数のエントリに分けて保存される
+      const response = await fetch(`${API_BASE_URL}/api/logs/extract`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          'Idempotency-Key': idempotencyKeyRef.current.key,
         },
         body: JSON.stringify({
           text: inputText,
@@ -137,9 +166,12 @@ const KazokuLogApp: React.FC = () => {
       });
 
       if (response.ok) {
-        const newEntry = await response.json();
-        setLogEntries([newEntry, ...logEntries]);
+        const newEntries: LogEntry[] = await response.json();
+        const newIds = new Set(newEntries.map(entry => entry.id));
+        // 一覧は新しい順。リアルタイム配信で先に届いている場合もあるので、同じIDは置き換える
+        setLogEntries(prev => [...[...newEntries].reverse(), ...prev.filter(entry => !newIds.has(entry.id))]);
         setInputText('');
+        idempotencyKeyRef.current = null;
         localStorage.setItem('familyAccessKey', familyAccessKey);
       } else {
         setError('ログの保存に失敗しました');
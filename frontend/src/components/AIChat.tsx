@@ -22,6 +22,7 @@ const AIChat: React.FC<AIChatProps> = ({ familyAccessKey }) => {
   const [recognition, setRecognition] = useState<any>(null);
   const [speechSupported, setSpeechSupported] = useState(false);
   const [voiceEnabled, setVoiceEnabled] = useState(false);
+  const [sessionId, setSessionId] = useState<string | null>(null);
 
   const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || (process.env.NODE_ENV === 'production' ? '' : 'http://localhost:8000');
 
@@ -37,6 +38,53 @@ const AIChat: React.FC<AIChatProps> = ({ familyAccessKey }) => {
     }
   }, []);
 
+  useEffect(() => {
+    // 前回の会話があれば復元する（サーバー側の要約と直近の発言で続きから答える）
+    const savedSessionId = localStorage.getItem(`chatSession:${familyAccessKey}`);
+    if (!familyAccessKey || !savedSessionId) return;
+    fetch(`${API_BASE_URL}/api/ai/chat/sessions/${familyAccessKey}/${savedSessionId}`)
+      .then(response => {
+        if (!response.ok) {
+          localStorage.removeItem(`chatSession:${familyAccessKey}`);
+          return null;
+        }
+        return response.json();
+      })
+      .then(session => {
+        if (!session) return;
+        setSessionId(session.id);
+        setMessages(session.turns.map((turn: any) => ({
+          id: `${session.id}-${turn.seq}`,
+          type: turn.role === 'user' ? 'user' : 'ai',
+          content: turn.content,
+          timestamp: turn.created_at
+        })));
+      })
+      .catch(error => console.error('Chat session restore error:', error));
+  }, [familyAccessKey, API_BASE_URL]);
+
+  const ensureSession = async (): Promise<string | null> => {
+    if (sessionId) return sessionId;
+    try {
+      const response = await fetch(`${API_BASE_URL}/api/ai/chat/sessions`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ family_access_key: familyAccessKey }),
+      });
+      if (!response.ok) return null;
+      const session = await response.json();
+      setSessionId(session.id);
+      localStorage.setItem(`chatSession:${familyAccessKey}`, session.id);
+      return session.id;
+    } catch (error) {
+      // 会話を作れなくても、単発の質問としては答えられる
+      console.error('Chat session error:', error);
+      return null;
+    }
+  };
+
   const sendVoiceMessage = async (message: string) => {
     if (!message.trim() || !familyAccessKey) return;
 
@@ -52,6 +100,7 @@ const AIChat: React.FC<AIChatProps> = ({ familyAccessKey }) => {
     setIsLoading(true);
 
     try {
+      const currentSessionId = await ensureSession();
       const response = await fetch(`${API_BASE_URL}/api/ai/chat`, {
         method: 'POST',
         headers: {
@@ -59,7 +108,8 @@ const AIChat: React.FC<AIChatProps> = ({ familyAccessKey }) => {
         },
         body: JSON.stringify({
           question: message,
-          family_access_key: familyAccessKey
+          family_access_key: familyAccessKey,
+          session_id: currentSessionId
         }),
       });
 
@@ -109,6 +159,7 @@ const AIChat: React.FC<AIChatProps> = ({ familyAccessKey }) => {
     setIsLoading(true);
 
     try {
+      const currentSessionId = await ensureSession();
       const response = await fetch(`${API_BASE_URL}/api/ai/chat`, {
         method: 'POST',
         headers: {
@@ -116,7 +167,8 @@ const AIChat: React.FC<AIChatProps> = ({ familyAccessKey }) => {
         },
         body: JSON.stringify({
           question: inputText,
-          family_access_key: familyAccessKey
+          family_access_key: familyAccessKey,
+          session_id: currentSessionId
         }),
       });
 